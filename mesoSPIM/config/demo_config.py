@@ -73,7 +73,7 @@ logging_level = 'DEBUG' # 'DEBUG' for ultra-detailed, 'INFO' for general logging
 '''
 Waveform output for Galvos, ETLs etc.
 '''
-waveformgeneration = 'DemoWaveFormGeneration' # 'DemoWaveFormGeneration' or 'NI'
+waveformgeneration = 'DemoWaveFormGeneration' # 'DemoWaveFormGeneration', 'Simulated' or 'NI'
 
 '''
 Card designations need to be the same as in NI MAX, if necessary, use NI MAX
@@ -103,7 +103,7 @@ sidepanel = 'Demo' #'Demo' or 'FarmSimulator', deprecated
 Digital laser enable lines
 '''
 
-laser = 'Demo' # 'Demo' or 'NI'
+laser = 'Demo' # 'Demo', 'Simulated' or 'NI'
 
 ''' The `laserdict` specifies laser labels of the GUI and their digital modulation channels. 
 Keys are the laser designation that will be shown in the user interface
@@ -122,6 +122,48 @@ individual images or stacks. This is helpful to avoid laser bleedthrough between
 modulation depth of the analog input (even at 0V, some laser light is still emitted).
 '''
 laser_blanking = 'images' # if 'images', laser is off before and after every image; if 'stacks', before and after each stack.
+# if 'hardware', the enable lines are generated as a hardware-timed DO waveform together with the AO waveforms (laser is on only during the laser pulse, no software switching).
+# 'hardware' requires the laser enable lines to support buffered (hardware-timed) digital output, e.g. port0 of NI X-series or PXI-6733.
+
+''' Hardware-timed stacks: the NI tasks play all planes of a stack after a single master trigger,
+instead of being started and stopped for every plane. Requires an ASI stage with 'ttl_motion_enabled': True,
+because Z/F steps are then triggered by TTL. Lasers stay enabled for the whole stack, like laser_blanking = 'stacks'.
+'''
+hardware_timed_stacks = False
+
+''' Pipelined tile transitions: the moves to the next tile (rotation, stage, filter, zoom, laser) start as soon
+as the last plane of a stack is exposed, while the camera and image writer finalize the previous stack in parallel.
+The next stack waits for the previous one to be closed before the camera is prepared (dependency barrier).
+'''
+pipelined_tile_transitions = False
+
+''' Concurrent device preparation: before each stack, the stages, filter wheel and zoom (on separate serial ports)
+move at the same time instead of one after another. The rotation always finishes before the XYZ move starts.
+Zoom changes which need the focus stage ('f_objective_exchange' in stage_parameters) still run after the stage moves.
+'''
+concurrent_device_preparation = False
+
+''' Waveform cache: write-ready AO buffers of recently used laser/shutter/ETL parameter sets are kept in memory (MB),
+so that switching between channels or illumination sides costs only a DAQ buffer write. 0 disables the cache.
+'''
+waveform_cache_MB = 64
+
+''' ETL parameters of laser/zoom combinations missing from the ETL csv file are linearly interpolated
+from the neighbouring wavelengths (same zoom) or zooms (same wavelength), instead of appending a new row to the file.
+'''
+interpolate_etl_parameters = False
+
+''' Simulated NI-DAQmx (waveformgeneration = 'Simulated' and/or laser = 'Simulated'): the real DAQmx task code runs
+against simulated devices with real-time generation and trigger timing, for timing and throughput tests without hardware.
+Optional latencies (s) of the simulated driver calls, e.g. measured on the real hardware. Keys: 'create_task', 'add_channel',
+'timing', 'reserve', 'start', 'stop', 'close', 'write' (per call) and 'write_per_sample'.
+'''
+simulated_daq_latencies = {'create_task': 0.0005, 'start': 0.001, 'close': 0.001}
+
+''' DemoCamera: frames of a synthetic 3D phantom (beads, fibres, tissue-like texture), imaged at the current stage position,
+focus, zoom and laser, are cached by imaging state (MB), so that Live mode and repeated states run at camera-like frame rates.
+'''
+demo_camera_cache_MB = 256
 
 '''
 Shutter configuration
@@ -205,8 +247,25 @@ camera_parameters = {'x_pixels' : 2048, #5056
                      'scan_line_delay' : 7, # 11.2 us x factor, a factor = 3 equals 33.6 us
                     }
 
+For a Replay camera (plays back a recorded TIFF, RAW, OME-Zarr or BDV HDF5 stack in a loop, for profiling
+processors and image writers with real data), x_pixels and y_pixels must match the recorded camera frames:
+
+camera_parameters = {'x_pixels' : 2048,
+                     'y_pixels' : 2048,
+                     'x_pixel_size_in_microns' : 6.5,
+                     'y_pixel_size_in_microns' : 6.5,
+                     'subsampling' : [1,2,4],
+                     'binning' : '1x1',
+                     'replay_path' : 'D:/data/stack.tif', # .tif, .btf, .raw (with its _meta.txt file), .ome.zarr or .h5
+                     'frame_rate' : 40, # fps, None: as fast as the frames can be read
+                     'jitter_ms' : 0.5, # standard deviation of the frame period
+                     'read_ahead' : 16, # frames read in advance from the file
+                     'replay_setup' : 0, # view of a BDV HDF5 file
+                     'replay_tile' : None, # tile of a mesoSPIM OME-Zarr container, e.g. 'Mag1x_Tile0_Ch488_FltEmpty_Sh0_Rot0.ome.zarr'
+                    }
+
 '''
-camera = 'DemoCamera' # 'DemoCamera' or 'HamamatsuOrca' or 'Photometrics'
+camera = 'DemoCamera' # 'DemoCamera', 'Replay', 'HamamatsuOrca' or 'Photometrics'
 
 camera_parameters = {'x_pixels' : 5056,
                      'y_pixels' : 2960,
@@ -226,6 +285,13 @@ camera_parameters = {'x_pixels' : 5056,
 
 binning_dict = {'1x1': (1,1), '2x2':(2,2), '4x4':(4,4)}
 
+'''
+Frame pool: number of preallocated camera frames buffered between the camera and the image writer.
+RAM use is fixed to frame_pool_depth x frame size (e.g. 128 x 8 MB = 1 GB for 2048x2048 px frames).
+If the writer falls behind and the pool is full, the camera waits for free frames instead of using more RAM.
+'''
+frame_pool_depth = 128
+
 '''
 Stage configuration
 '''
@@ -263,6 +329,21 @@ stage_parameters = {'stage_type' : 'DemoStage', # one of 'DemoStage', 'PI_1contr
                     'theta_min' : -999,
                     }
 
+'''
+Optional: device timing used by "Optimize Order" in the Acquisition Manager, which reorders the table
+to minimize the dead time between stacks (all channels of a tile stay consecutive).
+Missing keys use the defaults below. Measure the values on your system for a realistic time prediction.
+'''
+acquisition_order_cost_model = {'xy_speed_um_s': 1000,      # x and y stage speed
+                                'z_speed_um_s': 1000,       # z stage speed
+                                'f_speed_um_s': 1000,       # focus stage speed
+                                'stage_settle_s': 0.2,      # added to every stage move
+                                'rotation_speed_deg_s': 10,
+                                'rotation_settle_s': 1.0,   # added to every rotation
+                                'filter_change_s': 1.0,
+                                'zoom_change_s': 3.0,
+                                }
+
 ''''
 If 'stage_type' = 'DemoStage':
 No additional parameters needed (demo mode).
@@ -350,6 +431,7 @@ zoom_parameters = {'zoom_type' : 'Demo', # 'Demo', 'Dynamixel', or 'Mitu'
                    'COMport' : 'COM1',
                    'baudrate' : 9600,
                    'servo_id': 4, # only for 'Dynamixel'
+                   'move_time_s': 0.1, # only for 'Demo': simulated travel time per zoom change (s), e.g. 1.5 for a Dynamixel zoom
                    }
 
 '''
@@ -434,9 +516,12 @@ OME_Zarr_Writer = {
     'compression': 'zstd', # None, 'zstd', 'lz4'
     'compression_level': 5, # 1-9
     'shards': (64,6000,6000), # None or Tuple specifying max shard size. (axes: z,y,x), ignored if ome_version "0.4"
+    'shard_buffer_gb': 4.0, # RAM buffering complete shards, so that each shard is written once. Shards are made shallower if they do not fit, None: no limit
     'base_chunks': (256,256,256), # Tuple specifying starting chunk size (multiscale level 0). Bigger chunks, less files (axes: z,y,x)
     'target_chunks': (256,256,256), # Tuple specifying ending chunk size (multiscale highest level). Bigger chunks, less files (axes: z,y,x)
     'async_finalize': True, # True, False
+    'pyramid_batch': 4, # Planes downsampled together for the multiscale levels, more planes use more RAM
+    'pyramid_workers': 1, # Threads splitting the 2x2 downsampling into row bands, for large frames on many-core CPUs
     
     # BigStitcher Specific Options
     'write_big_stitcher_xml': True, # True, False
@@ -450,6 +535,7 @@ MP_OME_Zarr_Writer = {
     'compression': 'zstd',  # None, 'zstd', 'lz4'
     'compression_level': 5,  # 1-9
     'shards': (64, 6000, 6000),  # None or Tuple specifying max shard size. (axes: z,y,x), ignored if ome_version "0.4"
+    'shard_buffer_gb': 4.0,  # RAM per writer process buffering complete shards, so that each shard is written once. Shards are made shallower if they do not fit, None: no limit
     'base_chunks': (256, 256, 256),
     # Tuple specifying starting chunk size (multiscale level 0). Bigger chunks, less files (axes: z,y,x)
     'target_chunks': (256, 256, 256),
@@ -463,6 +549,14 @@ MP_OME_Zarr_Writer = {
 
     # Multiprocess options
     'ring_buffer_size': 16,  # Max number of images in shared memory ring buffer, 16 for simulation mode (eg laptop), 512 for production mode (fast workstation)
+    'writer_processes': 2,  # Persistent writer processes shared by all tiles, a tile is finalized in the background while the next one is written by another process
+    'max_finishing_tiles': 2,  # Max tiles finalized in the background at the same time, a new tile waits until one is finished
+    'min_free_memory_gb': 2.0,  # A new tile waits while tiles are finalized and less RAM is free
+    'max_cpu_percent': None,  # A new tile waits while tiles are finalized and the CPU load is higher, None: no limit
+    'max_writer_restarts': 3,  # Crashed writer processes are restarted, tiles queued behind the crashed tile are retried
+    'zero_copy_frames': True,  # True: the camera acquires frames directly into the ring buffer, which replaces the frame pool (frame_pool_depth) while writing. False: frames are copied into it
+    'pyramid_batch': 4,  # Planes downsampled together for the multiscale levels, more planes use more RAM per writer process
+    'pyramid_workers': 1,  # Threads per writer process splitting the 2x2 downsampling into row bands, for large frames on many-core CPUs
          
     # Write cache options. Write tile data to cache then move to acquisition folder
     # None acquires data direct to acquisition folder.
@@ -9,6 +9,8 @@ __license__ = "GPL v3"
 __version__ = "1.25.0"
 
 import time
+import json
+import signal
 import logging
 import argparse
 import glob
@@ -88,6 +90,12 @@ def get_parser():
                         help='Start a ipython console')
     parser.add_argument('-D', '--demo', action='store_true',
                         help='Start in demo mode')
+    parser.add_argument('--headless', metavar='TABLE', default=None,
+                        help='Run the acquisition table (csv) without GUI and exit')
+    parser.add_argument('--summary', metavar='PATH', default=None,
+                        help='Headless mode: write the summary of the run to this JSON file')
+    parser.add_argument('--config', metavar='PATH', default=None,
+                        help='Headless mode: microscope configuration file')
     return parser
 
 
@@ -110,6 +118,25 @@ def get_logger(cfg, package_directory):
     return logger
 
 
+def find_config_file(demo_mode=False):
+    """
+    Returns the configuration file to load, None if the user has to choose one of several config files.
+    """
+    demo_fname = os.path.join(package_directory, 'config', 'demo_config.py')
+    if not os.path.exists(demo_fname):
+        raise ValueError(f"Demo file not found: {demo_fname}")
+    if demo_mode:
+        return demo_fname
+    all_configs = glob.glob(os.path.join(package_directory, 'config', '*.py')) # All possible config files
+    all_configs_no_demo = list(filter(lambda f: str.find(f, 'demo_') < 0, all_configs))
+    if len(all_configs_no_demo) == 0:
+        return demo_fname
+    elif len(all_configs_no_demo) == 1:
+        return os.path.join(package_directory, all_configs_no_demo[0])
+    else:
+        return None
+
+
 def main(embed_console=False, demo_mode=False):
     """
     Load a configuration file according to the following rules:
@@ -120,24 +147,11 @@ def main(embed_console=False, demo_mode=False):
     """
     print('Starting control software')
     QtCore.QThread.currentThread().setObjectName('MainThread')
-    demo_fname = os.path.join(package_directory, 'config', 'demo_config.py')
-    if not os.path.exists(demo_fname):
-        raise ValueError(f"Demo file not found: {demo_fname}")
-
-    if demo_mode:
-        config_fname = demo_fname
+    config_fname = find_config_file(demo_mode)
+    if config_fname is not None:
         cfg = load_config_from_file(config_fname)
     else:
-        all_configs = glob.glob(os.path.join(package_directory, 'config', '*.py')) # All possible config files
-        all_configs_no_demo = list(filter(lambda f: str.find(f, 'demo_') < 0, all_configs))
-        if len(all_configs_no_demo) == 0:
-            config_fname = demo_fname
-            cfg = load_config_from_file(config_fname)
-        elif len(all_configs_no_demo) == 1:
-            config_fname = os.path.join(package_directory, all_configs_no_demo[0])
-            cfg = load_config_from_file(config_fname)
-        else:
-            cfg, config_fname = load_config_UI(os.path.join(package_directory, 'config'))
+        cfg, config_fname = load_config_UI(os.path.join(package_directory, 'config'))
     logger = get_logger(cfg, package_directory)
     logger.info(f'Config file loaded: {config_fname}')
     logger.info(f'mesoSPIM-control version: {__version__}')
@@ -174,8 +188,48 @@ def main(embed_console=False, demo_mode=False):
         sys.exit(app.exec_())
 
 
+def main_headless(table_path, summary_path=None, demo_mode=False, config_fname=None):
+    """
+    Run an acquisition table (csv, as saved by the Acquisition Manager) without GUI.
+    The configuration is chosen as in main(), or given by config_fname.
+    Prints the summary of the run as JSON (and writes it to summary_path) and returns the exit code:
+    0 if all images were acquired without warnings, 1 otherwise.
+    """
+    QtCore.QThread.currentThread().setObjectName('MainThread')
+    if config_fname is None:
+        config_fname = find_config_file(demo_mode)
+        if config_fname is None:
+            raise ValueError('Several configuration files found, choose one with --config')
+    cfg = load_config_from_file(config_fname)
+    logger = get_logger(cfg, package_directory)
+    logger.info(f'Config file loaded: {config_fname}')
+    logger.info(f'mesoSPIM-control version: {__version__}, headless')
+    app = QtCore.QCoreApplication(sys.argv)
+    PluginRegistry(cfg)
+
+    from mesoSPIM.src.mesoSPIM_Headless import mesoSPIM_HeadlessController, write_summary
+    controller = mesoSPIM_HeadlessController(package_directory, cfg)
+    acq_list = controller.load_table(table_path)
+    controller.sig_done.connect(lambda summary: app.quit())
+    signal.signal(signal.SIGINT, lambda signum, frame: controller.stop())
+    timer = QtCore.QTimer() # lets the Python interpreter handle Ctrl+C while the event loop runs
+    timer.timeout.connect(lambda: None)
+    timer.start(200)
+    QtCore.QTimer.singleShot(0, lambda: controller.run_acquisition_list(acq_list))
+    app.exec_()
+    controller.close()
+
+    summary = controller.summary
+    print(json.dumps(summary, indent=2))
+    if summary_path:
+        write_summary(summary, summary_path)
+    return 0 if summary['success'] else 1
+
+
 def run():
     args = get_parser().parse_args()
+    if args.headless:
+        sys.exit(main_headless(args.headless, summary_path=args.summary, demo_mode=args.demo, config_fname=args.config))
     main(embed_console=args.console, demo_mode=args.demo)
 
 
@@ -0,0 +1,16 @@
+'''
+Simulated stand-in for the subset of the nidaqmx API used by mesoSPIM_WaveFormGenerator
+and mesoSPIM_LaserEnabler, for timing and throughput tests without NI hardware.
+
+Usage, in place of the nidaqmx package:
+    from mesoSPIM.src.devices.daq import simulated_nidaqmx as nidaqmx
+    task = nidaqmx.Task()
+    ...
+    nidaqmx.system.set_latencies(start=0.01)   # configurable driver latencies, seconds
+    task.generated                             # recorded sample streams, [(t_start, samples), ...]
+
+See SimulatedSystem for the trigger wiring and latency model.
+'''
+from . import constants, errors, types
+from .hardware import SimulatedSystem, expand_physical_channels, system
+from .task import Task
@@ -0,0 +1,30 @@
+'''Subset of nidaqmx.constants used by mesoSPIM. The simulated tasks compare constants by name,
+so the enums of the real nidaqmx package are accepted as well.'''
+from enum import Enum
+
+
+class AcquisitionType(Enum):
+    FINITE = 10178
+    CONTINUOUS = 10123
+    HW_TIMED_SINGLE_POINT = 12522
+
+
+class TaskMode(Enum):
+    TASK_START = 0
+    TASK_STOP = 1
+    TASK_VERIFY = 2
+    TASK_COMMIT = 3
+    TASK_RESERVE = 4
+    TASK_UNRESERVE = 5
+    TASK_ABORT = 6
+
+
+class LineGrouping(Enum):
+    CHAN_PER_LINE = 0
+    CHAN_FOR_ALL_LINES = 1
+
+
+class DigitalWidthUnits(Enum):
+    SAMPLE_CLOCK_PERIODS = 10286
+    SECONDS = 10364
+    TICKS = 10304
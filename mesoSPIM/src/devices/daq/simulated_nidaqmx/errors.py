@@ -0,0 +1,12 @@
+'''Subset of nidaqmx.errors used by mesoSPIM'''
+
+
+class DaqError(Exception):
+    def __init__(self, message, error_code=-200000, task_name=''):
+        super().__init__(message)
+        self.error_code = error_code
+        self.task_name = task_name
+
+
+class DaqWarning(Warning):
+    pass
@@ -0,0 +1,109 @@
+'''
+Shared state of the simulated NI-DAQmx devices: latencies, trigger wiring and channel reservations.
+'''
+import re
+import time
+import threading
+from collections import Counter
+import logging
+logger = logging.getLogger(__name__)
+
+from .errors import DaqError
+
+
+def expand_physical_channels(physical_channel):
+    '''Expands a DAQmx channel string into single channels:
+    'PXI6259/ao0:3' -> ['PXI6259/ao0', ..., 'PXI6259/ao3'], 'Dev1/port0/line2,Dev1/port0/line3,' -> 2 lines'''
+    channels = []
+    for name in physical_channel.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        match = re.match(r'^(.*?)(\d+):(\d+)$', name)
+        if match:
+            prefix, start, end = match.group(1), int(match.group(2)), int(match.group(3))
+            step = 1 if end >= start else -1
+            channels.extend(f'{prefix}{i}' for i in range(start, end + step, step))
+        else:
+            channels.append(name)
+    return channels
+
+
+class SimulatedSystem:
+    '''
+    Settings and bookkeeping of the simulated devices, shared by all simulated tasks (module attribute `system`).
+
+    Timing: every driver call sleeps for its latency (seconds), writes additionally per sample and channel.
+    Triggers: all digital-edge start triggers are assumed to be wired to the master trigger output,
+    i.e. a rising edge in a multi-sample write of any DO task fires all armed tasks.
+    Single-sample DO writes (laser enable lines, shutters) are static line levels and fire nothing.
+    '''
+    DEFAULT_LATENCIES = {'create_task': 0.0005,
+                         'add_channel': 0.001,
+                         'timing': 0.0002,
+                         'reserve': 0.005,
+                         'start': 0.003,
+                         'stop': 0.001,
+                         'close': 0.002,
+                         'write': 0.0005,
+                         'write_per_sample': 5e-9,
+                         }
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self, **latencies):
+        '''Restores default settings, closes the bookkeeping of all tasks and applies latency overrides'''
+        with self.lock:
+            self.latencies = dict(self.DEFAULT_LATENCIES)
+            self.set_latencies(**latencies)
+            self.record = True              # keep the written buffers of every generation (Task.generated)
+            self.max_recorded = 1000        # generations kept per task, the oldest are dropped
+            self.retriggerable_ao = True    # False: AO tasks with retriggerable start triggers fail at start(), like on M-series cards
+            self.tasks = []
+            self.trigger_times = []         # perf_counter() times of master trigger edges
+            self.stats = Counter()          # number of calls per driver operation
+
+    def set_latencies(self, **latencies):
+        unknown = set(latencies) - set(self.DEFAULT_LATENCIES)
+        if unknown:
+            raise ValueError(f'Unknown simulated DAQ latencies: {sorted(unknown)}')
+        self.latencies.update(latencies)
+
+    def sleep(self, operation, n_samples=0):
+        self.stats[operation] += 1
+        duration = self.latencies[operation]
+        if operation == 'write':
+            duration += n_samples * self.latencies['write_per_sample']
+        if duration > 0:
+            time.sleep(duration)
+
+    def register(self, task):
+        with self.lock:
+            self.tasks.append(task)
+
+    def unregister(self, task):
+        with self.lock:
+            if task in self.tasks:
+                self.tasks.remove(task)
+
+    def reserve(self, task):
+        '''Raises DaqError if a physical channel of task is used by another running task'''
+        with self.lock:
+            for other in self.tasks:
+                if other is not task and other.is_running:
+                    shared = set(task.physical_channels) & set(other.physical_channels)
+                    if shared:
+                        raise DaqError(f'Resource requested by this task has already been reserved by task {other.name}: {sorted(shared)}',
+                                       error_code=-50103, task_name=task.name)
+
+    def fire_trigger(self, t_edge):
+        '''Master trigger edge at perf_counter() time t_edge: starts the generation of all armed tasks'''
+        with self.lock:
+            self.trigger_times.append(t_edge)
+            for task in self.tasks:
+                task._on_trigger(t_edge)
+
+
+system = SimulatedSystem() # shared by all simulated tasks
@@ -0,0 +1,341 @@
+'''
+Simulated nidaqmx.Task: AO voltage, DO and CO pulse channels, sample clock / implicit timing,
+digital-edge start triggers, buffer writes and wait_until_done with the timing of real generation.
+
+Generation runs in "wall-clock simulation": a started or triggered task generates its samples
+between t_start and t_start + duration, the number of generated samples is computed from
+time.perf_counter(). Nothing runs in the background.
+'''
+import time
+import itertools
+from collections import deque
+import numpy as np
+
+from .errors import DaqError
+from .hardware import expand_physical_channels, system
+
+_task_ids = itertools.count()
+AUTO_START_UNSET = object()
+
+
+def _name(constant):
+    '''Name of a constant of the simulated or the real nidaqmx.constants'''
+    return getattr(constant, 'name', constant)
+
+
+class _Channel:
+    def __init__(self, kind, physical_channel, n_channels, **parameters):
+        self.kind = kind
+        self.physical_channel = physical_channel
+        self.physical_channels = expand_physical_channels(physical_channel)
+        self.n_channels = n_channels
+        self.parameters = parameters
+
+
+class _ChannelCollection:
+    kind = None
+
+    def __init__(self, task):
+        self._task = task
+
+    def _add(self, physical_channel, n_channels=None, **parameters):
+        channel = _Channel(self.kind, physical_channel, n_channels or len(expand_physical_channels(physical_channel)), **parameters)
+        self._task._add_channel(channel)
+        return channel
+
+
+class AOChannelCollection(_ChannelCollection):
+    kind = 'ao'
+
+    def add_ao_voltage_chan(self, physical_channel, name_to_assign_to_channel='', terminal_config=None,
+                            min_val=-5.0, max_val=5.0, units=None, custom_scale_name=''):
+        return self._add(physical_channel, min_val=min_val, max_val=max_val)
+
+
+class DOChannelCollection(_ChannelCollection):
+    kind = 'do'
+
+    def add_do_chan(self, lines, name_to_assign_to_lines='', line_grouping=None):
+        per_line = _name(line_grouping) == 'CHAN_PER_LINE'
+        return self._add(lines, n_channels=None if per_line else 1, line_grouping=_name(line_grouping))
+
+
+class COChannelCollection(_ChannelCollection):
+    kind = 'co'
+
+    def add_co_pulse_chan_time(self, counter, name_to_assign_to_channel='', units=None, idle_state=None,
+                               initial_delay=0.0, low_time=0.01, high_time=0.01):
+        return self._add(counter, initial_delay=initial_delay, low_time=low_time, high_time=high_time)
+
+
+class Timing:
+    def __init__(self, task):
+        self._task = task
+        self.samp_clk_rate = None
+        self.samp_quant_samp_mode = None
+        self.samp_quant_samp_per_chan = None
+        self.implicit = False
+
+    def cfg_samp_clk_timing(self, rate, source='', active_edge=None, sample_mode=None, samps_per_chan=1000):
+        self._task._system.sleep('timing')
+        self.samp_clk_rate = float(rate)
+        self.samp_quant_samp_mode = _name(sample_mode) or 'FINITE'
+        self.samp_quant_samp_per_chan = int(samps_per_chan)
+
+    def cfg_implicit_timing(self, sample_mode=None, samps_per_chan=1000):
+        self._task._system.sleep('timing')
+        self.implicit = True
+        self.samp_quant_samp_mode = _name(sample_mode) or 'FINITE'
+        self.samp_quant_samp_per_chan = int(samps_per_chan)
+
+
+class StartTrigger:
+    def __init__(self, task):
+        self._task = task
+        self.trig_type = 'NONE'
+        self.dig_edge_src = ''
+        self.retriggerable = False
+
+    def cfg_dig_edge_start_trig(self, trigger_source, trigger_edge=None):
+        self.trig_type = 'DIGITAL_EDGE'
+        self.dig_edge_src = trigger_source
+
+    def disable_start_trig(self):
+        self.trig_type = 'NONE'
+
+
+class Triggers:
+    def __init__(self, task):
+        self.start_trigger = StartTrigger(task)
+
+
+class OutStream:
+    def __init__(self, task):
+        self._task = task
+        self.output_buf_size = None
+
+    @property
+    def total_samp_per_chan_generated(self):
+        return self._task._samples_generated(time.perf_counter())
+
+
+class Task:
+    '''Simulated nidaqmx.Task, see the module docstring'''
+    def __init__(self, new_task_name=''):
+        self._system = system
+        self._system.sleep('create_task')
+        self.name = new_task_name or f'_unnamedTask<{next(_task_ids)}>'
+        self.channels = []
+        self.ao_channels = AOChannelCollection(self)
+        self.do_channels = DOChannelCollection(self)
+        self.co_channels = COChannelCollection(self)
+        self.timing = Timing(self)
+        self.triggers = Triggers(self)
+        self.out_stream = OutStream(self)
+        self.buffer = None          # last written samples, shape (n_channels, n_samples)
+        self.plays = []             # [t_start, duration, samples per channel] of the generations not collapsed yet
+        self.n_plays = 0            # generations since the task was created
+        self._samples_done = 0      # samples per channel of the collapsed, finished generations
+        self.generated = deque(maxlen=self._system.max_recorded) # (t_start, buffer) of the last generations, if system.record
+        self.is_running = False
+        self.is_closed = False
+        self._armed = False         # started and waiting for a start trigger
+        self._last_levels = None    # DO line levels after the last write
+        self._system.register(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return f'SimulatedTask(name={self.name})'
+
+    # configuration
+    @property
+    def kind(self):
+        return self.channels[0].kind if self.channels else None
+
+    @property
+    def number_of_channels(self):
+        return sum(channel.n_channels for channel in self.channels)
+
+    @property
+    def physical_channels(self):
+        return [name for channel in self.channels for name in channel.physical_channels]
+
+    def _add_channel(self, channel):
+        self._check_open()
+        if self.channels and self.kind != channel.kind:
+            raise DaqError(f'Channels of type {channel.kind} cannot be added to a task with {self.kind} channels',
+                           error_code=-200559, task_name=self.name)
+        self._system.sleep('add_channel')
+        self.channels.append(channel)
+
+    def control(self, action):
+        self._check_open()
+        if _name(action) in ('TASK_RESERVE', 'TASK_COMMIT'):
+            self._system.sleep('reserve')
+            self._system.reserve(self)
+
+    def _check_open(self):
+        if self.is_closed:
+            raise DaqError('Task specified is invalid or does not exist.', error_code=-200088, task_name=self.name)
+
+    @property
+    def _hardware_timed(self):
+        return self.timing.samp_clk_rate is not None or self.kind == 'co'
+
+    def _play_duration(self):
+        '''Duration (s) of one generation after the start or trigger'''
+        if self.kind == 'co':
+            parameters = self.channels[0].parameters
+            n_pulses = self.timing.samp_quant_samp_per_chan if self.timing.implicit else 1
+            return parameters['initial_delay'] + n_pulses * (parameters['high_time'] + parameters['low_time']) - parameters['low_time']
+        return self.timing.samp_quant_samp_per_chan / self.timing.samp_clk_rate
+
+    def _samples_per_play(self):
+        if self.kind == 'co':
+            return self.timing.samp_quant_samp_per_chan if self.timing.implicit else 1
+        return self.timing.samp_quant_samp_per_chan
+
+    # writing
+    def write(self, data, auto_start=AUTO_START_UNSET, timeout=10.0):
+        '''Writes samples: 1D data are the samples of a single channel, or one sample per channel of a multi-channel task.
+        Returns the number of samples written per channel.'''
+        self._check_open()
+        data = np.asarray(data)
+        n_channels = self.number_of_channels
+        if data.ndim == 1:
+            data = data.reshape(1, -1) if n_channels == 1 else data.reshape(-1, 1)
+        if data.shape[0] != n_channels:
+            raise DaqError(f'Write cannot be performed, because the number of channels in the data ({data.shape[0]}) '
+                           f'does not match the number of channels in the task ({n_channels}).', error_code=-200524, task_name=self.name)
+        if self.kind == 'ao':
+            row = 0
+            for channel in self.channels:
+                values = data[row:row + channel.n_channels]
+                if values.size and (values.min() < channel.parameters['min_val'] or values.max() > channel.parameters['max_val']):
+                    raise DaqError(f'Value exceeds the maximum or minimum allowed output value of {channel.physical_channel}: '
+                                   f'[{values.min()}, {values.max()}] not in [{channel.parameters["min_val"]}, {channel.parameters["max_val"]}]',
+                                   error_code=-200561, task_name=self.name)
+                row += channel.n_channels
+        if self._hardware_timed and self.timing.samp_clk_rate is not None:
+            buffer_size = self.out_stream.output_buf_size
+            if buffer_size is not None and data.shape[1] > buffer_size:
+                raise DaqError(f'Write cannot be performed: {data.shape[1]} samples exceed the buffer size {buffer_size}',
+                               error_code=-200547, task_name=self.name)
+        self._system.sleep('write', data.size)
+        self.buffer = np.array(data)
+        if auto_start is AUTO_START_UNSET:
+            auto_start = not self._hardware_timed
+        if not self._hardware_timed:
+            self._write_on_demand()
+        elif auto_start and not self.is_running:
+            self.start()
+        return data.shape[1]
+
+    def _write_on_demand(self):
+        '''Software-timed write: the samples are generated right away'''
+        t_now = time.perf_counter()
+        self.is_running = True
+        if self._system.record:
+            self.generated.append((t_now, self.buffer))
+        if self.kind == 'do':
+            levels = self.buffer.astype(bool)
+            previous = self._last_levels if self._last_levels is not None else np.zeros((levels.shape[0], 1), dtype=bool)
+            if levels.shape[1] > 1 and np.any(~np.concatenate((previous, levels[:, :-1]), axis=1) & levels):
+                self._system.fire_trigger(t_now)
+            self._last_levels = levels[:, -1:]
+
+    # generation
+    def start(self):
+        self._check_open()
+        self._system.sleep('start')
+        if self._hardware_timed:
+            if self.kind != 'co' and self.buffer is None:
+                raise DaqError('Generation cannot be started, because the output buffer is empty.', error_code=-200462, task_name=self.name)
+            if self.kind == 'ao' and self.triggers.start_trigger.retriggerable and not self._system.retriggerable_ao:
+                raise DaqError('Specified property is not supported by the device: Retriggerable', error_code=-200452, task_name=self.name)
+        self._system.reserve(self)
+        self.is_running = True
+        if not self._hardware_timed:
+            return
+        if self.triggers.start_trigger.trig_type == 'DIGITAL_EDGE':
+            self._armed = True
+        else:
+            self._play(time.perf_counter())
+
+    def _play(self, t_start):
+        self._collapse_finished(t_start)
+        self.plays.append([t_start, self._play_duration(), self._samples_per_play()])
+        self.n_plays += 1
+        if self._system.record:
+            self.generated.append((t_start, self.buffer))
+
+    def _on_trigger(self, t_edge):
+        if not self._armed:
+            return
+        if self.plays and self.plays[-1][0] + self.plays[-1][1] > t_edge:
+            return # still generating, the trigger is ignored like by the hardware
+        self._play(t_edge)
+        if not self.triggers.start_trigger.retriggerable:
+            self._armed = False
+
+    def _collapse_finished(self, t_now):
+        '''Counts the generations finished at t_now, so that a task retriggered for hours keeps one play'''
+        finished = [play for play in self.plays if play[0] + play[1] <= t_now]
+        if finished:
+            self._samples_done += sum(n_samples for t_start, duration, n_samples in finished)
+            self.plays = [play for play in self.plays if play[0] + play[1] > t_now]
+
+    def _samples_generated(self, t_now):
+        generated = self._samples_done
+        for t_start, duration, n_samples in self.plays:
+            fraction = 1.0 if duration <= 0 else min(max((t_now - t_start) / duration, 0.0), 1.0)
+            generated += int(n_samples * fraction)
+        return generated
+
+    def is_task_done(self):
+        t_now = time.perf_counter()
+        if self._armed and (self.triggers.start_trigger.retriggerable or not self.plays):
+            return False
+        return all(t_start + duration <= t_now for t_start, duration, n_samples in self.plays)
+
+    def wait_until_done(self, timeout=10.0):
+        self._check_open()
+        deadline = time.perf_counter() + timeout
+        while not self.is_task_done():
+            if self.plays and not self._armed:
+                t_end = max(t_start + duration for t_start, duration, n_samples in self.plays)
+                remaining = t_end - time.perf_counter()
+            else:
+                remaining = 0.001 # waiting for a trigger
+            if time.perf_counter() + max(remaining, 0) > deadline:
+                time.sleep(max(deadline - time.perf_counter(), 0))
+                raise DaqError('Wait Until Done did not indicate that the task was done within the specified timeout.',
+                               error_code=-200560, task_name=self.name)
+            time.sleep(max(min(remaining, 0.01), 0.0001))
+
+    def stop(self):
+        self._check_open()
+        self._system.sleep('stop')
+        t_now = time.perf_counter()
+        for play in self.plays:
+            t_start, duration, n_samples = play
+            if t_start + duration > t_now: # generation aborted
+                elapsed = max(t_now - t_start, 0.0)
+                play[1:] = [elapsed, int(n_samples * elapsed / duration)]
+        self._collapse_finished(t_now)
+        self._armed = False
+        self.is_running = False
+
+    def close(self):
+        if self.is_closed:
+            return
+        self._system.sleep('close')
+        self._armed = False
+        self.is_running = False
+        self.is_closed = True
+        self._system.unregister(self)
@@ -0,0 +1,4 @@
+'''Subset of nidaqmx.types used by mesoSPIM'''
+from collections import namedtuple
+
+CtrTime = namedtuple('CtrTime', ['high_time', 'low_time'])
@@ -13,9 +13,13 @@ from mesoSPIM.src.devices.servos.dynamixel.dynamixel import Dynamixel
 from mesoSPIM.src.devices.filter_wheels.ZWO_EFW import pyzwoefw
 
 class mesoSPIM_DemoFilterWheel(QtCore.QObject):
+    '''Simulated filter wheel, waits move_time_s per filter change if wait_until_done'''
+    move_time_s = 1.0
+
     def __init__(self, filterdict):
         super().__init__()
         self.filterdict = filterdict
+        self.filter = None
 
     def _check_if_filter_in_filterdict(self, filter):
         '''
@@ -29,8 +33,9 @@ class mesoSPIM_DemoFilterWheel(QtCore.QObject):
 
     def set_filter(self, filter, wait_until_done=False):
         if self._check_if_filter_in_filterdict(filter) is True:
-            if wait_until_done:
-                time.sleep(1)
+            if wait_until_done and filter != self.filter:
+                time.sleep(self.move_time_s)
+            self.filter = filter
 
 
 class ZwoFilterWheel(QtCore.QObject):
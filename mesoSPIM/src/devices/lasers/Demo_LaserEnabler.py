@@ -1,7 +1,13 @@
+import logging
+logger = logging.getLogger(__name__)
+
 class Demo_LaserEnabler:
-    def __init__(self, laserdict):
+    def __init__(self, laserdict, hardware_timed=False):
         self.laserenablestate = 'None'
         self.laserdict = laserdict
+        self.hardware_timed = hardware_timed
+        self.switch_count = 0
+        self.switch_time_s = 0.0
 
     def _check_if_laser_in_laserdict(self, laser):
         if laser in self.laserdict:
@@ -12,6 +18,7 @@ class Demo_LaserEnabler:
     def enable(self, laser):
         if self._check_if_laser_in_laserdict(laser) is True:
             self.laserenablestate = laser
+            self.switch_count += 1
         else:
             pass
 
@@ -23,7 +30,16 @@ class Demo_LaserEnabler:
 
     def disable_all(self):
         self.laserenablestate = 'off'
+        self.switch_count += 1
+
+    def log_switch_stats(self):
+        if self.switch_count > 0:
+            logger.info(f"Demo laser enabler: {self.switch_count} switches")
+        self.switch_count = 0
+        self.switch_time_s = 0.0
 
+    def close(self):
+        pass
 
     def state(self):
         return self.laserenablestate
\ No newline at end of file
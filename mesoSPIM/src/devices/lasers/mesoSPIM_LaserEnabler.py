@@ -1,31 +1,57 @@
 """
 mesoSPIM Module for enabling single laser lines via NI-DAQmx
 """
+import time
+import logging
+logger = logging.getLogger(__name__)
 
-import nidaqmx
-from nidaqmx.constants import LineGrouping
+try:
+    import nidaqmx
+    from nidaqmx.constants import LineGrouping
+except ImportError: # offline: only the simulated DAQ is available
+    nidaqmx = None
+    from ..daq.simulated_nidaqmx.constants import LineGrouping
 
 class mesoSPIM_LaserEnabler:
     ''' Class for interacting with the laser enable DO lines via NI-DAQmx
     This uses the property of NI-DAQmx-outputs to keep their last digital state or
-    analog voltage for as long the device is not powered down. This means that
-    the NI tasks are closed after calls to "enable", "disable", etc which in turn
-    means that this class is not intended for fast switching in complicated waveforms.
+    analog voltage for as long the device is not powered down.
+    One software-timed DO task is created at startup and kept running,
+    so each call to "enable", "disable_all" is a single write to the lines.
     Needs a dictionary which combines laser wavelengths and device outputs
     in the form:
     {'488 nm': 'PXI1Slot4/port0/line2',
     '515 nm': 'PXI1Slot4/port0/line3'}
+
+    If hardware_timed is True, the enable lines are driven by the hardware-timed DO task
+    of mesoSPIM_WaveFormGenerator (laser_blanking = 'hardware' in the config).
+    The lines are then switched off once at startup and released, "enable" and "disable_all"
+    only keep track of the state.
+
+    daq is the DAQmx module, e.g. the simulated NI-DAQmx backend (default: nidaqmx).
     '''
-    def __init__(self, laserdict):
+    def __init__(self, laserdict, hardware_timed=False, daq=None):
         self.laserenablestate = 'None'
         self.laserdict = laserdict
+        self.hardware_timed = hardware_timed
+        self.switch_count = 0
+        self.switch_time_s = 0.0
 
         # get a value in the laserdict to get the general device string
         self.laserenable_device = ''
         self.laser_keys_sorted = sorted(laserdict.keys())
         for key in self.laser_keys_sorted:
             self.laserenable_device += laserdict[key] + ','
+
+        self.daq = daq or nidaqmx
+        if self.daq is None:
+            raise ImportError("nidaqmx is not installed, use laser = 'Demo' or 'Simulated' in the config")
+        self.task = self.daq.Task()
+        self.task.do_channels.add_do_chan(self.laserenable_device, line_grouping=LineGrouping.CHAN_PER_LINE)
+        self.task.start()
         self.disable_all()         # Make sure that all the Lasers are off upon initialization:
+        if self.hardware_timed:
+            self.close()
 
     def _check_if_laser_in_laserdict(self, laser):
         '''Checks if the laser designation (string) given as argument exists in the laserdict'''
@@ -34,26 +60,48 @@ class mesoSPIM_LaserEnabler:
         else:
             raise ValueError('Laser not in the configuration')
 
+    def _write(self, command_list):
+        '''Writes the line states to the persistent task and logs the switching time'''
+        if self.task is None:
+            return
+        start = time.perf_counter()
+        self.task.write(command_list)
+        elapsed = time.perf_counter() - start
+        self.switch_count += 1
+        self.switch_time_s += elapsed
+        logger.debug(f"Laser enable lines switched in {elapsed*1000:.2f} ms")
+
     def enable(self, laser):
         '''Enables a single laser line. All other lines are switched off.'''
         if self._check_if_laser_in_laserdict(laser):
             command_list = [False]*len(self.laserdict)
             ind_line_on = list(self.laser_keys_sorted).index(laser)
             command_list[ind_line_on] = True
-            with nidaqmx.Task() as task:
-                task.do_channels.add_do_chan(self.laserenable_device, line_grouping=LineGrouping.CHAN_PER_LINE)
-                task.write(command_list, auto_start=True)
+            self._write(command_list)
             self.laserenablestate = laser
         else:
             pass
 
     def disable_all(self):
         '''Disables all laser lines.'''
-        with nidaqmx.Task() as task:
-            task.do_channels.add_do_chan(self.laserenable_device, line_grouping=LineGrouping.CHAN_PER_LINE)
-            task.write([False]*len(self.laserdict), auto_start=True)
+        self._write([False]*len(self.laserdict))
         self.laserenablestate = 'off'
 
     def state(self):
         """ Returns laserline if a laser is on, otherwise "False" """
         return self.laserenablestate
+
+    def log_switch_stats(self):
+        """ Logs the number of line switches and the time spent in them since the last call """
+        if self.switch_count > 0:
+            logger.info(f"Laser enabler: {self.switch_count} switches, "
+                        f"{self.switch_time_s*1000:.1f} ms total, {self.switch_time_s*1000/self.switch_count:.2f} ms per switch")
+        self.switch_count = 0
+        self.switch_time_s = 0.0
+
+    def close(self):
+        """ Stops and releases the DO task, the lines keep their last state """
+        if self.task is not None:
+            self.task.stop()
+            self.task.close()
+            self.task = None
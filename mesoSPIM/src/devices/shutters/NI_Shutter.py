@@ -4,8 +4,12 @@ Author: Fabian Voigt
 #TODO
 """
 
-import nidaqmx
-from nidaqmx.constants import LineGrouping
+try:
+    import nidaqmx
+    from nidaqmx.constants import LineGrouping
+except ImportError: # offline: only the demo shutter is available
+    nidaqmx = None
+    from ..daq.simulated_nidaqmx.constants import LineGrouping
 
 class NI_Shutter:
     """
@@ -19,6 +23,8 @@ class NI_Shutter:
     analog voltage for as long the device is not powered down.
     """
     def __init__(self, shutterline):
+        if nidaqmx is None:
+            raise ImportError("nidaqmx is not installed, use shutter = 'Demo' in the config")
         self.shutterline = shutterline
 
         # Make sure that the Shutter is closed upon initialization
@@ -33,6 +33,7 @@ from .utils.multicolor_acquisition_wizard import MulticolorTilingWizard
 from .utils.filename_wizard import FilenameWizard
 from .utils.focus_tracking_wizard import FocusTrackingWizard
 from .utils.image_processing_wizard import ImageProcessingWizard
+from .utils.acquisition_order import AcquisitionCostModel, optimize_acquisition_order
 from .utils.utility_functions import convert_seconds_to_string, fit_window_to_screen
 from PyQt5.QtGui import QFont
 from PyQt5.QtWidgets import QMessageBox
@@ -143,6 +144,7 @@ class mesoSPIM_AcquisitionManagerWindow(QtWidgets.QWidget):
         self.FilenameWizardButton.clicked.connect(self.generate_filenames)
         self.FocusTrackingWizardButton.clicked.connect(self.run_focus_tracking_wizard)
         self.AutoIlliminationButton.clicked.connect(self.auto_illumination)
+        self.OptimizeOrderButton.clicked.connect(self.optimize_acquisition_order)
         self.ImageProcessingWizardButton.clicked.connect(self.run_image_processing_wizard)
 
         self.DeleteAllButton.clicked.connect(self.delete_all_rows)
@@ -698,6 +700,28 @@ class mesoSPIM_AcquisitionManagerWindow(QtWidgets.QWidget):
         elif self.GroupByIlluminationButton.isChecked():
             self.apply_group_by_illumination()
 
+    def optimize_acquisition_order(self):
+        '''Reorder the table to minimize the mechanical dead time, after showing the predicted time before and after.'''
+        acq_list = self.model.get_acquisition_list()
+        cost_model = AcquisitionCostModel(**(self.cfg.acquisition_order_cost_model if hasattr(self.cfg, 'acquisition_order_cost_model') else {}))
+        optimized = optimize_acquisition_order(acq_list, cost_model)
+        framerate = self.state['current_framerate']
+        before, after = cost_model.estimate_time(acq_list, framerate), cost_model.estimate_time(optimized, framerate)
+        message = 'Predicted acquisition time (imaging + stage, rotation, filter and zoom moves):\n\n'
+        message += f'Current order: {convert_seconds_to_string(before)} (dead time {convert_seconds_to_string(cost_model.overhead_time(acq_list))})\n'
+        message += f'Optimized order: {convert_seconds_to_string(after)} (dead time {convert_seconds_to_string(cost_model.overhead_time(optimized))})\n\n'
+        if after >= before:
+            self.display_warning(message + 'The current order is already optimal.')
+            return
+        message += 'Reorder the table? All channels of a tile stay consecutive.'
+        if self.display_information(message, 12) == QMessageBox.Cancel:
+            return
+        self.model.setTable(optimized)
+        self.set_state()
+        self._reapply_grouping_if_active()
+        self.update_acquisition_time_prediction()
+        self.update_acquisition_size_prediction()
+
     def auto_illumination(self):
         message = 'Illumination (Left/Right) will be changed for ALL tiles based on x-positions relative to the median X of the acquisition table.\n\n'
         message += 'Tiles with X < median → Right illumination.\n'
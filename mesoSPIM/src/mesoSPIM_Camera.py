@@ -17,25 +17,30 @@ except:
 
 from .utils.acquisitions import AcquisitionList, Acquisition
 from .utils.utility_functions import log_cpu_core, timed
+from .utils.phantom import SyntheticPhantom, PhantomFrameCache
+from .utils.replay import ReplayStream
 from .mesoSPIM_ProcessorChain import ProcessorChain
+from .plugins.ImageWriterApi import MESOSPIM_ORIENTATION
+from .plugins.utils import count_domain_to_uint16
+
+FRAME_POOL_TIMEOUT_S = 10 # max time to wait for a free frame slot before a frame is dropped
 
 
 class mesoSPIM_Camera(QtCore.QObject):
     '''Top-level class for all cameras'''
     sig_camera_frame = QtCore.pyqtSignal()
     sig_snap_image_ready = QtCore.pyqtSignal()  # emitted after snap; image is in frame_queue_display
-    sig_write_images = QtCore.pyqtSignal(Acquisition, AcquisitionList)
     sig_finished = QtCore.pyqtSignal()
     sig_end_image_series_done = QtCore.pyqtSignal()  # emitted after end_image_series cleanup is complete
     sig_update_gui_from_state = QtCore.pyqtSignal()
     sig_status_message = QtCore.pyqtSignal(str)
 
-    def __init__(self, parent, frame_queue, frame_queue_display):
+    def __init__(self, parent, frame_pool, frame_queue_display):
         super().__init__()
 
         self.parent = parent # a mesoSPIM_Core() object
         self.cfg = parent.cfg
-        self.frame_queue = frame_queue
+        self.frame_pool = frame_pool
         self.frame_queue_display = frame_queue_display
 
         self.state = self.parent.state # a mesoSPIM_StateSingleton() object
@@ -86,11 +91,14 @@ class mesoSPIM_Camera(QtCore.QObject):
             self.camera = mesoSPIM_PCOCamera(self)
         elif self.cfg.camera == 'DemoCamera':
             self.camera = mesoSPIM_DemoCamera(self)
+        elif self.cfg.camera == 'Replay':
+            self.camera = mesoSPIM_ReplayCamera(self)
 
         self.camera.open_camera()
         logger.info('Camera initialized')
 
         self.processor_chain = ProcessorChain()
+        self.processing_inplace = True # False while the chain changes the frame shape or dtype, see prepare_image_series()
 
     def __del__(self):
         try:
@@ -167,6 +175,19 @@ class mesoSPIM_Camera(QtCore.QObject):
         #self.image_writer.prepare_acquisition(acq, acq_list)
         self.max_frame = acq.get_image_count()
         self.processing_options_string = acq['processing']
+        frame_shape = (self.camera.y_pixels, self.camera.x_pixels)
+        self.processing_inplace = True
+        if self.processor_chain.is_enabled:
+            # a chain which changes the frame shape or dtype (e.g. binning) cannot process the frames in their pool slots,
+            # the pool holds the processed frames then and the camera frames are processed before they are copied into it
+            processed_shape, processed_dtype = self.processor_chain.output_spec(frame_shape, self.frame_pool.dtype)
+            self.processing_inplace = (processed_shape, processed_dtype) == (frame_shape, self.frame_pool.dtype)
+            if not self.processing_inplace:
+                logger.info(f'Camera: Processed frames {processed_shape} {processed_dtype} differ from the camera frames '
+                            f'{frame_shape} {self.frame_pool.dtype}, processing out of place')
+                frame_shape = processed_shape
+        self.frame_pool.allocate(frame_shape)
+        self.display_buffers = [np.empty(frame_shape, dtype=self.frame_pool.dtype) for i in range(2)]
         self.camera.initialize_image_series()
         self.cur_image = 0
         logger.info(f'Camera: Finished Preparing Image Series')
@@ -184,20 +205,50 @@ class mesoSPIM_Camera(QtCore.QObject):
         if self.stopflag is False:
             if self.cur_image < self.max_frame:
                 logger.debug(f'Adding images to series')
-                images = self.camera.get_images_in_series()
-                logger.debug(f'Got {len(images)} images')
-                
-                if self.processor_chain.is_enabled:
-                    images = [self.processor_chain.process(img) for img in images]
-                
-                self.frame_queue.extend(images) # push the list of images into queue
+                latency = self.frame_pool.latency
+                t_start = time.perf_counter()
+                if self.processing_inplace:
+                    slots = self.camera.get_images_in_series_into(self.frame_pool)
+                    n_images = len(slots)
+                else:
+                    images = self.camera.get_images_in_series()
+                    n_images = len(images)
+                logger.debug(f'Got {n_images} images')
+                if n_images == 0:
+                    return
+                latency.record('acquire', (time.perf_counter() - t_start) / n_images)
+
+                if not self.processing_inplace:
+                    slots = self.camera.copy_images_into(self.frame_pool, [self.process_out_of_place(image) for image in images])
+                    if len(slots) == 0:
+                        return
+                elif self.processor_chain.is_enabled:
+                    for slot in slots:
+                        t_start = time.perf_counter()
+                        self.processor_chain.process_inplace(self.frame_pool.frames[slot])
+                        latency.record('process', time.perf_counter() - t_start)
+
                 # show an image every other timepoint to prevent GUI freezing in long acquisitions
                 if self.cur_image % self.camera_display_temporal_subsampling == 0:
-                    self.frame_queue_display.append(images[0].T[::-1]) # push the first image into the display queue
+                    # copy the raw frame into an alternating display buffer (contiguous copy), the frame slot is reused once it is written.
+                    # The display gets an oriented view, the orientation is applied when the GUI renders the image.
+                    display_buffer = self.display_buffers[(self.cur_image // self.camera_display_temporal_subsampling) % 2]
+                    np.copyto(display_buffer, self.frame_pool.frames[slots[0]])
+                    self.frame_queue_display.append(MESOSPIM_ORIENTATION.apply(display_buffer)) # push the first image into the display queue
                     self.sig_camera_frame.emit() # signal the GUI to update the display
-                # tell the image writer to write the images in queue
-                self.sig_write_images.emit(acq, acq_list)
-                self.cur_image += len(images)
+                for slot in slots:
+                    self.frame_pool.push(slot) # hand the frames over to the image writer consumer thread
+                self.cur_image += len(slots)
+
+    def process_out_of_place(self, image):
+        '''Processes a camera frame with a processor chain which changes the frame shape or dtype,
+        the processed frame is converted to the dtype of the frame pool'''
+        t_start = time.perf_counter()
+        image = self.processor_chain.process(image)
+        if image.dtype != self.frame_pool.dtype:
+            image = count_domain_to_uint16(image)
+        self.frame_pool.latency.record('process', time.perf_counter() - t_start)
+        return image
 
     @QtCore.pyqtSlot(Acquisition, AcquisitionList)
     def end_image_series(self, acq, acq_list):
@@ -213,6 +264,7 @@ class mesoSPIM_Camera(QtCore.QObject):
         self.end_time = time.time()
         framerate = (self.cur_image + 1)/(self.end_time - self.start_time)
         logger.info(f'Camera: Framerate: {framerate:.2f}')
+        logger.info(f'Camera: Frame pool stats: {self.frame_pool.stats}')
         self.sig_finished.emit()
         self.sig_end_image_series_done.emit()
 
@@ -220,7 +272,7 @@ class mesoSPIM_Camera(QtCore.QObject):
     @log_cpu_core
     def snap_image(self, write_flag=True):
         """"Snap an image and display it"""
-        image = self.camera.get_image().T[::-1]
+        image = MESOSPIM_ORIENTATION.apply(self.camera.get_image())
         
         if self.processor_chain.is_enabled:
             image = self.processor_chain.process(image)
@@ -245,7 +297,7 @@ class mesoSPIM_Camera(QtCore.QObject):
     def get_live_image(self):
         images = self.camera.get_live_image()
         for image in images:
-            processed_image = image.T[::-1]
+            processed_image = MESOSPIM_ORIENTATION.apply(image)
             
             if self.processor_chain.is_enabled:
                 processed_image = self.processor_chain.process(processed_image)
@@ -331,6 +383,26 @@ class mesoSPIM_GenericCamera(QtCore.QObject):
         '''Should return a single numpy array'''
         pass
 
+    def get_images_in_series_into(self, frame_pool):
+        '''Copies the new images of the series into free slots of the frame pool and returns the list of slots.
+        Blocks while the pool is full (back-pressure from the image writer).
+        Drivers which can write into a buffer directly, or hand out a view of their own buffer,
+        should override this to avoid the allocation of get_images_in_series().'''
+        return self.copy_images_into(frame_pool, self.get_images_in_series())
+
+    def copy_images_into(self, frame_pool, images):
+        '''Copies images of the frame shape, or flat buffers of the same size, into free slots of the frame pool
+        and returns the list of slots. Blocks while the pool is full.'''
+        slots = []
+        for image in images:
+            slot = frame_pool.acquire(timeout=FRAME_POOL_TIMEOUT_S)
+            if slot is None:
+                logger.error(f'Frame pool full for {FRAME_POOL_TIMEOUT_S} s, frame dropped')
+                continue
+            np.copyto(frame_pool.frames[slot], image.reshape(frame_pool.shape))
+            slots.append(slot)
+        return slots
+
     def close_image_series(self):
         pass
 
@@ -351,47 +423,95 @@ class mesoSPIM_GenericCamera(QtCore.QObject):
 class mesoSPIM_DemoCamera(mesoSPIM_GenericCamera):
     '''Software-only camera driver for use without physical hardware.
 
-    Generates synthetic sinusoidal fringe images so that the GUI, image
-    writer, and acquisition-sequencing logic can be exercised without a
-    physical camera.  Used for development, demos, and CI/testing.
+    Images a synthetic 3D phantom (beads, fibres, tissue-like texture) at the current
+    stage position, focus, zoom, laser and intensity, with defocus blur, shot and read noise,
+    so that the GUI, image writer, processors, autofocus and tiling can be exercised
+    with meaningful images. Frames are served from a cache of rendered states (see utils/phantom.py).
+    Used for development, demos, and CI/testing.
     '''
     def __init__(self, parent):
         super().__init__(parent)
-
-        self.count = 0
-
-        self.line = np.linspace(0,6*np.pi,self.x_pixels)
-        self.line = 400*np.sin(self.line)+1200
+        self.phantom = None
+        self.frame_cache = None
 
     def open_camera(self):
+        self.phantom = SyntheticPhantom()
+        cache_MB = self.cfg.demo_camera_cache_MB if hasattr(self.cfg, 'demo_camera_cache_MB') else 256
+        self.frame_cache = PhantomFrameCache(self.phantom, max_bytes=cache_MB * 2**20)
         logger.info('Initialized Demo Camera')
 
     def close_camera(self):
+        if self.frame_cache is not None:
+            logger.info(f'Demo Camera frame cache: {self.frame_cache.stats}')
+            self.frame_cache.clear()
         logger.info('Closed Demo Camera')
-    
-    def set_binning(self, binning_string):
-        self.x_binning = int(binning_string[0])
-        self.y_binning = int(binning_string[2])
-        self.x_pixels = int(self.x_pixels / self.x_binning)
-        self.y_pixels = int(self.y_pixels / self.y_binning)
-        ''' Changing the number of pixels also affects the random image, so we need to update self.line '''
-        self.line = np.linspace(0,6*np.pi,self.x_pixels)
-        self.line = 400*np.sin(self.line)+1200
-        self.state['camera_binning'] = str(self.x_binning)+'x'+str(self.y_binning)
 
-    def _create_random_image(self):
-        data = np.array([np.roll(self.line, 4*i + self.count) for i in range(0, self.y_pixels)], dtype='uint16')
-        self.count += 20
-        return data
+    def _create_phantom_image(self):
+        '''Read-only frame of the phantom at the current imaging state'''
+        position, zoom, laser, intensity, exposure_time = self.state.get_parameter_list(['position', 'zoom', 'laser', 'intensity', 'camera_exposure_time'])
+        pixel_um = self.cfg.pixelsize[zoom] if zoom in self.cfg.pixelsize else self.x_pixel_size_in_microns
+        counts = min(40.0 * intensity * exposure_time / 0.02, 60000.0)
+        return self.frame_cache.get_frame(position, laser, (self.y_pixels, self.x_pixels), pixel_um * self.x_binning, counts)
 
     def get_images_in_series(self):
-        return [self._create_random_image()]
+        return [self._create_phantom_image()]
 
     def get_image(self):
-        return self._create_random_image()
+        return self._create_phantom_image()
 
     def get_live_image(self):
-        return [self._create_random_image()]
+        return [self._create_phantom_image()]
+
+
+class mesoSPIM_ReplayCamera(mesoSPIM_GenericCamera):
+    '''Software-only camera driver which plays back a recorded dataset (TIFF, RAW, OME-Zarr or BDV HDF5).
+
+    Frames are read ahead by a reader thread from the memory-mapped or lazily opened file
+    and delivered at the configured frame rate and jitter, so that processors and image writers
+    see production load with real image statistics. The dataset is played in a loop.
+
+    camera_parameters: 'replay_path', and optionally 'frame_rate' (fps), 'jitter_ms',
+    'read_ahead' (frames), 'replay_setup' (view of a BDV HDF5 file), 'replay_tile' (tile of an OME-Zarr container).
+    '''
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.stream = None
+
+    def open_camera(self):
+        parameters = self.cfg.camera_parameters
+        self.stream = ReplayStream(parameters['replay_path'],
+                                   frame_rate=parameters.get('frame_rate', None),
+                                   jitter_ms=parameters.get('jitter_ms', 0.0),
+                                   read_ahead=parameters.get('read_ahead', 16),
+                                   setup=parameters.get('replay_setup', 0),
+                                   tile=parameters.get('replay_tile', None))
+        if self.stream.frame_shape != (self.y_pixels, self.x_pixels):
+            raise ValueError(f'Replay dataset frames {self.stream.frame_shape} do not match '
+                             f'camera_parameters (y_pixels, x_pixels) = {(self.y_pixels, self.x_pixels)}')
+        self.stream.start()
+        logger.info(f'Initialized Replay Camera: {self.stream.path}')
+
+    def close_camera(self):
+        if self.stream is not None:
+            logger.info(f'Replay Camera stats: {self.stream.stats}')
+            self.stream.close()
+        logger.info('Closed Replay Camera')
+
+    def set_binning(self, binning_string):
+        logger.warning('Replay Camera: binning is not supported, frames are played as recorded')
+
+    def get_images_in_series(self):
+        return [self.stream.next_frame()]
+
+    def get_image(self):
+        return self.stream.next_frame()
+
+    def get_live_image(self):
+        return [self.stream.next_frame()]
+
+    def close_image_series(self):
+        logger.info(f'Replay Camera stats: {self.stream.stats}')
+        self.stream.reset_stats()
 
 
 class mesoSPIM_HamamatsuCamera(mesoSPIM_GenericCamera):
@@ -490,6 +610,11 @@ class mesoSPIM_HamamatsuCamera(mesoSPIM_GenericCamera):
         images = [np.reshape(aframe.getData(), (-1,self.x_pixels)) for aframe in frames]
         return images
 
+    def get_images_in_series_into(self, frame_pool):
+        '''The frames are copied straight from the recycled DCAM buffers into the frame pool, before DCAM reuses the buffers'''
+        [frames, _] = self.hcam.getFrames()
+        return self.copy_images_into(frame_pool, [aframe.getData() for aframe in frames])
+
     def close_image_series(self):
         self.hcam.stopAcquisition()
 
@@ -652,6 +777,11 @@ class mesoSPIM_PhotometricsCamera(mesoSPIM_GenericCamera):
         # print('Exp Time in series:', self.pvcam.exp_time)
         frame , _ , _ = self.pvcam.poll_frame()
         return [frame['pixel_data']]
+
+    def get_images_in_series_into(self, frame_pool):
+        ''' With copyData=False poll_frame returns a view of the PVCAM buffer instead of a new array, it is copied into the frame pool '''
+        frame , _ , _ = self.pvcam.poll_frame(copyData=False)
+        return self.copy_images_into(frame_pool, [frame['pixel_data']])
     
     def close_image_series(self):
         logger.debug("Calling self.pvcam.finish()")
@@ -8,6 +8,7 @@ import platform
 import io
 import traceback
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import logging
 logger = logging.getLogger(__name__)
 
@@ -29,12 +30,15 @@ from .mesoSPIM_Camera import mesoSPIM_Camera
 
 from .devices.lasers.Demo_LaserEnabler import Demo_LaserEnabler
 from .devices.lasers.mesoSPIM_LaserEnabler import mesoSPIM_LaserEnabler
+from .devices.daq import simulated_nidaqmx
 
 from .mesoSPIM_Serial import mesoSPIM_Serial
-from .mesoSPIM_WaveFormGenerator import mesoSPIM_WaveFormGenerator, mesoSPIM_DemoWaveFormGenerator
+from .mesoSPIM_WaveFormGenerator import mesoSPIM_WaveFormGenerator, mesoSPIM_DemoWaveFormGenerator, mesoSPIM_SimulatedWaveFormGenerator
 from .mesoSPIM_ImageWriter import mesoSPIM_ImageWriter
 
 from .utils.acquisitions import AcquisitionList, Acquisition
+from .utils.frame_pool import FramePool
+from .utils.device_operations import DeviceOperationGraph
 from .utils.utility_functions import convert_seconds_to_string, format_data_size, write_line, replace_with_underscores, log_cpu_core
 
 
@@ -88,14 +92,15 @@ class mesoSPIM_Core(QtCore.QObject):
         super().__init__()
 
         ''' Assign the parent class to a instance variable for callbacks '''
-        self.parent = parent # mesoSPIM_MainWindow class
+        self.parent = parent # mesoSPIM_MainWindow or mesoSPIM_HeadlessController class
         self.package_directory = self.parent.package_directory
         self.cfg = self.parent.cfg
 
         self.state = self.parent.state # mesoSPIM_StateSingleton class
         self.state['state'] = 'init'
 
-        self.frame_queue = deque([])
+        # preallocated frames between Camera and ImageWriter threads, the camera waits if the pool is full
+        self.frame_pool = FramePool(depth=self.cfg.frame_pool_depth if hasattr(self.cfg, 'frame_pool_depth') else 128)
         self.frame_queue_display = deque([], maxlen=1)    
 
         ''' The signal-slot switchboard '''
@@ -122,11 +127,12 @@ class mesoSPIM_Core(QtCore.QObject):
         self.sig_update_gui_from_shutter_state.connect(self.parent.update_GUI_by_shutter_state, type=QtCore.Qt.QueuedConnection)
 
         self.camera_thread = QtCore.QThread()
-        self.camera_worker = mesoSPIM_Camera(parent=self, frame_queue=self.frame_queue, frame_queue_display=self.frame_queue_display)
+        self.camera_worker = mesoSPIM_Camera(parent=self, frame_pool=self.frame_pool, frame_queue_display=self.frame_queue_display)
         self.camera_worker.moveToThread(self.camera_thread)
         self.camera_worker.sig_update_gui_from_state.connect(self.sig_update_gui_from_state.emit)
         self.camera_worker.sig_status_message.connect(self.send_status_message_to_gui)
-        self.camera_worker.sig_camera_frame.connect(self.parent.camera_window.update_image_from_deque)
+        if hasattr(self.parent, 'camera_window'): # no display in headless mode
+            self.camera_worker.sig_camera_frame.connect(self.parent.camera_window.update_image_from_deque)
         # Use QueuedConnection instead of BlockingQueuedConnection to avoid blocking the Core
         # thread while Camera/ImageWriter finish cleanup. The Core polls for completion via
         # _wait_for_end_image_series() which keeps processEvents() alive.
@@ -135,15 +141,13 @@ class mesoSPIM_Core(QtCore.QObject):
         self.camera_worker.sig_end_image_series_done.connect(self._on_camera_end_image_series_done, type=QtCore.Qt.QueuedConnection)
 
         self.image_writer_thread = QtCore.QThread()
-        self.image_writer = mesoSPIM_ImageWriter(self, self.frame_queue)
+        self.image_writer = mesoSPIM_ImageWriter(self, self.frame_pool)
         self.image_writer.moveToThread(self.image_writer_thread)
         self.sig_write_metadata.connect(self.image_writer.write_metadata, type=QtCore.Qt.BlockingQueuedConnection)
         self.sig_end_image_series.connect(self.image_writer.end_acquisition, type=QtCore.Qt.QueuedConnection)
         self.sig_stop_aquisition.connect(self.image_writer.abort_writing, type=QtCore.Qt.QueuedConnection)
         self.image_writer.sig_end_acquisition_done.connect(self._on_writer_end_acquisition_done, type=QtCore.Qt.QueuedConnection)
 
-        self.camera_worker.sig_write_images.connect(self.image_writer.write_images, type=QtCore.Qt.QueuedConnection)
-
         #self.serial_thread = QtCore.QThread() # The serial_worker remains in the Core thread, not separate thread for serial_worker
         self.serial_worker = mesoSPIM_Serial(self)
         # self.serial_worker.moveToThread(self.serial_thread) #legacy
@@ -174,6 +178,8 @@ class mesoSPIM_Core(QtCore.QObject):
             self.waveformer = mesoSPIM_WaveFormGenerator(self)
         elif self.cfg.waveformgeneration == 'DemoWaveFormGeneration':
             self.waveformer = mesoSPIM_DemoWaveFormGenerator(self)
+        elif self.cfg.waveformgeneration == 'Simulated':
+            self.waveformer = mesoSPIM_SimulatedWaveFormGenerator(self)
 
         self.waveformer.sig_update_gui_from_state.connect(self.sig_update_gui_from_state.emit)
         # Signals from Core
@@ -200,10 +206,14 @@ class mesoSPIM_Core(QtCore.QObject):
         self.state['max_laser_voltage'] = self.cfg.startup['max_laser_voltage']
 
         ''' Setting the laser enabler up '''
+        # laser_blanking = 'hardware': enable lines are part of the waveformer sample stream, no software switching
+        self.laser_blanking_hardware = hasattr(self.cfg, 'laser_blanking') and self.cfg.laser_blanking == 'hardware'
         if self.cfg.laser in ('NI', 'cDAQ'):
-            self.laserenabler = mesoSPIM_LaserEnabler(self.cfg.laserdict)
+            self.laserenabler = mesoSPIM_LaserEnabler(self.cfg.laserdict, hardware_timed=self.laser_blanking_hardware)
+        elif self.cfg.laser == 'Simulated':
+            self.laserenabler = mesoSPIM_LaserEnabler(self.cfg.laserdict, hardware_timed=self.laser_blanking_hardware, daq=simulated_nidaqmx)
         elif 'demo' in self.cfg.laser.lower():
-            self.laserenabler = Demo_LaserEnabler(self.cfg.laserdict)
+            self.laserenabler = Demo_LaserEnabler(self.cfg.laserdict, hardware_timed=self.laser_blanking_hardware)
 
         self.state['current_framerate'] = self.cfg.startup['average_frame_rate']
         self.state['snap_folder'] = self.cfg.startup['snap_folder']
@@ -220,6 +230,18 @@ class mesoSPIM_Core(QtCore.QObject):
             self.TTL_mode_enabled_in_cfg = self.read_config_parameter('ttl_motion_enabled', self.cfg.asi_parameters)
         else: # Default all other stages to TTL False
             self.TTL_mode_enabled_in_cfg = False
+        # Hardware-timed stacks need TTL-triggered Z/F steps, serial moves between planes are not possible
+        self.hardware_timed_stacks = self.cfg.hardware_timed_stacks if hasattr(self.cfg, 'hardware_timed_stacks') else False
+        if self.hardware_timed_stacks and not self.TTL_mode_enabled_in_cfg:
+            logger.warning("Config: 'hardware_timed_stacks' requires an ASI stage with 'ttl_motion_enabled', falling back to per-plane triggering.")
+            self.hardware_timed_stacks = False
+        # Next tile's moves overlap with camera/writer finalize of the previous tile
+        self.pipelined_tile_transitions = self.cfg.pipelined_tile_transitions if hasattr(self.cfg, 'pipelined_tile_transitions') else False
+        self.pending_close_acq = None # acquisition whose camera/writer finalize has not been waited for yet
+        self.pending_close_timing_info = None
+        # Rotation+stages, filter wheel and zoom move at the same time in prepare_acquisition
+        self.concurrent_device_preparation = self.cfg.concurrent_device_preparation if hasattr(self.cfg, 'concurrent_device_preparation') else False
+        self.device_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='mesoSPIM_device') if self.concurrent_device_preparation else None
 
         self.metadata_file = None
         # self.acquisition_list_rotation_position = {}
@@ -242,10 +264,13 @@ class mesoSPIM_Core(QtCore.QObject):
         Make sure to keep this up to date with the number of threads
         '''
         try:
+            self.laserenabler.close()
             self.camera_thread.quit()
             self.camera_thread.wait()
             self.image_writer_thread.quit()
             self.image_writer_thread.wait()
+            if self.device_executor is not None:
+                self.device_executor.shutdown(wait=True)
         except:
             pass
 
@@ -398,7 +423,7 @@ class mesoSPIM_Core(QtCore.QObject):
             self.visual_mode()
 
     def stop(self):
-        """Abort any ongoing acquisition, reset state to ``'idle'``, and clear the frame queue.
+        """Abort any ongoing acquisition, reset state to ``'idle'``, and clear the frame pool.
 
         Note: sig_finished is NOT emitted here.  Each acquisition/live loop is
         responsible for emitting sig_finished on its own exit path, *after* all
@@ -413,7 +438,7 @@ class mesoSPIM_Core(QtCore.QObject):
         self.sig_polling_stage_position_start.emit()
         self.state['state'] = 'idle'
         self.sig_update_gui_from_state.emit()
-        self.frame_queue.clear() # clear the frame queue
+        self.frame_pool.clear() # discard frames not written yet
 
 
 #    @QtCore.pyqtSlot(bool)
@@ -475,7 +500,8 @@ class mesoSPIM_Core(QtCore.QObject):
         self.send_status_message_to_gui('Setting magnification (zoom) to '+str(zoom))
         # Move to the objective exchange position if necessary
         f_pos_old = None
-        self.parent.ZoomComboBox.setEnabled(False)
+        if hasattr(self.parent, 'ZoomComboBox'):
+            self.parent.ZoomComboBox.setEnabled(False)
         if 'f_objective_exchange' in self.cfg.stage_parameters.keys():
             self.sig_warning.emit('Please wait until the zoom change is complete')
             f_pos_old = self.state['position']['f_pos']
@@ -490,7 +516,8 @@ class mesoSPIM_Core(QtCore.QObject):
             self.send_status_message_to_gui('Moving to the focus position')
             self.move_absolute({'f_abs': f_pos_old}, wait_until_done=wait_until_done, use_internal_position=True)
         self.send_status_message_to_gui('Magnification (zoom) changed')
-        self.parent.ZoomComboBox.setEnabled(True)
+        if hasattr(self.parent, 'ZoomComboBox'):
+            self.parent.ZoomComboBox.setEnabled(True)
         if update_etl:
             self.sig_state_request.emit({'set_etls_according_to_zoom': zoom})
         
@@ -529,6 +556,15 @@ class mesoSPIM_Core(QtCore.QObject):
         else:
             self.sig_state_request.emit({'intensity':intensity})
 
+    def set_etl_parameters(self, acq):
+        """Send the ETL amplitudes and offsets of an acquisition in a single state request,
+        so that the waveforms are regenerated only once.
+
+        Args:
+            acq (Acquisition): Acquisition (or dict) with the ETL parameters.
+        """
+        self.sig_state_request.emit({key: acq[key] for key in ('etl_l_amplitude', 'etl_r_amplitude', 'etl_l_offset', 'etl_r_offset')})
+
     @QtCore.pyqtSlot(float)
     def set_camera_exposure_time(self, time):
         """Forward a new exposure time (in seconds) to the waveform generator state.
@@ -692,9 +728,12 @@ class mesoSPIM_Core(QtCore.QObject):
         self.waveformer.stop_tasks()
         self.waveformer.close_tasks()
 
-    def prepare_image_series(self):
-        '''Prepares an image series without waveform update'''
-        self.waveformer.create_tasks()
+    def prepare_image_series(self, n_sweeps=1):
+        '''Prepares an image series without waveform update
+
+        With n_sweeps > 1 the tasks play the whole series after a single master trigger (hardware-timed stack).
+        '''
+        self.waveformer.create_tasks(n_sweeps=n_sweeps)
         self.waveformer.write_waveforms_to_tasks()
 
     @log_cpu_core
@@ -724,17 +763,28 @@ class mesoSPIM_Core(QtCore.QObject):
         Starts the camera in live mode, streams frames to the camera window
         via ``frame_queue_display``, and drives NI-DAQ waveforms repeatedly
         until :meth:`stop` sets ``self.stopflag = True``.
+
+        The DAQmx tasks are created once and retriggered for every frame; the AO
+        buffers are only rewritten when the waveforms changed (e.g. ETL tuning in the GUI).
         """
         self.stopflag = False
         self.sig_prepare_live.emit()
         laser = self.state['laser']
-        laser_blanking = False if (hasattr(self.cfg, 'laser_blanking') and (self.cfg.laser_blanking in ('stack', 'stacks'))) else True
+        laser_blanking = False if (hasattr(self.cfg, 'laser_blanking') and (self.cfg.laser_blanking in ('stack', 'stacks', 'hardware'))) else True
         self.laserenabler.enable(laser)
+        persistent_tasks = self.waveformer.start_live_tasks()
         while self.stopflag is False:
             ''' How to handle a possible shutter switch?'''
             self.open_shutters()
-            ''' Needs update to use snap image in series '''
-            self.snap_image(laser_blanking)
+            if persistent_tasks:
+                self.waveformer.update_live_tasks()
+                if laser_blanking:
+                    self.laserenabler.enable(self.state['laser'])
+                self.waveformer.run_live_tasks()
+                if laser_blanking:
+                    self.laserenabler.disable_all()
+            else:
+                self.snap_image(laser_blanking)
             self.sig_get_live_image.emit()
 
 #            while self.pauseflag is True:
@@ -743,6 +793,7 @@ class mesoSPIM_Core(QtCore.QObject):
 
             QtWidgets.QApplication.processEvents()
 
+        self.waveformer.stop_live_tasks()
         self.laserenabler.disable_all()
         self.close_shutters()
         self.sig_end_live.emit()
@@ -824,27 +875,20 @@ class mesoSPIM_Core(QtCore.QObject):
         Check if the motion limits of the stage are violated for each acquisition in the given list.
 
         Args:
-            acq_list (list): A list of dictionaries representing acquisitions, where each dictionary contains
-                             the x, y, and z positions.
+            acq_list (AcquisitionList): The acquisitions to check, using the x_pos, y_pos, z_start and z_end columns.
 
         Returns:
             list: A list of indices of acquisitions in the input list that violate the motion limits.
 
         """
-        unsafe_list = []
-        for i in range(len(acq_list)):
-            if not (self.cfg.stage_parameters['x_min'] <= acq_list[i]['x_pos'] - self.serial_worker.stage.int_x_pos_offset <= self.cfg.stage_parameters['x_max']):
-                unsafe_list.append(i)
-            elif not (self.cfg.stage_parameters['y_min'] <= acq_list[i]['y_pos'] - self.serial_worker.stage.int_y_pos_offset <= self.cfg.stage_parameters['y_max']):
-                unsafe_list.append(i)
-            elif not (self.cfg.stage_parameters['z_min'] <= acq_list[i]['z_start'] - self.serial_worker.stage.int_z_pos_offset <= self.cfg.stage_parameters['z_max']):
-                unsafe_list.append(i)
-            elif not (self.cfg.stage_parameters['z_min'] <= acq_list[i]['z_end'] - self.serial_worker.stage.int_z_pos_offset <= self.cfg.stage_parameters['z_max']):
-                unsafe_list.append(i)
-            else:
-                continue
-        return unsafe_list
-            
+        stage = self.serial_worker.stage
+        limits = self.cfg.stage_parameters
+        # limits in the acquisition list coordinates (stage coordinates + internal offsets)
+        return acq_list.get_rows_outside_limits(
+            x_range=(limits['x_min'] + stage.int_x_pos_offset, limits['x_max'] + stage.int_x_pos_offset),
+            y_range=(limits['y_min'] + stage.int_y_pos_offset, limits['y_max'] + stage.int_y_pos_offset),
+            z_range=(limits['z_min'] + stage.int_z_pos_offset, limits['z_max'] + stage.int_z_pos_offset))
+
     def prepare_acquisition_list(self, acq_list):
         ''' Housekeeping: Prepare the acquisition list '''
         self.image_count = 0
@@ -859,6 +903,8 @@ class mesoSPIM_Core(QtCore.QObject):
         For each :class:`~mesoSPIM.src.utils.acquisitions.Acquisition`, calls
         :meth:`prepare_acquisition`, :meth:`run_acquisition`, and
         :meth:`close_acquisition` sequentially, unless ``self.stopflag`` is set.
+        With ``pipelined_tile_transitions``, the camera/writer finalize of a stack
+        overlaps with the moves to the next one (see :meth:`finish_pending_close`).
 
         Args:
             acq_list (AcquisitionList): The list of acquisitions to execute.
@@ -868,6 +914,7 @@ class mesoSPIM_Core(QtCore.QObject):
                 self.prepare_acquisition(acq, acq_list)
                 self.run_acquisition(acq, acq_list)
                 self.close_acquisition(acq, acq_list)
+        self.finish_pending_close()
 
     def close_acquisition_list(self, acq_list):
         self.sig_status_message.emit('Closing Acquisition List')
@@ -883,18 +930,16 @@ class mesoSPIM_Core(QtCore.QObject):
             self._move_absolute_responsive(acq_list.get_startpoint())
             self.sig_polling_stage_position_start.emit()  # resume asking stages about their position
 
-            self.set_filter(acq_list[0]['filter'])
-            self.set_laser(acq_list[0]['laser'], wait_until_done=False, update_etl=False)
-            if self.state['zoom'] != acq_list[0]['zoom']:
-                self.set_zoom(acq_list[0]['zoom'], update_etl=False)
-            ''' This is for the GUI to update properly'''
-            QtWidgets.QApplication.processEvents()
+            with self.waveformer.state_transaction():
+                self.set_filter(acq_list[0]['filter'])
+                self.set_laser(acq_list[0]['laser'], wait_until_done=False, update_etl=False)
+                if self.state['zoom'] != acq_list[0]['zoom']:
+                    self.set_zoom(acq_list[0]['zoom'], update_etl=False)
+                ''' This is for the GUI to update properly'''
+                QtWidgets.QApplication.processEvents()
 
-            self.sig_state_request.emit({'etl_l_amplitude' : acq_list[0]['etl_l_amplitude']})
-            self.sig_state_request.emit({'etl_r_amplitude' : acq_list[0]['etl_r_amplitude']})
-            self.sig_state_request.emit({'etl_l_offset' : acq_list[0]['etl_l_offset']})
-            self.sig_state_request.emit({'etl_r_offset' : acq_list[0]['etl_r_offset']})
-            self.set_intensity(acq_list[0]['intensity'])
+                self.set_etl_parameters(acq_list[0])
+                self.set_intensity(acq_list[0]['intensity'])
             time.sleep(0.1) # tiny sleep period to allow Main Window indicators to catch up
             self.sig_finished.emit()
             self.send_status_message_to_gui('Acquisition list closed')
@@ -978,19 +1023,17 @@ class mesoSPIM_Core(QtCore.QObject):
         self.sig_status_message.emit('Going to start position')
         self.move_absolute(startpoint, wait_until_done=False)
 
-        self.sig_status_message.emit('Setting Shutter')
-        self.set_shutterconfig(acq['shutterconfig'])
-        self.sig_status_message.emit('Setting Zoom & Laser')
-        if self.state['zoom'] != acq['zoom']:
-            self.sig_status_message.emit('Setting magnification (zoom)')
-            self.set_zoom(acq['zoom'], update_etl=False)
-        self.set_intensity(acq['intensity'], wait_until_done=False)
-        self.set_laser(acq['laser'], wait_until_done=False, update_etl=False)
-
-        self.sig_state_request.emit({'etl_l_amplitude' : acq['etl_l_amplitude']})
-        self.sig_state_request.emit({'etl_r_amplitude' : acq['etl_r_amplitude']})
-        self.sig_state_request.emit({'etl_l_offset' : acq['etl_l_offset']})
-        self.sig_state_request.emit({'etl_r_offset' : acq['etl_r_offset']})
+        with self.waveformer.state_transaction():
+            self.sig_status_message.emit('Setting Shutter')
+            self.set_shutterconfig(acq['shutterconfig'])
+            self.sig_status_message.emit('Setting Zoom & Laser')
+            if self.state['zoom'] != acq['zoom']:
+                self.sig_status_message.emit('Setting magnification (zoom)')
+                self.set_zoom(acq['zoom'], update_etl=False)
+            self.set_intensity(acq['intensity'], wait_until_done=False)
+            self.set_laser(acq['laser'], wait_until_done=False, update_etl=False)
+
+            self.set_etl_parameters(acq)
 
         self.sig_status_message.emit('Ready for preview...')
         self.sig_update_gui_from_state.emit()
@@ -1009,29 +1052,37 @@ class mesoSPIM_Core(QtCore.QObject):
         # stop asking stages about their positions, to avoid messing up serial comm during acquisition. Position polling runs in MainWindow GUI thread, not in Core thread!
         self.sig_polling_stage_position_stop.emit()
         self.sig_status_message.emit('Going to start position')
-        ''' Check if sample has to be rotated, allow some tolerance '''
-        if current_rotation > target_rotation+0.1 or current_rotation < target_rotation-0.1:
-            self.move_absolute({'theta_abs': target_rotation}, wait_until_done=True)
-        
-        self.move_absolute(startpoint, wait_until_done=True)
-        self.serial_worker.stage.report_position() # Last Position update before acquisition starts for proper tile view display, directly from the Core thread
-        self.sig_status_message.emit('Setting Filter & Shutter')
-        self.set_shutterconfig(acq['shutterconfig'])
-        self.set_filter(acq['filter'], wait_until_done=True)
-        if self.state['zoom'] != acq['zoom']:
-            self.sig_status_message.emit('Setting magnification (zoom)')
-            self.set_zoom(acq['zoom'], update_etl=False)
-        self.set_intensity(acq['intensity'], wait_until_done=True)
-        self.set_laser(acq['laser'], wait_until_done=True, update_etl=False)
-        ''' This is for the GUI to update properly'''
-        QtWidgets.QApplication.processEvents()
+        # all waveform parameter changes of the tile transition regenerate the waveforms once, at the end of the transaction
+        regenerations = self.waveformer.task_stats['waveform_regenerations']
+        with self.waveformer.state_transaction():
+            ''' Check if sample has to be rotated, allow some tolerance '''
+            rotate = current_rotation > target_rotation+0.1 or current_rotation < target_rotation-0.1
+            if self.concurrent_device_preparation:
+                self.prepare_devices_concurrently(acq, startpoint, rotate)
+            else:
+                if rotate:
+                    self.move_absolute({'theta_abs': target_rotation}, wait_until_done=True)
+
+                self.move_absolute(startpoint, wait_until_done=True)
+                self.serial_worker.stage.report_position() # Last Position update before acquisition starts for proper tile view display, directly from the Core thread
+                self.sig_status_message.emit('Setting Filter & Shutter')
+                self.set_shutterconfig(acq['shutterconfig'])
+                self.set_filter(acq['filter'], wait_until_done=True)
+                if self.state['zoom'] != acq['zoom']:
+                    self.sig_status_message.emit('Setting magnification (zoom)')
+                    self.set_zoom(acq['zoom'], update_etl=False)
+                self.set_intensity(acq['intensity'], wait_until_done=True)
+                self.set_laser(acq['laser'], wait_until_done=True, update_etl=False)
+            ''' This is for the GUI to update properly'''
+            QtWidgets.QApplication.processEvents()
 
-        self.sig_state_request.emit({'etl_l_amplitude' : acq['etl_l_amplitude']})
-        self.sig_state_request.emit({'etl_r_amplitude' : acq['etl_r_amplitude']})
-        self.sig_state_request.emit({'etl_l_offset' : acq['etl_l_offset']})
-        self.sig_state_request.emit({'etl_r_offset' : acq['etl_r_offset']})
+            self.set_etl_parameters(acq)
+        logger.info(f"Tile transition: {self.waveformer.task_stats['waveform_regenerations'] - regenerations} waveform regeneration(s)")
         self.f_step_generator = acq.get_focus_stepsize_generator()
 
+        # Dependency barrier of the pipelined mode: the previous stack must be closed before the camera and writer are prepared
+        self.finish_pending_close()
+
         if self.TTL_mode_enabled_in_cfg is True:
             ''' The relative movement has to be carried out once with the ASI-controller '''
             self.move_relative(acq.get_delta_z_and_delta_f_dict(inverted=True))
@@ -1044,9 +1095,70 @@ class mesoSPIM_Core(QtCore.QObject):
         self.sig_status_message.emit('Preparing camera: Allocating memory')
         self.sig_prepare_image_series.emit(acq, acq_list) # signal to the Camera
         self.image_writer.prepare_acquisition(acq, acq_list)
-        self.prepare_image_series()
+        self.prepare_image_series(acq.get_image_count() if self.hardware_timed_stacks else 1)
         self.sig_write_metadata.emit(acq, acq_list)
 
+    def prepare_devices_concurrently(self, acq, startpoint, rotate):
+        """Move the stages, filter wheel and zoom of an acquisition at the same time.
+
+        The serial devices run in ``self.device_executor`` threads, with the rotation
+        always finished before the XYZ move starts. Devices sharing a serial port (see
+        ``get_serial_ports``) are moved one after the other. Shutter, intensity and laser settings
+        are applied to the waveform generator in the Core thread meanwhile.
+        With ``f_objective_exchange`` configured, the zoom change needs the focus stage
+        and runs after the stage moves, as in the sequential mode.
+
+        Args:
+            acq (Acquisition): Acquisition to prepare.
+            startpoint (dict): Absolute start position of the acquisition.
+            rotate (bool): Whether the sample has to be rotated first.
+        """
+        self.sig_status_message.emit('Going to start position, setting filter & zoom')
+        t_start = time.time()
+        zoom_change = self.state['zoom'] != acq['zoom']
+        zoom_needs_stage = 'f_objective_exchange' in self.cfg.stage_parameters.keys()
+        ports = self.get_serial_ports()
+        graph = DeviceOperationGraph(self.device_executor)
+        if rotate:
+            graph.add('rotation', self.serial_worker.move_absolute, {'theta_abs': startpoint['theta_abs']}, wait_until_done=True,
+                      port=ports['stages'])
+        graph.add('stages', self.serial_worker.move_absolute, startpoint, wait_until_done=True, after=('rotation',) if rotate else (),
+                  port=ports['stages'])
+        graph.add('filter', self.serial_worker.set_filter, acq['filter'], wait_until_done=True, port=ports['filter'])
+        if zoom_change and not zoom_needs_stage:
+            graph.add('zoom', self.serial_worker.set_zoom, acq['zoom'], wait_until_done=True, port=ports['zoom'])
+        self.set_shutterconfig(acq['shutterconfig'])
+        self.set_intensity(acq['intensity'], wait_until_done=True)
+        self.set_laser(acq['laser'], wait_until_done=True, update_etl=False)
+        durations = graph.wait()
+        logger.info(f'Concurrent device preparation took {time.time() - t_start:.2f} s, device times (s): '
+                    f'{ {name: round(duration, 2) for name, duration in durations.items()} }')
+        if zoom_change:
+            if zoom_needs_stage:
+                self.set_zoom(acq['zoom'], update_etl=False)
+            else:
+                self.waveformer.state_request_handler({'zoom': acq['zoom']}) # galvo amplitude rescaling
+        self.serial_worker.stage.report_position() # Last Position update before acquisition starts for proper tile view display, directly from the Core thread
+
+    def get_serial_ports(self):
+        """Serial ports of the stages, filter wheel and zoom, as configured.
+
+        Returns:
+            dict: 'stages', 'filter' and 'zoom' -> COM port, None if the device has no
+            serial port of its own in the config (demo devices, PI and ZWO over USB).
+        """
+        stage_type = self.cfg.stage_parameters['stage_type'].lower()
+        filterwheel_type = self.cfg.filterwheel_parameters['filterwheel_type']
+        zoom_type = self.cfg.zoom_parameters['zoom_type']
+        ports = {'stages': None, 'filter': None, 'zoom': None}
+        if 'asi' in stage_type or stage_type == 'mixed':
+            ports['stages'] = self.cfg.asi_parameters['COMport']
+        if filterwheel_type in ('Ludl', 'Dynamixel', 'Sutter'):
+            ports['filter'] = self.cfg.filterwheel_parameters['COMport']
+        if zoom_type in ('Dynamixel', 'Mitu', 'Mitutoyo'):
+            ports['zoom'] = self.cfg.zoom_parameters['COMport']
+        return ports
+
     def run_acquisition(self, acq, acq_list):
         """Execute a single acquisition: start waveforms, trigger the camera, and collect frames.
 
@@ -1068,67 +1180,115 @@ class mesoSPIM_Core(QtCore.QObject):
         move_dict = acq.get_delta_dict()
         laser = self.state['laser']
         self.laserenabler.enable(laser) # counter-intuitively the TTL laser enabler is slow here. Starts well before and ends well after actual AO waveforms.
-        laser_blanking = False if (hasattr(self.cfg, 'laser_blanking') and (self.cfg.laser_blanking in ('stack', 'stacks'))) else True
-        for i in range(steps):
-            if self.stopflag is True:
-                self.close_image_series()
-                self._camera_end_done = False
-                self._writer_end_done = False
-                self.sig_end_image_series.emit(acq, acq_list)
-                self._wait_for_end_image_series()
-                break
-            else:
-                self.snap_image_in_series(laser_blanking)
-                self.sig_add_images_to_image_series.emit(acq, acq_list)
-
-                if not self.state['ttl_movement_enabled_during_acq']:
-                    # Z and F moves via serial commands at each plane
-                    f_step = self.f_step_generator.__next__()
-                    if f_step != 0:
-                        move_dict.update({'f_rel':f_step})
-                    else: # clear key if no F-step is required
-                        move_dict.pop('f_rel', None)
-
-                    logger.debug(f"move_dict: {{{', '.join([f'{k!r}: {v:.3f}' if isinstance(v, (int, float)) else f'{k!r}: {v!r}' for k, v in move_dict.items()])}}}")
-                    self.move_relative(move_dict)
-
+        laser_blanking = False if (hasattr(self.cfg, 'laser_blanking') and (self.cfg.laser_blanking in ('stack', 'stacks', 'hardware'))) else True
+        if self.hardware_timed_stacks:
+            self.run_hardware_timed_stack(acq, acq_list, steps)
+        else:
+            for i in range(steps):
+                if self.stopflag is True:
+                    self.abort_image_series(acq, acq_list)
+                    break
                 else:
-                    logger.debug(f'Z and F steps of ASI stages triggered by TTL')
-
-                ''' The pauseflag allows:
-                    - pausing running acquisitions
-                    - wait for slow hardware to catch up (e.g. slow stages)
-                '''
-#                while self.pauseflag is True:
-#                    time.sleep(0.02)
-#                    QtWidgets.QApplication.processEvents()
+                    self.snap_image_in_series(laser_blanking)
+                    self.sig_add_images_to_image_series.emit(acq, acq_list)
+
+                    if not self.state['ttl_movement_enabled_during_acq']:
+                        # Z and F moves via serial commands at each plane
+                        f_step = self.f_step_generator.__next__()
+                        if f_step != 0:
+                            move_dict.update({'f_rel':f_step})
+                        else: # clear key if no F-step is required
+                            move_dict.pop('f_rel', None)
+
+                        logger.debug(f"move_dict: {{{', '.join([f'{k!r}: {v:.3f}' if isinstance(v, (int, float)) else f'{k!r}: {v!r}' for k, v in move_dict.items()])}}}")
+                        self.move_relative(move_dict)
+
+                    else:
+                        logger.debug(f'Z and F steps of ASI stages triggered by TTL')
+
+                    ''' The pauseflag allows:
+                        - pausing running acquisitions
+                        - wait for slow hardware to catch up (e.g. slow stages)
+                    '''
+#                    while self.pauseflag is True:
+#                        time.sleep(0.02)
+#                        QtWidgets.QApplication.processEvents()
                 
-                QtWidgets.QApplication.processEvents(QtCore.QEventLoop.AllEvents, 50)
-                self.image_count += 1
-
-                ''' Keep track of passed time and predict remaining time '''
-                time_passed = time.time() - self.start_time
-                time_remaining = time_passed / self.image_count * (self.total_image_count - self.image_count)
-
-                ''' Every 100 images, update the frame rate'''
-                if self.image_count % 100 == 0:
-                    self.state['current_framerate'] = self.image_count / time_passed
-
-                if (self.image_count % 5 == 0) or (self.image_count == self.total_image_count):
-                    self.send_progress(self.acquisition_count,
-                                    self.total_acquisition_count,
-                                    i + 1,
-                                    steps,
-                                    self.total_image_count,
-                                    self.image_count,
-                                    convert_seconds_to_string(time_passed),
-                                    convert_seconds_to_string(time_remaining))
+                    QtWidgets.QApplication.processEvents(QtCore.QEventLoop.AllEvents, 50)
+                    self.update_image_progress(i, steps)
         self.laserenabler.disable_all()
+        self.laserenabler.log_switch_stats()
         self.image_acq_end_time = time.time()
         self.image_acq_end_time_string = time.strftime("%Y%m%d-%H%M%S")
 
         self.close_shutters()
 
+    def run_hardware_timed_stack(self, acq, acq_list, steps):
+        '''Plays the whole stack as one hardware-timed sequence of sweeps.
+
+        The NI tasks were created for `steps` sweeps in prepare_acquisition(), a single master
+        trigger starts them and the stage steps on its TTL input. The Core only hands
+        completed frames to the camera thread and watches the stopflag.
+        Laser blanking between images is not possible in this mode, the lasers stay enabled for the stack.
+        If no sweep completes until the deadline (the remaining sweeps plus a margin, reset on every
+        completed sweep), the master trigger or the stage TTL is missing and the acquisition is stopped.
+        '''
+        stall_margin_s = 5.0
+        self.waveformer.start_stack_tasks()
+        frames_done = 0
+        deadline = time.perf_counter() + steps * self.state['sweeptime'] + stall_margin_s
+        while frames_done < steps:
+            if self.stopflag is True:
+                self.abort_image_series(acq, acq_list)
+                break
+            completed = self.waveformer.get_completed_sweeps()
+            if completed > frames_done:
+                deadline = time.perf_counter() + (steps - completed) * self.state['sweeptime'] + stall_margin_s
+            elif time.perf_counter() > deadline:
+                msg = (f'Hardware-timed stack stalled after {frames_done} of {steps} planes - stopping! \n'
+                       'Check the master trigger and the stage TTL wiring.')
+                logger.error(msg)
+                self.sig_warning.emit(msg)
+                self.stop()
+                self.abort_image_series(acq, acq_list)
+                break
+            for i in range(frames_done, completed):
+                self.sig_add_images_to_image_series.emit(acq, acq_list)
+                self.update_image_progress(i, steps)
+            frames_done = completed
+            QtWidgets.QApplication.processEvents(QtCore.QEventLoop.AllEvents, 50)
+            time.sleep(0.25*self.state['sweeptime'])
+
+    def abort_image_series(self, acq, acq_list):
+        '''Stops the running image series after the stopflag was set'''
+        self.close_image_series()
+        self._camera_end_done = False
+        self._writer_end_done = False
+        self.sig_end_image_series.emit(acq, acq_list)
+        self._wait_for_end_image_series()
+
+    def update_image_progress(self, i, steps):
+        '''Counts one acquired image and sends the progress to the GUI every 5 images'''
+        self.image_count += 1
+
+        ''' Keep track of passed time and predict remaining time '''
+        time_passed = time.time() - self.start_time
+        time_remaining = time_passed / self.image_count * (self.total_image_count - self.image_count)
+
+        ''' Every 100 images, update the frame rate'''
+        if self.image_count % 100 == 0:
+            self.state['current_framerate'] = self.image_count / time_passed
+
+        if (self.image_count % 5 == 0) or (self.image_count == self.total_image_count):
+            self.send_progress(self.acquisition_count,
+                            self.total_acquisition_count,
+                            i + 1,
+                            steps,
+                            self.total_image_count,
+                            self.image_count,
+                            convert_seconds_to_string(time_passed),
+                            convert_seconds_to_string(time_remaining))
+
     def close_acquisition(self, acq, acq_list):
         """Finalise a single acquisition: flush the image series, collect timing, and increment the counter.
 
@@ -1140,12 +1300,14 @@ class mesoSPIM_Core(QtCore.QObject):
             acq_list (AcquisitionList): Full list being executed.
         """
         self.sig_status_message.emit('Closing Acquisition: Saving data & freeing up memory')
+        pipelined = self.pipelined_tile_transitions and self.stopflag is False
         if self.stopflag is False:
             self.close_image_series()
             self._camera_end_done = False
             self._writer_end_done = False
             self.sig_end_image_series.emit(acq, acq_list)
-            self._wait_for_end_image_series()
+            if not pipelined:
+                self._wait_for_end_image_series()
 
         if self.TTL_mode_enabled_in_cfg is True:
             self.sig_state_request.emit({'ttl_movement_enabled_during_acq' : False})
@@ -1156,9 +1318,26 @@ class mesoSPIM_Core(QtCore.QObject):
         self.acq_end_time = time.time()
         self.acq_end_time_string = time.strftime("%Y%m%d-%H%M%S")
         self.state['current_framerate'] = acq.get_image_count() / (self.image_acq_end_time - self.image_acq_start_time)
-        self.append_timing_info_to_metadata(acq)
+        if pipelined:
+            # camera and writer finalize in their threads while the next tile is prepared
+            self.pending_close_acq = acq
+            self.pending_close_timing_info = self.get_timing_info()
+        else:
+            self.append_timing_info_to_metadata(acq)
         self.acquisition_count += 1
 
+    def finish_pending_close(self):
+        """Pipelined mode: wait until Camera and ImageWriter have closed the previous stack,
+        then append its timing info to the metadata. Does nothing if no stack is pending."""
+        if self.pending_close_acq is None:
+            return
+        acq = self.pending_close_acq
+        self.pending_close_acq = None
+        t_start = time.time()
+        self._wait_for_end_image_series()
+        logger.info(f'Pipelined tile transition: waited {time.time() - t_start:.2f} s for the previous stack to be closed')
+        self.append_timing_info_to_metadata(acq, self.pending_close_timing_info)
+
     @QtCore.pyqtSlot(str)
     def execute_script(self, script):
         """Execute a user-provided Python script string inside the Core event loop.
@@ -1208,8 +1387,7 @@ class mesoSPIM_Core(QtCore.QObject):
         """
         old_l_amp = self.state['etl_l_amplitude']
         old_r_amp = self.state['etl_r_amplitude']
-        self.sig_state_request.emit({'etl_l_amplitude' : 0})
-        self.sig_state_request.emit({'etl_r_amplitude' : 0})
+        self.sig_state_request.emit({'etl_l_amplitude' : 0, 'etl_r_amplitude' : 0})
         time.sleep(0.05)
 
         self.sig_prepare_live.emit()
@@ -1231,8 +1409,7 @@ class mesoSPIM_Core(QtCore.QObject):
 
         self.sig_finished.emit()
 
-        self.sig_state_request.emit({'etl_l_amplitude' : old_l_amp})
-        self.sig_state_request.emit({'etl_r_amplitude' : old_r_amp})
+        self.sig_state_request.emit({'etl_l_amplitude' : old_l_amp, 'etl_r_amplitude' : old_r_amp})
 
     def execute_galil_program(self):
         '''Little helper method to execute the program loaded onto the Galil stage:
@@ -1272,23 +1449,32 @@ class mesoSPIM_Core(QtCore.QObject):
         else:
             return dictionary[key]
 
-    def append_timing_info_to_metadata(self, acq):
+    def get_timing_info(self):
+        '''Returns the timing information of the last stack, as written to the metadata file'''
+        return {'Started stack': self.acq_start_time_string,
+                'Started taking images': self.image_acq_start_time_string,
+                'Stopped taking images': self.image_acq_end_time_string,
+                'Stopped stack': self.acq_end_time_string,
+                'Total time of taking images, s': str(round(self.image_acq_end_time - self.image_acq_start_time, 2)),
+                'Total time of stack acquisition, s': str(round(self.acq_end_time - self.acq_start_time, 2)),
+                'Frame rate during taking images, img/s:': str(round(self.state['current_framerate'], 2)),
+                }
+
+    def append_timing_info_to_metadata(self, acq, timing_info=None):
         '''
         Appends a metadata.txt file
         Path contains the file to be written
+        timing_info: dict from get_timing_info(), default: timing of the last stack
         '''
+        if timing_info is None:
+            timing_info = self.get_timing_info()
         metadata_path = self.image_writer.writer.metadata_file
         # path = acq['folder'] + '/' + replace_with_underscores(acq['filename'])
         # metadata_path = os.path.dirname(path) + '/' + os.path.basename(path) + '_meta.txt'
         with open(metadata_path, 'a') as file:
             write_line(file, 'TIMING INFORMATION')
-            write_line(file, 'Started stack', self.acq_start_time_string)
-            write_line(file, 'Started taking images', self.image_acq_start_time_string)
-            write_line(file, 'Stopped taking images', self.image_acq_end_time_string)
-            write_line(file, 'Stopped stack', self.acq_end_time_string)
-            write_line(file, 'Total time of taking images, s', str(round(self.image_acq_end_time - self.image_acq_start_time, 2)))
-            write_line(file, 'Total time of stack acquisition, s', str(round(self.acq_end_time - self.acq_start_time, 2)))
-            write_line(file, 'Frame rate during taking images, img/s:', str(round(self.state['current_framerate'], 2)))
+            for key, value in timing_info.items():
+                write_line(file, key, value)
             write_line(file, '===================== END OF ACQUISITION ======================')
             write_line(file)
 
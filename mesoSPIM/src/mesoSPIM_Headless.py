@@ -0,0 +1,204 @@
+'''
+mesoSPIM_Headless.py
+========================================
+
+Headless acquisition runner for scripted, unattended and benchmark runs.
+
+mesoSPIM_HeadlessController takes the place of the mesoSPIM_MainWindow as the parent of the
+mesoSPIM_Core: it owns the state and the Core thread and provides the signals and slots the
+Core connects to, but creates no widgets. The Core builds the camera, image writer, serial
+and waveform workers as usual, frames are written but not displayed.
+
+Usage (see mesoSPIM_Control.py):
+    python mesoSPIM_Control.py --demo --headless acq_table.csv --summary summary.json
+'''
+import os
+import json
+import time
+import logging
+logger = logging.getLogger(__name__)
+
+from PyQt5 import QtCore
+
+from .mesoSPIM_State import mesoSPIM_StateSingleton
+from .mesoSPIM_Core import mesoSPIM_Core
+from .mesoSPIM_ProcessorChain import ProcessorChain
+from .utils.acquisitions import AcquisitionList
+from .utils.pipeline_stats import peak_rss_bytes
+
+
+class mesoSPIM_HeadlessController(QtCore.QObject):
+    '''Runs acquisition lists on a mesoSPIM_Core without a GUI.
+
+    Args:
+        package_directory (str): mesoSPIM package directory
+        config (module): microscope configuration
+    '''
+    sig_state_request = QtCore.pyqtSignal(dict)
+    sig_execute_script = QtCore.pyqtSignal(str)
+    sig_move_relative = QtCore.pyqtSignal(dict)
+    sig_move_absolute = QtCore.pyqtSignal(dict)
+    sig_zero_axes = QtCore.pyqtSignal(list)
+    sig_unzero_axes = QtCore.pyqtSignal(list)
+    sig_stop_movement = QtCore.pyqtSignal()
+    sig_load_sample = QtCore.pyqtSignal()
+    sig_unload_sample = QtCore.pyqtSignal()
+    sig_center_sample = QtCore.pyqtSignal()
+    sig_save_etl_config = QtCore.pyqtSignal()
+    sig_run_time_lapse = QtCore.pyqtSignal(int, int)
+    sig_stop_time_lapse = QtCore.pyqtSignal()
+    sig_done = QtCore.pyqtSignal(dict) # summary of the finished acquisition list
+
+    def __init__(self, package_directory, config):
+        super().__init__()
+        self.cfg = config
+        self.package_directory = package_directory
+
+        self.state = mesoSPIM_StateSingleton()
+        self.state.set_parameters(self.cfg.startup)
+        self.state['galvo_amp_scale_w_zoom'] = self.cfg.scale_galvo_amp_with_zoom if hasattr(self.cfg, 'scale_galvo_amp_with_zoom') else False
+
+        self.acq_list = None
+        self.running = False
+        self.warnings = []
+        self.progress = {}
+        self.summary = None
+
+        t_start = time.perf_counter()
+        self.core_thread = QtCore.QThread()
+        self.core = mesoSPIM_Core(self.cfg, self)
+        self.core.moveToThread(self.core_thread)
+        self.core.waveformer.moveToThread(self.core_thread)
+        self.core.serial_worker.moveToThread(self.core_thread)
+        self.sig_move_absolute.connect(self.core.move_absolute, type=QtCore.Qt.QueuedConnection)
+
+        self.core.sig_finished.connect(self.finished)
+        self.core.sig_progress.connect(self.update_progress)
+        self.core.sig_warning.connect(self.display_warning)
+        self.core.sig_status_message.connect(self.display_status_message)
+        self._load_processor_chain_config()
+
+        self.core_thread.start(QtCore.QThread.HighestPriority)
+        self.startup_time = time.perf_counter() - t_start
+        logger.info(f'Headless: Core started in {self.startup_time:.2f} s')
+
+    def _load_processor_chain_config(self):
+        '''Loads the processor chain from processor_chain.json next to the config file, as the main window does'''
+        config_dir = os.path.dirname(self.cfg.__file__)
+        config = ProcessorChain.load_from_file(os.path.join(config_dir, 'processor_chain.json'))
+        if config:
+            self.core.camera_worker.processor_chain.set_config(config)
+            logger.info(f'Headless: processor chain loaded: {config}')
+
+    def load_table(self, path):
+        '''Loads an acquisition table saved by the Acquisition Manager (csv)'''
+        acq_list = AcquisitionList.load_csv(path)
+        if len(acq_list) == 0:
+            raise ValueError(f'Acquisition table {path} has no acquisitions')
+        logger.info(f'Headless: {len(acq_list)} acquisitions loaded from {path}')
+        return acq_list
+
+    def run_acquisition_list(self, acq_list):
+        '''Starts the acquisition list, sig_done is emitted with the summary when the Core has finished'''
+        self.acq_list = acq_list
+        self.warnings = []
+        self.progress = {}
+        self.summary = None
+        self.state['acq_list'] = acq_list
+        self.state['selected_row'] = -1
+        self.core.frame_pool.reset_run()
+        self.running = True
+        self.t_start = time.perf_counter()
+        self.sig_state_request.emit({'state': 'run_acquisition_list'})
+
+    def stop(self):
+        if self.running:
+            logger.warning('Headless: stop requested')
+            self.warnings.append('Stopped by the user')
+            self.sig_state_request.emit({'state': 'idle'})
+
+    @QtCore.pyqtSlot()
+    def finished(self):
+        if not self.running:
+            return
+        self.running = False
+        duration = time.perf_counter() - self.t_start
+        expected = self.acq_list.get_image_count()
+        images = self.core.image_count if hasattr(self.core, 'image_count') else 0
+        frame_pool = self.core.frame_pool
+        latency = frame_pool.latency
+        frames_written = latency.count('write')
+        # sustained frame rate: from the first acquired to the last written frame, without the device preparation
+        if frame_pool.first_acquired_at is not None and frame_pool.last_written_at is not None:
+            prep_time = frame_pool.first_acquired_at - self.t_start
+            acquisition_time = frame_pool.last_written_at - frame_pool.first_acquired_at
+        else:
+            prep_time, acquisition_time = duration, 0.0
+        self.summary = {
+            'success': images == expected and frames_written == expected and frame_pool.dropped == 0 and not self.warnings,
+            'acquisitions': len(self.acq_list),
+            'images': images,
+            'expected_images': expected,
+            'frames_written': frames_written,
+            'dropped': frame_pool.dropped,
+            'duration_s': round(duration, 3),
+            'prep_s': round(prep_time, 3),
+            'acquisition_s': round(acquisition_time, 3),
+            'framerate': round(frames_written / acquisition_time, 3) if acquisition_time > 0 else 0.0,
+            'startup_s': round(self.startup_time, 3),
+            'stalls': latency.count('stall'),
+            'stall_time_s': round(float(latency.values('stall').sum()), 3),
+            'latency': latency.percentiles(),
+            'peak_rss_MB': round(peak_rss_bytes() / 2**20, 1),
+            'processor_chain': [p['name'] for p in self.core.camera_worker.processor_chain.chain if p['enabled']],
+            'files': self.acq_list.get_all_filenames(),
+            'warnings': self.warnings,
+        }
+        logger.info(f'Headless: acquisition list finished: {self.summary}')
+        self.sig_done.emit(self.summary)
+
+    @QtCore.pyqtSlot(dict)
+    def update_progress(self, dict):
+        self.progress = dict
+        logger.debug(f"Headless: image {dict['image_counter']} of {dict['total_image_count']}, remaining {dict['remaining_time_string']}")
+
+    @QtCore.pyqtSlot(str)
+    def display_warning(self, string):
+        logger.warning(f'Headless: {string}')
+        self.warnings.append(string)
+
+    @QtCore.pyqtSlot(str)
+    def display_status_message(self, string):
+        if string:
+            logger.debug(f'Headless: {string}')
+
+    @QtCore.pyqtSlot(int)
+    def run_timepoint(self, timepoint):
+        logger.info(f'Headless: time point {timepoint}')
+        self.run_acquisition_list(self.acq_list)
+
+    @QtCore.pyqtSlot()
+    def on_time_lapse_finished(self):
+        pass
+
+    @QtCore.pyqtSlot()
+    def on_time_lapse_cancelled(self):
+        pass
+
+    @QtCore.pyqtSlot()
+    def update_GUI_by_shutter_state(self):
+        pass
+
+    def close(self):
+        '''Stops the worker threads of the Core'''
+        self.core.laserenabler.close()
+        for thread in (self.core.camera_thread, self.core.image_writer_thread, self.core_thread):
+            thread.quit()
+            thread.wait()
+        if self.core.device_executor is not None:
+            self.core.device_executor.shutdown(wait=True)
+
+
+def write_summary(summary, path):
+    with open(path, 'w') as file:
+        json.dump(summary, file, indent=2)
@@ -6,6 +6,7 @@ import os
 import json
 from pathlib import Path
 import time
+import threading
 import numpy as np
 import tifffile
 import logging
@@ -15,14 +16,19 @@ from PyQt5 import QtCore
 from distutils.version import StrictVersion
 from .utils.acquisitions import AcquisitionList, Acquisition
 from .utils.utility_functions import write_line, gb_size_of_array_shape, replace_with_underscores, log_cpu_core, timed
-from .plugins.ImageWriterApi import WriteRequest, WriteImage, FinalizeImage
+from .plugins.ImageWriterApi import WriteRequest, WriteContext, FinalizeImage, MESOSPIM_ORIENTATION
 from .plugins.utils import get_image_writer_from_name, get_image_writer_class_from_name
 
+WRITER_POLL_TIMEOUT_S = 0.1 # max time the writer consumer waits for new frames before checking its stop/abort flags
+WRITER_END_TIMEOUT_S = 10 # max time end_acquisition waits for the remaining frames of a stack
+
 class mesoSPIM_ImageWriter(QtCore.QObject):
     """Image and metadata writer that runs in its own high-priority QThread.
 
-    Consumes raw frames pushed into ``frame_queue`` by :class:`mesoSPIM_Camera` and
+    Consumes raw frames pushed into ``frame_pool`` by :class:`mesoSPIM_Camera` and
     writes them to disk using a pluggable writer backend (TIFF, HDF5, OME-ZARR, …).
+    Frames are written by a consumer thread started in ``prepare_acquisition``, which waits on
+    the frame pool and drains all available frames in one pass (no Qt signal per frame).
     Writer backends are selected per-acquisition via the ``image_writer_plugin`` field
     of each :class:`~mesoSPIM.src.utils.acquisitions.Acquisition`.
 
@@ -30,13 +36,13 @@ class mesoSPIM_ImageWriter(QtCore.QObject):
     """
     sig_end_acquisition_done = QtCore.pyqtSignal()  # emitted after end_acquisition cleanup is complete
 
-    def __init__(self, parent, frame_queue):
+    def __init__(self, parent, frame_pool):
         '''Image and metadata writer class. Parent is mesoSPIM_Camera() object'''
         super().__init__()
 
         self.parent = parent # a mesoSPIM_Camera() object
         self.cfg = parent.cfg
-        self.frame_queue = frame_queue
+        self.frame_pool = frame_pool
 
         self.state = self.parent.state # a mesoSPIM_StateSingleton() object
         self.running_flag = self.abort_flag = False
@@ -53,6 +59,8 @@ class mesoSPIM_ImageWriter(QtCore.QObject):
 
         self.file_extension = ''
         self.active_processor_metadata = []
+        self.consumer_thread = None
+        self.consumer_stop = threading.Event()
         self.check_versions()
 
     def _get_enabled_processor_metadata(self):
@@ -150,6 +158,7 @@ class mesoSPIM_ImageWriter(QtCore.QObject):
         if acq == acq_list[0]:
             self.writer_name = acq['image_writer_plugin']
             self.writer = get_image_writer_class_from_name(self.writer_name)() # Get and init () the writer class
+            self.writer.status_callback = self.report_file_status
 
         self.active_processor_metadata = self._get_enabled_processor_metadata()
 
@@ -184,7 +193,7 @@ class mesoSPIM_ImageWriter(QtCore.QObject):
 
         write_request = WriteRequest(
             uri = self.path,
-            shape = (self.max_frame, self.y_pixels, self.x_pixels), #(z,y,x)
+            shape = (self.max_frame,) + self.frame_pool.shape, #(z,y,x), the frames after processing, see mesoSPIM_Camera.prepare_image_series()
             dtype = 'uint16',
             axes = 'ZYX',
             x_res = px_size_um,
@@ -202,76 +211,132 @@ class mesoSPIM_ImageWriter(QtCore.QObject):
             num_shutters = acq_list.get_n_shutter_configs(),
             acq = acq,
             acq_list = acq_list,
-            writer_config_file_values = writer_config_file_values
+            writer_config_file_values = writer_config_file_values,
+            orientation = MESOSPIM_ORIENTATION,
         )
 
         logger.info(f'Opening ImageWriter: {self.writer.name}')
         self.writer.open(write_request)
         self.MIP_path = self.writer.MIP_path
+        self.attach_frame_allocator()
 
         # Place holder prior to image processing plugins
         if acq['processing'] == 'MAX':
             self.tiff_mip_writer = tifffile.TiffWriter(self.MIP_path, imagej=True)
-            self.mip_image = np.zeros((self.x_pixels, self.y_pixels), 'uint16')
+            self.mip_image = np.zeros(write_request.orientation.oriented_shape(self.frame_pool.shape), 'uint16')
 
         self.cur_image_counter = 0
         self.abort_flag = False
         self.running_flag = True
         self.acq = acq
         self.acq_list = acq_list
+        # indices and resolutions are resolved once here, not for every frame
+        self.write_context = WriteContext.from_acquisition(acq, acq_list, px_size_um, orientation=write_request.orientation)
 
         logger.info(f'Save path: {write_request.uri}')
-
-    @QtCore.pyqtSlot(Acquisition, AcquisitionList)
-    def write_images(self, acq, acq_list):
-        """Write available images to disk. 
-        The actual images are passed via `self.frame_queue` from the Camera thread, NOT via the signal/slot mechanism as before,\
-             starting from v.1.10.0. This is to avoid the overhead of signal/slot mechanism and to improve performance."""
-        if self.running_flag:
-            while len(self.frame_queue) > 0:
-                logger.debug('image queue length: ' + str(len(self.frame_queue)))
-                image = self.frame_queue.popleft().T[::-1]
-                self.image_to_disk(acq, acq_list, image)
+        self.start_consumer()
+
+    def report_file_status(self, status):
+        """Publish the status of a file (tile) finished in the background by the writer backend to the GUI.
+        Called by the writer backend from any thread."""
+        if status['status'] == 'failed':
+            error = (status.get('error') or '').strip().splitlines()
+            self.parent.sig_warning.emit(f"Writing {status['name']} failed: {error[-1] if error else 'unknown error'}")
         else:
-            logger.debug('self.running_flag = False, no images written')
-    
+            self.parent.sig_status_message.emit(f"Written: {status['name']} ({status.get('frames', 0)} frames)")
+
+    def attach_frame_allocator(self):
+        """Let the camera acquire frames directly into the frame buffer of the writer backend, if it provides one
+        (``ImageWriter.frame_allocator``), so that ``write_frame`` hands the slot over instead of copying the frame."""
+        allocator = self.writer.frame_allocator() if hasattr(self.writer, 'frame_allocator') else None
+        if allocator is None:
+            return
+        if tuple(allocator.frames.shape[1:]) != self.frame_pool.shape or allocator.frames.dtype != self.frame_pool.dtype:
+            logger.warning(f'ImageWriter: frame buffer of {self.writer_name} {allocator.frames.shape} {allocator.frames.dtype} '
+                           f'does not match the camera frames {self.frame_pool.shape} {self.frame_pool.dtype}, frames are copied')
+            return
+        self.frame_pool.attach(allocator)
+
+    def start_consumer(self):
+        """Start the consumer thread which writes the frames of the current acquisition (self.acq, self.acq_list)."""
+        self.stop_consumer()
+        self.consumer_stop.clear()
+        self.consumer_thread = threading.Thread(target=self.consume_frames, name='ImageWriterConsumer', daemon=True)
+        self.consumer_thread.start()
+
+    def stop_consumer(self, timeout=None):
+        """Ask the consumer thread to finish once the frame pool is empty, and wait for it.
+        If timeout is given, first wait up to timeout seconds for the consumer to write all frames of the stack."""
+        if self.consumer_thread is None:
+            return
+        if timeout is not None:
+            self.consumer_thread.join(timeout)
+            if self.consumer_thread.is_alive():
+                logger.warning(f'ImageWriter: {self.cur_image_counter} of {self.max_frame} frames written after {timeout} s, '
+                               f'stopping the consumer')
+        self.consumer_stop.set()
+        self.consumer_thread.join()
+        self.consumer_thread = None
+
+    def consume_frames(self):
+        """Consumer loop: waits on the frame pool and writes all available frames in one pass,
+        until the stack is complete, the consumer is stopped (and the pool is empty), or writing is aborted."""
+        while self.running_flag and not self.abort_flag and self.cur_image_counter < self.max_frame:
+            slots = self.frame_pool.pop_batch(timeout=WRITER_POLL_TIMEOUT_S)
+            if slots:
+                logger.debug(f'Writing batch of {len(slots)} frames')
+                self.write_images(slots)
+            elif self.consumer_stop.is_set():
+                break
+
+    def write_images(self, slots):
+        """Write a batch of frames to disk.
+        The actual images are passed via `self.frame_pool` from the Camera thread, NOT via the signal/slot mechanism as before,\
+             starting from v.1.10.0. This is to avoid the overhead of signal/slot mechanism and to improve performance.
+        Each frame slot is released back to the pool once written, writers must not keep references to the image.
+        If the pool is attached to the frame buffer of the writer, the slot is handed over to the writer instead."""
+        for slot in slots:
+            handed_over = False
+            try:
+                if self.running_flag and not self.abort_flag:
+                    t_start = time.perf_counter()
+                    if self.frame_pool.allocator is not None:
+                        self.image_to_disk(self.acq, self.acq_list, self.frame_pool.frames[slot], slot=slot)
+                        handed_over = True
+                    else:
+                        self.image_to_disk(self.acq, self.acq_list, self.frame_pool.frames[slot])
+                    self.frame_pool.latency.record('write', time.perf_counter() - t_start)
+            finally:
+                if handed_over:
+                    self.frame_pool.hand_over(slot)
+                else:
+                    self.frame_pool.release(slot)
+
     @timed
     @log_cpu_core
-    def image_to_disk(self, acq, acq_list, image):
-        """Write a single pre-transposed frame to the open writer backend.
+    def image_to_disk(self, acq, acq_list, raw_image, slot=None):
+        """Write a single raw camera frame to the open writer backend.
 
         Args:
-            acq (Acquisition): Active acquisition descriptor (provides zoom, z_step …).
-            acq_list (AcquisitionList): Full list (provides tile/channel/rotation indices).
-            image (np.ndarray): 2-D ``uint16`` array already transposed by the caller.
+            acq (Acquisition): Active acquisition descriptor.
+            acq_list (AcquisitionList): Full list. Tile/channel/rotation indices and resolutions
+                are taken from ``self.write_context``, resolved once in ``prepare_acquisition``.
+            raw_image (np.ndarray): 2-D ``uint16`` array as delivered by the camera.
+                The orientation is passed along as metadata, the writer applies it when copying the data.
+            slot (int): slot of the writer's frame buffer holding ``raw_image``, the writer owns it after ``write_frame``.
         """
         logger.debug('image_to_disk() started')
         if self.cur_image_counter % 5 == 0:
             self.parent.sig_status_message.emit('Writing to disk...')
 
-        xy_res = (1. / self.cfg.pixelsize[acq['zoom']], 1. / self.cfg.pixelsize[acq['zoom']])
-
-        write = WriteImage(
-            image = image,
-            current_image_counter = self.cur_image_counter,
-            tile_number=acq_list.get_tile_index(acq),
-            laser=acq_list.find_value_index(acq['laser'], 'laser'),
-            shutter=acq_list.find_value_index(acq['shutterconfig'], 'shutterconfig'),
-            rot=acq_list.find_value_index(acq['rot'], 'rot'),
-            x_res=xy_res,
-            y_res=xy_res,
-            z_res=acq['z_step'],
-            unit='microns',
-            acq = acq,
-            acq_list = acq_list,
-        )
-
-        self.writer.write_frame(write)
+        write = self.write_context.write_image(raw_image, self.cur_image_counter, slot)
 
         # Place holder prior to image processing plugins
+        # Before write_frame: a slot handed over to the writer can be reused as soon as it is written
         if acq['processing'] == 'MAX':
-            np.maximum(self.mip_image, image, out=self.mip_image)
+            np.maximum(self.mip_image, write.image, out=self.mip_image)
 
+        self.writer.write_frame(write)
 
         self.cur_image_counter += 1
         logger.debug('image_to_disk() ended')
@@ -280,6 +345,8 @@ class mesoSPIM_ImageWriter(QtCore.QObject):
     def abort_writing(self):
         """Terminate writing and close all files if STOP button is pressed"""
         self.abort_flag = True
+        self.stop_consumer()
+        self.frame_pool.detach()
         if self.running_flag:
             try:
                 self.writer.abort()
@@ -309,10 +376,14 @@ class mesoSPIM_ImageWriter(QtCore.QObject):
             acq_list = acq_list,
         )
         logger.info("end_acquisition() started")
+        self.stop_consumer(timeout=WRITER_END_TIMEOUT_S)
+        self.frame_pool.detach() # the frame buffer of the writer is released by finalize
+        t_start = time.perf_counter()
         try:
             self.writer.finalize(finalize_imsge)
         except Exception as e:
             logger.error(f'{e}')
+        self.frame_pool.latency.record('finalize', time.perf_counter() - t_start)
 
         # Place holder prior to image processing plugins
         if acq['processing'] == 'MAX':
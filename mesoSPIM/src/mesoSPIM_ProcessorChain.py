@@ -249,6 +249,40 @@ class ProcessorChain:
                         logger.error(f"Error in processor {p['name']}: {e}")
             return result
     
+    def output_spec(self, shape, dtype='uint16'):
+        """
+        Probe the shape and dtype of the processed frames with a blank frame.
+
+        Stateful processors see the blank frame, call reset() afterwards.
+
+        Args:
+            shape: Shape of the input frames
+            dtype: Dtype of the input frames
+
+        Returns:
+            (shape, dtype) of the processed frames
+        """
+        with self._lock:
+            result = self.process(np.zeros(shape, dtype=dtype))
+            return tuple(result.shape), result.dtype
+
+    def process_inplace(self, image: np.ndarray) -> None:
+        """
+        Process an image in place through the enabled processors in sequence.
+        Used for frames in preallocated buffers (FramePool), the chain must keep the shape
+        and dtype of the frames, see output_spec().
+
+        Args:
+            image: Image array, modified in place
+        """
+        with self._lock:
+            for p in self._processors:
+                if p['enabled']:
+                    try:
+                        p['instance'].process_frame_inplace(image)
+                    except Exception as e:
+                        logger.error(f"Error in processor {p['name']}: {e}")
+    
     def get_config(self) -> Dict[str, Any]:
         """
         Get the current chain configuration.
@@ -78,7 +78,7 @@ class mesoSPIM_Serial(QtCore.QObject):
         elif self.cfg.zoom_parameters['zoom_type'] in ('Mitu', 'Mitutoyo'):
             self.zoom = MitutoyoZoom(self.cfg.zoomdict, self.cfg.zoom_parameters['COMport'], self.cfg.zoom_parameters['baudrate'])
         elif self.cfg.zoom_parameters['zoom_type'] in ('Demo', 'DemoZoom'):
-            self.zoom = DemoZoom(self.cfg.zoomdict)
+            self.zoom = DemoZoom(self.cfg.zoomdict, self.cfg.zoom_parameters.get('move_time_s', 0.1))
         else:
             raise ValueError(f"Zoom type unknown: {self.cfg.zoom_parameters['zoom_type']}")
 
@@ -1,11 +1,16 @@
 '''
 mesoSPIM State class. 
 Only nominally a singleton class, but actually inherited by classes from their parent class.
+
+The state is stored as copy-on-write snapshots: every write publishes a new read-only dict
+together with an incremented version number. Readers take the current snapshot without locking,
+writers are serialized by a lock and publish all parameters of a set_parameters() call at once.
 '''
 import threading
+from types import MappingProxyType
 
 import numpy as np
-from PyQt5.QtCore import QObject, pyqtSignal, QMutex, QMutexLocker
+from PyQt5.QtCore import QObject, pyqtSignal
 import logging
 logger = logging.getLogger(__name__)
 from .utils.acquisitions import AcquisitionList
@@ -16,16 +21,19 @@ class mesoSPIM_StateSingleton(QObject):
 
     Only classes which control.
 
-    Access to attributes is mutex-locked to allow access from multiple threads.
+    Reads are lock-free: they use the current immutable snapshot, see snapshot().
+    Writes are serialized and replace the snapshot (copy-on-write), so a snapshot never changes.
+    Values are shared between snapshots, they have to be replaced, not modified in place.
 
     If more than one state parameter should be set at the same time, the 
-    set_parameter 
+    set_parameters() method publishes them in one version.
+
+    Callbacks can be registered for changes of specific keys with subscribe().
     '''
 
     instance = None
     _lock = threading.Lock()
     #sig_updated = pyqtSignal()
-    mutex = QMutex()
 
     def __new__(cls, *args, **kwargs):
         if cls.instance is None:
@@ -35,7 +43,9 @@ class mesoSPIM_StateSingleton(QObject):
 
     def __init__(self):
         super().__init__()
-        self._state_dict = {
+        self._write_lock = threading.Lock()
+        self._subscribers = [] # (frozenset of keys, callback)
+        state_dict = {
                         'state' : 'init', # 'init', 'idle' , 'live', 'snap', 'running_script', 'run_acquisition_list', 'run_selected_acquisition', 'lightsheet_alignment_mode'
                         'acq_list' : AcquisitionList(),
                         'selected_row': -2,
@@ -99,57 +109,86 @@ class mesoSPIM_StateSingleton(QObject):
                         'galvo_amp_scale_w_zoom': False,
                         'moving_to_target': False, # A dirty way to know if moving with wait_untile_done=True is finished from another thread
                         }
+        self._published = (0, MappingProxyType(state_dict)) # (version, snapshot), replaced as a whole
 
     def __len__(self):
-        return len(self._state_dict) 
-    
-    def __setitem__(self, key, value):
+        return len(self._published[1])
+
+    @property
+    def version(self):
+        '''Number of published updates, increases with every write'''
+        return self._published[0]
+
+    def snapshot(self):
         '''
-        Custom __setitem__ method to allow mutexed access to 
-        a state parameter. 
+        Returns the current state as read-only mapping, which stays consistent
+        (no partial updates) while it is read. No locking is involved.
+        '''
+        return self._published[1]
+
+    def versioned_snapshot(self):
+        '''Returns (version, snapshot), read atomically'''
+        return self._published
 
-        After the state has been changed, the updated signal is emitted.
+    def __setitem__(self, key, value):
         '''
-        with QMutexLocker(self.mutex):
-            self._state_dict.__setitem__(key, value)
-            logger.debug('State changed: {} = {}'.format(key, value))
-        #self.sig_updated.emit()
+        Custom __setitem__ method: publishes a new snapshot with the changed parameter.
+        '''
+        self.set_parameters({key: value})
 
     def __getitem__(self, key):
         '''
-        Custom __getitem__ method to allow mutexed access to 
-        a state parameter.
-
-        To avoid the state being updated while a parameter is read.
+        Custom __getitem__ method: reads the parameter from the current snapshot,
+        without locking.
         '''
-
-        with QMutexLocker(self.mutex):
-            return self._state_dict.__getitem__(key)
+        return self._published[1][key]
 
     def set_parameters(self, dict):
         '''
         Sometimes, several parameters should be set at once 
-        without allowing the state being updated while a parameter is read.
+        without allowing the state being updated while a parameter is read:
+        they are published in one new snapshot (one version).
         '''
-        with QMutexLocker(self.mutex):
-            for key, value in dict.items():
-                self._state_dict.__setitem__(key, value)
+        with self._write_lock:
+            version, snapshot = self._published
+            state_dict = snapshot.copy()
+            state_dict.update(dict)
+            version += 1
+            self._published = (version, MappingProxyType(state_dict))
+            subscribers = self._subscribers
+        for key, value in dict.items():
+            logger.debug('State changed: %s = %s', key, value)
+        for keys, callback in subscribers:
+            changes = {key: value for key, value in dict.items() if key in keys}
+            if changes:
+                try:
+                    callback(changes, version)
+                except Exception as e:
+                    logger.error(f'State subscriber {callback} failed: {e}')
         #self.sig_updated.emit()
 
+    def subscribe(self, keys, callback):
+        '''
+        Registers callback(changes, version) for changes of the given keys, instead of polling them.
+        changes is a dict with the changed subscribed keys. The callback is executed in the thread
+        of the writer, after the new snapshot was published: it must be short, or emit a Qt signal.
+        '''
+        with self._write_lock:
+            self._subscribers = self._subscribers + [(frozenset(keys), callback)]
+
+    def unsubscribe(self, callback):
+        with self._write_lock:
+            self._subscribers = [(keys, cb) for keys, cb in self._subscribers if cb != callback]
+
     def get_parameter_dict(self, list):
         '''
         For a list of keys, get a state dict with the current values back.
 
-        All the values are read out under a QMutexLocker so that 
-        the state cannot be updated at the same time.
+        All the values are read from the same snapshot so that 
+        they are consistent with each other.
         '''
-        return_dict = {}
-
-        with QMutexLocker(self.mutex):
-            for key in list:
-                return_dict[key] = self._state_dict.__getitem__(key)
-        
-        return return_dict
+        snapshot = self._published[1]
+        return {key: snapshot[key] for key in list}
 
     def get_parameter_list(self, list):
         '''
@@ -157,17 +196,11 @@ class mesoSPIM_StateSingleton(QObject):
 
         This is especially useful for unpacking.
 
-        All the values are read out under a QMutexLocker so that 
-        the state cannot be updated at the same time.
+        All the values are read from the same snapshot so that 
+        they are consistent with each other.
         '''
-        return_list = []
-
-        with QMutexLocker(self.mutex):
-            for key in list:
-                return_list.append(self._state_dict.__getitem__(key))
-        
-        return return_list
+        snapshot = self._published[1]
+        return [snapshot[key] for key in list]
 
     def block_signals(self, boolean):
         self.blockSignals(boolean)
-        
\ No newline at end of file
@@ -3,21 +3,30 @@ mesoSPIM Waveform Generator - Creates and allows control of waveform generation.
 '''
 import os
 import numpy as np
-import csv
 import time
+from contextlib import contextmanager
 
 import logging
 logger = logging.getLogger(__name__)
 
 '''National Instruments Imports'''
-import nidaqmx
-from nidaqmx.constants import AcquisitionType, TaskMode
-from nidaqmx.constants import LineGrouping, DigitalWidthUnits
-from nidaqmx.types import CtrTime
+try:
+    import nidaqmx
+    from nidaqmx.constants import AcquisitionType, TaskMode
+    from nidaqmx.constants import LineGrouping, DigitalWidthUnits
+    from nidaqmx.types import CtrTime
+except ImportError: # offline: only the demo and the simulated waveform generation are available
+    nidaqmx = None
+    from .devices.daq.simulated_nidaqmx.constants import AcquisitionType, TaskMode
+    from .devices.daq.simulated_nidaqmx.constants import LineGrouping, DigitalWidthUnits
+    from .devices.daq.simulated_nidaqmx.types import CtrTime
+from .devices.daq import simulated_nidaqmx
 
 '''mesoSPIM imports'''
 from .utils.waveforms import single_pulse, tunable_lens_ramp, sawtooth, square
 from .utils.utility_functions import log_cpu_core, timed
+from .utils.waveform_cache import WaveformCache
+from .utils.etl_calibration import ETLCalibrationTable
 
 from PyQt5 import QtCore
 
@@ -29,12 +38,43 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
 
     '''
     sig_update_gui_from_state = QtCore.pyqtSignal() # -> mesoSPIM_Core.sig_update_gui_from_state -> MainWindow.update_gui_from_state
+    # state parameters which determine the AO buffers, key of the waveform cache
+    WAVEFORM_PARAMETERS = ('samplerate', 'sweeptime',
+                           'etl_l_delay_%', 'etl_l_ramp_rising_%', 'etl_l_ramp_falling_%', 'etl_l_amplitude', 'etl_l_offset',
+                           'etl_r_delay_%', 'etl_r_ramp_rising_%', 'etl_r_ramp_falling_%', 'etl_r_amplitude', 'etl_r_offset',
+                           'galvo_l_frequency', 'galvo_l_amplitude', 'galvo_l_offset', 'galvo_l_duty_cycle', 'galvo_l_phase',
+                           'galvo_r_frequency', 'galvo_r_offset', 'galvo_r_duty_cycle', 'galvo_r_phase',
+                           'laser_l_delay_%', 'laser_l_pulse_%', 'max_laser_voltage', 'intensity', 'laser', 'shutterconfig')
+    daq = nidaqmx # DAQmx module used to create the tasks
+    # DAQmx tasks in the order they are closed, None if not created
+    TASK_NAMES = ('galvo_etl_task', 'laser_task', 'galvo_etl_laser_task', 'laser_enable_task',
+                  'camera_trigger_task', 'stage_trigger_task', 'master_trigger_task')
 
     def __init__(self, parent):
         super().__init__()
+        if self.daq is None:
+            raise ImportError("nidaqmx is not installed, use waveformgeneration = 'DemoWaveFormGeneration' or 'Simulated' in the config")
         self.cfg = parent.cfg
         self.parent = parent # mesoSPIM_Core object
         self.state = self.parent.state # mesoSPIM_StateSingleton object
+        self.waveforms_dirty = True # set by create_waveforms(), cleared when the AO buffers are written
+        self.live_tasks_running = False
+        self.live_task_signature = None # parameters that require task re-creation (not just a buffer rewrite)
+        self.task_stats = {'tasks_created': 0, 'buffer_writes': 0, 'live_sweeps': 0, 'waveform_regenerations': 0}
+        self.state_transaction_depth = 0 # > 0 while state changes are batched, see state_transaction()
+        self.waveform_update_pending = False
+        # laser enable lines generated as a hardware-timed DO stream, together with the AO waveforms
+        self.laser_blanking_hardware = hasattr(self.cfg, 'laser_blanking') and self.cfg.laser_blanking == 'hardware'
+        # 1 or 2 DAQ cards for AO waveform generation, determines the layout of the AO buffers
+        ah = self.cfg.acquisition_hardware
+        self.ao_cards = 1 if ah['galvo_etl_task_line'].split('/')[-2] == ah['laser_task_line'].split('/')[-2] else 2
+        # write-ready AO buffers of recently used parameter sets
+        cache_MB = self.cfg.waveform_cache_MB if hasattr(self.cfg, 'waveform_cache_MB') else 64
+        self.waveform_cache = WaveformCache(max_bytes=cache_MB * 2**20)
+        self.ao_buffers = None
+        # ETL calibration csv, loaded once and reloaded only when the file changes
+        self.etl_calibration = None
+        self.interpolate_etl_parameters = self.cfg.interpolate_etl_parameters if hasattr(self.cfg, 'interpolate_etl_parameters') else False
         self.parent.sig_save_etl_config.connect(self.save_etl_parameters_to_csv)
         cfg_file = self.parent.read_config_parameter('ETL_cfg_file', self.cfg.startup)
         self.state['ETL_cfg_file'] = cfg_file
@@ -86,8 +126,34 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
         else:
             logger.debug('No rescaling of galvo amplitude')
 
+    @contextmanager
+    def state_transaction(self):
+        '''Batches state changes: within the transaction, waveform updates are only marked as pending
+        and the waveforms are regenerated at most once, when the outermost transaction ends.
+
+        Usage:
+            with waveformer.state_transaction():
+                ...state requests...
+        '''
+        self.state_transaction_depth += 1
+        try:
+            yield
+        finally:
+            self.state_transaction_depth -= 1
+            if self.state_transaction_depth == 0 and self.waveform_update_pending:
+                self.create_waveforms()
+
+    def request_waveform_update(self):
+        '''Regenerates the waveforms, or marks them as pending if a state transaction is open'''
+        if self.state_transaction_depth > 0:
+            self.waveform_update_pending = True
+        else:
+            self.create_waveforms()
+
     @QtCore.pyqtSlot(dict)
     def state_request_handler(self, dict):
+        '''All keys of one request are applied before the waveforms are regenerated (once)'''
+        update_waveforms = False
         for key, value in zip(dict.keys(), dict.values()):
             logger.debug(f"state change: {key}: {value}")
             if key in ('samplerate',
@@ -125,11 +191,11 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
                        'shutterconfig',
                        ):
                 self.state[key] = value
-                self.create_waveforms() # no GUI update feeding back, one-way signal from the GUI to the hardware
+                update_waveforms = True # no GUI update feeding back, one-way signal from the GUI to the hardware
             elif key == 'zoom':
                 self.state[key] = value
                 self.rescale_galvo_amplitude_by_zoom(float(value.split('x')[0])) # truncate and convert string eg '1.2x BlahBlah' -> 1.2
-                self.create_waveforms()
+                update_waveforms = True
             elif key == 'ETL_cfg_file':
                 self.state[key] = value
                 self.update_etl_parameters_from_csv(value, self.state['laser'], self.state['zoom']) # feeding back state change to the GUI
@@ -139,15 +205,27 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
                 self.update_etl_parameters_from_laser(value) # feeding back state change to the GUI
             else:
                 pass
+        if update_waveforms:
+            self.request_waveform_update()
 
     def create_waveforms(self):
         logger.info("waveforms updated")
+        self.task_stats['waveform_regenerations'] += 1
+        self.waveform_update_pending = False
         self.calculate_samples()
-        self.create_etl_waveforms()
-        self.create_galvo_waveforms()
-        '''Bundle everything'''
-        self.bundle_galvo_and_etl_waveforms()
-        self.create_laser_waveforms()
+        key = tuple(self.state.get_parameter_list(list(self.WAVEFORM_PARAMETERS)))
+        buffers = self.waveform_cache.get(key)
+        if buffers is None:
+            self.create_etl_waveforms()
+            self.create_galvo_waveforms()
+            '''Bundle everything'''
+            self.bundle_galvo_and_etl_waveforms()
+            self.create_laser_waveforms()
+            buffers = self.waveform_cache.put(key, self.bundle_ao_buffers())
+        else:
+            logger.debug("waveforms taken from cache")
+        self.set_ao_buffers(buffers)
+        self.waveforms_dirty = True
         #self.sig_update_gui_from_state.emit() # not necessary, and to minimize looping between state changes and GUI
 
     def calculate_samples(self):
@@ -252,6 +330,16 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
         self.laser_waveform_list[current_laser_index] = self.laser_template_waveform
         self.laser_waveforms = np.stack(self.laser_waveform_list)
 
+        if self.laser_blanking_hardware:
+            '''Enable line of the current laser is high only during the laser pulse'''
+            self.laser_enable_waveforms = np.zeros((len(self.cfg.laserdict), self.samples), dtype=bool)
+            self.laser_enable_waveforms[current_laser_index] = single_pulse(samplerate = samplerate,
+                                                                            sweeptime = sweeptime,
+                                                                            delay = laser_l_delay,
+                                                                            pulsewidth = laser_l_pulse,
+                                                                            amplitude = 1,
+                                                                            offset = 0) > 0
+
     def bundle_galvo_and_etl_waveforms(self):
         """ Stacks the Galvo and ETL waveforms into a numpy array adequate for
         the NI cards.
@@ -264,6 +352,29 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
                                                  self.etl_l_waveform,
                                                  self.etl_r_waveform))
 
+    def bundle_ao_buffers(self):
+        """Returns the write-ready AO buffers (float64, C-contiguous) in the channel layout
+        of the AO card(s): galvo/ETL and laser waveforms separately for 2 cards, stacked for 1 card.
+        """
+        if self.ao_cards == 2:
+            buffers = {'galvo_etl': np.ascontiguousarray(self.galvo_and_etl_waveforms, dtype=np.float64),
+                       'laser': np.ascontiguousarray(self.laser_waveforms, dtype=np.float64)}
+        else:
+            buffers = {'galvo_etl_laser': np.ascontiguousarray(np.vstack((self.galvo_and_etl_waveforms, self.laser_waveforms)), dtype=np.float64)}
+        if self.laser_blanking_hardware:
+            buffers['laser_enable'] = self.laser_enable_waveforms
+        return buffers
+
+    def set_ao_buffers(self, buffers):
+        """Makes the (cached) AO buffers current, the bundled waveform attributes become views of them"""
+        self.ao_buffers = buffers
+        if self.ao_cards == 2:
+            self.galvo_and_etl_waveforms, self.laser_waveforms = buffers['galvo_etl'], buffers['laser']
+        else:
+            self.galvo_and_etl_waveforms, self.laser_waveforms = buffers['galvo_etl_laser'][:4], buffers['galvo_etl_laser'][4:]
+        if self.laser_blanking_hardware:
+            self.laser_enable_waveforms = buffers['laser_enable']
+
     def update_etl_parameters_from_zoom(self, zoom):
         """ Little helper method: Because the mesoSPIM core is not handling
         the serial Zoom connection. """
@@ -277,6 +388,15 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
         etl_cfg_file = os.path.join(self.parent.package_directory, self.state['ETL_cfg_file'])
         self.update_etl_parameters_from_csv(etl_cfg_file, laser, zoom)
 
+    def get_etl_calibration(self, cfg_path):
+        """ Returns the ETL calibration table of the csv file, reloaded if the file was changed """
+        full_path = os.path.abspath(os.path.join(self.parent.package_directory, cfg_path))
+        if self.etl_calibration is None or self.etl_calibration.path != full_path:
+            self.etl_calibration = ETLCalibrationTable(full_path)
+        else:
+            self.etl_calibration.reload_if_changed()
+        return self.etl_calibration
+
     def update_etl_parameters_from_csv(self, cfg_path, laser, zoom):
         """ Updates the internal ETL left/right offsets and amplitudes from the
         values in the ETL csv files
@@ -289,34 +409,16 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
         ETL-Left-Amp
         ETL-Right-Offset
         ETL-Right-Amp
+
+        The file is read once into an ETLCalibrationTable, missing combinations are
+        interpolated if 'interpolate_etl_parameters' is True in the config file.
         """
-        zoom_clean = zoom.split('x')[0] + 'x' # cleanup the zoom string for backwards compatibility with existing ETL files
-        full_path = os.path.join(self.parent.package_directory, cfg_path)
-        with open(full_path) as file:
-            reader = csv.DictReader(file, delimiter=';')
-            match_found = False
-            for row in reader:
-                if row['Wavelength'] == laser and (row['Zoom'] == zoom_clean or row['Zoom'] == zoom):
-                    match_found = True
-                    # Some diagnostic tracing statements
-                    # print(row)
-                    ''' updating internal state '''
-                    etl_l_offset = float(row['ETL-Left-Offset'])
-                    etl_l_amplitude = float(row['ETL-Left-Amp'])
-                    etl_r_offset = float(row['ETL-Right-Offset'])
-                    etl_r_amplitude = float(row['ETL-Right-Amp'])
-
-                    parameter_dict = {'etl_l_offset': etl_l_offset,
-                                      'etl_l_amplitude' : etl_l_amplitude,
-                                      'etl_r_offset' : etl_r_offset,
-                                      'etl_r_amplitude' : etl_r_amplitude}
-
-                    logger.info(f'Parameters set from csv: {parameter_dict}')
-                    self.state.set_parameters(parameter_dict)
-
-        if match_found:
+        parameter_dict = self.get_etl_calibration(cfg_path).lookup(laser, zoom, interpolate=self.interpolate_etl_parameters)
+        if parameter_dict is not None:
+            logger.info(f'Parameters set from csv: {parameter_dict}')
+            self.state.set_parameters(parameter_dict)
             '''Update waveforms with the new parameters'''
-            self.create_waveforms()
+            self.request_waveform_update()
         else:
             err_message = f"Combination {laser} - {zoom} not found in ETL file. The file will be updated:\n{cfg_path}"
             self.parent.sig_warning.emit(err_message)
@@ -337,57 +439,18 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
         ETL-Right-Offset
         ETL-Right-Amp
 
-        Creates a temporary cfg file with the ending _tmp
+        The row is appended to the file, see ETLCalibrationTable.update()
         """
-
         etl_cfg_file, laser, zoom, etl_l_offset, etl_l_amplitude, etl_r_offset, etl_r_amplitude = \
         self.state.get_parameter_list(['ETL_cfg_file', 'laser', 'zoom', 'etl_l_offset', 'etl_l_amplitude', 'etl_r_offset','etl_r_amplitude'])
 
-        '''Temporary filepath'''
-        etl_cfg_file = os.path.join(self.parent.package_directory, etl_cfg_file)
-        tmp_etl_cfg_file = etl_cfg_file+'_tmp'
-        with open(etl_cfg_file,'r') as input_file, open(tmp_etl_cfg_file,'w') as outputfile:
-            reader = csv.DictReader(input_file, delimiter=';')
-            fieldnames = ['Objective',
-                          'Wavelength',
-                          'Zoom',
-                          'ETL-Left-Offset',
-                          'ETL-Left-Amp',
-                          'ETL-Right-Offset',
-                          'ETL-Right-Amp']
-
-            writer = csv.DictWriter(outputfile, fieldnames=fieldnames, dialect='excel', delimiter=';')
-            writer.writeheader()
-            match_found = False
-            for row in reader:
-                # update values if the laser and zoom are already in the file
-                if row['Wavelength'] == laser and row['Zoom'] == zoom:
-                        writer.writerow({'Objective' : '1x',
-                                         'Wavelength' : laser,
-                                         'Zoom' : zoom,
-                                         'ETL-Left-Offset' : etl_l_offset,
-                                         'ETL-Left-Amp' : etl_l_amplitude,
-                                         'ETL-Right-Offset' : etl_r_offset,
-                                         'ETL-Right-Amp' : etl_r_amplitude,
-                                         })
-                        match_found = True
-                else:
-                    # copy all other rows
-                    writer.writerow(row)
-            if not match_found:
-                writer.writerow({'Objective' : '1x',
-                                 'Wavelength' : laser,
-                                 'Zoom' : zoom,
-                                 'ETL-Left-Offset' : etl_l_offset,
-                                 'ETL-Left-Amp' : etl_l_amplitude,
-                                 'ETL-Right-Offset' : etl_r_offset,
-                                 'ETL-Right-Amp' : etl_r_amplitude,
-                                 })
-        os.remove(etl_cfg_file)
-        os.rename(tmp_etl_cfg_file, etl_cfg_file)
+        self.get_etl_calibration(etl_cfg_file).update(laser, zoom, {'etl_l_offset': etl_l_offset,
+                                                                    'etl_l_amplitude': etl_l_amplitude,
+                                                                    'etl_r_offset': etl_r_offset,
+                                                                    'etl_r_amplitude': etl_r_amplitude})
 
     @timed
-    def create_tasks(self):
+    def create_tasks(self, retriggerable=False, n_sweeps=1):
         """Creates a tasks for the mesoSPIM:
 
         These are:
@@ -400,17 +463,28 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
           be on when the camera is acquiring) and the left/right ETL waveforms.
           This task is bundled with galvo-ETL task if a single DAQmx card is used, because multifunction DAQmx devices
           can only run only 1 AO hardware-timed task at a time (https://knowledge.ni.com/KnowledgeArticleDetails?id=kA00Z0000019KWYSA2&l=en-CH)
+
+        If `retriggerable` is True, the counter and AO tasks re-arm themselves after every sweep,
+        so they can be started once and fired by repeated master trigger pulses (Live mode).
+
+        If `n_sweeps` > 1, a single master trigger starts a hardware-timed sequence of `n_sweeps` sweeps:
+        the counters emit a finite pulse train with period `sweeptime` and the AO tasks regenerate
+        their one-sweep buffer `n_sweeps` times (hardware-timed stacks).
         """
         ah = self.cfg.acquisition_hardware
+        self.task_stats['tasks_created'] += 1
+        self.n_sweeps = n_sweeps
+        for name in self.TASK_NAMES: # close_tasks() then only closes the tasks created below, even if this fails
+            setattr(self, name, None)
 
         self.calculate_samples()
         samplerate, sweeptime = self.state.get_parameter_list(['samplerate','sweeptime'])
         samples = self.samples
         camera_pulse_percent, camera_delay_percent = self.state.get_parameter_list(['camera_pulse_%','camera_delay_%'])
-        self.master_trigger_task = nidaqmx.Task()
-        self.camera_trigger_task = nidaqmx.Task()
+        self.master_trigger_task = self.daq.Task()
+        self.camera_trigger_task = self.daq.Task()
         if 'asi' in self.cfg.stage_parameters['stage_type'].lower() or self.cfg.stage_parameters['stage_type'].lower() == 'mixed':
-            self.stage_trigger_task = nidaqmx.Task()
+            self.stage_trigger_task = self.daq.Task()
 
         # Check if 1 or 2 DAQ cards are used for AO waveform generation
         self.ao_cards = 1 if ah['galvo_etl_task_line'].split('/')[-2] == ah['laser_task_line'].split('/')[-2] else 2
@@ -419,10 +493,12 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
         # ADD THIS: Close existing task if it exists
         if self.ao_cards == 1:
             # These AO tasks than must be bundled into one task if a single DAQmx card is used (e.g. PXI-6733)
-            self.galvo_etl_laser_task = nidaqmx.Task()
+            self.galvo_etl_laser_task = self.daq.Task()
         else:
-            self.galvo_etl_task = nidaqmx.Task()
-            self.laser_task = nidaqmx.Task()
+            self.galvo_etl_task = self.daq.Task()
+            self.laser_task = self.daq.Task()
+        if self.laser_blanking_hardware:
+            self.laser_enable_task = self.daq.Task()
 
         '''Housekeeping: Setting up the DO master trigger task'''
         self.master_trigger_task.do_channels.add_do_chan(ah['master_trigger_out_line'],
@@ -438,11 +514,20 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
         self.camera_delay = camera_delay_percent*0.01*sweeptime
 
         '''Housekeeping: Setting up the counter task for the camera trigger'''
-        self.camera_trigger_task.co_channels.add_co_pulse_chan_time(ah['camera_trigger_out_line'],
-                                                                    high_time=self.camera_high_time,
-                                                                    initial_delay=self.camera_delay)
+        if n_sweeps == 1:
+            self.camera_trigger_task.co_channels.add_co_pulse_chan_time(ah['camera_trigger_out_line'],
+                                                                        high_time=self.camera_high_time,
+                                                                        initial_delay=self.camera_delay)
+        else:
+            self.camera_trigger_task.co_channels.add_co_pulse_chan_time(ah['camera_trigger_out_line'],
+                                                                        high_time=self.camera_high_time,
+                                                                        low_time=sweeptime - self.camera_high_time,
+                                                                        initial_delay=self.camera_delay)
+            self.camera_trigger_task.timing.cfg_implicit_timing(sample_mode=AcquisitionType.FINITE, samps_per_chan=n_sweeps)
 
         self.camera_trigger_task.triggers.start_trigger.cfg_dig_edge_start_trig(ah['camera_trigger_source'])
+        if retriggerable: # not set otherwise, some devices do not support the property
+            self.camera_trigger_task.triggers.start_trigger.retriggerable = True
         if self.cfg.waveformgeneration == 'cDAQ':
             self.camera_trigger_task.control(TaskMode.TASK_RESERVE) # cDAQ requirement
             logger.debug("cDAQ: camera_trigger_task reserved.")
@@ -456,8 +541,15 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
             stage_delay_percent = self.parent.read_config_parameter('stage_trigger_delay_%', self.cfg.asi_parameters)
             stage_high_time = stage_trigger_pulse_percent * 0.01 * sweeptime
             stage_delay = stage_delay_percent * 0.01 * sweeptime
-            self.stage_trigger_task.co_channels.add_co_pulse_chan_time(trig_line, high_time=stage_high_time, initial_delay=stage_delay)
+            if n_sweeps == 1:
+                self.stage_trigger_task.co_channels.add_co_pulse_chan_time(trig_line, high_time=stage_high_time, initial_delay=stage_delay)
+            else:
+                self.stage_trigger_task.co_channels.add_co_pulse_chan_time(trig_line, high_time=stage_high_time,
+                                                                           low_time=sweeptime - stage_high_time, initial_delay=stage_delay)
+                self.stage_trigger_task.timing.cfg_implicit_timing(sample_mode=AcquisitionType.FINITE, samps_per_chan=n_sweeps)
             self.stage_trigger_task.triggers.start_trigger.cfg_dig_edge_start_trig(trig_source)
+            if retriggerable:
+                self.stage_trigger_task.triggers.start_trigger.retriggerable = True
             if self.cfg.waveformgeneration == 'cDAQ':
                 self.stage_trigger_task.control(TaskMode.TASK_RESERVE) # cDAQ requirement
                 logger.debug("cDAQ: stage_trigger_task reserved.")
@@ -467,8 +559,12 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
             self.galvo_etl_task.ao_channels.add_ao_voltage_chan(ah['galvo_etl_task_line'], min_val = -self.MAX_GALVO_ETL_VOLT, max_val = self.MAX_GALVO_ETL_VOLT)
             self.galvo_etl_task.timing.cfg_samp_clk_timing(rate=samplerate,
                                                        sample_mode=AcquisitionType.FINITE,
-                                                       samps_per_chan=samples)
+                                                       samps_per_chan=samples*n_sweeps)
             self.galvo_etl_task.triggers.start_trigger.cfg_dig_edge_start_trig(ah['galvo_etl_task_trigger_source'])
+            if retriggerable:
+                self.galvo_etl_task.triggers.start_trigger.retriggerable = True
+            if n_sweeps > 1:
+                self.galvo_etl_task.out_stream.output_buf_size = samples # one sweep, regenerated n_sweeps times
             if self.cfg.waveformgeneration == 'cDAQ':
                 self.galvo_etl_task.control(TaskMode.TASK_RESERVE) # cDAQ requirement
                 logger.debug("cDAQ: galvo_etl_task reserved.")
@@ -479,8 +575,12 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
                                                             max_val=self.state['max_laser_voltage'])
             self.laser_task.timing.cfg_samp_clk_timing(rate=samplerate,
                                                         sample_mode=AcquisitionType.FINITE,
-                                                        samps_per_chan=samples)
+                                                        samps_per_chan=samples*n_sweeps)
             self.laser_task.triggers.start_trigger.cfg_dig_edge_start_trig(ah['laser_task_trigger_source'])
+            if retriggerable:
+                self.laser_task.triggers.start_trigger.retriggerable = True
+            if n_sweeps > 1:
+                self.laser_task.out_stream.output_buf_size = samples
             if self.cfg.waveformgeneration == 'cDAQ':
                 self.laser_task.control(TaskMode.TASK_RESERVE) # cDAQ requirement
                 logger.debug("cDAQ: laser_task reserved.")
@@ -490,22 +590,46 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
                                                                       min_val = -self.MAX_GALVO_ETL_VOLT, max_val = self.MAX_GALVO_ETL_VOLT)
             self.galvo_etl_laser_task.timing.cfg_samp_clk_timing(rate=samplerate,
                                                        sample_mode=AcquisitionType.FINITE,
-                                                       samps_per_chan=samples)
+                                                       samps_per_chan=samples*n_sweeps)
             self.galvo_etl_laser_task.triggers.start_trigger.cfg_dig_edge_start_trig(ah['galvo_etl_task_trigger_source'])
+            if retriggerable:
+                self.galvo_etl_laser_task.triggers.start_trigger.retriggerable = True
+            if n_sweeps > 1:
+                self.galvo_etl_laser_task.out_stream.output_buf_size = samples # one sweep, regenerated n_sweeps times
             if self.cfg.waveformgeneration == 'cDAQ':
                 self.galvo_etl_laser_task.control(TaskMode.TASK_RESERVE) # cDAQ requirement
                 logger.debug("cDAQ: galvo_etl_laser_task reserved.")
 
+        '''Housekeeping: Setting up the hardware-timed DO task for the laser enable lines (laser_blanking = 'hardware')'''
+        if self.laser_blanking_hardware:
+            laserenable_lines = ','.join([self.cfg.laserdict[key] for key in sorted(self.cfg.laserdict.keys())])
+            self.laser_enable_task.do_channels.add_do_chan(laserenable_lines, line_grouping=LineGrouping.CHAN_PER_LINE)
+            self.laser_enable_task.timing.cfg_samp_clk_timing(rate=samplerate,
+                                                              sample_mode=AcquisitionType.FINITE,
+                                                              samps_per_chan=samples*n_sweeps)
+            self.laser_enable_task.triggers.start_trigger.cfg_dig_edge_start_trig(ah['laser_task_trigger_source'])
+            if retriggerable:
+                self.laser_enable_task.triggers.start_trigger.retriggerable = True
+            if n_sweeps > 1:
+                self.laser_enable_task.out_stream.output_buf_size = samples
+            if self.cfg.waveformgeneration == 'cDAQ':
+                self.laser_enable_task.control(TaskMode.TASK_RESERVE) # cDAQ requirement
+                logger.debug("cDAQ: laser_enable_task reserved.")
+
     @timed
     def write_waveforms_to_tasks(self):
         """Write the waveforms to the slave tasks"""
+        self.task_stats['buffer_writes'] += 1
+        self.waveforms_dirty = False
         if self.ao_cards == 2:
-            self.galvo_etl_task.write(self.galvo_and_etl_waveforms)
-            self.laser_task.write(self.laser_waveforms)
+            self.galvo_etl_task.write(self.ao_buffers['galvo_etl'])
+            self.laser_task.write(self.ao_buffers['laser'])
         else:
             logger.debug(f"Writing analog waveforms: self.galvo_and_etl_waveforms, min {self.galvo_and_etl_waveforms.min()}, max {self.galvo_and_etl_waveforms.max()}")
             logger.debug(f"Writing analog waveforms: self.laser_waveforms, min {self.laser_waveforms.min()}, max {self.laser_waveforms.max()}")
-            self.galvo_etl_laser_task.write(np.vstack((self.galvo_and_etl_waveforms, self.laser_waveforms)))
+            self.galvo_etl_laser_task.write(self.ao_buffers['galvo_etl_laser'])
+        if self.laser_blanking_hardware:
+            self.laser_enable_task.write(self.ao_buffers['laser_enable'])
 
     @timed
     def start_tasks(self):
@@ -522,6 +646,8 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
             self.laser_task.start()
         else:
             self.galvo_etl_laser_task.start()
+        if self.laser_blanking_hardware:
+            self.laser_enable_task.start()
 
     @timed
     def run_tasks(self):
@@ -562,6 +688,8 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
             self.laser_task.stop()
         else:
             self.galvo_etl_laser_task.stop()
+        if self.laser_blanking_hardware:
+            self.laser_enable_task.stop()
         self.camera_trigger_task.stop()
         if 'asi' in self.cfg.stage_parameters['stage_type'].lower() or self.cfg.stage_parameters['stage_type'].lower() == 'mixed':
             self.stage_trigger_task.stop()
@@ -572,30 +700,134 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
     def close_tasks(self):
         """Closes the tasks for triggering, analog and counter outputs.
         Tasks should only be closed after they are stopped.
+        Safe for partially created tasks: only the tasks that exist are closed.
         """
         logger.debug("Closing tasks started")
-        if self.ao_cards == 2:
-            self.galvo_etl_task.close()
-            self.laser_task.close()
-        else:
-            self.galvo_etl_laser_task.close()
-        self.camera_trigger_task.close()
-        if 'asi' in self.cfg.stage_parameters['stage_type'].lower() or self.cfg.stage_parameters['stage_type'].lower() == 'mixed':
-            self.stage_trigger_task.close()
-        self.master_trigger_task.close()
+        for name in self.TASK_NAMES:
+            task = getattr(self, name, None)
+            if task is None:
+                continue
+            try:
+                task.close()
+            except self.daq.errors.DaqError as e:
+                logger.warning(f"Closing {name} failed: {e}")
+            setattr(self, name, None)
         logger.debug("All tasks closed")
 
+    def start_stack_tasks(self):
+        """Starts the tasks created with `create_tasks(n_sweeps=N)` and fires the master trigger once.
+
+        Returns immediately, the whole stack is then played by the hardware.
+        Use get_completed_sweeps() to follow the progress.
+        """
+        self.start_tasks()
+        self.master_trigger_task.write([False, True, True, True, True, True, False], auto_start=True)
+        logger.info(f"Hardware-timed stack of {self.n_sweeps} sweeps started")
+
+    def get_completed_sweeps(self):
+        """Number of sweeps the AO task has fully generated since start_stack_tasks()"""
+        ao_task = self.galvo_etl_task if self.ao_cards == 2 else self.galvo_etl_laser_task
+        return min(ao_task.out_stream.total_samp_per_chan_generated // self.samples, self.n_sweeps)
+
+    def _get_live_task_signature(self):
+        """Parameters which are baked into the task timing (not the AO buffer):
+        if any of them changes, the live tasks must be re-created."""
+        return tuple(self.state.get_parameter_list(['samplerate', 'sweeptime', 'camera_pulse_%', 'camera_delay_%']))
+
+    def start_live_tasks(self):
+        """Creates, writes and starts retriggerable tasks once for the whole Live session.
+
+        Each call of run_live_tasks() then only fires the master trigger, instead of
+        creating and closing all DAQmx tasks for every frame.
+
+        Returns False if the hardware does not support retriggerable tasks,
+        in that case the caller should fall back to snap_image() per frame.
+        """
+        try: # DAQmx may report the unsupported retriggering only when the tasks are started
+            self.create_tasks(retriggerable=True)
+            self.write_waveforms_to_tasks()
+            self.start_tasks()
+        except self.daq.errors.DaqError as e:
+            logger.warning(f"Retriggerable tasks not supported, Live mode falls back to per-frame tasks: {e}")
+            self.close_tasks()
+            return False
+        self.live_task_signature = self._get_live_task_signature()
+        self.live_tasks_running = True
+        logger.info("Live tasks started")
+        return True
+
+    def update_live_tasks(self):
+        """Brings the running live tasks up to date with the current state.
+
+        The AO buffers are rewritten only if the waveforms changed since the last write,
+        the tasks are re-created only if the sample timing or camera pulse changed.
+        """
+        if not self.live_tasks_running:
+            return
+        if self._get_live_task_signature() != self.live_task_signature:
+            logger.info("Live task timing changed, re-creating tasks")
+            self.stop_live_tasks()
+            self.start_live_tasks()
+        elif self.waveforms_dirty:
+            logger.debug("Waveforms changed, rewriting AO buffers")
+            self.stop_tasks()
+            self.write_waveforms_to_tasks()
+            self.start_tasks()
+
+    def run_live_tasks(self):
+        """Fires the master trigger once and waits until the retriggered AO task has played one sweep.
+
+        Retriggerable tasks never reach the 'done' state, so instead of wait_until_done()
+        the number of generated samples is polled.
+        """
+        ao_task = self.galvo_etl_task if self.ao_cards == 2 else self.galvo_etl_laser_task
+        sweeptime = self.state['sweeptime']
+        target_samples = ao_task.out_stream.total_samp_per_chan_generated + self.samples
+        self.master_trigger_task.write([False, True, True, True, True, True, False], auto_start=True)
+        time.sleep(0.9*sweeptime)
+        deadline = time.perf_counter() + sweeptime + 1.0
+        while ao_task.out_stream.total_samp_per_chan_generated < target_samples:
+            if time.perf_counter() > deadline:
+                logger.warning("Live sweep did not finish in time, check the trigger wiring")
+                break
+            time.sleep(0.001)
+        self.task_stats['live_sweeps'] += 1
+
+    def stop_live_tasks(self):
+        """Stops and closes the live tasks"""
+        if self.live_tasks_running:
+            self.stop_tasks()
+            self.close_tasks()
+            self.live_tasks_running = False
+            logger.info(f"Live tasks closed, task stats: {self.task_stats}, waveform cache: {self.waveform_cache.stats}")
+
+
+class mesoSPIM_SimulatedWaveFormGenerator(mesoSPIM_WaveFormGenerator):
+    """Runs the DAQmx code of mesoSPIM_WaveFormGenerator on the simulated NI-DAQmx backend,
+    for timing and throughput tests without hardware. Task latencies can be set with
+    `simulated_daq_latencies` in the config, every task keeps a record of its generated buffers.
+    """
+    daq = simulated_nidaqmx
+
+    def __init__(self, parent):
+        latencies = parent.cfg.simulated_daq_latencies if hasattr(parent.cfg, 'simulated_daq_latencies') else {}
+        self.daq.system.reset(**latencies)
+        super().__init__(parent)
+
 
 class mesoSPIM_DemoWaveFormGenerator(mesoSPIM_WaveFormGenerator):
     """Demo subclass of mesoSPIM_WaveFormGenerator class
     """
+    daq = simulated_nidaqmx # not used for task creation, only so that the demo runs without nidaqmx
 
     def __init__(self, parent):
         super().__init__(parent)
 
-    def create_tasks(self):
+    def create_tasks(self, retriggerable=False, n_sweeps=1):
         """"Demo version of the actual DAQmx-based function."""
-        logger.debug("Demo: create tasks")
+        logger.debug(f"Demo: create tasks, retriggerable={retriggerable}, n_sweeps={n_sweeps}")
+        self.task_stats['tasks_created'] += 1
+        self.n_sweeps = n_sweeps
         self.calculate_samples()
         samplerate, sweeptime = self.state.get_parameter_list(['samplerate','sweeptime'])
         camera_pulse_percent, camera_delay_percent = self.state.get_parameter_list(['camera_pulse_%','camera_delay_%'])
@@ -605,7 +837,8 @@ class mesoSPIM_DemoWaveFormGenerator(mesoSPIM_WaveFormGenerator):
     def write_waveforms_to_tasks(self):
         """Demo: write the waveforms to the slave tasks """
         logger.debug("Demo: write waveforms to tasks")
-        pass
+        self.task_stats['buffer_writes'] += 1
+        self.waveforms_dirty = False
 
     def start_tasks(self):
         """Demo: starts the tasks for camera triggering and analog outputs. """
@@ -617,6 +850,22 @@ class mesoSPIM_DemoWaveFormGenerator(mesoSPIM_WaveFormGenerator):
         logger.debug("Demo: run tasks")
         time.sleep(self.state['sweeptime'])
 
+    def run_live_tasks(self):
+        """Demo: fires the master trigger of the running live tasks. """
+        logger.debug("Demo: run live tasks")
+        time.sleep(self.state['sweeptime'])
+        self.task_stats['live_sweeps'] += 1
+
+    def start_stack_tasks(self):
+        """Demo: starts the hardware-timed stack, sweeps are then counted from the start time. """
+        logger.debug(f"Demo: start stack tasks, {self.n_sweeps} sweeps")
+        self.stack_start_time = time.perf_counter()
+
+    def get_completed_sweeps(self):
+        """Demo: number of sweeps played since start_stack_tasks() """
+        completed = int((time.perf_counter() - self.stack_start_time) / self.state['sweeptime'])
+        return min(completed, self.n_sweeps)
+
     def stop_tasks(self):
         """"Demo: stop tasks"""
         logger.debug("Demo: stop tasks")
@@ -13,12 +13,14 @@ class DemoZoom(QtCore.QObject):
     '''Software-only zoom driver for use without physical hardware.
 
     All :meth:`set_zoom` calls validate the requested zoom string against
-    ``zoomdict`` and optionally sleep 100 ms to simulate settling time.
+    ``zoomdict`` and optionally sleep ``move_time_s`` to simulate the travel
+    time of a zoom body (about 1.5 s for a Dynamixel servo).
     No serial or USB connections are opened.  Used for development and testing.
     '''
-    def __init__(self, zoomdict):
+    def __init__(self, zoomdict, move_time_s=0.1):
         super().__init__()
         self.zoomdict = zoomdict
+        self.move_time_s = move_time_s
 
     def set_zoom(self, zoom, wait_until_done=True):
         """Simulate moving the zoom body to the named zoom position.
@@ -26,12 +28,12 @@ class DemoZoom(QtCore.QObject):
         Args:
             zoom (str): Zoom designation, e.g. ``'2x'``, that must be a key in
                 ``self.zoomdict``.
-            wait_until_done (bool): When ``True``, sleep 100 ms to simulate
-                a mechanical settle delay.
+            wait_until_done (bool): When ``True``, sleep ``move_time_s`` to simulate
+                the mechanical travel and settle delay.
         """
         if zoom in self.zoomdict:
             if wait_until_done:
-                time.sleep(0.1)
+                time.sleep(self.move_time_s)
    
 
 class DynamixelZoom(Dynamixel):
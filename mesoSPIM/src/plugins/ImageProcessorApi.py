@@ -71,7 +71,8 @@ class ImageProcessor(Protocol):
         """
         Process a frame in place (for processors that support it).
         
-        Default implementation calls process_frame and assigns result.
+        Default implementation calls process_frame and assigns result,
+        the result must have the shape of the frame.
         Override this for in-place processing for better performance.
         """
         result = self.process_frame(image)
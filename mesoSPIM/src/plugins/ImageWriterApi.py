@@ -23,6 +23,35 @@ class WriterCapabilities:
     supports_overwrite: bool
     streaming_safe: bool                 # tile-by-tile streaming without global state
 
+@dataclass(frozen=True)
+class FrameOrientation:
+    # Orientation of the raw camera frame relative to the saved/displayed image, carried as metadata
+    # so that frames travel untouched from the camera and the orientation is applied once, where the data is copied anyway.
+    transpose: bool = True               # swap the frame axes (y, x) -> (x, y)
+    flip_axes: Tuple[int, ...] = (0,)    # axes flipped after the transpose
+
+    def apply(self, frame: np.ndarray) -> np.ndarray:
+        """Return the oriented frame as a view of 'frame', no data is copied"""
+        if self.transpose:
+            frame = frame.T
+        if self.flip_axes:
+            frame = np.flip(frame, axis=self.flip_axes)
+        return frame
+
+    def restore(self, image: np.ndarray) -> np.ndarray:
+        """Inverse of apply(): the raw camera frame of a saved image, as a view"""
+        if self.flip_axes:
+            image = np.flip(image, axis=self.flip_axes)
+        if self.transpose:
+            image = image.T
+        return image
+
+    def oriented_shape(self, raw_shape: Tuple[int, int]) -> Tuple[int, int]:
+        return tuple(raw_shape[::-1]) if self.transpose else tuple(raw_shape)
+
+# mesoSPIM default: saved image = raw_frame.T[::-1]
+MESOSPIM_ORIENTATION = FrameOrientation()
+
 @dataclass
 class WriteRequest:
     # Minimal, format-agnostic metadata needed by all writers passed when initializing the writer
@@ -46,22 +75,90 @@ class WriteRequest:
     acq: Dict = None  # imaging + acquisition metadata
     acq_list: List = None
     writer_config_file_values: Optional[Dict[str, Any]] = None
+    orientation: FrameOrientation = MESOSPIM_ORIENTATION  # orientation of the saved image relative to the camera frame
 
 @dataclass
 class WriteImage:
     # Minimal, format-agnostic metadata needed by all writers passed when initializing the writer
-    image: np.ndarray               # z_frame to write
+    image: np.ndarray               # z_frame to write, oriented view of raw_image
     current_image_counter: int      # z_frame #
     tile_number: int                # Tile number in acquisition grid
-    laser: str                      # Excitation laser
-    shutter: str                    # 'left', 'right'
-    rot: int                        # Angle of rotation
+    laser: int                      # Excitation laser index in the acquisition list
+    shutter: int                    # Shutter config index ('Left', 'Right') in the acquisition list
+    rot: int                        # Rotation angle index in the acquisition list
     x_res: int                      # resolution x in unit
     y_res: int                      # resolution y in unit
     z_res: int                      # resolution z in unit
     unit: str = 'microns'
     acq: Dict = None
     acq_list: List = None
+    raw_image: np.ndarray = None    # z_frame as delivered by the camera, C-contiguous
+    orientation: FrameOrientation = MESOSPIM_ORIENTATION  # image == orientation.apply(raw_image)
+    slot: Optional[int] = None      # slot of the writer's FrameAllocator holding raw_image, None if not allocated by the writer
+
+@dataclass(frozen=True)
+class WriteContext:
+    # Per-acquisition part of WriteImage, resolved once when the writer is opened and reused for every frame
+    tile_number: int                # Tile number in acquisition grid
+    laser: int                      # Excitation laser index
+    shutter: int                    # Shutter config index
+    rot: int                        # Rotation angle index
+    x_res: Any                      # resolution x in unit
+    y_res: Any                      # resolution y in unit
+    z_res: float                    # resolution z in unit
+    unit: str = 'microns'
+    acq: Dict = None
+    acq_list: List = None
+    orientation: FrameOrientation = MESOSPIM_ORIENTATION
+
+    @classmethod
+    def from_acquisition(cls, acq, acq_list, pixelsize_um: float, orientation: FrameOrientation = MESOSPIM_ORIENTATION) -> WriteContext:
+        """Resolve the tile/channel/shutter/rotation indices (O(len(acq_list)) each) once per acquisition"""
+        xy_res = (1. / pixelsize_um, 1. / pixelsize_um)
+        return cls(
+            tile_number=acq_list.get_tile_index(acq),
+            laser=acq_list.find_value_index(acq['laser'], 'laser'),
+            shutter=acq_list.find_value_index(acq['shutterconfig'], 'shutterconfig'),
+            rot=acq_list.find_value_index(acq['rot'], 'rot'),
+            x_res=xy_res,
+            y_res=xy_res,
+            z_res=acq['z_step'],
+            acq=acq,
+            acq_list=acq_list,
+            orientation=orientation,
+        )
+
+    def write_image(self, raw_image: np.ndarray, current_image_counter: int, slot: Optional[int] = None) -> WriteImage:
+        """Build the WriteImage of a raw camera frame, O(1)"""
+        return WriteImage(
+            image=self.orientation.apply(raw_image),
+            current_image_counter=current_image_counter,
+            tile_number=self.tile_number,
+            laser=self.laser,
+            shutter=self.shutter,
+            rot=self.rot,
+            x_res=self.x_res,
+            y_res=self.y_res,
+            z_res=self.z_res,
+            unit=self.unit,
+            acq=self.acq,
+            acq_list=self.acq_list,
+            raw_image=raw_image,
+            orientation=self.orientation,
+            slot=slot,
+        )
+
+@runtime_checkable
+class FrameAllocator(Protocol):
+    # Frame buffer owned by a writer, e.g. shared memory read by a writer process.
+    # The frame pool fills the slots directly, so that write_frame only hands the slot over instead of copying the frame.
+    frames: np.ndarray              # (n_slots, y, x) raw camera frames
+
+    def acquire(self, timeout: Optional[float] = None) -> Optional[int]:
+        """Return a free slot, None if there is none within timeout (seconds, 0: do not wait, None: wait forever)"""
+
+    def release(self, slot: int) -> None:
+        """Return a slot which was not handed over to write_frame, e.g. a frame discarded on abort"""
 
 @dataclass
 class FinalizeImage:
@@ -92,6 +189,9 @@ class ImageWriter(Protocol):
     """A streaming-friendly writer interface."""
 
     writer = None
+    # Set by mesoSPIM before open(): writers finishing files in the background call status_callback(status) from any thread
+    # with status = {'name': str, 'status': 'done' | 'failed', 'frames': int, 'error': str or None, ...}
+    status_callback = None
 
     @classmethod
     def api_version(cls) -> str:
@@ -139,7 +239,20 @@ class ImageWriter(Protocol):
         Write a block into 'index' (same rank as req.shape).
         - 'data' should support the buffer protocol; accept numpy/dask chunks.
         - Called repeatedly, possibly from multiple threads.
+        - 'data.image' is a view into a reused frame buffer: copy it if it is needed after write_frame returns.
+        - 'data.image' is a lazy (strided) view, 'data.raw_image' is the contiguous camera frame.
+          Writers which copy the frame anyway can store the raw frame and apply 'data.orientation' later.
+        - 'data.slot' is set if the frame is in a slot of this writer's frame_allocator(): the writer owns the slot
+          once write_frame returns and frees it (FrameAllocator.release or its own mechanism) when it is written.
+        """
+
+    def frame_allocator(self) -> Optional[FrameAllocator]:
+        """
+        Optional: return a FrameAllocator over a frame buffer of the writer, called after open().
+        Camera frames are then acquired directly into its slots (zero copy) until finalize() or abort().
+        Default None: frames are acquired into the frame pool of mesoSPIM and write_frame copies them.
         """
+        return None
 
     def finalize(self, finalize_image: FinalizeImage) -> None:
         """
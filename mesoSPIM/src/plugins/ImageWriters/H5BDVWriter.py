@@ -141,11 +141,12 @@ class H5BDVWriter(ImageWriter):
 
     def write_frame(self, data: WriteImage):
 
+        # view indices resolved once per acquisition in the WriteContext, no AcquisitionList lookups per frame
         self.writer.append_plane(plane=data.image, z=data.current_image_counter,
-                                     illumination=data.acq_list.find_value_index(data.acq['shutterconfig'], 'shutterconfig'),
-                                     channel=data.acq_list.find_value_index(data.acq['laser'], 'laser'),
-                                     angle=data.acq_list.find_value_index(data.acq['rot'], 'rot'),
-                                     tile=data.acq_list.get_tile_index(data.acq)
+                                     illumination=data.shutter,
+                                     channel=data.laser,
+                                     angle=data.rot,
+                                     tile=data.tile_number
                                      )
         # flush H5 every 100 frames
         if (data.current_image_counter + 1) % 100 == 0:
@@ -54,6 +54,9 @@ class OMEZarrWriter(ImageWriter):
     shards are defined by default. Be careful, shard shape must be defined carefully to prevent performance
     degradation. We suggest that shards are shallow in Z and as large as you camera sensor in XY.
     For best performance set the base and target chunks to the same z-depth as your shards.
+    Complete shards (full XY planes, shard z-depth) are buffered in RAM per level, so that every shard is written once,
+    without read-modify-write. If the buffers of all levels do not fit 'shard_buffer_gb', the shards of the largest
+    levels are made shallower, down to one chunk.
 
     async_finalize: default: True. Enables acquisition of the next tile to proceed immediately while the multiscale
     is finalized in the background. On systems with slow IO, data can accumulate in RAM and cause a crash.
@@ -69,9 +72,12 @@ class OMEZarrWriter(ImageWriter):
         'compression': 'zstd', # None, 'zstd', 'lz4'
         'compression_level': 5, # 1-9
         'shards': (64,6000,6000), # None or Tuple specifying max shard size. (axes: z,y,x), ignored if ome_version "0.4"
+        'shard_buffer_gb': 4.0, # RAM for buffering complete shards, shards are made shallower if they do not fit. None: no limit.
         'base_chunks': (64,256,256), # Tuple specifying starting chunk size (multiscale level 0). Bigger chunks, less files (axes: z,y,x)
         'target_chunks': (64,64,64), # Tuple specifying ending chunk size (multiscale highest level). Bigger chunks, less files (axes: z,y,x)
         'async_finalize': True, # True, False
+        'pyramid_batch': 4, # Planes downsampled together for the multiscale levels, more planes use more RAM.
+        'pyramid_workers': 1, # Threads splitting the 2x2 downsampling of each plane into row bands.
 
         # BigStitcher Specific Options
         'write_big_stitcher_xml': True, # True, False
@@ -137,9 +143,12 @@ class OMEZarrWriter(ImageWriter):
         compression = 'zstd'  # None, 'zstd', 'lz4'
         compression_level = 5  # 1-9
         shards = (64, 6000, 6000)  # None or Tuple specifying max shard size. (axes: z,y,x), ignored if ome_version "0.4"
+        shard_buffer_gb = 4.0  # RAM for buffering complete shards, None: no limit
         base_chunks = (64, 256, 256)  # Tuple specifying starting chunk size (multiscale level 0). Bigger chunks, less files (axes: z,y,x)
         target_chunks = (64, 64, 64)  # Tuple specifying ending chunk size (multiscale highest level). Bigger chunks, less files (axes: z,y,x)
         async_finalize = True  # True, False
+        pyramid_batch = 4  # planes downsampled together for the multiscale levels
+        pyramid_workers = 1  # threads for the 2x2 downsampling
 
         # BigStitcher XML Options Defaults - for easy drag/drop import into BigStitcher
         write_big_stitcher_xml = True  # True, False
@@ -159,9 +168,14 @@ class OMEZarrWriter(ImageWriter):
                 pass
             compression_level = req.writer_config_file_values.get('compression_level', compression_level)
             shards = req.writer_config_file_values.get('shards', shards)
+            if 'shard_buffer_gb' in req.writer_config_file_values:
+                # Deals with case where shard_buffer_gb is None in config so it is retained
+                shard_buffer_gb = req.writer_config_file_values.get('shard_buffer_gb')
             base_chunks = req.writer_config_file_values.get('base_chunks', base_chunks)
             target_chunks = req.writer_config_file_values.get('target_chunks', target_chunks)
             async_finalize = req.writer_config_file_values.get('async_finalize', async_finalize)
+            pyramid_batch = req.writer_config_file_values.get('pyramid_batch', pyramid_batch)
+            pyramid_workers = req.writer_config_file_values.get('pyramid_workers', pyramid_workers)
             write_big_stitcher_xml = req.writer_config_file_values.get('write_big_stitcher_xml', write_big_stitcher_xml)
             flip_xyz = req.writer_config_file_values.get('flip_xyz', flip_xyz)
             transpose_xy = req.writer_config_file_values.get('transpose_xy', transpose_xy)
@@ -272,7 +286,10 @@ class OMEZarrWriter(ImageWriter):
             flush_pad=FlushPad.DUPLICATE_LAST,  # keeps alignment, no RMW
             async_close=async_finalize,
             translation=(acq['z_start'], acq['y_pos'], acq['x_pos']),
-            ome_version=ome_version
+            ome_version=ome_version,
+            pyramid_batch=pyramid_batch,
+            pyramid_workers=pyramid_workers,
+            shard_buffer_gb=shard_buffer_gb,
         )
 
         self.metadata_file_info()
@@ -280,7 +297,8 @@ class OMEZarrWriter(ImageWriter):
 
 
     def write_frame(self, data: WriteImage):
-        self.omezarr_writer.push_slice(data.image)
+        # push_slice() queues the frame for a background thread, copy it because the frame buffer is reused
+        self.omezarr_writer.push_slice(data.image.copy())
 
     def finalize(self, finalize_image=FinalizeImage) -> None:
         self.omezarr_writer.close()
@@ -5,6 +5,8 @@ logger = logging.getLogger(__name__)
 import numpy as np
 from typing import Any, Dict, Iterable, Optional, Protocol, runtime_checkable, Tuple, List, Union
 import sys
+import time
+import queue
 
 # Setup multiprocessing with 'spawn' method
 import multiprocessing as mp
@@ -13,7 +15,7 @@ mp.set_start_method("spawn", force=True)
 
 
 from mesoSPIM.src.plugins.ImageWriterApi import (
-    ImageWriter, WriterCapabilities, WriteRequest, API_VERSION, FileNaming, WriteImage, FinalizeImage
+    ImageWriter, WriterCapabilities, WriteRequest, API_VERSION, FileNaming, WriteImage, FinalizeImage, FrameAllocator
 )
 
 # Install zarr via pip if needed
@@ -34,8 +36,28 @@ from plugins.support_files.ImageWriters.OmeZarrWriterMP.omezarr_writer import (
     Live3DPyramidWriter, plan_levels,
     compute_xy_only_levels, FlushPad,
     BloscCodec, BloscShuffle,
-    XmlWriter, omezarr_writer_worker
+    XmlWriter
 )
+from plugins.support_files.ImageWriters.OmeZarrWriterMP.writer_pool import get_writer_pool
+
+
+class SharedRingAllocator(FrameAllocator):
+    '''
+    Slots of the shared memory ring buffer of the writer process pool, as frame buffer of the mesoSPIM frame pool.
+    Free slots come from the free-slot queue of the pool, which is refilled once a writer process has ingested a slot.
+    '''
+    def __init__(self, ring: np.ndarray, free_q):
+        self.frames = ring
+        self._free_q = free_q
+
+    def acquire(self, timeout: Optional[float] = None) -> Optional[int]:
+        try:
+            return self._free_q.get(timeout != 0, timeout)
+        except queue.Empty:
+            return None
+
+    def release(self, slot: int) -> None:
+        self._free_q.put(slot)
 
 
 class OMEZarrWriterMP(ImageWriter):
@@ -44,6 +66,12 @@ class OMEZarrWriterMP(ImageWriter):
     MP is used to offload the writing of data to disk to a separate process
     to prevent bottlenecks during acquisition.
 
+    Tiles are written by a persistent pool of writer processes (see writer_pool.py) sharing one shared memory
+    ring buffer, started with the first tile and reused for all tiles and acquisitions of the session.
+    The next tile is scheduled on an idle writer process while the previous one is still being finalized.
+    The pool is supervised: new tiles wait while too many tiles are finalized or RAM is short, crashed writer
+    processes are restarted, and the completion of each tile is reported to the GUI.
+
     Write Tiles as OME-Zarr
     Each tile is written into a different folder inside a larger .ome.zarr folder.
     This writer also produces a BigStitcher XML file (only for ome zarr v0.4) for easy import into BigStitcher
@@ -72,7 +100,9 @@ class OMEZarrWriterMP(ImageWriter):
 
     shards are defined by default. Be careful, shard shape must be defined carefully to prevent performance
     degradation. We suggest that shards are shallow in Z and as large as you camera sensor in XY.
-    For best performance set the base and target chunks to the same z-depth as your shards.
+    Complete shards (full XY planes, shard z-depth) are buffered in RAM per level, so that every shard is written once,
+    without read-modify-write. If the buffers of all levels do not fit 'shard_buffer_gb', the shards of the largest
+    levels are made shallower, down to one chunk.
 
 
     OPTIONAL: Place the following entry into the mesoSPIM configuration file and change as needed
@@ -83,6 +113,7 @@ class OMEZarrWriterMP(ImageWriter):
         'compression': 'zstd', # None, 'zstd', 'lz4'
         'compression_level': 5, # 1-9
         'shards': (64,6000,6000), # None or Tuple specifying max shard size. (axes: z,y,x), ignored if ome_version "0.4"
+        'shard_buffer_gb': 4.0, # RAM per writer process for buffering complete shards, shards are made shallower if they do not fit. None: no limit.
         'base_chunks': (64,256,256), # Tuple specifying starting chunk size (multiscale level 0). Bigger chunks, less files (axes: z,y,x)
         'target_chunks': (64,64,64), # Tuple specifying ending chunk size (multiscale highest level). Bigger chunks, less files (axes: z,y,x)
 
@@ -93,6 +124,14 @@ class OMEZarrWriterMP(ImageWriter):
 
         # Multiprocess options
         'ring_buffer_size': 512, # The number of frames buffered into shared memory for the MP writer.
+        'writer_processes': 2, # Persistent writer processes, tiles are finalized in the background while the next tile is written by another process.
+        'max_finishing_tiles': 2, # Max tiles finalized in the background at the same time, a new tile waits for admission.
+        'min_free_memory_gb': 2.0, # A new tile waits while tiles are finalized and less RAM is free.
+        'max_cpu_percent': None, # A new tile waits while tiles are finalized and the CPU load is higher. None: no limit.
+        'max_writer_restarts': 3, # Crashed writer processes restarted per session, tiles queued behind the crashed tile are retried.
+        'zero_copy_frames': True, # True: camera frames are acquired directly into the shared memory ring buffer, which then replaces the frame pool. False: frames are copied into it.
+        'pyramid_batch': 4, # Planes downsampled together for the multiscale levels, more planes use more RAM per writer process.
+        'pyramid_workers': 1, # Threads per writer process splitting the 2x2 downsampling of each plane into row bands.
 
         # Cache location
         # Location where tile data is written and then moved to defined acquisition directory
@@ -106,16 +145,15 @@ class OMEZarrWriterMP(ImageWriter):
     def __init__(self):
         super().__init__()
         self.omezarr_writer = None  # not used in process mode, but keep for API compatibility
-        self._shm = None
+        self._pool = None
         self._ring = None
-        self._ring_size = None
         self._frame_shape = None
-        self._work_q = None
         self._free_q = None
-        self._writer_proc = None
+        self._tile_id = None
+        self._zero_copy_frames = True
         self.xml_writer = None
         self.req = None
-        self._background_writers: list[tuple[mp.Process, str]] = []
+        self._background_tiles: list[int] = []  # tiles of this acquisition list, finalized in the background
 
     writer = None
     write_request = None
@@ -166,20 +204,6 @@ class OMEZarrWriterMP(ImageWriter):
     Y, X = 2048, 2048
     RING_SIZE = 16  # number of frames that can be queued at once
 
-    def _create_shared_ringbuffer(self, ring_buffer_size: int, Y: int, X: int) -> None:
-        """
-        Create a shared memory ring buffer to hold image frames.
-        Stores SharedMemory object and numpy view on self.
-        """
-        nbytes = ring_buffer_size * Y * X * np.dtype('uint16').itemsize
-        shm = shared_memory.SharedMemory(create=True, size=nbytes)
-        buf = np.ndarray((ring_buffer_size, X, Y), dtype=np.uint16, buffer=shm.buf)
-
-        self._shm = shm
-        self._ring = buf
-        self._ring_size = ring_buffer_size
-        self._frame_shape = (X, Y)
-
     def open(self, req: WriteRequest) -> None:
         assert self.compatible_suffix(req), f'URI suffix not compatible with {self.name()}'
 
@@ -191,6 +215,7 @@ class OMEZarrWriterMP(ImageWriter):
         compression = 'zstd'            # None, 'zstd', 'lz4'
         compression_level = 5  # 1-9
         shards = (64, 6000, 6000)       # None or Tuple specifying max shard size. (axes: z,y,x), ignored if ome_version "0.4"
+        shard_buffer_gb = 4.0           # RAM per writer process for buffering complete shards, None: no limit
         base_chunks = (64, 256, 256)    # Tuple specifying starting chunk size (multiscale level 0). Bigger chunks, less files (axes: z,y,x)
         target_chunks = (64, 64, 64)    # Tuple specifying ending chunk size (multiscale highest level). Bigger chunks, less files (axes: z,y,x)
         async_finalize = True           # True, False
@@ -202,6 +227,16 @@ class OMEZarrWriterMP(ImageWriter):
 
         # Multiprocess options
         ring_buffer_size = 512          # number of frames that can be queued at once
+        writer_processes = 2            # persistent writer processes shared by all tiles
+        supervision = dict(             # admission control and restarts of the writer pool, see writer_pool.py
+            max_finishing_tiles=None,   # default: writer_processes
+            min_free_memory_gb=2.0,
+            max_cpu_percent=None,
+            max_restarts=3,
+        )
+        zero_copy_frames = True         # camera frames are acquired directly into the shared memory ring buffer
+        pyramid_batch = 4               # planes downsampled together for the multiscale levels
+        pyramid_workers = 1             # threads per writer process for the 2x2 downsampling
 
         # Cache
         write_cache = None
@@ -217,6 +252,9 @@ class OMEZarrWriterMP(ImageWriter):
                 compression = req.writer_config_file_values.get('compression')
             compression_level = req.writer_config_file_values.get('compression_level', compression_level)
             shards = req.writer_config_file_values.get('shards', shards)
+            if 'shard_buffer_gb' in req.writer_config_file_values:
+                # Deals with case where shard_buffer_gb is None in config so it is retained
+                shard_buffer_gb = req.writer_config_file_values.get('shard_buffer_gb')
             base_chunks = req.writer_config_file_values.get('base_chunks', base_chunks)
             target_chunks = req.writer_config_file_values.get('target_chunks', target_chunks)
             async_finalize = req.writer_config_file_values.get('async_finalize', async_finalize)
@@ -224,6 +262,13 @@ class OMEZarrWriterMP(ImageWriter):
             flip_xyz = req.writer_config_file_values.get('flip_xyz', flip_xyz)
             transpose_xy = req.writer_config_file_values.get('transpose_xy', transpose_xy)
             ring_buffer_size = req.writer_config_file_values.get('ring_buffer_size', ring_buffer_size)
+            writer_processes = req.writer_config_file_values.get('writer_processes', writer_processes)
+            for key in ('max_finishing_tiles', 'min_free_memory_gb', 'max_cpu_percent'):
+                supervision[key] = req.writer_config_file_values.get(key, supervision[key])
+            supervision['max_restarts'] = req.writer_config_file_values.get('max_writer_restarts', supervision['max_restarts'])
+            zero_copy_frames = req.writer_config_file_values.get('zero_copy_frames', zero_copy_frames)
+            pyramid_batch = req.writer_config_file_values.get('pyramid_batch', pyramid_batch)
+            pyramid_workers = req.writer_config_file_values.get('pyramid_workers', pyramid_workers)
             if 'write_cache' in req.writer_config_file_values:
                 # Deals with case where write_cache is None in config
                 write_cache = req.writer_config_file_values.get('write_cache')
@@ -326,22 +371,15 @@ class OMEZarrWriterMP(ImageWriter):
         if compression:
             compressor = BloscCodec(cname=compression, clevel=compression_level, shuffle=BloscShuffle.bitshuffle)
 
-        # Setup multiprocessing ring buffer
-        # self.shared_memory
-        # self.rig_buffer
-        self._create_shared_ringbuffer(ring_buffer_size, req.shape[1], req.shape[2])
-        shm_name = self._shm.name
-
-        # --- Create queues ---
-        ctx = mp.get_context("spawn")
-        self._work_q = ctx.Queue(maxsize=ring_buffer_size)
-        self._free_q = ctx.Queue(maxsize=ring_buffer_size)
-
-        # Initialize free-slot queue with all indices
-        for i in range(ring_buffer_size):
-            self._free_q.put(i)
+        # Persistent writer processes and their shared memory ring buffer, (re)started if the frame shape changed
+        # Raw camera frames are stored, the worker applies req.orientation when ingesting them into the chunk buffers
+        self._frame_shape = (req.shape[1], req.shape[2])
+        self._pool = get_writer_pool(writer_processes, ring_buffer_size, self._frame_shape, **supervision)
+        self._ring = self._pool.ring
+        self._free_q = self._pool.free_q
+        self._zero_copy_frames = zero_copy_frames
 
-        # --- Spawn writer process, which owns Live3DPyramidWriter ---
+        # --- Schedule the tile on a writer process, which owns its Live3DPyramidWriter ---
         writer_kwargs = dict(
             spec=spec,
             voxel_size=px_size_zyx,
@@ -356,35 +394,40 @@ class OMEZarrWriterMP(ImageWriter):
             async_close=False, # Force sync close to ensure all data is written before proceeding, sync not compatible with Multiprocess
             translation=(acq['z_start'], acq['y_pos'], acq['x_pos']),
             ome_version=ome_version,
+            pyramid_batch=pyramid_batch,
+            pyramid_workers=pyramid_workers,
+            shard_buffer_gb=shard_buffer_gb,
         )
 
-        self._writer_proc = ctx.Process(
-            target=omezarr_writer_worker,  # From omezarr_writer.py
-            args=(
-                shm_name,
-                (Y, X),
-                ring_buffer_size,
-                writer_kwargs,
-                self._work_q,
-                self._free_q,
-                write_cache,
-            ),
-            daemon=True,
+        t_start = time.perf_counter()
+        self._tile_id = self._pool.open_tile(
+            self.omezarr_group_name,
+            writer_kwargs,
+            write_cache,
+            (req.orientation.transpose, tuple(req.orientation.flip_axes)),
+            on_status=self.status_callback,
         )
+        logger.debug(f'Tile {self.omezarr_group_name} scheduled in {(time.perf_counter() - t_start) * 1000:.1f} ms')
 
-        self._writer_proc.start()
-
-        # remember this writer as “in the background”
-        self._background_writers.append((self._writer_proc, shm_name))
-        logger.debug("Added a new writer process to the list, total writer processes running: %d", len(self._background_writers))
+        # remember this tile as “in the background”
+        self._background_tiles.append(self._tile_id)
 
         # You no longer instantiate Live3DPyramidWriter here in the parent.
         self.omezarr_writer = None  # keep attribute for compatibility
 
         self.metadata_file_info()
 
+    def frame_allocator(self) -> Optional[FrameAllocator]:
+        # The frame pool acquires camera frames directly into the shared memory ring buffer,
+        # write_frame then only passes the slot index to the writer process
+        if not self._zero_copy_frames or self._ring is None:
+            return None
+        return SharedRingAllocator(self._ring, self._free_q)
+
     def write_frame(self, data: WriteImage):
-        frame = data.image
+        # Contiguous raw frame: the copy into shared memory is a plain memcpy, orientation is applied in the worker
+        frame = data.raw_image
+        assert data.orientation == self.req.orientation, "Frame orientation differs from the WriteRequest"
 
         # Basic sanity checks
         assert frame.dtype == np.uint16
@@ -392,6 +435,11 @@ class OMEZarrWriterMP(ImageWriter):
             f"Expected frame shape {self._frame_shape}, got {frame.shape}"
         )
 
+        # Frame acquired into a slot of the ring buffer (frame_allocator): no copy, the writer process frees the slot
+        if data.slot is not None and np.may_share_memory(frame, self._ring[data.slot]):
+            self._pool.submit_frame(self._tile_id, data.slot)
+            return
+
         # Get a free slot (blocks if all slots are in use -> back-pressure)
         slot = self._free_q.get()
 
@@ -400,38 +448,29 @@ class OMEZarrWriterMP(ImageWriter):
         # self._ring[slot] = frame
 
         # Tell writer process which slot to read
-        self._work_q.put(slot)
+        self._pool.submit_frame(self._tile_id, slot)
 
     def finalize(self, finalize_image: FinalizeImage) -> None:
-        # Tell this tile's writer process to finish
-        if self._work_q is not None:
+        # Tell this tile's writer process to finish the tile
+        if self._tile_id is not None:
             try:
-                self._work_q.put(None)
+                self._pool.close_tile(self._tile_id)
             except Exception:
-                logger.exception("Failed to send shutdown to writer process")
+                logger.exception("Failed to send close to writer process")
 
-        # DO NOT join here → let it run in the background
+        # DO NOT wait here → the tile is finalized in the background, the next tile goes to another writer process
         # Just drop our references so they don't get reused accidentally
-        self._writer_proc = None
-        self._work_q = None
+        # The shared memory belongs to the writer pool, it is kept for the next tile
+        self._tile_id = None
         self._free_q = None
-
-        # IMPORTANT: close our handle to the shm, but DO NOT unlink it
-        if self._shm is not None:
-            try:
-                self._shm.close()
-            except Exception:
-                logger.exception("Error closing shared memory handle in finalize()")
-            self._shm = None
-            self._ring = None
+        self._ring = None
 
         # BigStitcher XML logic still happens here, but:
         acq = finalize_image.acq
         acq_list = finalize_image.acq_list
 
         if self.xml_writer and acq == acq_list[-1]:
-            # Before writing XML or returning at the very end of the experiment,
-            # wait for all background writers and clean up their shared memory.
+            # Before writing XML at the very end of the experiment, wait for all tiles to be written.
             self._wait_for_background_writers()
 
             self.xml_writer.set_attribute_labels('channel', tuple(acq_list.get_unique_attr_list('laser')))
@@ -441,21 +480,15 @@ class OMEZarrWriterMP(ImageWriter):
 
     def abort(self) -> None:
         try:
-            if self._work_q is not None:
-                self._work_q.put(None)
-            if self._writer_proc is not None:
-                self._writer_proc.join(timeout=5.0)
+            if self._tile_id is not None:
+                self._pool.close_tile(self._tile_id)
+                self._pool.wait([self._tile_id], timeout=5.0)
         except Exception:
             pass
         finally:
-            if self._shm is not None:
-                self._shm.close()
-                try:
-                    self._shm.unlink()
-                except FileNotFoundError:
-                    pass
-                self._shm = None
-                self._ring = None
+            self._tile_id = None
+            self._free_q = None
+            self._ring = None
 
     def metadata_file_info(self) -> str:
         """
@@ -478,23 +511,13 @@ class OMEZarrWriterMP(ImageWriter):
         self.MIP_path = path.with_name('MAX_' + path.name + '.tif').as_posix()
 
     def _wait_for_background_writers(self):
-        """Wait for all tile writer processes to finish and clean shared memory."""
-        for proc, shm_name in self._background_writers:
-            try:
-                proc.join()
-            except Exception:
-                logger.exception("Error joining writer process")
-
-            # Now its shm can be safely unlinked
-            try:
-                shm = shared_memory.SharedMemory(name=shm_name)
-                shm.close()
-                shm.unlink()
-            except FileNotFoundError:
-                # Already cleaned or never created
-                pass
-            except Exception:
-                logger.exception("Error cleaning shared memory for %s", shm_name)
-
-        # clear the list so we don't double-join/unlink
-        self._background_writers.clear()
\ No newline at end of file
+        """Wait for the writer processes to finish all tiles of this acquisition list."""
+        if self._pool is not None and self._background_tiles:
+            self._pool.wait(self._background_tiles)
+            failed = [self._pool.tiles[i]['name'] for i in self._background_tiles if self._pool.tiles[i]['status'] == 'failed']
+            if failed:
+                logger.error(f'OME-Zarr tiles failed: {failed}')
+            logger.info(f'OME-Zarr writer pool: {self._pool.stats()}')
+
+        # clear the list so we don't wait twice
+        self._background_tiles.clear()
\ No newline at end of file
@@ -60,7 +60,9 @@ class TiffWriter(ImageWriter):
         self.xy_stack = np.memmap(req.uri, mode="write", dtype=np.uint16, shape=self.fsize * req.shape[0])
 
     def write_frame(self, data: WriteImage) -> None:
-        self.xy_stack[data.current_image_counter * self.fsize:(data.current_image_counter + 1) * self.fsize] = data.image.flatten()
+        # copy the oriented view straight into the memmap, without an intermediate flattened copy
+        plane = self.xy_stack[data.current_image_counter * self.fsize:(data.current_image_counter + 1) * self.fsize]
+        np.copyto(plane.reshape(data.image.shape), data.image)
 
     def finalize(self, finalize_image=FinalizeImage) -> None:
         try:
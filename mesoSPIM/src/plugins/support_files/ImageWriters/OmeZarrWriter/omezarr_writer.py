@@ -8,8 +8,10 @@ import zarr
 from zarr.codecs import BloscCodec, BloscShuffle, ShardingCodec
 from dataclasses import dataclass
 from typing import Union, Tuple, Optional
-from enum import Enum
 from xml.etree import ElementTree as ET
+# The pyramid levels and the shard buffers are planned as in the multiprocess writer
+from mesoSPIM.src.plugins.support_files.ImageWriters.OmeZarrWriterMP.omezarr_writer import (
+    PyramidBuilder, FlushPad, plan_shard_buffers)
 
 ### Multiscale writer ###
 
@@ -28,28 +30,6 @@ STORE_PATH = "volume.ome.zarr"
 def ceil_div(a, b):  # integer ceil
     return -(-a // b)
 
-def ds2_mean_uint16(img: np.ndarray) -> np.ndarray:
-    y, x = img.shape
-    y2 = y - (y & 1); x2 = x - (x & 1)
-    out = img[:y2:2, :x2:2].astype(np.uint32)
-    out += img[1:y2:2, :x2:2].astype(np.uint32)
-    out += img[:y2:2, 1:x2:2].astype(np.uint32)
-    out += img[1:y2:2, 1:x2:2].astype(np.uint32)
-    out += 2 # +2 to mean round divide by 4
-    out[:] = out >> 2
-    # pad edge by replication if odd dims:
-    if y & 1: out = np.vstack([out, out[-1:]])
-    if x & 1: out = np.hstack([out, out[:, -1:]])
-    return out.astype(np.uint16)
-
-def dsZ2_mean_uint16(a: np.ndarray, b: np.ndarray) -> np.ndarray:
-    """Mean of two uint16 slices -> uint16."""
-    out = a.astype(np.uint32)
-    out += b.astype(np.uint32)
-    out += 1 # +1 for mean round divide by 2
-    out[:] = out >> 1
-    return out.astype(np.uint16)
-
 def infer_n_levels(y, x, z_estimate, min_dim=256):
     """Stop when any axis would shrink below min_dim (spatial) or z_estimate//2**L < 1."""
     levels = 1
@@ -231,22 +211,30 @@ def init_ome_zarr(spec: PyramidSpec, path=STORE_PATH,
                   translation: Tuple[int, int, int] = (0,0,0), # in units
                   xy_levels: int = 0,
                   shard_shape: Tuple[int,int,int] | None = None,
-                  ome_version: str = "0.5"):
+                  ome_version: str = "0.5",
+                  shard_buffer_bytes: int | None = None):
 
     # Map OME-NGFF version to Zarr store version
     zarr_version = 2 if ome_version == "0.4" else 3
     root = zarr.open_group(path, mode="a", zarr_version=zarr_version)
-    arrs = []
+    lvl_shapes, lvl_chunks, lvl_shards = [], [], []
     for l in range(spec.levels):
         zf, yf, xf = level_factors(l, xy_levels)
         z_l = ceil_div(spec.z_size_estimate, zf)
         y_l = ceil_div(spec.y, yf)
         x_l = ceil_div(spec.x, xf)
-        lvl_shape = (z_l, y_l, x_l)
+        lvl_shapes.append((z_l, y_l, x_l))
+        lvl_chunks.append(chunk_scheme.chunks_for_level(l, lvl_shapes[l]))
+        lvl_shards.append(pick_shards_for_level(shard_shape, lvl_chunks[l], lvl_shapes[l]) if zarr_version == 3 else None)
+    planned = plan_shard_buffers(lvl_shapes, lvl_chunks, lvl_shards, shard_buffer_bytes)
+    if VERBOSE and planned != lvl_shards:
+        print(f"[init] shards made shallower to buffer complete shards in {shard_buffer_bytes / 2**30:.1f} GB: "
+              f"{lvl_shards} -> {planned}")
 
-        chunks = chunk_scheme.chunks_for_level(l, lvl_shape)
-        # shards_l = pick_shards_for_level(shard_shape, chunks, lvl_shape)
-        shards_l = pick_shards_for_level(shard_shape, chunks, lvl_shape) if zarr_version == 3 else None
+    arrs = []
+    for l in range(spec.levels):
+        lvl_shape, chunks, shards_l = lvl_shapes[l], lvl_chunks[l], planned[l]
+        z_l, y_l, x_l = lvl_shape
 
         name = f"{l}"
         if name in root:
@@ -337,17 +325,12 @@ def init_ome_zarr(spec: PyramidSpec, path=STORE_PATH,
 
 
 
-class FlushPad(Enum):
-    DUPLICATE_LAST = "duplicate_last"  # repeat last plane to fill the chunk
-    ZEROS = "zeros"                    # pad with zeros
-    DROP = "drop"                      # do not flush the tail (you'll lose last planes)
-
-
 # ---------- Live writer: true 3D decimation pipeline ----------
 class Live3DPyramidWriter:
     """
     Streams true-3D (2x in z,y,x) pyramid while you acquire slices.
-    Buffers complete Z-chunks per level and flushes only when chunks fill -> no read-modify-write.
+    Buffers complete Z-chunks (complete shards, if sharded) per level and flushes only when they fill -> no read-modify-write.
+    The levels above 0 are computed by a PyramidBuilder, in batches of pyramid_batch planes.
     """
 
     def __init__(self, spec: PyramidSpec, voxel_size=(1.0, 1.0, 1.0), path=STORE_PATH, max_workers=None,
@@ -358,7 +341,10 @@ class Live3DPyramidWriter:
                  async_close: bool = True,
                  shard_shape: Tuple[int, int, int] | None = None,
                  translation: Tuple[int,int,int] = (0,0,0),
-                 ome_version: str = "0.5"):
+                 ome_version: str = "0.5",
+                 pyramid_batch: int = 4,
+                 pyramid_workers: int = 1,
+                 shard_buffer_gb: float | None = 4.0):
 
         self.spec = spec
         self.chunk_scheme = chunk_scheme
@@ -374,6 +360,7 @@ class Live3DPyramidWriter:
             voxel_size=voxel_size, xy_levels=self.xy_levels,
             shard_shape=shard_shape, translation=translation,
             ome_version=ome_version,
+            shard_buffer_bytes=None if shard_buffer_gb is None else int(shard_buffer_gb * 2**30),
         )
 
         self.levels = spec.levels
@@ -393,6 +380,12 @@ class Live3DPyramidWriter:
             self.zc.append(zc)
             self.yx_shapes.append((y_l, x_l))
 
+        # Z-depth of the level buffers: a complete shard (written once, no read-modify-write), or a chunk.
+        # A shard buffer is written while the next one fills, at most one per level is in flight.
+        self.buf_depth = [a.shards[0] if a.shards else zc for a, zc in zip(self.arrs, self.zc)]
+        self._shard_sems = [threading.Semaphore(1) if depth > zc else None
+                            for depth, zc in zip(self.buf_depth, self.zc)]
+
         # Concurrency primitives
         self.q = queue.Queue(maxsize=ingest_queue_size)
         self.stop = threading.Event()
@@ -404,6 +397,13 @@ class Live3DPyramidWriter:
         self.max_inflight_chunks = max_inflight_chunks or (self.max_workers * 40)
         self._inflight_sem = threading.Semaphore(self.max_inflight_chunks)
 
+        # Pyramid levels 1.. are computed in batches of pyramid_batch planes with preallocated buffers,
+        # the 2x2 means are split into row bands over pyramid_workers threads
+        self.pyramid_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=pyramid_workers) if pyramid_workers > 1 else None
+        self.pyramid = PyramidBuilder(self.yx_shapes, self.xy_levels, self._append_planes, batch=pyramid_batch,
+                                      flush_pad=flush_pad, pool=self.pyramid_pool, bands=pyramid_workers)
+
         self.worker = threading.Thread(target=self._consume, daemon=True)
         self.worker.start()
 
@@ -434,8 +434,8 @@ class Live3DPyramidWriter:
         self.worker.join()
 
         with self.lock:
-            # flush odd Z-pair tails at levels >= 1
-            self._flush_pair_tails_all_the_way()
+            # cascade the last batch and flush odd Z-pair tails at levels >= 1
+            self.pyramid.finish()
 
             # Flush any partially filled chunks w/o RMW by padding to full chunk size
             for l in range(self.levels):
@@ -443,6 +443,8 @@ class Live3DPyramidWriter:
                     self._pad_and_flush_partial_chunk(l)
 
         self.pool.shutdown(wait=True)
+        if self.pyramid_pool is not None:
+            self.pyramid_pool.shutdown(wait=True)
 
         for l, a in enumerate(self.arrs):
             a.resize((self.z_counts[l], a.shape[1], a.shape[2]))
@@ -466,7 +468,7 @@ class Live3DPyramidWriter:
         self.worker.join()
 
         with self.lock:
-            self._flush_pair_tails_all_the_way()
+            self.pyramid.finish()
             for l in range(self.levels):
                 if self.buffers[l] is not None and self.buf_fill[l] > 0:
                     self._pad_and_flush_partial_chunk(l)
@@ -474,6 +476,8 @@ class Live3DPyramidWriter:
         # for fut in self.pending_futs:
         #     fut.result()
         self.pool.shutdown(wait=True)
+        if self.pyramid_pool is not None:
+            self.pyramid_pool.shutdown(wait=True)
 
         for l, a in enumerate(self.arrs):
             a.resize((self.z_counts[l], a.shape[1], a.shape[2]))
@@ -489,33 +493,10 @@ class Live3DPyramidWriter:
 
     # ---------- Internals ----------
 
-    def _flush_pair_tails_all_the_way(self):
-        if not hasattr(self, "_pair_buf"):
-            return
-        changed = True
-        while changed:
-            changed = False
-            for lvl in range(max(1, self.xy_levels + 1), self.levels):  # start at first 3D level
-                buf = self._pair_buf[lvl]
-                if buf is None:
-                    continue
-                if self.flush_pad == FlushPad.DUPLICATE_LAST:
-                    tail = dsZ2_mean_uint16(buf, buf)
-                elif self.flush_pad == FlushPad.ZEROS:
-                    tail = dsZ2_mean_uint16(buf, np.zeros_like(buf, dtype=np.uint16))
-                else:  # DROP
-                    self._pair_buf[lvl] = None
-                    continue
-                self._pair_buf[lvl] = None
-                zL = self._reserve_z(lvl)
-                self._append_to_active_buffer(lvl, zL, tail)
-                self._emit_next(lvl + 1, ds2_mean_uint16(tail))
-                changed = True
-
     def _consume(self):
         while True:
             item = self.q.get()
-            if item is None or self.stop.is_set():
+            if item is None: # queued by close after the last slice: all slices are ingested
                 break
             self._ingest_raw(item)
 
@@ -526,10 +507,18 @@ class Live3DPyramidWriter:
 
     def _submit_write_chunk(self, level: int, z0: int, buf3d: np.ndarray):
         # bound in-flight tasks; acquire before submitting
+        shard_sem = self._shard_sems[level]
+        if shard_sem is not None:
+            shard_sem.acquire()
         self._inflight_sem.acquire()
         fut = self.pool.submit(self._write_chunk_slice, self.arrs[level], z0, buf3d)
         # Release the slot when done (and drop ref to the future immediately)
-        fut.add_done_callback(lambda _f: self._inflight_sem.release())
+        fut.add_done_callback(lambda _f: self._release_inflight(shard_sem))
+
+    def _release_inflight(self, shard_sem):
+        self._inflight_sem.release()
+        if shard_sem is not None:
+            shard_sem.release()
 
     @staticmethod
     def _write_chunk_slice(arr, z0, buf3d):
@@ -538,59 +527,49 @@ class Live3DPyramidWriter:
     def _ensure_active_buffer(self, level: int, start_z: int):
         """Allocate active chunk buffer for a level if absent, starting at start_z."""
         if self.buffers[level] is None:
-            zc = self.zc[level]
             y_l, x_l = self.yx_shapes[level]
-            self.buffers[level] = np.empty((zc, y_l, x_l), dtype=np.uint16)
+            self.buffers[level] = np.empty((self.buf_depth[level], y_l, x_l), dtype=np.uint16)
             self.buf_fill[level] = 0
             self.buf_start[level] = start_z
 
     def _append_to_active_buffer(self, level: int, z_index: int, plane: np.ndarray):
         """Append plane into the active buffer; flush when full."""
-        zc = self.zc[level]
+        depth = self.buf_depth[level]
         if self.buf_fill[level] == 0:
-            # Align start to chunk boundary; with strictly increasing z, z_index should already align when new chunk begins
-            start_z = (z_index // zc) * zc
+            # Align start to chunk (shard) boundary; with strictly increasing z, z_index should already align when new chunk begins
+            start_z = (z_index // depth) * depth
             self._ensure_active_buffer(level, start_z)
 
         offset = z_index - self.buf_start[level]
         self.buffers[level][offset, :, :] = plane
         self.buf_fill[level] += 1
 
-        if self.buf_fill[level] == zc:
+        if self.buf_fill[level] == depth:
             # Full chunk -> flush and reset
-            buf = self.buffers[level]
-            z0 = self.buf_start[level]
-            # hand a copy to the pool to avoid mutation races
-            self._submit_write_chunk(level, z0, buf)
-            self.buffers[level] = None
-            self.buf_fill[level] = 0
-            self.buf_start[level] = z0 + zc
+            self._flush_full_buffer(level)
 
     def _pad_and_flush_partial_chunk(self, level: int):
-        """Pad the active buffer to full chunk size (duplicate last or zeros) and flush."""
+        """Pad the active buffer to the next chunk boundary (duplicate last or zeros) and flush."""
         zc = self.zc[level]
         fill = self.buf_fill[level]
         if fill == 0:
             return
         buf = self.buffers[level]
+        end = ceil_div(fill, zc) * zc
         if self.flush_pad == FlushPad.DUPLICATE_LAST:
-            last = buf[fill - 1:fill, :, :]
-            repeat = np.repeat(last, zc - fill, axis=0)
-            padded = np.concatenate([buf[:fill], repeat], axis=0)
+            buf[fill:end] = buf[fill - 1]
         elif self.flush_pad == FlushPad.ZEROS:
-            pad = np.zeros((zc - fill, buf.shape[1], buf.shape[2]), dtype=np.uint16)
-            padded = np.concatenate([buf[:fill], pad], axis=0)
+            buf[fill:end] = 0
         else:  # DROP
-            # simply discard and roll back z_counts to the start of the partial chunk
-            self.z_counts[level] = self.buf_start[level]
-            self.buffers[level] = None
-            self.buf_fill[level] = 0
-            return
+            # discard the partial chunk and roll back z_counts to its start, the complete chunks are written
+            end = (fill // zc) * zc
+            self.z_counts[level] = self.buf_start[level] + end
 
-        self._submit_write_chunk(level, self.buf_start[level], padded)
+        if end:
+            self._submit_write_chunk(level, self.buf_start[level], buf[:end])
         self.buffers[level] = None
         self.buf_fill[level] = 0
-        self.buf_start[level] += zc
+        self.buf_start[level] += self.buf_depth[level]
 
     def _ingest_raw(self, img0: np.ndarray):
         with self.lock:
@@ -598,41 +577,34 @@ class Live3DPyramidWriter:
             z0 = self._reserve_z(0)
             self._append_to_active_buffer(0, z0, img0)
 
-            # Build and cascade upper levels (true 3D, factor 2^L)
-            if self.levels > 1:
-                self._emit_next(level=1, candidate_xy=ds2_mean_uint16(img0))
-
-
-
-    def _emit_next(self, level: int, candidate_xy: np.ndarray):
-        if level >= self.levels:
-            return
-
-        if level <= self.xy_levels:
-            # XY-only stage: append every incoming slice (no Z pairing)
-            zL = self._reserve_z(level)
-            self._append_to_active_buffer(level, zL, candidate_xy)
-            # continue XY decimation upward
-            self._emit_next(level + 1, ds2_mean_uint16(candidate_xy))
-            return
-
-        # 3D stage: pair consecutive planes along Z
-        if not hasattr(self, "_pair_buf"):
-            self._pair_buf = [None] * self.levels
-
-        buf = self._pair_buf[level]
-        if buf is None:
-            self._pair_buf[level] = candidate_xy
-            return
-
-        out_3d = dsZ2_mean_uint16(buf, candidate_xy)
-        self._pair_buf[level] = None
-
-        zL = self._reserve_z(level)
-        self._append_to_active_buffer(level, zL, out_3d)
-
-        # propagate upward with further XY decimation
-        self._emit_next(level + 1, ds2_mean_uint16(out_3d))
+            # Build and cascade upper levels (true 3D, factor 2^L), in batches of planes
+            self.pyramid.push(img0)
+
+    def _append_planes(self, level: int, planes: np.ndarray):
+        """Append a stack of consecutive planes into the active buffers of a level; flush every full buffer."""
+        depth = self.buf_depth[level]
+        i = 0
+        while i < len(planes):
+            z = self.z_counts[level]
+            if self.buf_fill[level] == 0:
+                self._ensure_active_buffer(level, (z // depth) * depth)
+            offset = z - self.buf_start[level]
+            n = min(len(planes) - i, depth - offset)
+            self.buffers[level][offset:offset + n] = planes[i:i + n]
+            self.z_counts[level] += n
+            self.buf_fill[level] += n
+            i += n
+            if self.buf_fill[level] == depth:
+                self._flush_full_buffer(level)
+
+    def _flush_full_buffer(self, level: int):
+        buf = self.buffers[level]
+        z0 = self.buf_start[level]
+        # hand the buffer to the pool and start a new one, to avoid mutation races
+        self.buffers[level] = None
+        self.buf_fill[level] = 0
+        self.buf_start[level] = z0 + self.buf_depth[level]
+        self._submit_write_chunk(level, z0, buf)
 
 
 class XmlWriter:
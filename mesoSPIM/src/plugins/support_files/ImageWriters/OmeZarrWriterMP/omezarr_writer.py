@@ -31,27 +31,61 @@ STORE_PATH = "volume.ome.zarr"
 def ceil_div(a, b):  # integer ceil
     return -(-a // b)
 
-def ds2_mean_uint16(img: np.ndarray) -> np.ndarray:
-    y, x = img.shape
-    y2 = y - (y & 1); x2 = x - (x & 1)
-    out = img[:y2:2, :x2:2].astype(np.uint32)
-    out += img[1:y2:2, :x2:2].astype(np.uint32)
-    out += img[:y2:2, 1:x2:2].astype(np.uint32)
-    out += img[1:y2:2, 1:x2:2].astype(np.uint32)
-    out += 2 # +2 to mean round divide by 4
-    out[:] = out >> 2
-    # pad edge by replication if odd dims:
-    if y & 1: out = np.vstack([out, out[-1:]])
-    if x & 1: out = np.hstack([out, out[:, -1:]])
-    return out.astype(np.uint16)
-
-def dsZ2_mean_uint16(a: np.ndarray, b: np.ndarray) -> np.ndarray:
-    """Mean of two uint16 slices -> uint16."""
-    out = a.astype(np.uint32)
-    out += b.astype(np.uint32)
-    out += 1 # +1 for mean round divide by 2
-    out[:] = out >> 1
-    return out.astype(np.uint16)
+def ds2_mean_uint16(img: np.ndarray, out: np.ndarray | None = None, acc: np.ndarray | None = None) -> np.ndarray:
+    """2x2 mean of a (..., y, x) uint16 plane or stack of planes -> (..., ceil(y/2), ceil(x/2)) uint16.
+    Odd dims are padded by replicating the last row/column. out and acc (1D uint32 scratch of
+    ds2_scratch_size) are optional preallocated buffers, then nothing is allocated."""
+    *lead, y, x = img.shape
+    if out is None:
+        out = np.empty((*lead, y // 2 + (y & 1), x // 2 + (x & 1)), dtype=np.uint16)
+    if acc is None:
+        acc = np.empty(ds2_scratch_size(img.shape), dtype=np.uint32)
+    rows, sums = _ds2_scratch(acc, img.shape)
+    _ds2_mean_rows(img, out, rows, sums, 0, y // 2)
+    replicate_odd_edges(out, y, x)
+    return out
+
+def ds2_scratch_size(shape):
+    """uint32 scratch of ds2_mean_uint16: row-pair sums (..., y//2, 2*(x//2)) and 2x2 sums (..., y//2, x//2)."""
+    *lead, y, x = shape
+    return 3 * int(np.prod(lead, dtype=np.int64)) * (y // 2) * (x // 2)
+
+def _ds2_scratch(acc, shape):
+    """Views of the scratch, in separate memory ranges (overlapping operands would make numpy copy them)."""
+    *lead, y, x = shape
+    n = int(np.prod(lead, dtype=np.int64)) * (y // 2) * (x // 2)
+    return acc[:2 * n].reshape(*lead, y // 2, 2 * (x // 2)), acc[2 * n:3 * n].reshape(*lead, y // 2, x // 2)
+
+def _ds2_mean_rows(img, out, rows, sums, r0, r1):
+    """Rows r0:r1 (of the even part) of ds2_mean_uint16, for splitting a plane into bands."""
+    xh = img.shape[-1] // 2
+    rows, sums = rows[..., r0:r1, :], sums[..., r0:r1, :]
+    # sum the row pairs first (contiguous), then the column pairs
+    np.add(img[..., 2 * r0:2 * r1:2, :2 * xh], img[..., 2 * r0 + 1:2 * r1:2, :2 * xh], out=rows, dtype=np.uint32)
+    np.add(rows[..., 0::2], rows[..., 1::2], out=sums)
+    np.add(sums, 2, out=sums) # +2 to mean round divide by 4
+    np.right_shift(sums, 2, out=sums)
+    np.copyto(out[..., r0:r1, :xh], sums, casting='unsafe')
+
+def replicate_odd_edges(out: np.ndarray, y: int, x: int):
+    """Pad the last row/column of a ds2 result in place, if the source dims were odd."""
+    yh, xh = y // 2, x // 2
+    if y & 1: out[..., yh, :xh] = out[..., yh - 1, :xh]
+    if x & 1: out[..., :, xh] = out[..., :, xh - 1]
+
+def dsZ2_mean_uint16(a: np.ndarray, b: np.ndarray, out: np.ndarray | None = None,
+                     tmp: np.ndarray | None = None) -> np.ndarray:
+    """Mean of two uint16 slices (or stacks of slices) -> uint16, rounded up as (a + b + 1) >> 1.
+    Computed in uint16 as (a | b) - ((a ^ b) >> 1), without overflow; out and tmp are optional preallocated buffers."""
+    if out is None:
+        out = np.empty(np.broadcast_shapes(a.shape, b.shape), dtype=np.uint16)
+    if tmp is None:
+        tmp = np.empty_like(out)
+    np.bitwise_xor(a, b, out=tmp)
+    np.right_shift(tmp, 1, out=tmp)
+    np.bitwise_or(a, b, out=out)
+    np.subtract(out, tmp, out=out)
+    return out
 
 def infer_n_levels(y, x, z_estimate, min_dim=256):
     """Stop when any axis would shrink below min_dim (spatial) or z_estimate//2**L < 1."""
@@ -228,6 +262,33 @@ def pick_shards_for_level(
         out.append(s)
     return tuple(out)
 
+def plan_shard_buffers(
+    lvl_shapes: list,
+    chunks: list,
+    shards: list,
+    budget_bytes: int | None = None,
+) -> list:
+    """
+    Zarr v3: Live3DPyramidWriter buffers complete shards along Z (full XY planes), so that every shard
+    is written exactly once, without read-modify-write. The buffers are double buffered per level
+    (one filling, one being written): 2 * shard_z * y_l * x_l * 2 bytes.
+    If they do not fit budget_bytes, the shard Z-depth of the level with the largest buffer is reduced
+    by one chunk, until they fit. Shards never get shallower than one chunk, then the budget is exceeded.
+    Returns the shards per level (None: not sharded).
+    """
+    shards = [None if s is None else list(s) for s in shards]
+    def buffer_bytes(l):
+        return 2 * shards[l][0] * lvl_shapes[l][1] * lvl_shapes[l][2] * 2
+    sharded = [l for l, s in enumerate(shards) if s is not None]
+    if budget_bytes is not None:
+        while sum(buffer_bytes(l) for l in sharded) > budget_bytes:
+            reducible = [l for l in sharded if shards[l][0] > chunks[l][0]]
+            if not reducible:
+                break
+            l = max(reducible, key=buffer_bytes)
+            shards[l][0] -= chunks[l][0]
+    return [None if s is None else tuple(s) for s in shards]
+
 # ---------- Zarr v3 init (multiscales 0.5) ----------
 def init_ome_zarr(spec: PyramidSpec, path=STORE_PATH,
                   chunk_scheme: ChunkScheme = ChunkScheme(),
@@ -236,22 +297,30 @@ def init_ome_zarr(spec: PyramidSpec, path=STORE_PATH,
                   translation: Tuple[int, int, int] = (0,0,0), # in units
                   xy_levels: int = 0,
                   shard_shape: Tuple[int,int,int] | None = None,
-                  ome_version: str = "0.5"):
+                  ome_version: str = "0.5",
+                  shard_buffer_bytes: int | None = None):
 
     # Map OME-NGFF version to Zarr store version
     zarr_version = 2 if ome_version == "0.4" else 3
     root = zarr.open_group(path, mode="a", zarr_version=zarr_version)
-    arrs = []
+    lvl_shapes, lvl_chunks, lvl_shards = [], [], []
     for l in range(spec.levels):
         zf, yf, xf = level_factors(l, xy_levels)
         z_l = ceil_div(spec.z_size_estimate, zf)
         y_l = ceil_div(spec.y, yf)
         x_l = ceil_div(spec.x, xf)
-        lvl_shape = (z_l, y_l, x_l)
+        lvl_shapes.append((z_l, y_l, x_l))
+        lvl_chunks.append(chunk_scheme.chunks_for_level(l, lvl_shapes[l]))
+        lvl_shards.append(pick_shards_for_level(shard_shape, lvl_chunks[l], lvl_shapes[l]) if zarr_version == 3 else None)
+    planned = plan_shard_buffers(lvl_shapes, lvl_chunks, lvl_shards, shard_buffer_bytes)
+    if VERBOSE and planned != lvl_shards:
+        print(f"[init] shards made shallower to buffer complete shards in {shard_buffer_bytes / 2**30:.1f} GB: "
+              f"{lvl_shards} -> {planned}")
 
-        chunks = chunk_scheme.chunks_for_level(l, lvl_shape)
-        # shards_l = pick_shards_for_level(shard_shape, chunks, lvl_shape)
-        shards_l = pick_shards_for_level(shard_shape, chunks, lvl_shape) if zarr_version == 3 else None
+    arrs = []
+    for l in range(spec.levels):
+        lvl_shape, chunks, shards_l = lvl_shapes[l], lvl_chunks[l], planned[l]
+        z_l, y_l, x_l = lvl_shape
 
         name = f"{l}"
         if name in root:
@@ -349,10 +418,127 @@ class FlushPad(Enum):
 
 
 # ---------- Live writer: true 3D decimation pipeline ----------
+class PyramidBuilder:
+    """
+    Computes pyramid levels 1.. from a stream of level-0 planes, in batches of planes.
+
+    Level 1 is reduced plane by plane as the planes arrive (they may be views into reused buffers),
+    every `batch` planes the batch cascades through the higher levels as whole stacks: XY 2x2 means,
+    and Z pair means at the 3D levels (an odd plane is carried to the next batch).
+    All accumulators are preallocated per level, the planes of a level are passed to
+    sink(level, planes) as a view that is only valid during the call.
+    With a thread pool, the 2x2 means are split into row bands (numpy releases the GIL).
+    """
+
+    def __init__(self, yx_shapes, xy_levels: int, sink, batch: int = 4,
+                 flush_pad: FlushPad = FlushPad.DUPLICATE_LAST, pool=None, bands: int = 1):
+        self.levels = len(yx_shapes)
+        self.yx_shapes = [tuple(s) for s in yx_shapes]
+        self.xy_levels = xy_levels
+        self.sink = sink
+        self.batch = max(2, int(batch))
+        self.flush_pad = flush_pad
+        self.pool = pool
+        self.bands = max(1, int(bands)) if pool is not None else 1
+        self._n = 0  # planes of the level-1 batch
+        self._cand = [None] * self.levels   # ds2 of the level below, (batch, y_l, x_l) uint16
+        self._acc = [None] * self.levels    # uint32 accumulators of the ds2 means
+        self._pairs = [None] * self.levels  # Z pair means and their uint16 scratch, 3D levels
+        self._carry = [None] * self.levels  # odd plane waiting for its pair, 3D levels
+        self._has_carry = [False] * self.levels
+        for l in range(1, self.levels):
+            y_l, x_l = self.yx_shapes[l]
+            y_p, x_p = self.yx_shapes[l - 1]
+            n = 1 if l == 1 else self.batch
+            self._cand[l] = np.empty((self.batch, y_l, x_l), dtype=np.uint16)
+            self._acc[l] = np.empty(ds2_scratch_size((n, y_p, x_p)), dtype=np.uint32)
+            if self._is_3d(l):
+                n_pairs = self.batch // 2 + 1
+                self._pairs[l] = (np.empty((n_pairs, y_l, x_l), dtype=np.uint16),
+                                  np.empty((n_pairs, y_l, x_l), dtype=np.uint16))
+                self._carry[l] = np.empty((y_l, x_l), dtype=np.uint16)
+
+    def _is_3d(self, level):
+        return level > self.xy_levels
+
+    def push(self, plane: np.ndarray):
+        """Reduce a level-0 plane into the level-1 batch, cascade the batch when it is full."""
+        if self.levels < 2:
+            return
+        self._ds2(plane, self._cand[1][self._n], self._acc[1])
+        self._n += 1
+        if self._n == self.batch:
+            self.flush_batch()
+
+    def flush_batch(self):
+        n, self._n = self._n, 0
+        if n:
+            self._cascade(1, self._cand[1][:n])
+
+    def finish(self):
+        """Cascade the last batch, then the odd Z-pair tails all the way up, padded by flush_pad."""
+        self.flush_batch()
+        for l in range(max(1, self.xy_levels + 1), self.levels):  # from the first 3D level up
+            if not self._has_carry[l]:
+                continue
+            self._has_carry[l] = False
+            if self.flush_pad == FlushPad.DROP:
+                continue
+            tail, tmp = self._pairs[l][0][:1], self._pairs[l][1][:1]
+            if self.flush_pad == FlushPad.DUPLICATE_LAST:
+                tail[0] = self._carry[l]  # mean of the plane with itself
+            else:  # ZEROS
+                dsZ2_mean_uint16(self._carry[l], 0, out=tail[0], tmp=tmp[0])
+            self._emit(l, tail)
+
+    def _ds2(self, img, out, acc):
+        y, x = img.shape[-2:]
+        yh = y // 2
+        rows, sums = _ds2_scratch(acc, img.shape)
+        if self.bands > 1 and yh >= 2 * self.bands:
+            edges = np.linspace(0, yh, self.bands + 1).astype(int)
+            list(self.pool.map(lambda r: _ds2_mean_rows(img, out, rows, sums, r[0], r[1]), zip(edges[:-1], edges[1:])))
+        else:
+            _ds2_mean_rows(img, out, rows, sums, 0, yh)
+        replicate_odd_edges(out, y, x)
+        return out
+
+    def _cascade(self, level: int, cand: np.ndarray):
+        """cand: ds2 of the planes of level-1, for this level"""
+        if not self._is_3d(level):
+            self._emit(level, cand)
+            return
+        # 3D stage: pair consecutive planes along Z, starting with the carried one
+        out, tmp = self._pairs[level]
+        n, k = len(cand), 0
+        if self._has_carry[level]:
+            dsZ2_mean_uint16(self._carry[level], cand[0], out=out[0], tmp=tmp[0])
+            self._has_carry[level] = False
+            n, k = n - 1, 1
+        rest = cand[k:]
+        m = n // 2
+        if m:
+            dsZ2_mean_uint16(rest[0:2 * m:2], rest[1:2 * m:2], out=out[k:k + m], tmp=tmp[k:k + m])
+        if n & 1:
+            self._carry[level][...] = rest[-1]
+            self._has_carry[level] = True
+        if k + m:
+            self._emit(level, out[:k + m])
+
+    def _emit(self, level: int, planes: np.ndarray):
+        """Hand the planes of a level to the sink, then continue XY decimation upward."""
+        self.sink(level, planes)
+        if level + 1 < self.levels:
+            n = len(planes)
+            cand = self._ds2(planes, self._cand[level + 1][:n], self._acc[level + 1])
+            self._cascade(level + 1, cand)
+
+
 class Live3DPyramidWriter:
     """
     Streams true-3D (2x in z,y,x) pyramid while you acquire slices.
-    Buffers complete Z-chunks per level and flushes only when chunks fill -> no read-modify-write.
+    Buffers complete Z-chunks (complete shards, if sharded) per level and flushes only when they fill -> no read-modify-write.
+    The levels above 0 are computed by a PyramidBuilder, in batches of pyramid_batch planes.
     """
 
     def __init__(self, spec: PyramidSpec, voxel_size=(1.0, 1.0, 1.0), path=STORE_PATH, max_workers=None,
@@ -363,7 +549,10 @@ class Live3DPyramidWriter:
                  async_close: bool = True,
                  shard_shape: Tuple[int, int, int] | None = None,
                  translation: Tuple[int,int,int] = (0,0,0),
-                 ome_version: str = "0.5"):
+                 ome_version: str = "0.5",
+                 pyramid_batch: int = 4,
+                 pyramid_workers: int = 1,
+                 shard_buffer_gb: float | None = 4.0):
 
         self.spec = spec
         self.chunk_scheme = chunk_scheme
@@ -372,6 +561,7 @@ class Live3DPyramidWriter:
         self.max_workers = max_workers or min(8, os.cpu_count() or 4)
         self.async_close = async_close
         self.finalize_future = None
+        self.ingest_error = None  # first exception raised while ingesting a slice
 
         self.root, self.arrs = init_ome_zarr(
             spec, path,
@@ -379,6 +569,7 @@ class Live3DPyramidWriter:
             voxel_size=voxel_size, xy_levels=self.xy_levels,
             shard_shape=shard_shape, translation=translation,
             ome_version=ome_version,
+            shard_buffer_bytes=None if shard_buffer_gb is None else int(shard_buffer_gb * 2**30),
         )
 
         self.levels = spec.levels
@@ -398,6 +589,12 @@ class Live3DPyramidWriter:
             self.zc.append(zc)
             self.yx_shapes.append((y_l, x_l))
 
+        # Z-depth of the level buffers: a complete shard (written once, no read-modify-write), or a chunk.
+        # A shard buffer is written while the next one fills, at most one per level is in flight.
+        self.buf_depth = [a.shards[0] if a.shards else zc for a, zc in zip(self.arrs, self.zc)]
+        self._shard_sems = [threading.Semaphore(1) if depth > zc else None
+                            for depth, zc in zip(self.buf_depth, self.zc)]
+
         # Concurrency primitives
         self.q = queue.Queue(maxsize=ingest_queue_size)
         self.stop = threading.Event()
@@ -409,15 +606,24 @@ class Live3DPyramidWriter:
         self.max_inflight_chunks = max_inflight_chunks or (self.max_workers * 40)
         self._inflight_sem = threading.Semaphore(self.max_inflight_chunks)
 
+        # Pyramid levels 1.. are computed in batches of pyramid_batch planes with preallocated buffers,
+        # the 2x2 means are split into row bands over pyramid_workers threads
+        self.pyramid_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=pyramid_workers) if pyramid_workers > 1 else None
+        self.pyramid = PyramidBuilder(self.yx_shapes, self.xy_levels, self._append_planes, batch=pyramid_batch,
+                                      flush_pad=flush_pad, pool=self.pyramid_pool, bands=pyramid_workers)
+
         self.worker = threading.Thread(target=self._consume, daemon=True)
         self.worker.start()
 
     # ---------- Public API ----------
-    def push_slice(self, slice_u16: np.ndarray):
+    def push_slice(self, slice_u16: np.ndarray, on_ingested=None):
+        """Queue a slice for ingestion. The slice is read later by the ingest thread: if it is a view into a
+        reused buffer, on_ingested() is called once it is copied into the chunk buffers and may be overwritten."""
         assert slice_u16.dtype == np.uint16, "slice must be uint16"
         assert slice_u16.shape == (self.spec.y, self.spec.x), \
             f"got {slice_u16.shape}, expected {(self.spec.y, self.spec.x)}"
-        self.q.put(slice_u16, block=True)
+        self.q.put((slice_u16, on_ingested), block=True)
 
     def __enter__(self):
         return self
@@ -439,8 +645,8 @@ class Live3DPyramidWriter:
         self.worker.join()
 
         with self.lock:
-            # flush odd Z-pair tails at levels >= 1
-            self._flush_pair_tails_all_the_way()
+            # cascade the last batch and flush odd Z-pair tails at levels >= 1
+            self.pyramid.finish()
 
             # Flush any partially filled chunks w/o RMW by padding to full chunk size
             for l in range(self.levels):
@@ -448,6 +654,8 @@ class Live3DPyramidWriter:
                     self._pad_and_flush_partial_chunk(l)
 
         self.pool.shutdown(wait=True)
+        if self.pyramid_pool is not None:
+            self.pyramid_pool.shutdown(wait=True)
 
         for l, a in enumerate(self.arrs):
             a.resize((self.z_counts[l], a.shape[1], a.shape[2]))
@@ -471,7 +679,7 @@ class Live3DPyramidWriter:
         self.worker.join()
 
         with self.lock:
-            self._flush_pair_tails_all_the_way()
+            self.pyramid.finish()
             for l in range(self.levels):
                 if self.buffers[l] is not None and self.buf_fill[l] > 0:
                     self._pad_and_flush_partial_chunk(l)
@@ -479,6 +687,8 @@ class Live3DPyramidWriter:
         # for fut in self.pending_futs:
         #     fut.result()
         self.pool.shutdown(wait=True)
+        if self.pyramid_pool is not None:
+            self.pyramid_pool.shutdown(wait=True)
 
         for l, a in enumerate(self.arrs):
             a.resize((self.z_counts[l], a.shape[1], a.shape[2]))
@@ -494,35 +704,19 @@ class Live3DPyramidWriter:
 
     # ---------- Internals ----------
 
-    def _flush_pair_tails_all_the_way(self):
-        if not hasattr(self, "_pair_buf"):
-            return
-        changed = True
-        while changed:
-            changed = False
-            for lvl in range(max(1, self.xy_levels + 1), self.levels):  # start at first 3D level
-                buf = self._pair_buf[lvl]
-                if buf is None:
-                    continue
-                if self.flush_pad == FlushPad.DUPLICATE_LAST:
-                    tail = dsZ2_mean_uint16(buf, buf)
-                elif self.flush_pad == FlushPad.ZEROS:
-                    tail = dsZ2_mean_uint16(buf, np.zeros_like(buf, dtype=np.uint16))
-                else:  # DROP
-                    self._pair_buf[lvl] = None
-                    continue
-                self._pair_buf[lvl] = None
-                zL = self._reserve_z(lvl)
-                self._append_to_active_buffer(lvl, zL, tail)
-                self._emit_next(lvl + 1, ds2_mean_uint16(tail))
-                changed = True
-
     def _consume(self):
         while True:
             item = self.q.get()
-            if item is None or self.stop.is_set():
+            if item is None: # queued by close after the last slice: all slices are ingested
                 break
-            self._ingest_raw(item)
+            slice_u16, on_ingested = item
+            try:
+                self._ingest_raw(slice_u16)
+            except Exception as e:
+                self.ingest_error = self.ingest_error or e # keep consuming, so that the producer does not block
+            finally:
+                if on_ingested is not None:
+                    on_ingested()
 
     def _reserve_z(self, level: int) -> int:
         z = self.z_counts[level]
@@ -535,10 +729,18 @@ class Live3DPyramidWriter:
         if self.max_inflight_chunks == 1 and self.max_inflight_chunks == 1: # Helps with single threaded debugging
             self.arrs[level][z0:z0 + buf3d.shape[0], :, :] = buf3d
         else:
+            shard_sem = self._shard_sems[level]
+            if shard_sem is not None:
+                shard_sem.acquire()
             self._inflight_sem.acquire()
             fut = self.pool.submit(self._write_chunk_slice, self.arrs[level], z0, buf3d)
             # Release the slot when done (and drop ref to the future immediately)
-            fut.add_done_callback(lambda _f: self._inflight_sem.release())
+            fut.add_done_callback(lambda _f: self._release_inflight(shard_sem))
+
+    def _release_inflight(self, shard_sem):
+        self._inflight_sem.release()
+        if shard_sem is not None:
+            shard_sem.release()
 
     @staticmethod
     def _write_chunk_slice(arr, z0, buf3d):
@@ -547,59 +749,49 @@ class Live3DPyramidWriter:
     def _ensure_active_buffer(self, level: int, start_z: int):
         """Allocate active chunk buffer for a level if absent, starting at start_z."""
         if self.buffers[level] is None:
-            zc = self.zc[level]
             y_l, x_l = self.yx_shapes[level]
-            self.buffers[level] = np.empty((zc, y_l, x_l), dtype=np.uint16)
+            self.buffers[level] = np.empty((self.buf_depth[level], y_l, x_l), dtype=np.uint16)
             self.buf_fill[level] = 0
             self.buf_start[level] = start_z
 
     def _append_to_active_buffer(self, level: int, z_index: int, plane: np.ndarray):
         """Append plane into the active buffer; flush when full."""
-        zc = self.zc[level]
+        depth = self.buf_depth[level]
         if self.buf_fill[level] == 0:
-            # Align start to chunk boundary; with strictly increasing z, z_index should already align when new chunk begins
-            start_z = (z_index // zc) * zc
+            # Align start to chunk (shard) boundary; with strictly increasing z, z_index should already align when new chunk begins
+            start_z = (z_index // depth) * depth
             self._ensure_active_buffer(level, start_z)
 
         offset = z_index - self.buf_start[level]
         self.buffers[level][offset, :, :] = plane
         self.buf_fill[level] += 1
 
-        if self.buf_fill[level] == zc:
+        if self.buf_fill[level] == depth:
             # Full chunk -> flush and reset
-            buf = self.buffers[level]
-            z0 = self.buf_start[level]
-            # hand a copy to the pool to avoid mutation races
-            self.buffers[level] = None
-            self.buf_fill[level] = 0
-            self.buf_start[level] = z0 + zc
-            self._submit_write_chunk(level, z0, buf)
+            self._flush_full_buffer(level)
 
     def _pad_and_flush_partial_chunk(self, level: int):
-        """Pad the active buffer to full chunk size (duplicate last or zeros) and flush."""
+        """Pad the active buffer to the next chunk boundary (duplicate last or zeros) and flush."""
         zc = self.zc[level]
         fill = self.buf_fill[level]
         if fill == 0:
             return
         buf = self.buffers[level]
+        end = ceil_div(fill, zc) * zc
         if self.flush_pad == FlushPad.DUPLICATE_LAST:
-            last = buf[fill - 1:fill, :, :]
-            repeat = np.repeat(last, zc - fill, axis=0)
-            padded = np.concatenate([buf[:fill], repeat], axis=0)
+            buf[fill:end] = buf[fill - 1]
         elif self.flush_pad == FlushPad.ZEROS:
-            pad = np.zeros((zc - fill, buf.shape[1], buf.shape[2]), dtype=np.uint16)
-            padded = np.concatenate([buf[:fill], pad], axis=0)
+            buf[fill:end] = 0
         else:  # DROP
-            # simply discard and roll back z_counts to the start of the partial chunk
-            self.z_counts[level] = self.buf_start[level]
-            self.buffers[level] = None
-            self.buf_fill[level] = 0
-            return
+            # discard the partial chunk and roll back z_counts to its start, the complete chunks are written
+            end = (fill // zc) * zc
+            self.z_counts[level] = self.buf_start[level] + end
 
-        self._submit_write_chunk(level, self.buf_start[level], padded)
+        if end:
+            self._submit_write_chunk(level, self.buf_start[level], buf[:end])
         self.buffers[level] = None
         self.buf_fill[level] = 0
-        self.buf_start[level] += zc
+        self.buf_start[level] += self.buf_depth[level]
 
     def _ingest_raw(self, img0: np.ndarray):
         with self.lock:
@@ -607,41 +799,34 @@ class Live3DPyramidWriter:
             z0 = self._reserve_z(0)
             self._append_to_active_buffer(0, z0, img0)
 
-            # Build and cascade upper levels (true 3D, factor 2^L)
-            if self.levels > 1:
-                self._emit_next(level=1, candidate_xy=ds2_mean_uint16(img0))
-
-
-
-    def _emit_next(self, level: int, candidate_xy: np.ndarray):
-        if level >= self.levels:
-            return
-
-        if level <= self.xy_levels:
-            # XY-only stage: append every incoming slice (no Z pairing)
-            zL = self._reserve_z(level)
-            self._append_to_active_buffer(level, zL, candidate_xy)
-            # continue XY decimation upward
-            self._emit_next(level + 1, ds2_mean_uint16(candidate_xy))
-            return
-
-        # 3D stage: pair consecutive planes along Z
-        if not hasattr(self, "_pair_buf"):
-            self._pair_buf = [None] * self.levels
-
-        buf = self._pair_buf[level]
-        if buf is None:
-            self._pair_buf[level] = candidate_xy
-            return
-
-        out_3d = dsZ2_mean_uint16(buf, candidate_xy)
-        self._pair_buf[level] = None
-
-        zL = self._reserve_z(level)
-        self._append_to_active_buffer(level, zL, out_3d)
-
-        # propagate upward with further XY decimation
-        self._emit_next(level + 1, ds2_mean_uint16(out_3d))
+            # Build and cascade upper levels (true 3D, factor 2^L), in batches of planes
+            self.pyramid.push(img0)
+
+    def _append_planes(self, level: int, planes: np.ndarray):
+        """Append a stack of consecutive planes into the active buffers of a level; flush every full buffer."""
+        depth = self.buf_depth[level]
+        i = 0
+        while i < len(planes):
+            z = self.z_counts[level]
+            if self.buf_fill[level] == 0:
+                self._ensure_active_buffer(level, (z // depth) * depth)
+            offset = z - self.buf_start[level]
+            n = min(len(planes) - i, depth - offset)
+            self.buffers[level][offset:offset + n] = planes[i:i + n]
+            self.z_counts[level] += n
+            self.buf_fill[level] += n
+            i += n
+            if self.buf_fill[level] == depth:
+                self._flush_full_buffer(level)
+
+    def _flush_full_buffer(self, level: int):
+        buf = self.buffers[level]
+        z0 = self.buf_start[level]
+        # hand the buffer to the pool and start a new one, to avoid mutation races
+        self.buffers[level] = None
+        self.buf_fill[level] = 0
+        self.buf_start[level] = z0 + self.buf_depth[level]
+        self._submit_write_chunk(level, z0, buf)
 
 
 class XmlWriter:
@@ -894,6 +1079,63 @@ def lower_priority() -> None:
     return
 
 
+def write_cache_location(write_cache, acq_path: Path) -> Path:
+    """Unique directory in write_cache where the tile acq_path is written before it is moved"""
+    from datetime import datetime
+    import uuid
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    random_char = str(uuid.uuid4()).split('-')[-1]
+    return Path(write_cache) / f'{timestamp}_{acq_path.name}.{random_char}'
+
+
+def move_write_cache(tmp_location: Path, acq_path: Path, max_retries: int = 3) -> bool:
+    """Move a tile written to the write cache to the acquisition directory, returns True if all files were moved"""
+    import shutil
+
+    print(f'Moving {tmp_location} --> {acq_path}')
+
+    acq_path.mkdir(parents=True, exist_ok=True)
+
+    total_loops = 0
+
+    while total_loops < max_retries:
+        retry = 0
+
+        for item in tmp_location.iterdir():
+            destination_item_path = acq_path / item.name
+            try:
+                shutil.move(str(item), str(destination_item_path))
+                print(f"Moved: {item.name}")
+            except Exception as e:
+                retry += 1
+                print(f"Failed to move {item.name}: {e}")
+
+        if retry == 0:
+            print(f'All files moved successfully from {tmp_location} to {acq_path}')
+            remaining = list(tmp_location.iterdir())
+            if remaining:
+                print(f"Not removing {tmp_location}, still contains {len(remaining)} items")
+            else:
+                tmp_location.rmdir()
+            return True
+
+        total_loops += 1
+        print(f'Retry {total_loops}/{max_retries}: {retry} files failed')
+
+    print(f'Some files were not copied from {tmp_location} to {acq_path}')
+    return False
+
+
+def oriented_frame(ring: np.ndarray, slot: int, transpose: bool, flip_axes: tuple) -> np.ndarray:
+    """View of the raw frame in ring[slot] with the orientation applied, no data is copied"""
+    frame = ring[slot]          # view into shared memory
+    if transpose:
+        frame = frame.T
+    if flip_axes:
+        frame = np.flip(frame, axis=flip_axes)
+    return frame
+
+
 def omezarr_writer_worker(
     shm_name: str,
     frame_shape: tuple[int, int],
@@ -902,38 +1144,32 @@ def omezarr_writer_worker(
     work_q: mp.Queue,
     free_q: mp.Queue,
     write_cache: Path | None,
+    orientation: tuple[bool, tuple[int, ...]] = (False, ()),
 ):
     """
-    Child process:
-    - Attaches to shared memory
+    Child process writing a single tile:
+    - Attaches to shared memory holding raw frames of frame_shape
+    - orientation (transpose, flip_axes) is applied as a view, the data is reordered
+      once when Live3DPyramidWriter copies the slice into its chunk buffer
     - Lowers its own cpu priority to yield to acquisition loop
     - Handles saving to write_cache directory and copying data to acquisition destination
     - Creates Live3DPyramidWriter
     - Loops reading slot indices from work_q
     - For each slot, takes the frame from shared memory and pushes it
-    - Returns slot to free_q when done
+    - Returns slot to free_q once the frame is ingested into the chunk buffers
+    See omezarr_pool_worker for the persistent worker of the writer process pool.
     """
-
-    import numpy as np
-    import shutil
-    import uuid
-    from datetime import datetime
-
     lower_priority()
 
-    def get_name_write_cache_dir(acq_path) -> Path | None:
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        random_char = str(uuid.uuid4()).split('-')[-1]
-        return f'{timestamp}_{acq_path.name}.{random_char}'
-
     # Attach to shared memory
     shm = shared_memory.SharedMemory(name=shm_name)
     Y, X = frame_shape
     ring = np.ndarray((ring_size, Y, X), dtype=np.uint16, buffer=shm.buf)
+    transpose, flip_axes = orientation
 
     if write_cache:
         acq_path = Path(writer_kwargs['path'])
-        tmp_location = Path(write_cache) / get_name_write_cache_dir(acq_path)
+        tmp_location = write_cache_location(write_cache, acq_path)
         writer_kwargs['path'] = tmp_location
         print(f'Acquiring to temp location: {tmp_location}')
 
@@ -946,11 +1182,8 @@ def omezarr_writer_worker(
             if slot is None:
                 break
 
-            frame = ring[slot]          # view into shared memory
-            writer.push_slice(frame)
-
-            # Slot now reusable
-            free_q.put(slot)
+            # Slot reusable once the frame is copied into the chunk buffers
+            writer.push_slice(oriented_frame(ring, slot, transpose, flip_axes), on_ingested=lambda slot=slot: free_q.put(slot))
     finally:
         try:
             writer.close()
@@ -970,39 +1203,113 @@ def omezarr_writer_worker(
             # Linux/Unix: higher nice => lower priority (0 is default)
             p.nice(19)  # 10-19 are common "background" values
 
-        print(f'Moving {tmp_location} --> {acq_path}')
+        move_write_cache(tmp_location, acq_path)
 
-        acq_path.mkdir(parents=True, exist_ok=True)
+        shm.close()
+        print(f'Writer closed for {acq_path.name}')
 
-        max_retries = 3
-        total_loops = 0
 
-        while total_loops < max_retries:
-            retry = 0
+def omezarr_pool_worker(
+    worker_id: int,
+    shm_name: str,
+    frame_shape: tuple[int, int],
+    ring_size: int,
+    work_q: mp.Queue,
+    result_conn,
+):
+    """
+    Persistent child process of the writer process pool (see writer_pool.py), writes one tile after the other:
+    - Attaches once to the shared memory ring of the pool and imports zarr/blosc once
+    - Reads a stream of messages from its work_q:
+        ('open', tile_id, writer_kwargs, write_cache, orientation)   creates the Live3DPyramidWriter of a tile
+        slot (int)                                                  frame of the open tile in ring[slot]
+        ('close', tile_id)                                          finalizes the tile, moves it from the write cache
+        None                                                        exits
+    - Sends ('freed', slot) on result_conn once the frame is ingested, and reports ('opened', worker_id, tile_id, time, init_s)
+      and ('closed', worker_id, tile_id, time, ok, error, frames). A tile whose writer failed keeps consuming (and freeing)
+      its frames and is reported as failed.
+      result_conn is the worker's own pipe to the pool: unlike a shared queue, a crashed worker cannot leave it locked.
+    Unlike omezarr_writer_worker the priority is not lowered further while moving the write cache:
+    on Linux it could not be raised again for the next tile.
+    """
+    import time
+    import traceback
 
-            for item in tmp_location.iterdir():
-                destination_item_path = acq_path / item.name
-                try:
-                    shutil.move(str(item), str(destination_item_path))
-                    print(f"Moved: {item.name}")
-                except Exception as e:
-                    retry += 1
-                    print(f"Failed to move {item.name}: {e}")
-
-            if retry == 0:
-                print(f'All files moved successfully from {tmp_location} to {acq_path}')
-                remaining = list(tmp_location.iterdir())
-                if remaining:
-                    print(f"Not removing {tmp_location}, still contains {len(remaining)} items")
-                else:
-                    tmp_location.rmdir()
-                break
+    lower_priority()
 
-            total_loops += 1
-            print(f'Retry {total_loops}/{max_retries}: {retry} files failed')
+    shm = shared_memory.SharedMemory(name=shm_name)
+    Y, X = frame_shape
+    ring = np.ndarray((ring_size, Y, X), dtype=np.uint16, buffer=shm.buf)
 
-        else:
-            print(f'Some files were not copied from {tmp_location} to {acq_path}')
+    send_lock = threading.Lock() # slots are freed by the ingest thread of the writer
+    def send(msg):
+        with send_lock:
+            result_conn.send(msg)
 
+    def free(slot):
+        send(('freed', slot))
+
+    writer = None
+    tile_id = None
+    error = None
+    frames = 0
+    try:
+        while True:
+            msg = work_q.get()
+            if msg is None:
+                break
+
+            if isinstance(msg, int):
+                if writer is None:
+                    free(msg) # tile failed to open: drop the frame
+                    continue
+                try:
+                    writer.push_slice(oriented_frame(ring, msg, transpose, flip_axes), on_ingested=lambda slot=msg: free(slot))
+                    frames += 1
+                except Exception:
+                    free(msg)
+                    error = error or traceback.format_exc()
+                continue
+
+            if msg[0] == 'open':
+                _, tile_id, writer_kwargs, write_cache, (transpose, flip_axes) = msg
+                error = None
+                frames = 0
+                acq_path = Path(writer_kwargs['path'])
+                tmp_location = None
+                if write_cache:
+                    tmp_location = write_cache_location(write_cache, acq_path)
+                    writer_kwargs['path'] = tmp_location
+                    print(f'Acquiring to temp location: {tmp_location}')
+                t_start = time.perf_counter()
+                try:
+                    writer = Live3DPyramidWriter(**writer_kwargs)
+                except Exception:
+                    writer = None
+                    error = traceback.format_exc()
+                send(('opened', worker_id, tile_id, time.perf_counter(), time.perf_counter() - t_start))
+
+            elif msg[0] == 'close':
+                if writer is not None:
+                    try:
+                        writer.close()
+                    except Exception:
+                        error = error or traceback.format_exc()
+                    if writer.ingest_error is not None:
+                        error = error or repr(writer.ingest_error)
+                    writer = None
+                    if tmp_location is not None and not move_write_cache(tmp_location, acq_path):
+                        error = error or f'Some files were not moved from {tmp_location} to {acq_path}'
+                send(('closed', worker_id, tile_id, time.perf_counter(), error is None, error, frames))
+                print(f'Writer {worker_id} closed tile {acq_path.name}')
+                tile_id = None
+    finally:
+        if writer is not None:
+            try:
+                writer.close()
+            except Exception:
+                import logging
+                logging.getLogger(__name__).exception("Error closing Live3DPyramidWriter in worker")
+        del ring
         shm.close()
-        print(f'Writer closed for {acq_path.name}')
\ No newline at end of file
+        result_conn.close()
@@ -0,0 +1,438 @@
+'''
+writer_pool.py
+========================================
+
+Persistent, supervised pool of OME-Zarr writer processes, shared by all tiles (and acquisition lists) of a session.
+
+The pool owns one shared memory ring of raw camera frames with its free-slot queue, and n_workers
+processes running omezarr_pool_worker. Each worker attaches to the ring and imports zarr/blosc once,
+then writes a stream of tiles ('open' / frames / 'close' messages on its work queue).
+Each worker reports freed slots and tile status on its own result pipe, which the supervisor thread reads:
+no queue or lock is shared between the workers, so a crashed worker cannot block the others.
+Tiles are scheduled on the worker with the fewest unfinished tiles, so that the next tile is written
+by an idle worker while the previous one is still being finalized (pyramid flush, write cache move).
+
+Supervision (supervisor thread of the pool):
+    - admission control: a new tile waits while max_finishing_tiles tiles are still being finalized,
+      or while tiles are finalized and the free RAM is below min_free_memory_gb or the CPU load above max_cpu_percent
+      (up to admission_timeout_s, then it is opened anyway)
+    - crashed workers are detected and restarted (up to max_restarts): their slots are reclaimed, tiles queued
+      behind the crashed tile are retried on the new process, resent from the messages the pool recorded for them
+      (the queues of a crashed worker are never read); the frames of the crashed tile are lost (the ring is reused),
+      it is reported as failed
+    - per-tile completion ('done' / 'failed') is reported to the on_status callback of the tile
+    - shared memory segments leaked by a previous session which crashed are removed when the pool starts
+
+Per-tile metrics are recorded in a LatencyRecorder (see pipeline_stats.py):
+    tile_admission  open_tile() waiting for admission
+    tile_open       open_tile() -> the worker has created the tile's writer (queueing behind a busy worker + init)
+    tile_init       creation of the tile's Live3DPyramidWriter in the worker
+    tile_close      close_tile() -> the worker has finalized the tile
+'''
+import os
+import glob
+import time
+import uuid
+import queue
+import atexit
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory, connection
+import numpy as np
+import psutil
+import logging
+logger = logging.getLogger(__name__)
+
+from mesoSPIM.src.utils.pipeline_stats import LatencyRecorder
+from .omezarr_writer import omezarr_pool_worker
+
+POLL_INTERVAL_S = 0.1
+SHM_PREFIX = 'mesospim_zarr_' # shared memory name: prefix + pid of the acquisition process + random suffix
+FINISHED = ('done', 'failed')
+
+
+def cleanup_leaked_shared_memory():
+    '''Removes the ring buffers of writer pools whose process no longer exists (Linux: /dev/shm).
+    On Windows shared memory is released with the last handle, there is nothing to clean up.'''
+    removed = []
+    for path in glob.glob(os.path.join('/dev/shm', SHM_PREFIX + '*')):
+        name = os.path.basename(path)
+        try:
+            pid = int(name[len(SHM_PREFIX):].split('_')[0])
+        except ValueError:
+            continue
+        if pid == os.getpid() or psutil.pid_exists(pid):
+            continue
+        try:
+            os.remove(path)
+            removed.append(name)
+        except OSError as e:
+            logger.warning(f'Leaked shared memory {name} could not be removed: {e}')
+    if removed:
+        logger.warning(f'Removed shared memory leaked by a previous session: {removed}')
+    return removed
+
+
+class _Worker:
+    def __init__(self, worker_id, process, work_q, result_conn):
+        self.worker_id = worker_id
+        self.process = process
+        self.work_q = work_q
+        self.result_conn = result_conn # read end of the worker's result pipe, None once the worker closed it
+        self.tiles = set()      # tile ids submitted and not yet closed by the worker
+        self.last_used = 0.0
+        self.alive = True       # False once it crashed and could not be restarted
+
+
+class WriterProcessPool:
+    '''
+    Args:
+        n_workers (int): writer processes
+        ring_size (int): frames in the shared memory ring
+        frame_shape (tuple): raw camera frame shape (y, x)
+        **supervision: see configure()
+    '''
+    def __init__(self, n_workers, ring_size, frame_shape, **supervision):
+        self.n_workers = max(1, int(n_workers))
+        self.ring_size = int(ring_size)
+        self.frame_shape = tuple(frame_shape)
+        self._ctx = mp.get_context("spawn")
+        self._cond = threading.Condition(threading.RLock())
+        self.configure(**supervision)
+
+        cleanup_leaked_shared_memory()
+        nbytes = self.ring_size * self.frame_shape[0] * self.frame_shape[1] * np.dtype('uint16').itemsize
+        name = f'{SHM_PREFIX}{os.getpid()}_{uuid.uuid4().hex[:8]}'
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=nbytes)
+        self.ring = np.ndarray((self.ring_size,) + self.frame_shape, dtype=np.uint16, buffer=self.shm.buf)
+        self.owner = [0] * self.ring_size # worker id + 1 holding each slot, 0: free or in this process
+        self.free_q = queue.Queue(maxsize=self.ring_size) # refilled by the supervisor with the slots freed by the workers
+        for i in range(self.ring_size):
+            self.free_q.put(i)
+
+        self.tiles = {}         # tile_id -> tile record, see open_tile
+        self._next_tile_id = 0
+        self.restarts = 0
+        self.latency = LatencyRecorder(capacity=10000)
+        self._shutting_down = False
+        self.workers = [self._start_worker(i) for i in range(self.n_workers)]
+        self._supervisor = threading.Thread(target=self._supervise, name='OmeZarrWriterSupervisor', daemon=True)
+        self._supervisor.start()
+        logger.info(f'OME-Zarr writer pool: {self.n_workers} processes, ring of {self.ring_size} x {self.frame_shape}, '
+                    f'{nbytes / 2**30:.2f} GB shared memory {self.shm.name}')
+
+    def configure(self, max_finishing_tiles=None, min_free_memory_gb=2.0, max_cpu_percent=None,
+                  admission_timeout_s=600, max_restarts=3):
+        '''
+        Args:
+            max_finishing_tiles (int): tiles finalized in the background at the same time, default n_workers
+            min_free_memory_gb (float): free RAM needed to open a tile while others are finalized
+            max_cpu_percent (float): CPU load above which a tile waits while others are finalized, None: no limit
+            admission_timeout_s (float): max wait for admission, then the tile is opened anyway
+            max_restarts (int): crashed workers restarted per session
+        '''
+        with self._cond:
+            self.max_finishing_tiles = max(1, int(max_finishing_tiles or self.n_workers))
+            self.min_free_memory_gb = min_free_memory_gb
+            self.max_cpu_percent = max_cpu_percent
+            self.admission_timeout_s = admission_timeout_s
+            self.max_restarts = max_restarts
+
+    def _start_worker(self, worker_id):
+        work_q = self._ctx.Queue()
+        result_conn, worker_conn = self._ctx.Pipe(duplex=False)
+        process = self._ctx.Process(
+            target=omezarr_pool_worker,
+            args=(worker_id, self.shm.name, self.frame_shape, self.ring_size, work_q, worker_conn),
+            name=f'OmeZarrWriter-{worker_id}',
+            daemon=True,
+        )
+        process.start()
+        worker_conn.close() # only the worker writes, the pipe then reports EOF once it exits
+        return _Worker(worker_id, process, work_q, result_conn)
+
+    def matches(self, n_workers, ring_size, frame_shape):
+        return (self.n_workers, self.ring_size, self.frame_shape) == (max(1, int(n_workers)), int(ring_size), tuple(frame_shape))
+
+    # ---------- Tiles ----------
+    def open_tile(self, name, writer_kwargs, write_cache, orientation, on_status=None):
+        '''Schedules a tile on the least busy worker, once admitted, and returns its tile id.
+        on_status(tile) is called (from the supervisor thread) when the tile is done or failed.'''
+        self._admit(name)
+        with self._cond:
+            workers = [w for w in self.workers if w.alive]
+            if not workers:
+                raise RuntimeError('All OME-Zarr writer processes crashed')
+            worker = min(workers, key=lambda w: (len(w.tiles), w.last_used))
+            tile_id = self._next_tile_id
+            self._next_tile_id += 1
+            now = time.perf_counter()
+            open_msg = ('open', tile_id, writer_kwargs, write_cache, orientation)
+            # 'messages': sent to the worker until it opens the tile, to resend them if it crashes before
+            self.tiles[tile_id] = {'tile_id': tile_id, 'name': name, 'worker': worker.worker_id, 'status': 'opening',
+                                   'submitted': now, 'opened': None, 'close_requested': None, 'closed': None,
+                                   'frames': 0, 'retries': 0, 'error': None, 'on_status': on_status,
+                                   'messages': [open_msg]}
+            worker.tiles.add(tile_id)
+            worker.last_used = now
+            worker.work_q.put(open_msg)
+            logger.debug(f'Tile {tile_id} {name} scheduled on writer {worker.worker_id}, '
+                         f'{len(worker.tiles) - 1} unfinished tiles ahead of it')
+            return tile_id
+
+    def submit_frame(self, tile_id, slot):
+        '''Hands the frame in ring[slot] to the worker of the tile, which frees the slot once it is written.
+        Returns False if the tile failed: the frame is dropped and the slot freed.'''
+        with self._cond:
+            tile = self.tiles[tile_id]
+            if tile['status'] == 'failed':
+                self._free_slot(slot)
+                return False
+            worker = self.workers[tile['worker']]
+            self.owner[slot] = worker.worker_id + 1
+            if tile['messages'] is not None:
+                tile['messages'].append(slot)
+            worker.work_q.put(slot)
+            return True
+
+    def close_tile(self, tile_id):
+        '''Asks the worker to finalize the tile after its frames, returns immediately'''
+        with self._cond:
+            tile = self.tiles[tile_id]
+            tile['close_requested'] = time.perf_counter()
+            if tile['status'] in FINISHED:
+                return
+            tile['status'] = 'closing'
+            if tile['messages'] is not None:
+                tile['messages'].append(('close', tile_id))
+            self.workers[tile['worker']].work_q.put(('close', tile_id))
+
+    def _free_slot(self, slot):
+        self.owner[slot] = 0
+        self.free_q.put(slot)
+
+    def _admit(self, name):
+        '''Waits until the tile may be opened, see configure()'''
+        t_start = time.perf_counter()
+        reason = None
+        with self._cond:
+            while True:
+                finishing = sum(tile['status'] == 'closing' for tile in self.tiles.values())
+                reason = None
+                if finishing >= self.max_finishing_tiles:
+                    reason = f'{finishing} tiles are being finalized'
+                elif finishing: # waiting for resources only helps while other tiles are finalized
+                    free_gb = psutil.virtual_memory().available / 2**30
+                    if free_gb < self.min_free_memory_gb:
+                        reason = f'{free_gb:.1f} GB RAM free'
+                    elif self.max_cpu_percent and psutil.cpu_percent() > self.max_cpu_percent:
+                        reason = f'CPU load above {self.max_cpu_percent} %'
+                if reason is None:
+                    break
+                if time.perf_counter() - t_start > self.admission_timeout_s:
+                    logger.warning(f'Tile {name} opened after waiting {self.admission_timeout_s} s for admission: {reason}')
+                    break
+                self._cond.wait(POLL_INTERVAL_S * 5)
+        waited = time.perf_counter() - t_start
+        self.latency.record('tile_admission', waited)
+        if waited > 1:
+            logger.info(f'Tile {name} waited {waited:.1f} s for admission')
+
+    # ---------- Supervision ----------
+    def _supervise(self):
+        while True:
+            with self._cond:
+                # workers found dead before their pipes are read: all their messages are then handled before recovery
+                dead = [w for w in self.workers if w.alive and not w.process.is_alive()]
+                conns = {w.result_conn: w for w in self.workers if w.result_conn is not None}
+            messages = self._receive(conns)
+            with self._cond:
+                finished = []
+                for msg in messages:
+                    tile = self._handle_result(msg)
+                    if tile is not None:
+                        finished.append(tile)
+                if not self._shutting_down:
+                    for worker in dead:
+                        finished.extend(self._recover(worker))
+                self._cond.notify_all()
+                stop = self._shutting_down and not messages and not any(w.process.is_alive() for w in self.workers)
+            for tile in finished:
+                self._notify(tile)
+            if stop:
+                break
+        for worker in self.workers:
+            self._close_result_conn(worker)
+
+    def _receive(self, conns):
+        '''Messages waiting on the result pipes of the workers, waits up to POLL_INTERVAL_S for the first one'''
+        if not conns:
+            time.sleep(POLL_INTERVAL_S)
+            return []
+        messages = []
+        for conn in connection.wait(list(conns), timeout=POLL_INTERVAL_S):
+            try:
+                while conn.poll():
+                    messages.append(conn.recv())
+            except (EOFError, OSError): # the worker exited
+                self._close_result_conn(conns[conn])
+        return messages
+
+    @staticmethod
+    def _close_result_conn(worker):
+        if worker.result_conn is not None:
+            worker.result_conn.close()
+            worker.result_conn = None
+
+    def _notify(self, tile):
+        if tile['on_status'] is None:
+            return
+        status = {key: tile[key] for key in ('tile_id', 'name', 'status', 'frames', 'retries', 'error')}
+        try:
+            tile['on_status'](status)
+        except Exception:
+            logger.exception(f"Tile status callback failed for {tile['name']}")
+
+    def _handle_result(self, msg):
+        if msg[0] == 'freed':
+            self._free_slot(msg[1])
+            return None
+        kind, worker_id, tile_id, timestamp = msg[:4]
+        tile = self.tiles.get(tile_id)
+        if tile is None or tile['status'] in FINISHED:
+            return None
+        if kind == 'opened':
+            tile['opened'] = timestamp
+            tile['messages'] = None # frames are consumed from now on, they cannot be resent
+            if tile['status'] == 'opening':
+                tile['status'] = 'open'
+            self.latency.record('tile_open', timestamp - tile['submitted'])
+            self.latency.record('tile_init', msg[4])
+            return None
+        ok, error, frames = msg[4:7]
+        tile.update(closed=timestamp, frames=frames, error=error, status='done' if ok else 'failed', messages=None)
+        if tile['close_requested'] is not None:
+            self.latency.record('tile_close', timestamp - tile['close_requested'])
+        self.workers[worker_id].tiles.discard(tile_id)
+        if not ok:
+            logger.error(f"OME-Zarr writer {worker_id}: tile {tile['name']} failed: {error}")
+        return tile
+
+    def _recover(self, worker):
+        '''Reclaims the slots of a crashed worker, fails its current tile and retries the tiles queued behind it
+        on a restarted worker (or fails them too once max_restarts is reached)
+        The work queue of the crashed worker is abandoned: the worker may have died holding its lock.'''
+        worker_id = worker.worker_id
+        error = f'Writer process {worker_id} exited with code {worker.process.exitcode}'
+        logger.error(f'OME-Zarr writer pool: {error}, tiles {sorted(worker.tiles)}')
+
+        # the tiles the worker did not open yet are resent from their record, the one it was writing is lost
+        restart = self.restarts < self.max_restarts
+        retried = {tile_id for tile_id in worker.tiles if self.tiles[tile_id]['messages'] is not None} if restart else set()
+        resend = [msg for tile_id in sorted(retried) for msg in self.tiles[tile_id]['messages']]
+        resent_slots = {msg for msg in resend if isinstance(msg, int)}
+        for slot in range(self.ring_size):
+            if self.owner[slot] == worker_id + 1 and slot not in resent_slots:
+                self._free_slot(slot) # held by the crashed worker
+
+        failed = []
+        for tile_id in sorted(worker.tiles - retried):
+            tile = self.tiles[tile_id]
+            tile.update(status='failed', closed=time.perf_counter(), error=error, messages=None)
+            logger.error(f"OME-Zarr writer {worker_id}: tile {tile['name']} failed: {error}")
+            failed.append(tile)
+        worker.tiles = set(retried)
+
+        if restart:
+            self.restarts += 1
+            new_worker = self._start_worker(worker_id)
+            new_worker.tiles = worker.tiles
+            self.workers[worker_id] = new_worker
+            for msg in resend:
+                new_worker.work_q.put(msg)
+            for tile_id in retried:
+                self.tiles[tile_id]['retries'] += 1
+            logger.warning(f'OME-Zarr writer {worker_id} restarted ({self.restarts}/{self.max_restarts}), '
+                           f'retrying tiles {sorted(retried)}')
+        else:
+            worker.alive = False
+            logger.error(f'OME-Zarr writer {worker_id} not restarted, {self.restarts} restarts already')
+        return failed
+
+    # ---------- Status ----------
+    def pending(self, tile_ids=None):
+        '''Tile ids not finished yet (among tile_ids, default all tiles)'''
+        with self._cond:
+            tile_ids = list(self.tiles) if tile_ids is None else tile_ids
+            return [i for i in tile_ids if self.tiles[i]['status'] not in FINISHED]
+
+    def wait(self, tile_ids=None, timeout=None):
+        '''Waits until the tiles (default: all) are finished, returns False on timeout'''
+        with self._cond:
+            return self._cond.wait_for(lambda: not self.pending(tile_ids), timeout)
+
+    def stats(self):
+        with self._cond:
+            statuses = [tile['status'] for tile in self.tiles.values()]
+            return {'workers': self.n_workers, 'tiles': len(self.tiles),
+                    'done': statuses.count('done'), 'failed': statuses.count('failed'),
+                    'retried': sum(tile['retries'] > 0 for tile in self.tiles.values()), 'restarts': self.restarts,
+                    'latency': self.latency.percentiles()}
+
+    def shutdown(self, timeout=None):
+        '''Lets the workers finish their tiles and exit, then releases the shared memory'''
+        with self._cond:
+            self._shutting_down = True
+        for worker in self.workers:
+            if not worker.process.is_alive():
+                continue
+            try:
+                worker.work_q.put(None)
+            except RuntimeError:
+                # At interpreter exit the feeder thread of a queue never used cannot be started: the worker has no tile
+                worker.process.terminate()
+            except Exception:
+                logger.exception(f'Failed to send shutdown to writer process {worker.worker_id}')
+        for worker in self.workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                logger.warning(f'Writer process {worker.worker_id} did not exit, terminating it')
+                worker.process.terminate()
+        self._supervisor.join(timeout=5 * POLL_INTERVAL_S + 1)
+        self.ring = None
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.exception(f'Error releasing shared memory {self.shm.name}')
+        logger.info(f'OME-Zarr writer pool shut down: {self.stats()}')
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_writer_pool(n_workers, ring_size, frame_shape, **supervision):
+    '''The writer pool of the session, (re)started if it does not exist or its size or frame shape changed'''
+    global _pool
+    with _pool_lock:
+        if _pool is not None and not _pool.matches(n_workers, ring_size, frame_shape):
+            _pool.shutdown()
+            _pool = None
+        if _pool is None:
+            _pool = WriterProcessPool(n_workers, ring_size, frame_shape, **supervision)
+        else:
+            _pool.configure(**supervision)
+        return _pool
+
+
+@atexit.register
+def shutdown_writer_pool():
+    '''Registered after multiprocessing's exit handler, so it runs first: tiles still being written are finished'''
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
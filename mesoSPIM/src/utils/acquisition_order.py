@@ -0,0 +1,177 @@
+'''
+acquisition_order.py
+========================================
+
+Reordering of an AcquisitionList to minimize the mechanical dead time between stacks
+(stage travel, rotation, filter wheel and zoom changes).
+
+The rows are grouped into tiles (unique x_pos, y_pos, z_start, rot), all rows of a tile stay consecutive.
+The tile sequence is built by a nearest-neighbour tour starting at the first tile of the table,
+improved by 2-opt moves, and the rows within each tile are ordered to avoid filter and zoom changes
+(e.g. the channel order alternates from tile to tile).
+'''
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+from .acquisitions import AcquisitionList
+
+
+class AcquisitionCostModel:
+    '''
+    Estimated time of the device moves between two acquisitions.
+
+    Keyword arguments override DEFAULTS, e.g. from the 'acquisition_order_cost_model' dictionary in the config file.
+    The stage axes are assumed to move simultaneously, rotation, filter and zoom changes one after another.
+    '''
+    DEFAULTS = {'xy_speed_um_s': 1000,      # x and y stage speed
+                'z_speed_um_s': 1000,       # z stage speed
+                'f_speed_um_s': 1000,       # focus stage speed
+                'stage_settle_s': 0.2,      # added to every stage move
+                'rotation_speed_deg_s': 10,
+                'rotation_settle_s': 1.0,   # added to every rotation
+                'filter_change_s': 1.0,
+                'zoom_change_s': 3.0,
+                }
+
+    def __init__(self, **parameters):
+        unknown = set(parameters) - set(self.DEFAULTS)
+        if unknown:
+            logger.warning(f'Unknown acquisition order cost model parameters ignored: {sorted(unknown)}')
+        self.parameters = {key: parameters.get(key, default) for key, default in self.DEFAULTS.items()}
+        for key, value in self.parameters.items():
+            setattr(self, key, value)
+
+    def rotation_time(self, delta_rot):
+        delta_rot = np.abs(delta_rot)
+        return np.where(delta_rot > 0.1, self.rotation_settle_s + delta_rot / self.rotation_speed_deg_s, 0.0)
+
+    def stage_time(self, dx, dy, dz, df=0.0):
+        move = np.maximum(np.maximum(np.abs(dx), np.abs(dy)) / self.xy_speed_um_s,
+                          np.maximum(np.abs(dz) / self.z_speed_um_s, np.abs(df) / self.f_speed_um_s))
+        return np.where(move > 0, move + self.stage_settle_s, 0.0)
+
+    def transition_times(self, acq_list):
+        '''Returns the estimated dead time (s) before each acquisition of the list except the first one'''
+        if len(acq_list) < 2:
+            return np.zeros(0)
+        columns = acq_list.columns
+        table = columns.table
+        # moves start from the end point of the previous stack
+        stage = self.stage_time(np.diff(table['x_pos']), np.diff(table['y_pos']),
+                                table['z_start'][1:] - table['z_end'][:-1], table['f_start'][1:] - table['f_end'][:-1])
+        rotation = self.rotation_time(np.diff(table['rot']))
+        filter_change = np.where(np.diff(columns.codes['filter']) != 0, self.filter_change_s, 0.0)
+        zoom_change = np.where(np.diff(columns.codes['zoom']) != 0, self.zoom_change_s, 0.0)
+        return stage + rotation + filter_change + zoom_change
+
+    def overhead_time(self, acq_list):
+        '''Returns the estimated total dead time (s) between the acquisitions of the list'''
+        return float(self.transition_times(acq_list).sum())
+
+    def estimate_time(self, acq_list, framerate):
+        '''Returns the estimated total time (s) of the list: imaging plus dead time'''
+        return acq_list.get_acquisition_time(framerate) + self.overhead_time(acq_list)
+
+
+def _tile_distance(cost_model, tiles, a, b):
+    '''Symmetric travel time between tile a and tile(s) b, tiles is the (n_tiles, 4) array of x, y, z_start, rot'''
+    delta = tiles[b] - tiles[a]
+    return (cost_model.stage_time(delta[..., 0], delta[..., 1], delta[..., 2]) +
+            cost_model.rotation_time(delta[..., 3]))
+
+
+def _nearest_neighbour_tour(cost_model, tiles):
+    n_tiles = len(tiles)
+    tour = [0]
+    remaining = np.ones(n_tiles, dtype=bool)
+    remaining[0] = False
+    candidates = np.arange(n_tiles)
+    for i in range(n_tiles - 1):
+        left = candidates[remaining]
+        nearest = left[np.argmin(_tile_distance(cost_model, tiles, tour[-1], left))]
+        tour.append(nearest)
+        remaining[nearest] = False
+    return np.array(tour)
+
+
+def _two_opt(cost_model, tiles, tour, max_passes):
+    '''Improves an open tour with a fixed start by reversing segments, vectorized over the segment end'''
+    n_tiles = len(tour)
+    for n_pass in range(max_passes):
+        improved = False
+        for i in range(n_tiles - 2):
+            edges = _tile_distance(cost_model, tiles, tour[:-1], tour[1:])
+            a, b = tour[i], tour[i + 1]
+            ends = tour[i + 2:]
+            # reversing tour[i+1:j+1] replaces edges (a, b) and (tour[j], tour[j+1]) with (a, tour[j]) and (b, tour[j+1])
+            delta = _tile_distance(cost_model, tiles, a, ends) - edges[i]
+            delta[:-1] += _tile_distance(cost_model, tiles, b, tour[i + 3:]) - edges[i + 2:]
+            k = int(np.argmin(delta))
+            if delta[k] < -1e-6:
+                j = i + 2 + k
+                tour[i + 1:j + 1] = tour[i + 1:j + 1][::-1].copy()
+                improved = True
+        if not improved:
+            break
+    return tour
+
+
+def _order_rows_within_tile(rows, filter_codes, zoom_codes, state):
+    '''Orders the rows of a tile greedily, preferring rows which need no filter and no zoom change'''
+    ordered = []
+    rows = list(rows)
+    while rows:
+        costs = [(filter_codes[row] != state[0]) + 2 * (zoom_codes[row] != state[1]) for row in rows]
+        row = rows.pop(int(np.argmin(costs)))
+        ordered.append(row)
+        state = (filter_codes[row], zoom_codes[row])
+    return ordered, state
+
+
+def optimize_acquisition_order(acq_list, cost_model=None, max_passes=3):
+    '''
+    Returns a reordered AcquisitionList with the same Acquisition objects and less estimated dead time.
+    All rows of a tile stay consecutive, the first tile of the list stays the first one.
+    If no better order is found, the original order is returned.
+
+    Args:
+        acq_list (AcquisitionList): the acquisitions to reorder
+        cost_model (AcquisitionCostModel): device timing, default AcquisitionCostModel()
+        max_passes (int): maximum number of 2-opt passes over the tile sequence
+    '''
+    if cost_model is None:
+        cost_model = AcquisitionCostModel()
+    if len(acq_list) < 3:
+        return AcquisitionList(list(acq_list))
+
+    columns = acq_list.columns
+    table = columns.table
+    rows_per_tile = _rows_per_tile(columns.tile_ids)
+    first_rows = np.array([rows[0] for rows in rows_per_tile])
+    tiles = np.stack([table['x_pos'][first_rows], table['y_pos'][first_rows],
+                      table['z_start'][first_rows], table['rot'][first_rows]], axis=-1)
+    tour = _nearest_neighbour_tour(cost_model, tiles)
+    if len(tour) > 3:
+        tour = _two_opt(cost_model, tiles, tour, max_passes)
+
+    filter_codes, zoom_codes = columns.codes['filter'], columns.codes['zoom']
+    state = (filter_codes[0], zoom_codes[0])
+    order = []
+    for tile in tour:
+        rows, state = _order_rows_within_tile(rows_per_tile[tile], filter_codes, zoom_codes, state)
+        order.extend(rows)
+
+    optimized = AcquisitionList([acq_list[row] for row in order])
+    before, after = cost_model.overhead_time(acq_list), cost_model.overhead_time(optimized)
+    logger.info(f'Acquisition order optimized: estimated dead time {before:.1f} s -> {after:.1f} s')
+    if after < before:
+        return optimized
+    return AcquisitionList(list(acq_list))
+
+
+def _rows_per_tile(tile_ids):
+    '''Row indices of every tile, in the original row order'''
+    order = np.argsort(tile_ids, kind='stable')
+    counts = np.bincount(tile_ids)
+    return np.split(order, np.cumsum(counts)[:-1])
@@ -5,8 +5,11 @@ acquisitions.py
 Helper classes for mesoSPIM acquisitions
 '''
 from pathlib import Path
+import csv
 import indexed
 import os.path
+import weakref
+import numpy as np
 import logging
 logger = logging.getLogger(__name__)
 from ..plugins.utils import get_image_writer_name_for_file_extension, get_image_writer_from_name
@@ -69,6 +72,7 @@ class Acquisition(indexed.IndexedOrderedDict):
                  processing='MAX',
                  ):
 
+        self._owners = weakref.WeakValueDictionary() # id: AcquisitionList holding this acquisition, its cached columns depend on it
         super().__init__()
 
         self['x_pos']=x_pos
@@ -97,6 +101,22 @@ class Acquisition(indexed.IndexedOrderedDict):
 
     def __setitem__(self, key, value):
         super().__setitem__(key, value)
+        self._mark_modified()
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._mark_modified()
+
+    def __reduce__(self):
+        ''' Copies and pickles do not belong to the lists of the original '''
+        cls, args, state, listitems, dictitems = super().__reduce__()
+        if state:
+            state.pop('_owners', None)
+        return cls, args, state or None, listitems, dictitems
+
+    def _mark_modified(self):
+        for acq_list in list(self._owners.values()):
+            acq_list._mark_modified()
 
     def __call__(self, index):
         ''' This way the dictionary is callable with an index '''
@@ -223,6 +243,57 @@ class Acquisition(indexed.IndexedOrderedDict):
             expected_focus += f_step
 
 
+class AcquisitionColumns:
+    '''
+    Columnar (structured NumPy) view of an AcquisitionList with cached unique-value and tile indices.
+    Built by AcquisitionList.columns and rebuilt after any change of the list or its rows.
+
+    Attributes:
+        table (np.ndarray): structured array, one record per row, one float64 field per NUMERIC_KEYS entry
+        image_counts (np.ndarray): number of planes per row
+        tile_ids (np.ndarray): tile index per row, tiles are unique (x_pos, y_pos, z_start, rot) in order of appearance
+        codes (dict): per CATEGORICAL_KEYS entry, the index of each row's value in unique_values
+    '''
+    NUMERIC_KEYS = ('x_pos', 'y_pos', 'z_start', 'z_end', 'z_step', 'rot', 'f_start', 'f_end', 'intensity')
+    TILE_KEYS = ('x_pos', 'y_pos', 'z_start', 'rot')
+    CATEGORICAL_KEYS = ('laser', 'shutterconfig', 'rot', 'filter', 'zoom')
+
+    def __init__(self, acq_list):
+        self.table = np.array([tuple(self._to_float(acq[key]) for key in self.NUMERIC_KEYS) for acq in acq_list],
+                              dtype=[(key, 'f8') for key in self.NUMERIC_KEYS])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.image_counts = np.abs(np.round((self.table['z_end'] - self.table['z_start']) / self.table['z_step'])) + 1
+
+        # tiles in order of first appearance
+        tiles = self.table[list(self.TILE_KEYS)]
+        _, first_rows, inverse = np.unique(tiles, return_index=True, return_inverse=True)
+        order = np.argsort(first_rows)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        self.tile_ids = rank[inverse.ravel()]
+        self.tile_index = {tuple(tiles[i].tolist()): n for n, i in enumerate(first_rows[order])}
+
+        # unique values in order of first appearance, kept as the original Python objects
+        self.unique_values = {}
+        self.value_index = {}
+        self.codes = {} # per row: index of the value in unique_values
+        for key in self.CATEGORICAL_KEYS:
+            index = dict.fromkeys(acq[key] for acq in acq_list)
+            self.unique_values[key] = list(index)
+            self.value_index[key] = {value: n for n, value in enumerate(index)}
+            self.codes[key] = np.fromiter((self.value_index[key][acq[key]] for acq in acq_list), dtype=int, count=len(acq_list))
+
+    @staticmethod
+    def _to_float(value):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+
+    def tile_key(self, acq):
+        return tuple(self._to_float(acq[key]) for key in self.TILE_KEYS)
+
+
 class AcquisitionList(list):
     '''
     Class for a list of acquisition objects
@@ -244,6 +315,7 @@ class AcquisitionList(list):
     '''
     def __init__(self, *args):
         list.__init__(self, *args)
+        self._mark_modified(self)
 
         ''' If no arguments are provided, create a
         default acquistion in the list '''
@@ -259,6 +331,73 @@ class AcquisitionList(list):
         # '''
         # self.rotation_point = {'x_abs' : None, 'y_abs' : None, 'z_abs' : None}
 
+    @property
+    def columns(self):
+        '''Columnar view of the list (AcquisitionColumns), cached until the list or one of its rows changes'''
+        version = getattr(self, '_version', 0)
+        if getattr(self, '_columns_version', None) != version:
+            self._columns = AcquisitionColumns(self)
+            self._columns_version = version
+        return self._columns
+
+    def _mark_modified(self, added=()):
+        '''Invalidates the cached columns. The added acquisitions report their changes to this list.'''
+        self._version = getattr(self, '_version', 0) + 1
+        for acq in added:
+            if isinstance(acq, Acquisition):
+                acq._owners[id(self)] = self
+
+    # List mutations invalidate the cached columns
+    def __setitem__(self, index, value):
+        if isinstance(index, slice):
+            value = list(value)
+        super().__setitem__(index, value)
+        self._mark_modified(value if isinstance(index, slice) else (value,))
+
+    def __delitem__(self, index):
+        super().__delitem__(index)
+        self._mark_modified()
+
+    def __iadd__(self, other):
+        other = list(other)
+        result = super().__iadd__(other)
+        self._mark_modified(other)
+        return result
+
+    def append(self, acq):
+        super().append(acq)
+        self._mark_modified((acq,))
+
+    def extend(self, acqs):
+        acqs = list(acqs)
+        super().extend(acqs)
+        self._mark_modified(acqs)
+
+    def insert(self, index, acq):
+        super().insert(index, acq)
+        self._mark_modified((acq,))
+
+    def pop(self, index=-1):
+        acq = super().pop(index)
+        self._mark_modified()
+        return acq
+
+    def remove(self, acq):
+        super().remove(acq)
+        self._mark_modified()
+
+    def clear(self):
+        super().clear()
+        self._mark_modified()
+
+    def sort(self, *args, **kwargs):
+        super().sort(*args, **kwargs)
+        self._mark_modified()
+
+    def reverse(self):
+        super().reverse()
+        self._mark_modified()
+
     def get_capitalized_keylist(self):
         return self[0].get_capitalized_keylist()
 
@@ -272,21 +411,13 @@ class AcquisitionList(list):
         '''
         Returns total time in seconds of a list of acquisitions
         '''
-        time = 0
-        for i in range(len(self)):
-            time += self[i].get_acquisition_time(framerate)
-
-        return time
+        return float(self.columns.image_counts.sum()) / framerate
 
     def get_image_count(self):
         '''
         Returns the total number of planes for a list of acquistions
         '''
-        image_count = 0
-        for i in range(len(self)):
-            image_count += self[i].get_image_count()
-
-        return image_count
+        return int(self.columns.image_counts.sum())
 
     def get_startpoint(self):
         return self[0].get_startpoint()
@@ -372,40 +503,42 @@ class AcquisitionList(list):
 
     def get_n_shutter_configs(self):
         """Get the number of unique shutter configs (1 or 2)"""
-        sconfig_list = [a['shutterconfig'] for a in self]
-        sconfig_set = set(sconfig_list)
-        return len(sconfig_set)
+        return len(self.columns.unique_values['shutterconfig'])
 
     def get_n_angles(self):
         """Get the number of unique angles"""
-        angle_list = [a['rot'] for a in self]
-        angle_set = set(angle_list)
-        return len(angle_set)
+        return len(self.columns.unique_values['rot'])
 
     def get_n_lasers(self):
         """Get the number of unique laser lines"""
-        laser_list = [a['laser'] for a in self]
-        laser_set = set(laser_list)
-        return len(laser_set)
+        return len(self.columns.unique_values['laser'])
 
     def get_n_tiles(self):
         """Get the number of tiles as unique (x,y,z_start,rot) combinations"""
-        tile_list = []
-        for a in self:
-            tile_str = f"{a['x_pos']}{a['y_pos']}{a['z_start']}{a['rot']}"
-            if not tile_str in tile_list:
-                tile_list.append(tile_str)
-        return len(tile_list)
+        return len(self.columns.tile_index)
 
     def get_tile_index(self, acq):
         """Get the the tile index for given acquisition"""
-        acq_str = f"{acq['x_pos']}{acq['y_pos']}{acq['z_start']}{acq['rot']}"
-        tile_list = []
-        for a in self:
-            tile_str = f"{a['x_pos']}{a['y_pos']}{a['z_start']}{a['rot']}"
-            if not tile_str in tile_list:
-                tile_list.append(tile_str)
-        return tile_list.index(acq_str)
+        columns = self.columns
+        tile_key = columns.tile_key(acq)
+        if tile_key not in columns.tile_index:
+            raise ValueError(f"Tile {tile_key} is not in the acquisition list")
+        return columns.tile_index[tile_key]
+
+    def get_rows_outside_limits(self, x_range, y_range, z_range):
+        """Get the indices of rows whose x_pos, y_pos, z_start or z_end is outside the given (min, max) ranges"""
+        table = self.columns.table
+
+        def outside(values, limits):
+            return ~((limits[0] <= values) & (values <= limits[1]))
+
+        unsafe = (outside(table['x_pos'], x_range) | outside(table['y_pos'], y_range) |
+                  outside(table['z_start'], z_range) | outside(table['z_end'], z_range))
+        return np.flatnonzero(unsafe).tolist()
+
+    def get_tile_ids(self):
+        """Get the tile index of every row as an array"""
+        return self.columns.tile_ids
 
     def get_unique_attr_list(self, key: str = 'laser') -> list:
         """Return ordered list of acquisition attributes.
@@ -421,11 +554,7 @@ class AcquisitionList(list):
         """
         attributes = ('laser', 'shutterconfig', 'rot')
         assert key in attributes, f'Key {key} must be one of {attributes}.'
-        unique_list = []
-        for acq in self:
-            if acq[key] not in unique_list:
-                unique_list.append(acq[key])
-        return unique_list
+        return list(self.columns.unique_values[key])
 
     def find_value_index(self, value: str = '488 nm', key: str = 'laser'):
         """Find the attribute index in the acquisition list.
@@ -440,9 +569,37 @@ class AcquisitionList(list):
         al.find_value_index('561 nm', 'laser') # -> 1
         al.find_value_index('637 nm', 'laser') # -> 2
         """
-        unique_list = self.get_unique_attr_list(key)
-        assert value in unique_list, f"Value({value}) not found in list {unique_list}"
-        return unique_list.index(value)
-
-
-
+        value_index = self.columns.value_index[key]
+        assert value in value_index, f"Value({value}) not found in list {list(value_index)}"
+        return value_index[value]
+
+    def save_csv(self, filename):
+        ''' Saves the acquisition table as a CSV file '''
+        keys = self.get_keylist()
+        with open(filename, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=keys)
+            writer.writeheader()
+            for acq in self:
+                writer.writerow(dict(acq))
+
+    @classmethod
+    def load_csv(cls, filename):
+        ''' Loads an acquisition table saved by save_csv(), values are converted to the types of the default Acquisition '''
+        ref = Acquisition()
+        type_map = {key: type(ref[key]) for key in ref.keys()}
+        acq_list = cls([])
+        with open(filename, 'r', newline='') as file:
+            reader = csv.DictReader(file)
+            for row in reader:
+                acq = Acquisition()
+                for key, value in row.items():
+                    expected_type = type_map.get(key, str)
+                    try:
+                        acq[key] = expected_type(value)
+                    except (ValueError, TypeError):
+                        try:
+                            acq[key] = float(value)
+                        except (ValueError, TypeError):
+                            acq[key] = value
+                acq_list.append(acq)
+        return acq_list
@@ -0,0 +1,83 @@
+'''
+device_operations.py
+========================================
+
+Concurrent execution of independent device operations, e.g. the device changes of
+prepare_acquisition: the filter wheel, zoom and XYZ stages sit on different serial ports
+and can move at the same time. Operations on the same serial port (e.g. a Dynamixel filter wheel
+and zoom on one servo bus) run one after the other.
+
+Every operation runs in a thread of the executor and first waits for the operations it depends on
+(e.g. the XYZ move waits for the rotation). Operations are submitted in the order they are added
+and dependencies must be added first, so a FIFO thread pool never blocks on a dependency which was not started yet.
+'''
+import time
+from concurrent.futures import Future, wait
+import logging
+logger = logging.getLogger(__name__)
+
+
+class DeviceOperationGraph:
+    '''
+    Args:
+        executor (concurrent.futures.Executor): runs the operations, None runs them one after another
+            in the calling thread, e.g. to compare against the sequential timing
+
+    Usage:
+        graph = DeviceOperationGraph(executor)
+        graph.add('rotation', serial_worker.move_absolute, {'theta_abs': 90}, wait_until_done=True)
+        graph.add('stages', serial_worker.move_absolute, startpoint, wait_until_done=True, after=('rotation',))
+        graph.add('filter', serial_worker.set_filter, '515-30', wait_until_done=True, port='COM3')
+        graph.add('zoom', serial_worker.set_zoom, '2x', wait_until_done=True, port='COM3') # after the filter
+        durations = graph.wait()
+    '''
+    def __init__(self, executor=None):
+        self.executor = executor
+        self.futures = {}
+        self.last_on_port = {} # serial port -> last operation added on it
+        self.durations = {} # seconds per operation, without the time waiting for dependencies
+
+    def add(self, name, function, *args, after=(), port=None, **kwargs):
+        '''Starts function(*args, **kwargs) once the operations named in `after` are done. Returns its Future.
+        With a serial `port`, the operation also waits for the operation added before it on the same port.'''
+        if name in self.futures:
+            raise ValueError(f'Device operation added twice: {name}')
+        unknown = [dependency for dependency in after if dependency not in self.futures]
+        if unknown:
+            raise ValueError(f'Device operation {name} depends on operations which were not added before: {unknown}')
+        if port is not None:
+            port = str(port).upper() # Windows COM port names are case-insensitive
+            if port in self.last_on_port and self.last_on_port[port] not in after:
+                after = tuple(after) + (self.last_on_port[port],)
+            self.last_on_port[port] = name
+        dependencies = [self.futures[dependency] for dependency in after]
+        if self.executor is None:
+            future = Future()
+            try:
+                future.set_result(self._run(name, dependencies, function, args, kwargs))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            future = self.executor.submit(self._run, name, dependencies, function, args, kwargs)
+        self.futures[name] = future
+        return future
+
+    def _run(self, name, dependencies, function, args, kwargs):
+        for dependency in dependencies:
+            dependency.result() # re-raises: an operation is not started if one of its dependencies failed
+        t_start = time.perf_counter()
+        result = function(*args, **kwargs)
+        self.durations[name] = time.perf_counter() - t_start
+        return result
+
+    def wait(self, timeout=None):
+        '''Waits until all operations are done and re-raises the first exception.
+        Returns the duration (s) of every operation.'''
+        done, not_done = wait(list(self.futures.values()), timeout)
+        if not_done:
+            raise TimeoutError(f'Device operations not done after {timeout} s: {[name for name, future in self.futures.items() if future in not_done]}')
+        for name, future in self.futures.items():
+            if future.exception() is not None:
+                logger.error(f'Device operation {name} failed: {future.exception()}')
+                raise future.exception()
+        return dict(self.durations)
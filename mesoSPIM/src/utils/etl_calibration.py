@@ -0,0 +1,150 @@
+'''
+etl_calibration.py
+========================================
+
+In-memory ETL calibration table, loaded once from the ETL csv file and indexed by (wavelength, zoom).
+
+The csv file contains the columns (';'-delimited):
+    Objective;Wavelength;Zoom;ETL-Left-Offset;ETL-Left-Amp;ETL-Right-Offset;ETL-Right-Amp
+
+The table is reloaded only when the file changes on disk (mtime or size). Saved parameters are appended
+to the file, later rows override earlier ones of the same (wavelength, zoom); the file is compacted
+when it contains more superseded rows than current ones.
+'''
+import os
+import csv
+import re
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+FIELDNAMES = ['Objective', 'Wavelength', 'Zoom', 'ETL-Left-Offset', 'ETL-Left-Amp', 'ETL-Right-Offset', 'ETL-Right-Amp']
+# state parameter -> csv column
+PARAMETER_COLUMNS = {'etl_l_offset': 'ETL-Left-Offset',
+                     'etl_l_amplitude': 'ETL-Left-Amp',
+                     'etl_r_offset': 'ETL-Right-Offset',
+                     'etl_r_amplitude': 'ETL-Right-Amp'}
+
+
+def _leading_number(string):
+    '''488 nm -> 488.0, 1.25x -> 1.25, None if the string does not start with a number'''
+    match = re.match(r'\s*([0-9]*\.?[0-9]+)', string)
+    return float(match.group(1)) if match else None
+
+
+def clean_zoom(zoom):
+    '''Zoom string cleanup for backwards compatibility with existing ETL files, e.g. '1.2x BlahBlah' -> '1.2x' '''
+    return zoom.split('x')[0] + 'x'
+
+
+class ETLCalibrationTable:
+    '''
+    Args:
+        path (str): path of the ETL csv file
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.rows = {} # (wavelength, zoom) -> {state parameter: float}
+        self.objectives = {} # (wavelength, zoom) -> 'Objective' column, kept when the file is rewritten
+        self.n_file_rows = 0
+        self._file_signature = None
+        self.reload_if_changed()
+
+    def _signature(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def reload_if_changed(self):
+        '''Reloads the table if the file was changed on disk since it was loaded. Returns True if reloaded.'''
+        signature = self._signature()
+        if signature == self._file_signature:
+            return False
+        self.load()
+        return True
+
+    def load(self):
+        rows, objectives = {}, {}
+        n_file_rows = 0
+        with open(self.path, newline='') as file:
+            for row in csv.DictReader(file, delimiter=';'):
+                key = (row['Wavelength'], row['Zoom'])
+                rows[key] = {parameter: float(row[column]) for parameter, column in PARAMETER_COLUMNS.items()}
+                objectives[key] = row.get('Objective') or '1x'
+                n_file_rows += 1
+        self.rows, self.objectives = rows, objectives
+        self.n_file_rows = n_file_rows
+        self._file_signature = self._signature()
+        logger.info(f'ETL calibration loaded: {len(rows)} entries from {self.path}')
+
+    def lookup(self, laser, zoom, interpolate=False):
+        '''Returns the ETL parameters of laser and zoom as dict of state parameters, or None if not in the table.
+        The exact zoom string is preferred over the cleaned one (e.g. '1.2x BlahBlah' -> '1.2x').
+        With interpolate=True, missing entries are linearly interpolated over the wavelength (same zoom),
+        or over the zoom magnification (same wavelength), from at least two neighbouring entries.'''
+        for key in ((laser, zoom), (laser, clean_zoom(zoom))):
+            if key in self.rows:
+                return dict(self.rows[key])
+        if interpolate:
+            parameters = self.interpolate(laser, zoom)
+            if parameters is not None:
+                logger.warning(f'ETL parameters of {laser} - {zoom} interpolated: {parameters}')
+            return parameters
+        return None
+
+    def interpolate(self, laser, zoom):
+        '''Linear interpolation of missing ETL parameters, clamped at the ends of the calibrated range'''
+        wavelength, magnification = _leading_number(laser), _leading_number(zoom)
+        zoom_candidates = (zoom, clean_zoom(zoom))
+        # same zoom, other wavelengths
+        points = [(_leading_number(key[0]), values) for key, values in self.rows.items() if key[1] in zoom_candidates]
+        x_target = wavelength
+        if x_target is None or len([x for x, values in points if x is not None]) < 2:
+            # same wavelength, other zooms
+            points = [(_leading_number(key[1]), values) for key, values in self.rows.items() if key[0] == laser]
+            x_target = magnification
+        points = sorted(((x, values) for x, values in points if x is not None), key=lambda point: point[0])
+        if x_target is None or len(points) < 2:
+            return None
+        x = np.array([point[0] for point in points])
+        return {parameter: float(np.interp(x_target, x, [point[1][parameter] for point in points]))
+                for parameter in PARAMETER_COLUMNS}
+
+    def update(self, laser, zoom, parameters):
+        '''Stores the ETL parameters (dict of state parameters) of laser and zoom in the table and in the file.'''
+        self.reload_if_changed()
+        self.rows[(laser, zoom)] = {parameter: float(parameters[parameter]) for parameter in PARAMETER_COLUMNS}
+        if self.n_file_rows + 1 > 2 * len(self.rows):
+            self.save()
+        else:
+            self._append(laser, zoom)
+
+    def _row(self, laser, zoom):
+        values = self.rows[(laser, zoom)]
+        row = {'Objective': self.objectives.get((laser, zoom), '1x'), 'Wavelength': laser, 'Zoom': zoom}
+        row.update({column: values[parameter] for parameter, column in PARAMETER_COLUMNS.items()})
+        return row
+
+    def _append(self, laser, zoom):
+        needs_newline = False
+        with open(self.path, 'rb') as file:
+            if file.seek(0, os.SEEK_END) > 0:
+                file.seek(-1, os.SEEK_END)
+                needs_newline = file.read(1) not in (b'\n', b'\r')
+        with open(self.path, 'a', newline='') as file:
+            if needs_newline:
+                file.write('\r\n')
+            csv.DictWriter(file, fieldnames=FIELDNAMES, dialect='excel', delimiter=';').writerow(self._row(laser, zoom))
+        self.n_file_rows += 1
+        self._file_signature = self._signature()
+
+    def save(self):
+        '''Rewrites the file with one row per (wavelength, zoom), via a temporary file'''
+        tmp_path = self.path + '_tmp'
+        with open(tmp_path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=FIELDNAMES, dialect='excel', delimiter=';')
+            writer.writeheader()
+            for laser, zoom in self.rows:
+                writer.writerow(self._row(laser, zoom))
+        os.replace(tmp_path, self.path)
+        self.n_file_rows = len(self.rows)
+        self._file_signature = self._signature()
@@ -0,0 +1,245 @@
+'''
+frame_pool.py
+========================================
+
+Fixed-size pool of preallocated camera frames, shared by the Camera and ImageWriter threads.
+
+Slot life cycle:
+    acquire() -> fill frames[slot] -> push(slot) -> pop() or pop_batch() -> write -> release(slot)
+
+The pool replaces the unbounded deque between camera and writer: RAM use is fixed to
+depth x frame size, and if the writer falls behind, acquire() blocks the camera thread (back-pressure)
+instead of allocating more memory.
+
+An image writer can provide the frame buffer instead (see ImageWriter.frame_allocator, e.g. shared memory
+read by a writer process): attach() makes the pool acquire and release the slots of the writer's buffer,
+frames are acquired directly into it and the writer takes slots over with hand_over() instead of copying the frames.
+
+The pool also records the time frames wait for the writer ('queue'), the time from acquire() to release()
+of a slot ('frame') and the waits for a free slot ('stall') in its LatencyRecorder, see pipeline_stats.py.
+These, the dropped frames and the times of the first acquired and the last written frame cover all image
+series of a run (e.g. an acquisition list) until reset_run().
+'''
+import time
+import threading
+from collections import deque
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+from .pipeline_stats import LatencyRecorder
+
+
+class FramePool:
+    '''
+    Args:
+        depth (int): number of preallocated frame slots
+        dtype (str): pixel data type of the frames
+    '''
+    def __init__(self, depth=128, dtype='uint16'):
+        self.depth = int(depth)
+        self.dtype = dtype
+        self.shape = None
+        self.frames = None # np.ndarray of shape (depth, y, x), allocated by allocate()
+        self.allocator = None # FrameAllocator of the image writer while attached, see attach()
+        self._own = None # (depth, shape, frames) of the pool's own buffer while attached
+        self._in_use = 0 # slots of the allocator acquired and not yet released or handed over
+        self._free = deque()
+        self._filled = deque()
+        self._cond = threading.Condition()
+        self._acquired_at = np.zeros(self.depth)
+        self._pushed_at = np.zeros(self.depth)
+        self.latency = LatencyRecorder() # not reset by reset_stats(), covers all image series until reset_run()
+        self.reset_run()
+        self.reset_stats()
+
+    def allocate(self, shape):
+        '''(Re)allocates the frame buffer if the frame shape changed, e.g. after a binning change,
+        and discards frames left over from a previous image series. Called before an image series starts.'''
+        shape = tuple(shape)
+        self.detach() # a writer left attached, e.g. after an error
+        with self._cond:
+            if self.frames is None or self.shape != shape:
+                self.frames = np.empty((self.depth,) + shape, dtype=self.dtype)
+                self.shape = shape
+                self._free = deque(range(self.depth))
+                self._filled.clear()
+                logger.info(f'Frame pool allocated: {self.depth} x {shape} {self.dtype}, {self.frames.nbytes/2**30:.2f} GB')
+        self.clear()
+        self.reset_stats()
+
+    def attach(self, allocator):
+        '''Uses the frame buffer of an image writer (FrameAllocator) until detach(): its slots are acquired
+        and released through the allocator, written frames are handed over to the writer with hand_over().
+        Called when the writer is opened, before the image series starts.'''
+        with self._cond:
+            self._own = (self.depth, self.shape, self.frames)
+            self.allocator = allocator
+            self.frames = allocator.frames
+            self.depth = self.frames.shape[0]
+            self.shape = tuple(self.frames.shape[1:])
+            self._acquired_at = np.zeros(self.depth)
+            self._pushed_at = np.zeros(self.depth)
+            self._filled.clear()
+            self._in_use = 0
+        logger.info(f'Frame pool attached to the frame buffer of the image writer: {self.depth} x {self.shape}')
+
+    def detach(self):
+        '''Discards the frames not written yet and returns to the pool's own buffer, before the writer is closed'''
+        with self._cond:
+            if self.allocator is None:
+                return
+            for slot in self._filled:
+                self.allocator.release(slot)
+            self._filled.clear()
+            self.allocator = None
+            self.depth, self.shape, self.frames = self._own
+            self._own = None
+            self._acquired_at = np.zeros(self.depth)
+            self._pushed_at = np.zeros(self.depth)
+            self._free = deque(range(self.depth))
+            self._cond.notify_all()
+
+    def reset_run(self):
+        '''Resets the statistics of all image series, e.g. before an acquisition list runs'''
+        self.latency.reset()
+        self.dropped = 0                # number of acquire() calls which timed out
+        self.first_acquired_at = None   # time.perf_counter() of the first acquired slot
+        self.last_written_at = None     # time.perf_counter() of the last slot released or handed over
+
+    def reset_stats(self):
+        '''Resets the statistics of the image series'''
+        self.high_water = 0     # max number of slots in use (filled or being written)
+        self.stalls = 0         # number of acquire() calls which had to wait for a free slot
+        self.stall_time = 0.0   # total time spent waiting for free slots, seconds
+
+    @property
+    def stats(self):
+        return {'depth': self.depth, 'high_water': self.high_water, 'stalls': self.stalls,
+                'stall_time_s': round(self.stall_time, 3), 'dropped': self.dropped}
+
+    def acquire(self, timeout=None):
+        '''Returns the index of a free slot, blocking while the pool is full (back-pressure).
+        Returns None if no slot got free within timeout (seconds).'''
+        if self.allocator is not None:
+            return self._acquire_from_allocator(timeout)
+        with self._cond:
+            if not self._free:
+                self.stalls += 1
+                t_start = time.perf_counter()
+                self._cond.wait_for(lambda: len(self._free) > 0, timeout)
+                stall_time = time.perf_counter() - t_start
+                self.stall_time += stall_time
+                self.latency.record('stall', stall_time)
+                if not self._free:
+                    self.dropped += 1
+                    return None
+            slot = self._free.popleft()
+            self._acquired_at[slot] = time.perf_counter()
+            if self.first_acquired_at is None:
+                self.first_acquired_at = self._acquired_at[slot]
+            in_use = self.depth - len(self._free)
+            if in_use > self.high_water:
+                self.high_water = in_use
+            return slot
+
+    def _acquire_from_allocator(self, timeout):
+        allocator = self.allocator
+        slot = allocator.acquire(0)
+        if slot is None:
+            self.stalls += 1
+            t_start = time.perf_counter()
+            slot = allocator.acquire(timeout)
+            stall_time = time.perf_counter() - t_start
+            self.stall_time += stall_time
+            self.latency.record('stall', stall_time)
+            if slot is None:
+                self.dropped += 1
+                return None
+        with self._cond:
+            attached = self.allocator is allocator
+            if attached:
+                self._acquired_at[slot] = time.perf_counter()
+                if self.first_acquired_at is None:
+                    self.first_acquired_at = self._acquired_at[slot]
+                self._in_use += 1
+                if self._in_use > self.high_water:
+                    self.high_water = self._in_use
+        if not attached: # detached while waiting, e.g. on abort
+            allocator.release(slot)
+            return self.acquire(timeout)
+        return slot
+
+    def push(self, slot):
+        '''Hands a filled slot over to the consumer'''
+        with self._cond:
+            self._pushed_at[slot] = time.perf_counter()
+            self._filled.append(slot)
+            self._cond.notify_all()
+
+    def pop(self, timeout=0):
+        '''Returns the oldest filled slot, or None if there is none within timeout (seconds, None waits forever)'''
+        with self._cond:
+            if not self._filled and timeout != 0:
+                self._cond.wait_for(lambda: len(self._filled) > 0, timeout)
+            if self._filled:
+                slot = self._filled.popleft()
+                self.latency.record('queue', time.perf_counter() - self._pushed_at[slot])
+                return slot
+            return None
+
+    def pop_batch(self, timeout=0):
+        '''Returns all filled slots (oldest first) in one pass, waiting up to timeout (seconds, None waits forever)
+        for the first one. Returns an empty list if there is none.'''
+        with self._cond:
+            if not self._filled and timeout != 0:
+                self._cond.wait_for(lambda: len(self._filled) > 0, timeout)
+            slots = list(self._filled)
+            self._filled.clear()
+            now = time.perf_counter()
+            for slot in slots:
+                self.latency.record('queue', now - self._pushed_at[slot])
+            return slots
+
+    def release(self, slot):
+        '''Returns a slot to the pool after its frame was written'''
+        with self._cond:
+            self.last_written_at = time.perf_counter()
+            self.latency.record('frame', self.last_written_at - self._acquired_at[slot])
+            if self.allocator is not None:
+                self._in_use -= 1
+                self.allocator.release(slot)
+                return
+            self._free.append(slot)
+            self._cond.notify_all()
+
+    def hand_over(self, slot):
+        '''Records a written slot which the attached image writer took over, the writer frees it itself'''
+        with self._cond:
+            self.last_written_at = time.perf_counter()
+            self.latency.record('frame', self.last_written_at - self._acquired_at[slot])
+            self._in_use -= 1
+
+    def put(self, image, timeout=None):
+        '''Copies an image which was not acquired into the pool directly. Returns the slot, or None on timeout.'''
+        slot = self.acquire(timeout)
+        if slot is not None:
+            np.copyto(self.frames[slot], image)
+            self.push(slot)
+        return slot
+
+    def clear(self):
+        '''Discards all filled frames, e.g. when an acquisition is stopped'''
+        with self._cond:
+            if self.allocator is not None:
+                for slot in self._filled:
+                    self._in_use -= 1
+                    self.allocator.release(slot)
+            else:
+                self._free.extend(self._filled)
+            self._filled.clear()
+            self._cond.notify_all()
+
+    def __len__(self):
+        '''Number of filled frames waiting for the consumer'''
+        return len(self._filled)
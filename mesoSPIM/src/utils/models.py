@@ -5,7 +5,6 @@ from .acquisitions import Acquisition, AcquisitionList
 #from ..mesoSPIM_State import mesoSPIM_StateSingleton
 
 import copy
-import csv
 
 
 class AcquisitionModel(QtCore.QAbstractTableModel):
@@ -357,12 +356,7 @@ class AcquisitionModel(QtCore.QAbstractTableModel):
 
     def saveModel(self, filename):
         ''' Saves the acquisition table as a CSV file '''
-        keys = self._table.get_keylist()
-        with open(filename, 'w', newline='') as file:
-            writer = csv.DictWriter(file, fieldnames=keys)
-            writer.writeheader()
-            for acq in self._table:
-                writer.writerow(dict(acq))
+        self._table.save_csv(filename)
 
     def setTable(self, table):
         self.modelAboutToBeReset.emit()
@@ -373,24 +367,8 @@ class AcquisitionModel(QtCore.QAbstractTableModel):
         self._table[row]['shutterconfig'] = shutterconfig
     
     def loadModel(self, filename):
+        new_table = AcquisitionList.load_csv(filename)
         self.modelAboutToBeReset.emit()
-        ref = Acquisition()
-        type_map = {key: type(ref[key]) for key in ref.keys()}
-        new_table = AcquisitionList([])
-        with open(filename, 'r', newline='') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                acq = Acquisition()
-                for key, value in row.items():
-                    expected_type = type_map.get(key, str)
-                    try:
-                        acq[key] = expected_type(value)
-                    except (ValueError, TypeError):
-                        try:
-                            acq[key] = float(value)
-                        except (ValueError, TypeError):
-                            acq[key] = value
-                new_table.append(acq)
         self._table = new_table
         self.modelReset.emit()
 
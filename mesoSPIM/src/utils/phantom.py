@@ -0,0 +1,267 @@
+'''
+phantom.py
+========================================
+
+Synthetic 3D sample for the demo camera: a procedurally generated, periodic phantom
+(fluorescent beads, fibres and a tissue-like texture) which is imaged at the current stage position,
+focus, zoom and laser, with a defocus blur and shot noise.
+
+The phantom is stored on a coarse voxel grid (periodic in x, y and z, so every stage position shows a sample).
+A frame is rendered by
+    1. interpolating the z-plane of the volume (of the current laser channel),
+    2. blurring it with the defocus |f - focus_um| (Gaussian, in Fourier space, on the coarse grid),
+    3. sampling the camera columns of every voxel row,
+    4. adding shot noise (Gaussian approximation) to these voxel rows from a precomputed noise field,
+    5. copying the voxel row of every camera row and adding read noise per pixel, both at a random offset per frame.
+Only steps 5 work on the full frame: a copy of the rows and one integer addition, so that planes of a stack,
+each a new state, are rendered at more than 100 fps at 2048x2048. Camera rows of the same voxel row
+differ by their read noise only.
+Rendered frames are kept in a PhantomFrameCache, keyed by the quantized imaging state,
+so repeated states (Live mode, planes of the same voxel) are served without rendering.
+'''
+import time
+from collections import OrderedDict
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+NOISE_MARGIN = 2**16 # samples, the noise of a frame starts at a random offset into its noise field
+READ_NOISE_MAX = 16 # counts, read noise is clipped to +-READ_NOISE_MAX
+# relative weights of (beads, fibres, texture) per laser wavelength band, upper wavelength limit in nm
+CHANNEL_WEIGHTS = ((450, (0.2, 0.1, 1.0)),
+                   (530, (0.1, 1.0, 0.1)),
+                   (600, (1.0, 0.1, 0.1)),
+                   (np.inf, (0.5, 0.2, 0.3)))
+
+
+def _wavelength(laser):
+    '''488 nm -> 488.0, 0 if the laser string does not start with a number'''
+    try:
+        return float(str(laser).split()[0].rstrip('nm'))
+    except ValueError:
+        return 0.0
+
+
+def _gaussian_transfer(shape, sigmas):
+    '''Fourier transfer function of a periodic Gaussian blur (sigma in voxels per axis) for np.fft.rfftn of shape'''
+    frequencies = [np.fft.fftfreq(n) for n in shape[:-1]] + [np.fft.rfftfreq(shape[-1])]
+    transfer = 1.0
+    for axis, (frequency, sigma) in enumerate(zip(frequencies, sigmas)):
+        view = [1] * len(shape)
+        view[axis] = -1
+        transfer = transfer * np.exp(-2 * (np.pi * sigma * frequency.reshape(view)) ** 2)
+    return transfer.astype(np.float32)
+
+
+class SyntheticPhantom:
+    '''
+    Args:
+        shape (tuple): voxels (z, y, x) of one period of the phantom
+        voxel_um (tuple): voxel size (z, y, x) in microns
+        seed (int): the phantom is reproducible for a given seed
+        focus_um (float): f position (microns) of the best focus
+        defocus_blur (float): blur sigma (microns) per micron of defocus
+    '''
+    def __init__(self, shape=(64, 256, 256), voxel_um=(4.0, 4.0, 4.0), seed=0,
+                 n_beads=3000, n_fibres=80, focus_um=0.0, defocus_blur=0.2):
+        self.shape = tuple(shape)
+        self.voxel_um = np.asarray(voxel_um, dtype=float)
+        self.focus_um = focus_um
+        self.defocus_blur = defocus_blur
+        self.rng = np.random.default_rng(seed)
+        start = time.perf_counter()
+        self.components = (self._beads(n_beads), self._fibres(n_fibres), self._texture())
+        self.channels = {} # channel weights -> normalized volume
+        self.spectra = {} # channel weights -> 2D spectra of the z-planes of the volume, for the defocus blur
+        self.plane_transfers = {} # blur sigma (voxels) -> 2D transfer function
+        logger.info(f'Synthetic phantom {self.shape} created in {time.perf_counter() - start:.2f} s')
+
+    def _splat(self, points, sigma_um):
+        '''Volume of Gaussian spots at the points (N, 3) in voxel coordinates, periodic'''
+        volume = np.zeros(self.shape, dtype=np.float32)
+        index = tuple(np.mod(np.round(points).astype(np.intp), self.shape).T)
+        np.add.at(volume, index, 1.0)
+        spectrum = np.fft.rfftn(volume) * _gaussian_transfer(self.shape, sigma_um / self.voxel_um)
+        volume = np.fft.irfftn(spectrum, s=self.shape, axes=(0, 1, 2)).astype(np.float32)
+        return volume / max(volume.max(), 1e-6)
+
+    def _beads(self, n_beads):
+        points = self.rng.random((n_beads, 3)) * self.shape
+        return self._splat(points, sigma_um=3.0)
+
+    def _fibres(self, n_fibres):
+        '''Straight fibres of random direction and length, sampled every half voxel'''
+        starts = self.rng.random((n_fibres, 3)) * self.shape
+        directions = self.rng.normal(size=(n_fibres, 3))
+        directions[:, 0] *= 0.3 # mostly in the xy plane
+        directions /= np.linalg.norm(directions, axis=1, keepdims=True)
+        lengths = self.rng.uniform(0.3, 1.0, n_fibres) * max(self.shape)
+        steps = [np.arange(0, length, 0.5) for length in lengths]
+        points = np.concatenate([start + step[:, None] * direction for start, step, direction in zip(starts, steps, directions)])
+        return self._splat(points, sigma_um=2.0)
+
+    def _texture(self):
+        '''Band-pass filtered noise, a cell-sized tissue-like texture'''
+        noise = np.fft.rfftn(self.rng.standard_normal(self.shape).astype(np.float32))
+        band = _gaussian_transfer(self.shape, 6.0 / self.voxel_um) - _gaussian_transfer(self.shape, 40.0 / self.voxel_um)
+        volume = np.fft.irfftn(noise * band, s=self.shape, axes=(0, 1, 2)).astype(np.float32)
+        volume = np.clip(volume, 0, None)
+        return volume / max(volume.max(), 1e-6)
+
+    @staticmethod
+    def _weights(laser):
+        wavelength = _wavelength(laser)
+        return next(weights for limit, weights in CHANNEL_WEIGHTS if wavelength < limit)
+
+    def channel(self, laser):
+        '''Normalized volume (0..1) of the laser channel, a wavelength-dependent mix of the components'''
+        weights = self._weights(laser)
+        if weights not in self.channels:
+            volume = sum(weight * component for weight, component in zip(weights, self.components))
+            self.channels[weights] = (volume / max(volume.max(), 1e-6)).astype(np.float32)
+        return self.channels[weights]
+
+    def channel_spectrum(self, laser):
+        '''2D spectra (np.fft.rfft2) of the z-planes of the channel, a defocused plane only needs the inverse transform'''
+        weights = self._weights(laser)
+        if weights not in self.spectra:
+            self.spectra[weights] = np.fft.rfft2(self.channel(laser), axes=(1, 2)).astype(np.complex64)
+        return self.spectra[weights]
+
+    def plane(self, laser, z_um, f_um=None):
+        '''Coarse plane (y, x voxels) of the channel at z, linearly interpolated, blurred by the defocus'''
+        z = z_um / self.voxel_um[0]
+        z0 = int(np.floor(z))
+        weight = np.float32(z - z0)
+        defocus_um = 0.0 if f_um is None else abs(f_um - self.focus_um)
+        sigma = round(self.defocus_blur * defocus_um / self.voxel_um[1], 1)
+        if sigma <= 0.1:
+            volume = self.channel(laser)
+            return (1 - weight) * volume[z0 % self.shape[0]] + weight * volume[(z0 + 1) % self.shape[0]]
+        if sigma not in self.plane_transfers:
+            self.plane_transfers[sigma] = _gaussian_transfer(self.shape[1:], (sigma, sigma))
+        spectra = self.channel_spectrum(laser)
+        spectrum = (1 - weight) * spectra[z0 % self.shape[0]] + weight * spectra[(z0 + 1) % self.shape[0]]
+        spectrum *= self.plane_transfers[sigma]
+        return np.fft.irfft2(spectrum, s=self.shape[1:]).astype(np.float32)
+
+    def pixel_indices(self, center_um, n_pixels, pixel_um, axis):
+        '''Voxel indices (periodic) of n_pixels camera pixels centered on the stage position'''
+        positions = center_um + (np.arange(n_pixels) - n_pixels / 2) * pixel_um
+        return np.mod(np.floor(positions / self.voxel_um[axis]).astype(np.intp), self.shape[axis])
+
+    def render_rows(self, position, laser, frame_shape, pixel_um, counts=3000.0, background=100.0):
+        '''Noise-free image (float32, (voxel rows, frame_shape[1])) of the voxel rows at the camera columns,
+        and the voxel row of every camera row: the frame is image[rows], see render().'''
+        plane = self.plane(laser, position['z_pos'], position['f_pos'])
+        columns = self.pixel_indices(position['x_pos'], frame_shape[1], pixel_um, axis=2)
+        image = np.take(plane, columns, axis=1)
+        image *= np.float32(counts)
+        image += np.float32(background)
+        return image, self.pixel_indices(position['y_pos'], frame_shape[0], pixel_um, axis=1)
+
+    def render(self, position, laser, frame_shape, pixel_um, counts=3000.0, background=100.0):
+        '''Noise-free image (float32, frame_shape) of the phantom.
+        position: dict with x_pos, y_pos, z_pos, f_pos in microns; pixel_um: pixel size in the sample.'''
+        image, rows = self.render_rows(position, laser, frame_shape, pixel_um, counts, background)
+        return image[rows]
+
+
+class PhantomFrameCache:
+    '''
+    Noisy uint16 frames of a SyntheticPhantom, cached by the quantized imaging state.
+    Each state has n_noise frames with different noise, served in turn, so that Live mode and repeated
+    states look like a real camera stream.
+
+    Args:
+        phantom (SyntheticPhantom)
+        max_bytes (int): memory cap of the cached frames, least recently used states are evicted first
+        n_noise (int): noise realisations per state
+        position_step_um (float): stage positions are quantized to this step (default: the voxel size)
+        read_noise (float): read noise (counts, standard deviation) per pixel
+    '''
+    def __init__(self, phantom, max_bytes=256 * 2**20, n_noise=4, position_step_um=None, seed=0, read_noise=2.0):
+        self.phantom = phantom
+        self.max_bytes = int(max_bytes)
+        self.n_noise = n_noise
+        self.position_step_um = position_step_um or float(phantom.voxel_um.min())
+        self.read_noise = read_noise
+        self.rng = np.random.default_rng(seed)
+        self._entries = OrderedDict() # key -> list of n_noise frames (None until rendered)
+        self.nbytes = 0
+        self.noise_fields = {} # 'shot' or 'read' -> noise field
+        self.count = 0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def stats(self):
+        return {'states': len(self._entries), 'MB': round(self.nbytes / 2**20, 2), 'hits': self.hits, 'misses': self.misses}
+
+    def key(self, position, laser, frame_shape, pixel_um, counts):
+        step = self.position_step_um
+        quantized = tuple(int(round(position[axis] / step)) for axis in ('x_pos', 'y_pos', 'z_pos', 'f_pos'))
+        return quantized + (laser, tuple(frame_shape), round(pixel_um, 4), round(counts))
+
+    def _noise_field(self, kind, shape):
+        '''Contiguous noise of shape, at a random offset into a flat noise field NOISE_MARGIN samples larger.
+        'shot': standard normal, float32; 'read': read noise in counts, int16 viewed as uint16 (added modulo 2**16)'''
+        size = shape[0] * shape[1]
+        field = self.noise_fields.get(kind)
+        if field is None or field.size != size + NOISE_MARGIN:
+            field = self.rng.standard_normal(size + NOISE_MARGIN, dtype=np.float32)
+            if kind == 'read':
+                field = np.clip(np.round(field * self.read_noise), -READ_NOISE_MAX, READ_NOISE_MAX).astype(np.int16).view(np.uint16)
+            self.noise_fields[kind] = field
+        offset = self.rng.integers(0, NOISE_MARGIN)
+        return field[offset:offset + size].reshape(shape)
+
+    def _render(self, key, position, laser, frame_shape, pixel_um, counts):
+        step = self.position_step_um
+        quantized_position = dict(zip(('x_pos', 'y_pos', 'z_pos', 'f_pos'), (value * step for value in key[:4])))
+        signal, rows = self.phantom.render_rows(quantized_position, laser, frame_shape, pixel_um, counts=counts)
+        noise = np.sqrt(signal) # shot noise: Poisson, approximated by a Gaussian with variance = signal
+        noise *= self._noise_field('shot', signal.shape)
+        signal += noise
+        np.clip(signal, READ_NOISE_MAX, 65535 - READ_NOISE_MAX, out=signal) # the read noise cannot wrap around
+        frame = signal.astype(np.uint16)[rows]
+        frame += self._noise_field('read', frame_shape)
+        frame.setflags(write=False)
+        return frame
+
+    def get_frame(self, position, laser, frame_shape, pixel_um, counts=3000.0):
+        '''Returns a read-only uint16 frame of the phantom at the imaging state'''
+        key = self.key(position, laser, frame_shape, pixel_um, counts)
+        frames = self._entries.get(key)
+        if frames is None:
+            frames = [None] * self.n_noise
+            self._entries[key] = frames
+        self._entries.move_to_end(key)
+        index = self.count % self.n_noise
+        self.count += 1
+        if frames[index] is not None:
+            self.hits += 1
+            return frames[index]
+        self.misses += 1
+        frame = self._render(key, position, laser, frame_shape, pixel_um, counts)
+        frames[index] = frame
+        self.nbytes += frame.nbytes
+        self._evict(keep=key)
+        return frame
+
+    def _evict(self, keep):
+        while self.nbytes > self.max_bytes and len(self._entries) > 1:
+            old_key = next(iter(self._entries))
+            if old_key == keep:
+                break
+            self.nbytes -= sum(frame.nbytes for frame in self._entries.pop(old_key) if frame is not None)
+        if self.nbytes > self.max_bytes: # a single state larger than the cap keeps only the newest frame
+            frames = self._entries[keep]
+            for i, frame in enumerate(frames):
+                if frame is not None and self.nbytes > self.max_bytes and i != (self.count - 1) % self.n_noise:
+                    self.nbytes -= frame.nbytes
+                    frames[i] = None
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
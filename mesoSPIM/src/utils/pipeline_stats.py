@@ -0,0 +1,85 @@
+'''
+pipeline_stats.py
+========================================
+
+Per-stage latency statistics of the acquisition pipeline (camera -> processors -> frame pool -> image writer)
+and the peak memory use of the process, for the headless runner and the pipeline benchmark.
+
+Stages recorded by the FramePool, the Camera and the ImageWriter (seconds per frame, unless noted):
+    acquire   frame read from the camera driver into the frame pool
+    process   processor chain (in place)
+    queue     frame waiting in the frame pool for the image writer (push -> pop)
+    write     image writer backend
+    frame     acquire() of the slot -> release() after writing (end to end)
+    stall     camera waiting for a free slot of the frame pool (per stall)
+    finalize  image writer backend finalizing a stack (per stack)
+'''
+import sys
+import numpy as np
+import logging
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 90, 99)
+
+
+class LatencyRecorder:
+    '''
+    Fixed-size ring buffer of durations per stage, recording is allocation-free.
+    Each stage must be recorded by a single thread.
+
+    Args:
+        capacity (int): durations kept per stage, older ones are overwritten
+    '''
+    def __init__(self, capacity=100000):
+        self.capacity = int(capacity)
+        self._buffers = {}
+        self._counts = {}
+
+    def record(self, stage, seconds):
+        buffer = self._buffers.get(stage)
+        if buffer is None:
+            buffer = self._buffers[stage] = np.zeros(self.capacity, dtype=np.float64)
+            self._counts[stage] = 0
+        count = self._counts[stage]
+        buffer[count % self.capacity] = seconds
+        self._counts[stage] = count + 1
+
+    def count(self, stage):
+        return self._counts.get(stage, 0)
+
+    def values(self, stage):
+        '''Recorded durations of the stage (the last `capacity` ones), in seconds'''
+        count = self._counts.get(stage, 0)
+        return self._buffers[stage][:min(count, self.capacity)] if count else np.empty(0)
+
+    def percentiles(self, percentiles=PERCENTILES):
+        '''{stage: {'count', 'mean_ms', 'p50_ms', ..., 'max_ms'}} of all recorded stages'''
+        summary = {}
+        for stage in list(self._buffers):
+            values = self.values(stage) * 1000
+            if values.size == 0:
+                continue
+            stage_summary = {'count': self._counts[stage], 'mean_ms': round(float(values.mean()), 3)}
+            for percentile, value in zip(percentiles, np.percentile(values, percentiles)):
+                stage_summary[f'p{percentile}_ms'] = round(float(value), 3)
+            stage_summary['max_ms'] = round(float(values.max()), 3)
+            summary[stage] = stage_summary
+        return summary
+
+    def reset(self):
+        for stage in self._counts:
+            self._counts[stage] = 0
+
+
+def peak_rss_bytes():
+    '''Peak resident memory of this process, in bytes (0 if unknown)'''
+    try:
+        if sys.platform == 'win32':
+            import psutil
+            return int(psutil.Process().memory_info().peak_wset)
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return int(peak if sys.platform == 'darwin' else peak * 1024) # bytes on macOS, kB on Linux
+    except Exception as e:
+        logger.warning(f'Peak memory use not available: {e}')
+        return 0
@@ -0,0 +1,222 @@
+'''
+replay.py
+========================================
+
+Playback of recorded mesoSPIM datasets as a camera stream, for the replay camera.
+
+Supported datasets (one stack, z-y-x as saved by the image writers):
+    TIFF / BigTIFF  (.tif, .tiff, .btf) memory-mapped if uncompressed, else read page by page
+    RAW             (.raw) memory-mapped, the shape is taken from the '_meta.txt' file of the writer
+    OME-Zarr        (.zarr directory) resolution level 0, read lazily by chunk (needs zarr).
+                    In a mesoSPIM container of tiles (Mag..._Tile....ome.zarr groups) the tile `tile` is played,
+                    it may be omitted if the container has a single tile
+    BDV HDF5        (.h5) setup `setup` of time point 0, full resolution (needs h5py)
+
+Saved images are oriented (see FrameOrientation), the stream restores the raw camera frames,
+so that they pass through the same orientation as frames of a real camera.
+A reader thread copies the next `read_ahead` frames out of the file, the consumer gets them
+at `frame_rate` (fps), with Gaussian jitter of the frame period.
+'''
+import os
+import time
+import queue
+import threading
+import numpy as np
+import tifffile
+import logging
+logger = logging.getLogger(__name__)
+
+from ..plugins.ImageWriterApi import MESOSPIM_ORIENTATION
+
+
+def read_metadata(path):
+    '''Reads the '[key] value' lines of the metadata file of a dataset into a dict of strings'''
+    metadata = {}
+    metadata_path = path + '_meta.txt'
+    if not os.path.exists(metadata_path):
+        return metadata
+    with open(metadata_path) as file:
+        for line in file:
+            if line.startswith('[') and ']' in line:
+                key, value = line[1:].split(']', 1)
+                metadata[key.strip()] = value.strip()
+    return metadata
+
+
+class _TiffPages:
+    '''Page-by-page access to a compressed or non-contiguous TIFF stack'''
+    def __init__(self, path):
+        self.tif = tifffile.TiffFile(path)
+        self.pages = self.tif.pages
+        first = self.pages[0]
+        self.shape = (len(self.pages),) + tuple(first.shape[-2:])
+        self.dtype = first.dtype
+
+    def __getitem__(self, index):
+        return self.pages[index].asarray()
+
+    def close(self):
+        self.tif.close()
+
+
+def _open_tiff(path):
+    try:
+        return tifffile.memmap(path, mode='r')
+    except ValueError: # compressed or not contiguous
+        return _TiffPages(path)
+
+
+def _open_raw(path, frame_shape=None):
+    data = np.memmap(path, mode='r', dtype=np.uint16)
+    if frame_shape is None:
+        metadata = read_metadata(path)
+        if 'z_planes' not in metadata:
+            raise ValueError(f'{path}: the frame shape is needed, the metadata file has no z_planes')
+        frame_pixels = data.size // int(metadata['z_planes'])
+        x_pixels, y_pixels = int(metadata.get('x_pixels', 0)), int(metadata.get('y_pixels', 0))
+        if x_pixels * y_pixels == frame_pixels:
+            frame_shape = MESOSPIM_ORIENTATION.oriented_shape((y_pixels, x_pixels))
+        else: # binned: square frames assumed
+            side = int(round(np.sqrt(frame_pixels)))
+            if side * side != frame_pixels:
+                raise ValueError(f'{path}: the frame shape cannot be derived from the metadata, set it explicitly')
+            frame_shape = (side, side)
+    n_frames = data.size // (frame_shape[0] * frame_shape[1])
+    return data[:n_frames * frame_shape[0] * frame_shape[1]].reshape((n_frames,) + tuple(frame_shape))
+
+
+def _open_zarr(path, tile=None):
+    import zarr # optional, installed with the OME-Zarr writer
+    root = zarr.open(path, mode='r')
+    if not hasattr(root, 'keys'): # plain array
+        return root
+    if tile is None and '0' in root: # a single OME-Zarr image
+        return root['0']
+    tiles = sorted(name for name, group in root.groups() if '0' in group) # container of tiles, each an OME-Zarr image
+    if tile is None and len(tiles) == 1:
+        tile = tiles[0]
+    if tile not in tiles:
+        raise ValueError(f'{path}: select the tile to replay, available tiles: {tiles}' if tile is None else
+                         f'{path}: no OME-Zarr tile {tile}, available tiles: {tiles}')
+    return root[tile]['0']
+
+
+def _open_h5(path, setup=0):
+    import h5py # optional, installed with the BDV writer
+    file = h5py.File(path, 'r')
+    return file[f't00000/s{setup:02d}/0/cells']
+
+
+def open_dataset(path, setup=0, frame_shape=None, tile=None):
+    '''Returns a lazy (z, y, x) array-like of the dataset, indexing a plane reads it from the file'''
+    path = str(path).rstrip('/\\')
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.tif', '.tiff', '.btf'):
+        return _open_tiff(path)
+    if extension == '.raw':
+        return _open_raw(path, frame_shape)
+    if extension == '.zarr':
+        return _open_zarr(path, tile)
+    if extension == '.h5':
+        return _open_h5(path, setup)
+    raise ValueError(f'Replay: unsupported dataset {path}')
+
+
+class ReplayStream:
+    '''
+    Args:
+        path (str): dataset, see the module docstring
+        frame_rate (float): frames per second, None: as fast as the frames are read
+        jitter_ms (float): standard deviation of the frame period, in ms
+        read_ahead (int): frames read in advance by the reader thread
+        loop (bool): restart at the first frame after the last one, else next_frame() returns None at the end
+        setup (int): view of a BDV HDF5 file
+        frame_shape (tuple): saved (oriented) frame shape of RAW files without metadata file
+        tile (str): tile group of a mesoSPIM OME-Zarr container, e.g. 'Mag1x_Tile0_Ch488_FltEmpty_Sh0_Rot0.ome.zarr'
+    '''
+    def __init__(self, path, frame_rate=None, jitter_ms=0.0, read_ahead=16, loop=True, setup=0,
+                 frame_shape=None, orientation=MESOSPIM_ORIENTATION, seed=None, tile=None):
+        self.path = path
+        self.dataset = open_dataset(path, setup=setup, frame_shape=frame_shape, tile=tile)
+        self.n_frames = self.dataset.shape[0]
+        self.orientation = orientation
+        self.frame_shape = tuple(orientation.restore(np.empty(self.dataset.shape[1:], dtype=np.uint8)).shape) # raw (y, x)
+        self.frame_rate = frame_rate
+        self.jitter_s = jitter_ms / 1000
+        self.read_ahead = max(int(read_ahead), 1)
+        self.loop = loop
+        self.rng = np.random.default_rng(seed)
+        self._queue = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.reset_stats()
+        logger.info(f'Replay dataset {path}: {self.n_frames} frames of {self.frame_shape}')
+
+    def reset_stats(self):
+        self.stats = {'frames': 0, 'starved': 0, 'starved_s': 0.0, 'late': 0}
+
+    def start(self, first_frame=0):
+        '''Starts the reader thread at first_frame and the frame clock'''
+        self.stop()
+        self._stop.clear()
+        self._queue = queue.Queue(maxsize=self.read_ahead)
+        self._thread = threading.Thread(target=self._read_frames, args=(first_frame,), name='mesoSPIM_replay_reader', daemon=True)
+        self._thread.start()
+        self.t_next = time.perf_counter()
+        self.reset_stats()
+
+    def _read_frames(self, index):
+        while not self._stop.is_set():
+            if index >= self.n_frames:
+                if not self.loop:
+                    self._put(None)
+                    return
+                index = 0
+            frame = np.array(self.orientation.restore(self.dataset[index]), dtype=np.uint16, order='C') # reads from the file
+            if not self._put(frame):
+                return
+            index += 1
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def next_frame(self, timeout=10.0):
+        '''Returns the next raw frame at the frame rate, None at the end of the dataset (loop=False)'''
+        try:
+            frame = self._queue.get_nowait()
+        except queue.Empty:
+            self.stats['starved'] += 1
+            start = time.perf_counter()
+            frame = self._queue.get(timeout=timeout)
+            self.stats['starved_s'] += time.perf_counter() - start
+        if frame is None:
+            return None
+        if self.frame_rate:
+            now = time.perf_counter()
+            if self.t_next > now:
+                time.sleep(self.t_next - now)
+            elif now - self.t_next > 1 / self.frame_rate:
+                self.stats['late'] += 1 # the consumer is more than a frame behind the camera clock
+            period = 1 / self.frame_rate + (self.rng.normal(0, self.jitter_s) if self.jitter_s > 0 else 0)
+            self.t_next = max(self.t_next, now - 1 / self.frame_rate) + max(period, 0)
+        self.stats['frames'] += 1
+        return frame
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        if hasattr(self.dataset, 'close'):
+            self.dataset.close()
+        elif hasattr(self.dataset, 'file'): # h5py dataset
+            self.dataset.file.close()
@@ -1,13 +1,18 @@
 '''
 Contains a variety of mesoSPIM utility functions
 '''
+import os
 import ctypes
 import logging
+import platform
 from PyQt5 import QtWidgets
 logger = logging.getLogger(__name__)
 
-# Windows API binding
-GetCurrentProcessorNumber = ctypes.windll.kernel32.GetCurrentProcessorNumber
+# Windows API binding, ctypes.windll only exists on Windows (the simulated hardware also runs on Linux)
+if platform.system() == 'Windows':
+    GetCurrentProcessorNumber = ctypes.windll.kernel32.GetCurrentProcessorNumber
+else:
+    GetCurrentProcessorNumber = getattr(os, 'sched_getcpu', lambda: -1)
 
 
 def fit_window_to_screen(window, margin=60):
@@ -132,7 +137,7 @@ def log_cpu_core(func):
     import functools
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        core = GetCurrentProcessorNumber()  # Windows only.
+        core = GetCurrentProcessorNumber()
         logger.debug(f"{func.__name__}() running on logical CPU core: {core}")
         return func(*args, **kwargs)
     return wrapper
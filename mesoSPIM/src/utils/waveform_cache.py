@@ -0,0 +1,74 @@
+'''
+waveform_cache.py
+========================================
+
+LRU cache of write-ready AO buffers of the waveform generator.
+
+Multicolor and dual-illumination acquisitions switch between a handful of laser/shutter/ETL
+parameter sets. The bundled buffers of every parameter set (keyed by the tuple of waveform parameters)
+are kept, so that switching back to a known set costs only a DAQ buffer write.
+Cached arrays are read-only, because they are shared between all users of the same parameter set.
+'''
+from collections import OrderedDict
+import logging
+logger = logging.getLogger(__name__)
+
+
+class WaveformCache:
+    '''
+    Args:
+        max_bytes (int): memory cap of all cached buffers, least recently used entries are evicted first.
+            0 disables caching.
+    '''
+    def __init__(self, max_bytes=64 * 2**20):
+        self.max_bytes = int(max_bytes)
+        self._entries = OrderedDict() # key -> dict of read-only np.ndarrays
+        self.nbytes = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def stats(self):
+        return {'entries': len(self._entries), 'MB': round(self.nbytes / 2**20, 2), 'max_MB': round(self.max_bytes / 2**20, 2),
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+    def get(self, key):
+        '''Returns the buffers cached for key, or None'''
+        buffers = self._entries.get(key)
+        if buffers is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return buffers
+
+    def put(self, key, buffers):
+        '''Caches a dict of buffers and returns it. The arrays are made read-only.'''
+        for array in buffers.values():
+            array.setflags(write=False)
+        nbytes = sum(array.nbytes for array in buffers.values())
+        if nbytes > self.max_bytes:
+            return buffers
+        if key in self._entries:
+            self.nbytes -= sum(array.nbytes for array in self._entries.pop(key).values())
+        while self._entries and self.nbytes + nbytes > self.max_bytes:
+            old_key, old_buffers = self._entries.popitem(last=False)
+            self.nbytes -= sum(array.nbytes for array in old_buffers.values())
+            self.evictions += 1
+        self._entries[key] = buffers
+        self.nbytes += nbytes
+        return buffers
+
+    def clear(self):
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
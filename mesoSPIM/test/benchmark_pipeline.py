@@ -0,0 +1,317 @@
+# To run the benchmark (from the mesoSPIM folder):
+# python -m test.benchmark_pipeline --output benchmark.json
+# python -m test.benchmark_pipeline --quick
+# python -m test.benchmark_pipeline --components
+"""
+End-to-end benchmark of the acquisition pipeline: mesoSPIM_Core -> Camera -> ProcessorChain -> ImageWriter.
+
+Every case runs the headless runner (mesoSPIM_Control.py --headless) in demo mode in its own process,
+with the offscreen Qt platform, so that the peak memory and the startup are measured per case.
+The cases are the product of the image writers, frame sizes, stack depths and processor chains.
+The demo config is extended per case (camera frame size, sweep time, output folder) and the
+processor chain is written to processor_chain.json next to it.
+
+Reported per case: sustained frame rate (first acquired to last written frame), preparation time before
+the first frame, frames written and dropped, per-stage latency percentiles
+(acquire, process, queue, write, frame, finalize, see src/utils/pipeline_stats.py),
+frame pool stalls, peak RSS and warnings. The results are saved as JSON, with the platform,
+to compare versions and hardware.
+
+With --components, microbenchmarks of pipeline components run in this process instead of the cases:
+frame rate of the demo camera (phantom frames from the cache and rendered stack planes), reads/writes per second
+of the state store under contention, compared to the previous store with a global QMutex, and the time
+per frame to build the WriteImage from a WriteContext, compared to the per-frame AcquisitionList lookups.
+"""
+import os
+import re
+import sys
+import json
+import time
+import types
+import shutil
+import argparse
+import platform
+import itertools
+import threading
+import subprocess
+import tempfile
+import importlib.util
+import numpy as np
+from PyQt5.QtCore import QMutex, QMutexLocker
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONTROL_SCRIPT = os.path.join(PACKAGE_DIRECTORY, 'mesoSPIM_Control.py')
+DEMO_CONFIG = os.path.join(PACKAGE_DIRECTORY, 'config', 'demo_config.py')
+
+
+def load_demo_config():
+    spec = importlib.util.spec_from_file_location('demo_config', DEMO_CONFIG)
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    return config
+
+
+def get_writers():
+    '''{writer name: file extension} of the registered image writer plugins'''
+    from src.plugins.manager import PluginRegistry
+    from src.plugins.utils import get_image_writer_plugins
+    PluginRegistry(types.SimpleNamespace())
+    writers = {}
+    for writer in get_image_writer_plugins():
+        extensions = writer['file_extensions']
+        extension = extensions[0] if isinstance(extensions, (list, tuple)) else extensions
+        writers[writer['name']] = extension.lstrip('.')
+    return writers
+
+
+def single_file_format(writer_name):
+    from src.plugins.utils import get_image_writer_class_from_name
+    return get_image_writer_class_from_name(writer_name).file_names().SingleFileFormat
+
+
+def parse_frame_size(text):
+    '''2048x1024 -> (y_pixels, x_pixels) = (1024, 2048)'''
+    x_pixels, y_pixels = (int(value) for value in text.lower().split('x'))
+    return y_pixels, x_pixels
+
+
+def parse_chain(text):
+    '''none -> [], GaussianBlur+BackgroundSubtraction -> ['GaussianBlur', 'BackgroundSubtraction']'''
+    return [] if text.lower() == 'none' else text.split('+')
+
+
+def write_case_config(folder, demo_config, frame_shape, sweeptime, chain):
+    '''Demo config with the case parameters appended, and its processor_chain.json'''
+    overrides = f'''
+# Benchmark case parameters
+camera = 'DemoCamera'
+camera_parameters = dict(camera_parameters, x_pixels={frame_shape[1]}, y_pixels={frame_shape[0]}, binning='1x1')
+startup = dict(startup, sweeptime={sweeptime}, folder={folder!r}, snap_folder={folder!r}, camera_binning='1x1')
+'''
+    config_path = os.path.join(folder, 'benchmark_config.py')
+    with open(DEMO_CONFIG) as file:
+        text = file.read()
+    with open(config_path, 'w') as file:
+        file.write(text + overrides)
+    with open(os.path.join(folder, 'processor_chain.json'), 'w') as file:
+        json.dump({'processors': [{'name': name, 'enabled': True} for name in chain]}, file)
+    return config_path
+
+
+def write_case_table(folder, demo_config, writer, extension, planes, tiles, z_step):
+    from src.utils.acquisitions import Acquisition, AcquisitionList
+    startup = demo_config.startup
+    single_file = single_file_format(writer)
+    acq_list = AcquisitionList([])
+    for tile in range(tiles):
+        filename = f'benchmark.{extension}' if single_file else f'benchmark_tile{tile}.{extension}'
+        acq_list.append(Acquisition(x_pos=1000 * tile, y_pos=startup['position']['y_pos'], z_start=0, z_end=(planes - 1) * z_step,
+                                    z_step=z_step, planes=planes, theta_pos=startup['position']['theta_pos'],
+                                    f_start=startup['position']['f_pos'], f_end=startup['position']['f_pos'],
+                                    laser=startup['laser'], intensity=startup['intensity'], filter=startup['filter'],
+                                    zoom=startup['zoom'], shutterconfig='Left', folder=folder, filename=filename,
+                                    image_writer_plugin=writer, processing='NONE'))
+    table_path = os.path.join(folder, 'benchmark_table.csv')
+    acq_list.save_csv(table_path)
+    return table_path
+
+
+def run_case(case, demo_config, args):
+    folder = tempfile.mkdtemp(prefix='mesoSPIM_benchmark_', dir=args.folder)
+    try:
+        config_path = write_case_config(folder, demo_config, case['frame_shape'], args.sweeptime, case['chain'])
+        table_path = write_case_table(folder, demo_config, case['writer'], case['extension'], case['planes'], args.tiles, args.z_step)
+        summary_path = os.path.join(folder, 'summary.json')
+        env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+        t_start = time.perf_counter()
+        try:
+            process = subprocess.run([sys.executable, CONTROL_SCRIPT, '--headless', table_path, '--summary', summary_path,
+                                      '--config', config_path], cwd=PACKAGE_DIRECTORY, env=env, capture_output=True,
+                                     text=True, timeout=args.timeout)
+            returncode, stderr = process.returncode, process.stderr
+        except subprocess.TimeoutExpired:
+            returncode, stderr = None, f'Timeout after {args.timeout} s'
+        result = {'wall_time_s': round(time.perf_counter() - t_start, 3), 'returncode': returncode}
+        if os.path.exists(summary_path):
+            with open(summary_path) as file:
+                result.update(json.load(file))
+        else:
+            result.update({'success': False, 'error': stderr[-2000:]})
+        result.pop('files', None)
+        return result
+    finally:
+        if not args.keep:
+            shutil.rmtree(folder, ignore_errors=True)
+
+
+class MutexState:
+    '''Reference: the previous state store, with a global QMutex on every access'''
+    def __init__(self, state_dict):
+        self.mutex = QMutex()
+        self._state_dict = dict(state_dict)
+
+    def __setitem__(self, key, value):
+        with QMutexLocker(self.mutex):
+            self._state_dict[key] = value
+
+    def __getitem__(self, key):
+        with QMutexLocker(self.mutex):
+            return self._state_dict[key]
+
+
+def contended_ops_per_s(state, n_ops=20000, n_readers=4):
+    '''Readers and one writer access the state at the same time, returns reads/s and writes/s'''
+    def read():
+        for i in range(n_ops):
+            state['position']
+            state['laser']
+
+    def write():
+        for i in range(n_ops // 10):
+            state['position'] = {'x_pos': i, 'y_pos': 0, 'z_pos': 0, 'f_pos': 0, 'theta_pos': 0}
+
+    threads = [threading.Thread(target=read) for i in range(n_readers)] + [threading.Thread(target=write)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return n_readers * 2 * n_ops / elapsed, n_ops // 10 / elapsed
+
+
+def benchmark_state_store():
+    from src.mesoSPIM_State import mesoSPIM_StateSingleton
+    state = mesoSPIM_StateSingleton()
+    reads, writes = contended_ops_per_s(state)
+    mutex_reads, mutex_writes = contended_ops_per_s(MutexState(state.snapshot()))
+    print(f"State store: {reads:.0f} reads/s, {writes:.0f} writes/s; "
+          f"QMutex state: {mutex_reads:.0f} reads/s, {mutex_writes:.0f} writes/s")
+    return {'reads_per_s': round(reads), 'writes_per_s': round(writes),
+            'mutex_reads_per_s': round(mutex_reads), 'mutex_writes_per_s': round(mutex_writes)}
+
+
+def benchmark_demo_camera(frame_shape=(2048, 2048), pixel_um=6.5, n_frames=200):
+    from src.utils.phantom import SyntheticPhantom, PhantomFrameCache
+    cache = PhantomFrameCache(SyntheticPhantom(seed=1), n_noise=4)
+    position = {'x_pos': 0, 'y_pos': 0, 'z_pos': 100, 'f_pos': 0}
+    frame_buffer = np.empty(frame_shape, dtype=np.uint16) # frames are copied into the frame pool by the camera
+    for i in range(4): # noise variants of the state
+        cache.get_frame(position, '488 nm', frame_shape, pixel_um)
+    t_start = time.perf_counter()
+    for i in range(n_frames):
+        np.copyto(frame_buffer, cache.get_frame(position, '488 nm', frame_shape, pixel_um))
+    fps = n_frames / (time.perf_counter() - t_start)
+    rendered_fps = {}
+    for name, focus_um in (('stack', 0), ('defocused_stack', 100)): # every plane is a new state
+        t_start = time.perf_counter()
+        for i in range(n_frames):
+            plane_position = dict(position, z_pos=200 + 5 * i, f_pos=focus_um)
+            np.copyto(frame_buffer, cache.get_frame(plane_position, '488 nm', frame_shape, pixel_um))
+        rendered_fps[name] = round(n_frames / (time.perf_counter() - t_start), 1)
+    print(f"Demo camera {frame_shape[1]}x{frame_shape[0]}: {fps:.0f} fps from cache, "
+          f"{rendered_fps['stack']:.0f} fps rendered stack planes, {rendered_fps['defocused_stack']:.0f} fps defocused")
+    return {'frame_shape': frame_shape, 'cached_fps': round(fps, 1), 'rendered_fps': rendered_fps}
+
+
+def benchmark_write_context(n_frames=2000):
+    from src.utils.acquisitions import Acquisition, AcquisitionList
+    from src.plugins.ImageWriterApi import WriteContext
+    raw_image = np.zeros((64, 32), dtype='uint16')
+    results = {}
+    for n_tiles in (10, 5000):
+        acq_list = AcquisitionList([Acquisition(x_pos=100 * i, laser=('488 nm', '561 nm')[i % 2]) for i in range(n_tiles)])
+        acq = acq_list[-1]
+        context = WriteContext.from_acquisition(acq, acq_list, pixelsize_um=1.0)
+        t_start = time.perf_counter()
+        for i in range(n_frames):
+            context.write_image(raw_image, i)
+        context_us = (time.perf_counter() - t_start) / n_frames * 1e6
+        t_start = time.perf_counter()
+        for i in range(3): # the lookups done per frame before the WriteContext
+            acq_list.get_tile_index(acq), acq_list.find_value_index(acq['laser'], 'laser')
+            acq_list.find_value_index(acq['shutterconfig'], 'shutterconfig'), acq_list.find_value_index(acq['rot'], 'rot')
+        lookup_us = (time.perf_counter() - t_start) / 3 * 1e6
+        print(f"WriteImage, {n_tiles} tiles: {context_us:.1f} us per frame with WriteContext, "
+              f"{lookup_us:.1f} us per frame with per-frame lookups")
+        results[n_tiles] = {'context_us': round(context_us, 2), 'lookup_us': round(lookup_us, 2)}
+    return results
+
+
+def run_components(output):
+    results = {'platform': get_platform(), 'components': {'demo_camera': benchmark_demo_camera(),
+                                                          'state_store': benchmark_state_store(),
+                                                          'write_context': benchmark_write_context()}}
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    return 0
+
+
+def get_version():
+    with open(CONTROL_SCRIPT) as file:
+        match = re.search(r'__version__ = "(.+)"', file.read())
+    return match.group(1) if match else None
+
+
+def get_platform():
+    import psutil
+    return {'mesoSPIM_version': get_version(), 'platform': platform.platform(), 'processor': platform.processor(),
+            'cpu_count': os.cpu_count(), 'memory_GB': round(psutil.virtual_memory().total / 2**30, 1),
+            'python': platform.python_version(), 'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--writers', default=None, help='Comma-separated writer names (default: all registered writers)')
+    parser.add_argument('--frame-sizes', default='1024x1024,2048x2048', help='Comma-separated frame sizes, XxY pixels')
+    parser.add_argument('--planes', default='100,500', help='Comma-separated stack depths')
+    parser.add_argument('--chains', default='none,GaussianBlur',
+                        help="Comma-separated processor chains, processors joined by '+', 'none' for no processing")
+    parser.add_argument('--tiles', type=int, default=2, help='Stacks per acquisition table')
+    parser.add_argument('--sweeptime', type=float, default=0.01, help='Sweep time of the demo waveforms (s), limits the frame rate')
+    parser.add_argument('--z-step', type=float, default=5.0,
+                        help='z step (um); every plane of a stack is a new phantom frame for steps >= 4 um (the voxel size)')
+    parser.add_argument('--folder', default=None, help='Folder for the data written by the cases (default: temporary folder)')
+    parser.add_argument('--keep', action='store_true', help='Keep the data written by the cases')
+    parser.add_argument('--timeout', type=float, default=1800, help='Timeout per case (s)')
+    parser.add_argument('--quick', action='store_true', help='Smoke test: RAW writer, 512x512, 20 planes, no processing')
+    parser.add_argument('--components', action='store_true', help='Microbenchmarks of pipeline components instead of the cases')
+    parser.add_argument('--output', default=None, help='JSON results file (default: benchmark_<date>.json)')
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    output = args.output or f"benchmark_{time.strftime('%Y%m%d-%H%M%S')}.json"
+    if args.components:
+        return run_components(output)
+    if args.quick:
+        args.writers, args.frame_sizes, args.planes, args.chains, args.tiles = 'RAW_Writer', '512x512', '20', 'none', 1
+    demo_config = load_demo_config()
+    writers = get_writers()
+    if args.writers:
+        writers = {name: writers[name] for name in args.writers.split(',')}
+    cases = [{'writer': writer, 'extension': writers[writer], 'frame_shape': parse_frame_size(frame_size),
+              'planes': int(planes), 'chain': parse_chain(chain)}
+             for writer, frame_size, planes, chain in itertools.product(writers, args.frame_sizes.split(','),
+                                                                        args.planes.split(','), args.chains.split(','))]
+    results = {'platform': get_platform(), 'settings': vars(args), 'cases': []}
+    print(f'{len(cases)} benchmark cases, results in {output}')
+    for i, case in enumerate(cases):
+        result = run_case(case, demo_config, args)
+        results['cases'].append({'writer': case['writer'], 'frame_shape': case['frame_shape'], 'planes': case['planes'],
+                                 'tiles': args.tiles, 'processor_chain': case['chain'], **result})
+        write_latency = result.get('latency', {}).get('write', {})
+        print(f"{i + 1}/{len(cases)} {case['writer']} {case['frame_shape'][1]}x{case['frame_shape'][0]} "
+              f"{case['planes']} planes, chain {'+'.join(case['chain']) or 'none'}: "
+              f"{'ok' if result.get('success') else 'FAILED'}, {result.get('framerate', 0):.1f} fps, "
+              f"write p50/p99 {write_latency.get('p50_ms', 0):.1f}/{write_latency.get('p99_ms', 0):.1f} ms, "
+              f"prep {result.get('prep_s', 0):.1f} s, {result.get('stalls', 0)} stalls, "
+              f"{result.get('dropped', 0)} dropped, peak RSS {result.get('peak_rss_MB', 0):.0f} MB")
+        with open(output, 'w') as file: # saved after every case, a crash keeps the finished cases
+            json.dump(results, file, indent=2)
+    return 0 if all(case.get('success') for case in results['cases']) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
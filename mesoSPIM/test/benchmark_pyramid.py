@@ -0,0 +1,158 @@
+# To run the benchmark (from the mesoSPIM folder):
+# python -m test.benchmark_pyramid
+# python -m test.benchmark_pyramid --frame-sizes 2048x2048 --batches 2,4,8 --workers 1,4 --output pyramid.json
+"""
+Microbenchmark of the multiscale pyramid downsampling of the MP OME-Zarr writer (omezarr_writer.py).
+
+Compares the per-plane reference (every plane recursively through the levels, numpy temporaries
+per 2x2 and Z mean, odd edges padded by concatenation) with the PyramidBuilder of Live3DPyramidWriter
+(level 1 reduced per plane, higher levels per batch of planes, preallocated buffers, optional row bands
+over a thread pool). Only the downsampling is timed, the planes are handed to a sink that drops them.
+
+Reported per case: ms per level-0 plane, planes per second, and the peak memory allocated
+while downsampling (tracemalloc, numpy buffers included). The outputs of both are checked to be equal.
+"""
+import sys
+import json
+import time
+import argparse
+import platform
+import itertools
+import tracemalloc
+import concurrent.futures
+import numpy as np
+from src.plugins.support_files.ImageWriters.OmeZarrWriterMP.omezarr_writer import (
+    PyramidBuilder, FlushPad, ceil_div, compute_xy_only_levels, plan_levels)
+
+
+def reference_ds2(img):
+    y, x = img.shape
+    y2 = y - (y & 1); x2 = x - (x & 1)
+    out = img[:y2:2, :x2:2].astype(np.uint32)
+    out += img[1:y2:2, :x2:2].astype(np.uint32)
+    out += img[:y2:2, 1:x2:2].astype(np.uint32)
+    out += img[1:y2:2, 1:x2:2].astype(np.uint32)
+    out += 2
+    out[:] = out >> 2
+    if y & 1: out = np.vstack([out, out[-1:]])
+    if x & 1: out = np.hstack([out, out[:, -1:]])
+    return out.astype(np.uint16)
+
+
+def reference_dsZ2(a, b):
+    out = a.astype(np.uint32)
+    out += b.astype(np.uint32)
+    out += 1
+    out[:] = out >> 1
+    return out.astype(np.uint16)
+
+
+class ReferencePyramid:
+    '''Per-plane pyramid, as Live3DPyramidWriter computed it before the PyramidBuilder'''
+    def __init__(self, levels, xy_levels, sink):
+        self.levels, self.xy_levels, self.sink = levels, xy_levels, sink
+        self.pair = [None] * levels
+
+    def push(self, plane):
+        if self.levels > 1:
+            self._emit(1, reference_ds2(plane))
+
+    def _emit(self, level, candidate):
+        if level >= self.levels:
+            return
+        if level > self.xy_levels:
+            if self.pair[level] is None:
+                self.pair[level] = candidate
+                return
+            candidate, self.pair[level] = reference_dsZ2(self.pair[level], candidate), None
+        self.sink(level, candidate[None])
+        self._emit(level + 1, reference_ds2(candidate))
+
+    def finish(self):
+        for level in range(max(1, self.xy_levels + 1), self.levels):
+            if self.pair[level] is not None:
+                tail, self.pair[level] = self.pair[level], None
+                self.sink(level, tail[None])
+                self._emit(level + 1, reference_ds2(tail))
+
+
+def parse_frame_size(text):
+    '''2048x1024 -> (y_pixels, x_pixels) = (1024, 2048)'''
+    x_pixels, y_pixels = (int(value) for value in text.lower().split('x'))
+    return y_pixels, x_pixels
+
+
+def run_case(pyramid, planes, n_planes):
+    '''Pushes n_planes (cycling through planes), returns (seconds, peak allocated bytes)'''
+    tracemalloc.start()
+    t_start = time.perf_counter()
+    for i in range(n_planes):
+        pyramid.push(planes[i % len(planes)])
+    pyramid.finish()
+    elapsed = time.perf_counter() - t_start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frame-sizes', default='2048x2048,5056x5056', help='Comma-separated frame sizes, XxY pixels')
+    parser.add_argument('--planes', type=int, default=64, help='Level-0 planes per case')
+    parser.add_argument('--voxel-size', default='2,1,1', help='z,y,x voxel size, sets the XY-only levels')
+    parser.add_argument('--batches', default='4', help='Comma-separated PyramidBuilder batch sizes (planes)')
+    parser.add_argument('--workers', default='1,4', help='Comma-separated PyramidBuilder thread counts')
+    parser.add_argument('--output', default=None, help='JSON results file')
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    voxel_size = tuple(float(v) for v in args.voxel_size.split(','))
+    xy_levels = compute_xy_only_levels(voxel_size)
+    rng = np.random.default_rng(0)
+    results = {'platform': {'platform': platform.platform(), 'processor': platform.processor(),
+                            'python': platform.python_version(), 'numpy': np.__version__},
+               'settings': vars(args), 'cases': []}
+    for frame_size in args.frame_sizes.split(','):
+        y, x = parse_frame_size(frame_size)
+        levels = plan_levels(y, x, args.planes, xy_levels)
+        shapes = [(ceil_div(y, 2 ** l), ceil_div(x, 2 ** l)) for l in range(levels)]
+        planes = rng.integers(0, 4096, (4, y, x), dtype=np.uint16)
+        outputs = {}
+        def sink(name):
+            counts = outputs.setdefault(name, [0] * levels)
+            sums = outputs.setdefault(name + '_sum', [0] * levels)
+            def add(level, stack):
+                counts[level] += len(stack)
+                sums[level] += int(stack[:, ::17, ::13].sum(dtype=np.uint64)) # cheap checksum
+            return add
+        cases = [('reference', None, None, ReferencePyramid(levels, xy_levels, sink('reference')))]
+        for batch, workers in itertools.product(args.batches.split(','), args.workers.split(',')):
+            batch, workers = int(batch), int(workers)
+            pool = concurrent.futures.ThreadPoolExecutor(workers) if workers > 1 else None
+            name = f'batch {batch}, {workers} workers'
+            cases.append((name, batch, workers, PyramidBuilder(shapes, xy_levels, sink(name), batch=batch,
+                                                                flush_pad=FlushPad.DUPLICATE_LAST, pool=pool,
+                                                                bands=workers)))
+        for name, batch, workers, pyramid in cases:
+            elapsed, peak = run_case(pyramid, planes, args.planes)
+            if getattr(pyramid, 'pool', None) is not None:
+                pyramid.pool.shutdown()
+            equal = outputs[name] == outputs['reference'] and outputs[name + '_sum'] == outputs['reference_sum']
+            case = {'frame_shape': (y, x), 'levels': levels, 'xy_levels': xy_levels, 'pyramid': name,
+                    'batch': batch, 'workers': workers, 'ms_per_plane': round(1000 * elapsed / args.planes, 3),
+                    'planes_per_s': round(args.planes / elapsed, 1), 'peak_alloc_MB': round(peak / 2**20, 1),
+                    'equal_to_reference': equal}
+            results['cases'].append(case)
+            print(f"{x}x{y}, {levels} levels, {name}: {case['ms_per_plane']:.2f} ms/plane, "
+                  f"{case['planes_per_s']:.1f} planes/s, peak alloc {case['peak_alloc_MB']:.1f} MB"
+                  f"{'' if equal else ', OUTPUT DIFFERS'}")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 0 if all(case['equal_to_reference'] for case in results['cases']) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
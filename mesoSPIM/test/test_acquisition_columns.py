@@ -0,0 +1,76 @@
+# To run the test:
+# python -m test.test_acquisition_columns
+import os
+import copy
+import pickle
+import tempfile
+import unittest
+from src.utils.acquisitions import Acquisition, AcquisitionList
+
+class TestAcquisitionColumns(unittest.TestCase):
+    def setUp(self) -> None:
+        self.acq_list = AcquisitionList([Acquisition(x_pos=100 * (i // 4), y_pos=50, z_start=0, z_end=10 * (i + 1), z_step=5,
+                                                     theta_pos=(i // 2) % 2 * 90, laser=('488 nm', '561 nm')[i % 2],
+                                                     shutterconfig='Left') for i in range(12)])
+
+    def test_queries(self):
+        self.assertEqual(self.acq_list.get_image_count(), sum(acq.get_image_count() for acq in self.acq_list))
+        self.assertAlmostEqual(self.acq_list.get_acquisition_time(10), self.acq_list.get_image_count() / 10)
+        self.assertEqual(self.acq_list.get_n_tiles(), 6)
+        self.assertEqual([self.acq_list.get_tile_index(acq) for acq in self.acq_list], [0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5])
+        self.assertEqual(self.acq_list.get_tile_ids().tolist(), [0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5])
+        self.assertEqual(self.acq_list.get_unique_attr_list('laser'), ['488 nm', '561 nm'])
+        self.assertEqual(self.acq_list.get_unique_attr_list('rot'), [0, 90])
+        self.assertEqual(self.acq_list.find_value_index('561 nm', 'laser'), 1)
+        self.assertEqual((self.acq_list.get_n_lasers(), self.acq_list.get_n_angles(), self.acq_list.get_n_shutter_configs()), (2, 2, 1))
+
+    def test_cache_invalidation(self):
+        columns = self.acq_list.columns
+        self.assertIs(self.acq_list.columns, columns, "Unchanged list must reuse the cached columns")
+        self.acq_list[3]['laser'] = '640 nm'
+        self.assertEqual(self.acq_list.get_unique_attr_list('laser'), ['488 nm', '561 nm', '640 nm'])
+        self.acq_list[0]['z_end'] = 100
+        self.assertEqual(self.acq_list.get_image_count(), sum(acq.get_image_count() for acq in self.acq_list))
+        self.acq_list.append(Acquisition(x_pos=-1000))
+        self.assertEqual(self.acq_list.get_n_tiles(), 7)
+        del self.acq_list[-1]
+        self.assertEqual(self.acq_list.get_n_tiles(), 6)
+
+    def test_cache_per_list(self):
+        other = AcquisitionList([Acquisition(x_pos=-1000)])
+        columns = self.acq_list.columns
+        other[0]['laser'] = '640 nm'
+        other.append(Acquisition(x_pos=-2000))
+        self.assertIs(self.acq_list.columns, columns, "Changes of another list must not invalidate the cached columns")
+        shared = AcquisitionList([self.acq_list[0], other[0]])
+        shared.columns
+        self.acq_list[0]['laser'] = '405 nm' # a row of both lists
+        self.assertEqual(shared.get_unique_attr_list('laser'), ['405 nm', '640 nm'])
+        self.assertEqual(self.acq_list.get_unique_attr_list('laser'), ['405 nm', '561 nm', '488 nm'])
+
+    def test_copies_not_owned(self):
+        copied = copy.deepcopy(self.acq_list[0])
+        restored = pickle.loads(pickle.dumps(self.acq_list))
+        columns = self.acq_list.columns
+        copied['laser'] = '640 nm'
+        restored[0]['laser'] = '640 nm'
+        self.assertIs(self.acq_list.columns, columns)
+        self.assertEqual(restored.get_unique_attr_list('laser'), ['640 nm', '561 nm', '488 nm'])
+
+    def test_rows_outside_limits(self):
+        self.acq_list[5]['y_pos'] = 1000
+        self.acq_list[7]['z_end'] = -20
+        self.assertEqual(self.acq_list.get_rows_outside_limits((0, 500), (0, 100), (0, 200)), [5, 7])
+
+    def test_csv_round_trip(self):
+        path = os.path.join(tempfile.mkdtemp(), 'acq_table.csv')
+        self.acq_list.save_csv(path)
+        loaded = AcquisitionList.load_csv(path)
+        self.assertEqual(len(loaded), len(self.acq_list))
+        for key in ('x_pos', 'z_end', 'z_step', 'rot', 'laser', 'shutterconfig'):
+            self.assertEqual([acq[key] for acq in loaded], [acq[key] for acq in self.acq_list], key)
+        self.assertEqual(loaded.get_image_count(), self.acq_list.get_image_count())
+        os.remove(path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+# To run the test:
+# python -m test.test_acquisition_order
+import unittest
+import numpy as np
+from src.utils.acquisitions import Acquisition, AcquisitionList
+from src.utils.acquisition_order import AcquisitionCostModel, optimize_acquisition_order
+
+class TestAcquisitionOrder(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cost_model = AcquisitionCostModel()
+        rows = []
+        # tiles in a zig-zag far from the optimal path, two channels per tile
+        for x in (0, 4000, 1000, 3000, 2000):
+            for laser, filter in (('488 nm', '515LP'), ('561 nm', '594LP')):
+                rows.append(Acquisition(x_pos=x, z_start=0, z_end=100, laser=laser, filter=filter))
+        self.acq_list = AcquisitionList(rows)
+
+    def test_transition_times(self):
+        times = self.cost_model.transition_times(self.acq_list)
+        self.assertEqual(len(times), len(self.acq_list) - 1)
+        # same tile, other filter: z returns from z_end to z_start (0.1 s + settle) plus a filter change
+        self.assertAlmostEqual(times[0], 100 / 1000 + 0.2 + 1.0)
+
+    def test_optimized_order(self):
+        optimized = optimize_acquisition_order(self.acq_list, self.cost_model)
+        self.assertEqual(sorted(map(id, optimized)), sorted(map(id, self.acq_list)), "Rows must be the same objects")
+        self.assertLess(self.cost_model.overhead_time(optimized), self.cost_model.overhead_time(self.acq_list))
+        self.assertIs(optimized[0], self.acq_list[0], "First tile must stay first")
+        self.assertEqual([acq['x_pos'] for acq in optimized[::2]], [0, 1000, 2000, 3000, 4000])
+        tile_ids = optimized.get_tile_ids()
+        self.assertEqual(np.count_nonzero(np.diff(tile_ids)) + 1, optimized.get_n_tiles(), "Channels of a tile must be consecutive")
+        self.assertEqual([acq['filter'] for acq in optimized[:4]], ['515LP', '594LP', '594LP', '515LP'], "Channel order must alternate")
+
+if __name__ == '__main__':
+    unittest.main()
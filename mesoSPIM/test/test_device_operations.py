@@ -0,0 +1,80 @@
+# To run the test:
+# python -m test.test_device_operations
+import unittest
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from src.utils.device_operations import DeviceOperationGraph
+
+MOVE_TIME_S = 0.2 # simulated duration of every device move, scaled down from the Demo devices
+
+
+class TestDeviceOperationGraph(unittest.TestCase):
+    def setUp(self) -> None:
+        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.log = []
+        self.lock = threading.Lock()
+
+    def tearDown(self) -> None:
+        self.executor.shutdown(wait=True)
+
+    def move(self, device):
+        with self.lock:
+            self.log.append(('start', device))
+        time.sleep(MOVE_TIME_S)
+        with self.lock:
+            self.log.append(('end', device))
+
+    def prepare(self, executor):
+        graph = DeviceOperationGraph(executor)
+        graph.add('rotation', self.move, 'rotation')
+        graph.add('stages', self.move, 'stages', after=('rotation',))
+        graph.add('filter', self.move, 'filter')
+        graph.add('zoom', self.move, 'zoom')
+        return graph.wait()
+
+    def test_sequential_without_executor(self):
+        self.prepare(None)
+        for i in range(0, len(self.log), 2):
+            self.assertEqual((self.log[i][0], self.log[i + 1]), ('start', ('end', self.log[i][1])))
+
+    def test_concurrent_moves_overlap(self):
+        durations = self.prepare(self.executor)
+        self.assertEqual(set(durations), {'rotation', 'stages', 'filter', 'zoom'})
+        rotation_end = self.log.index(('end', 'rotation'))
+        for device in ('filter', 'zoom'):
+            self.assertLess(self.log.index(('start', device)), rotation_end,
+                            "Filter and zoom must move during rotation and stage moves")
+
+    def test_rotation_before_stages(self):
+        self.prepare(self.executor)
+        self.assertLess(self.log.index(('end', 'rotation')), self.log.index(('start', 'stages')))
+
+    def test_same_port_sequential(self):
+        graph = DeviceOperationGraph(self.executor)
+        graph.add('stages', self.move, 'stages', port='COM32')
+        graph.add('filter', self.move, 'filter', port='COM3')
+        graph.add('zoom', self.move, 'zoom', port='com3') # Dynamixel filter wheel and zoom on one servo bus
+        graph.wait()
+        self.assertLess(self.log.index(('end', 'filter')), self.log.index(('start', 'zoom')))
+        self.assertLess(self.log.index(('start', 'stages')), self.log.index(('end', 'filter')))
+
+    def test_failed_dependency_blocks_operation(self):
+        def fail():
+            raise RuntimeError('rotation failed')
+        graph = DeviceOperationGraph(self.executor)
+        graph.add('rotation', fail)
+        graph.add('stages', self.move, 'stages', after=('rotation',))
+        graph.add('filter', self.move, 'filter')
+        with self.assertRaises(RuntimeError):
+            graph.wait()
+        self.assertNotIn(('start', 'stages'), self.log)
+
+    def test_unknown_dependency(self):
+        graph = DeviceOperationGraph(self.executor)
+        with self.assertRaises(ValueError):
+            graph.add('stages', self.move, 'stages', after=('rotation',))
+
+
+if __name__ == '__main__':
+    unittest.main()
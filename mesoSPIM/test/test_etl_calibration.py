@@ -0,0 +1,50 @@
+# To run the test:
+# python -m test.test_etl_calibration
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from src.utils.etl_calibration import ETLCalibrationTable
+
+ETL_FILE = os.path.join(os.path.dirname(__file__), '..', 'config', 'etl_parameters', 'ETL-parameters.csv')
+
+class TestETLCalibrationTable(unittest.TestCase):
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'ETL-parameters.csv')
+        shutil.copy(ETL_FILE, self.path)
+        self.table = ETLCalibrationTable(self.path)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.tmp_dir)
+
+    def test_lookup(self):
+        parameters = self.table.lookup('405 nm', '0.8x')
+        self.assertAlmostEqual(parameters['etl_l_amplitude'], 0.765)
+        self.assertEqual(self.table.lookup('405 nm', '0.8x Revolver'), parameters, "Zoom name must be cleaned up")
+        self.assertIsNone(self.table.lookup('999 nm', '0.8x'))
+
+    def test_interpolation(self):
+        low, high = self.table.lookup('405 nm', '1x'), self.table.lookup('488 nm', '1x')
+        parameters = self.table.lookup('450 nm', '1x', interpolate=True)
+        for key in parameters:
+            self.assertTrue(min(low[key], high[key]) <= parameters[key] <= max(low[key], high[key]))
+        self.assertIsNone(self.table.lookup('laser', 'zoom', interpolate=True))
+
+    def test_update_appends_and_reloads(self):
+        n_lines = len(open(self.path).readlines())
+        values = {'etl_l_offset': 1.0, 'etl_l_amplitude': 0.5, 'etl_r_offset': 1.5, 'etl_r_amplitude': 0.25}
+        self.table.update('999 nm', '1x', values)
+        self.assertEqual(len(open(self.path).readlines()), n_lines + 1)
+        self.assertEqual(ETLCalibrationTable(self.path).lookup('999 nm', '1x'), values)
+        self.assertFalse(self.table.reload_if_changed(), "Own writes must not invalidate the table")
+        time.sleep(0.01)
+        with open(self.path, 'a') as file:
+            file.write('1x;998 nm;1x;1;1;1;1\n')
+        self.assertTrue(self.table.reload_if_changed())
+        self.assertIsNotNone(self.table.lookup('998 nm', '1x'))
+
+
+if __name__ == '__main__':
+    unittest.main()
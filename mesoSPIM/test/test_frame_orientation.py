@@ -0,0 +1,27 @@
+# To run the test:
+# python -m test.test_frame_orientation
+import unittest
+import numpy as np
+from src.plugins.ImageWriterApi import FrameOrientation, MESOSPIM_ORIENTATION
+
+class TestFrameOrientation(unittest.TestCase):
+    def setUp(self) -> None:
+        self.raw = np.arange(8 * 16, dtype='uint16').reshape(8, 16)
+
+    def test_mesospim_orientation_is_zero_copy_view(self):
+        image = MESOSPIM_ORIENTATION.apply(self.raw)
+        self.assertTrue(np.shares_memory(image, self.raw))
+        np.testing.assert_array_equal(image, self.raw.T[::-1])
+        self.assertEqual(image.shape, MESOSPIM_ORIENTATION.oriented_shape(self.raw.shape))
+
+    def test_identity_orientation(self):
+        identity = FrameOrientation(transpose=False, flip_axes=())
+        self.assertIs(identity.apply(self.raw), self.raw)
+        self.assertEqual(identity.oriented_shape(self.raw.shape), (8, 16))
+
+    def test_restore_is_inverse(self):
+        image = MESOSPIM_ORIENTATION.apply(self.raw)
+        np.testing.assert_array_equal(MESOSPIM_ORIENTATION.restore(image), self.raw)
+
+if __name__ == '__main__':
+    unittest.main()
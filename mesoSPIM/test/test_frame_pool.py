@@ -0,0 +1,117 @@
+# To run the test:
+# python -m test.test_frame_pool
+import time
+import queue
+import unittest
+import threading
+import numpy as np
+from src.utils.frame_pool import FramePool
+
+class QueueAllocator:
+    '''Frame buffer of a writer, slots are freed by the writer after hand_over'''
+    def __init__(self, n_slots, shape):
+        self.frames = np.zeros((n_slots,) + shape, dtype='uint16')
+        self.free = queue.Queue()
+        for slot in range(n_slots):
+            self.free.put(slot)
+
+    def acquire(self, timeout=None):
+        try:
+            return self.free.get(timeout != 0, timeout)
+        except queue.Empty:
+            return None
+
+    def release(self, slot):
+        self.free.put(slot)
+
+class TestFramePool(unittest.TestCase):
+    def setUp(self) -> None:
+        self.pool = FramePool(depth=4)
+        self.pool.allocate((8, 16))
+
+    def test_fifo_order_and_release(self):
+        for value in range(3):
+            self.pool.put(np.full((8, 16), value, dtype='uint16'))
+        self.assertEqual(len(self.pool), 3)
+        for value in range(3):
+            slot = self.pool.pop()
+            self.assertTrue(np.all(self.pool.frames[slot] == value))
+            self.pool.release(slot)
+        self.assertIsNone(self.pool.pop())
+        self.assertEqual(self.pool.stats['high_water'], 3)
+
+    def test_back_pressure(self):
+        slots = [self.pool.acquire() for i in range(4)]
+        self.assertIsNone(self.pool.acquire(timeout=0.01), "Full pool must not hand out a slot")
+        self.assertEqual(self.pool.stats['dropped'], 1)
+        threading.Timer(0.05, self.pool.release, args=(slots[0],)).start()
+        self.assertEqual(self.pool.acquire(timeout=5), slots[0], "Released slot must unblock the producer")
+        self.assertEqual(self.pool.stats['stalls'], 2)
+
+    def test_pop_batch(self):
+        self.assertEqual(self.pool.pop_batch(timeout=0.01), [])
+        for value in range(3):
+            self.pool.put(np.full((8, 16), value, dtype='uint16'))
+        slots = self.pool.pop_batch()
+        self.assertEqual([int(self.pool.frames[slot][0, 0]) for slot in slots], [0, 1, 2])
+        self.assertEqual(len(self.pool), 0)
+        threading.Timer(0.05, self.pool.put, args=(np.zeros((8, 16), dtype='uint16'),)).start()
+        self.assertEqual(len(self.pool.pop_batch(timeout=5)), 1, "pop_batch must wait for the first frame")
+
+    def test_clear_and_reallocate(self):
+        self.pool.put(np.zeros((8, 16), dtype='uint16'))
+        self.pool.clear()
+        self.assertEqual(len(self.pool), 0)
+        frames = self.pool.frames
+        self.pool.allocate((8, 16))
+        self.assertIs(self.pool.frames, frames, "Same shape must reuse the buffer")
+        self.pool.allocate((4, 8))
+        self.assertEqual(self.pool.frames.shape, (4, 4, 8))
+        self.assertEqual(len([self.pool.acquire() for i in range(4)]), 4)
+
+    def test_latency(self):
+        for i in range(3):
+            self.pool.put(np.zeros((8, 16), dtype='uint16'))
+            time.sleep(0.01)
+            self.pool.release(self.pool.pop())
+        latency = self.pool.latency.percentiles()
+        self.assertEqual(latency['queue']['count'], 3)
+        self.assertGreaterEqual(latency['queue']['p50_ms'], 10)
+        self.assertGreaterEqual(latency['frame']['max_ms'], latency['queue']['max_ms'])
+        self.pool.latency.reset()
+        self.assertEqual(self.pool.latency.percentiles(), {})
+
+    def test_run_stats(self):
+        slots = [self.pool.acquire() for i in range(4)]
+        self.assertIsNone(self.pool.acquire(timeout=0.01))
+        for slot in slots:
+            self.pool.release(slot)
+        self.pool.allocate((8, 16)) # next image series of the run
+        self.assertEqual(self.pool.dropped, 1, "Dropped frames are counted for the whole run")
+        self.assertLessEqual(self.pool.first_acquired_at, self.pool.last_written_at)
+        self.pool.reset_run()
+        self.assertEqual((self.pool.dropped, self.pool.first_acquired_at, self.pool.last_written_at), (0, None, None))
+
+    def test_attach_allocator(self):
+        own_frames = self.pool.frames
+        allocator = QueueAllocator(6, (8, 16))
+        self.pool.attach(allocator)
+        self.assertIs(self.pool.frames, allocator.frames)
+        slots = [self.pool.put(np.full((8, 16), value, dtype='uint16')) for value in range(6)]
+        self.assertEqual(sorted(slots), list(range(6)), "Slots must come from the allocator")
+        self.assertIsNone(self.pool.acquire(timeout=0.01))
+        self.assertEqual(self.pool.stats['dropped'], 1)
+        written = self.pool.pop_batch()
+        for slot in written[:4]:
+            self.pool.hand_over(slot) # taken over by the writer, not freed
+        self.pool.release(written[4])
+        self.assertEqual(allocator.free.qsize(), 1)
+        self.pool.push(written[5])
+        self.pool.detach() # unwritten frames are returned to the allocator
+        self.assertEqual(allocator.free.qsize(), 2)
+        self.assertIs(self.pool.frames, own_frames)
+        self.assertEqual(len([self.pool.acquire() for i in range(4)]), 4)
+        self.assertEqual(self.pool.latency.count('frame'), 5)
+
+if __name__ == '__main__':
+    unittest.main()
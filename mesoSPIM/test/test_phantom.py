@@ -0,0 +1,64 @@
+# To run the test:
+# python -m test.test_phantom
+import unittest
+import numpy as np
+from src.utils.phantom import SyntheticPhantom, PhantomFrameCache
+
+FRAME_SHAPE = (2048, 2048)
+PIXEL_UM = 6.5
+
+
+class TestPhantom(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.phantom = SyntheticPhantom(seed=1)
+
+    def setUp(self) -> None:
+        self.position = {'x_pos': 0, 'y_pos': 0, 'z_pos': 100, 'f_pos': 0}
+
+    def test_stage_shift_moves_the_image(self):
+        shift_px = 40
+        image = self.phantom.render(self.position, '488 nm', (256, 256), PIXEL_UM)
+        shifted = self.phantom.render(dict(self.position, x_pos=shift_px * PIXEL_UM), '488 nm', (256, 256), PIXEL_UM)
+        np.testing.assert_allclose(shifted[:, :-shift_px], image[:, shift_px:], rtol=1e-5)
+
+    def test_defocus_blurs(self):
+        def sharpness(image):
+            return np.mean(np.abs(np.diff(image, axis=1)))
+        in_focus = self.phantom.render(self.position, '561 nm', (512, 512), 2.0)
+        defocused = self.phantom.render(dict(self.position, f_pos=200), '561 nm', (512, 512), 2.0)
+        self.assertLess(sharpness(defocused), 0.5 * sharpness(in_focus))
+        self.assertAlmostEqual(in_focus.mean(), defocused.mean(), delta=0.05 * in_focus.mean())
+
+    def test_lasers_show_different_structures(self):
+        blue = self.phantom.render(self.position, '405 nm', (256, 256), PIXEL_UM)
+        yellow = self.phantom.render(self.position, '561 nm', (256, 256), PIXEL_UM)
+        self.assertLess(np.corrcoef(blue.ravel(), yellow.ravel())[0, 1], 0.9)
+
+    def test_cached_frames(self):
+        """Cached frames of one state differ only by noise (frame rate: benchmark_pipeline --components)"""
+        cache = PhantomFrameCache(self.phantom, n_noise=4)
+        frames = [cache.get_frame(self.position, '488 nm', FRAME_SHAPE, PIXEL_UM) for i in range(8)]
+        self.assertFalse(np.array_equal(frames[0], frames[1]), "Frames of the same state must have different noise")
+        self.assertFalse(frames[0].flags.writeable)
+        self.assertEqual(frames[0].dtype, np.uint16)
+        self.assertIs(frames[4], frames[0], "The noise variants are reused")
+
+    def test_shot_and_read_noise(self):
+        cache = PhantomFrameCache(self.phantom, read_noise=2.0)
+        signal = self.phantom.render(self.position, '488 nm', (512, 512), PIXEL_UM)
+        frame = cache.get_frame(self.position, '488 nm', (512, 512), PIXEL_UM)
+        residual = frame - signal
+        self.assertAlmostEqual(residual.mean(), 0, delta=1.0)
+        self.assertAlmostEqual(residual.std(), np.sqrt(signal.mean() + 2.0**2), delta=0.1 * np.sqrt(signal.mean()))
+
+    def test_cache_memory_cap(self):
+        frame_bytes = 256 * 256 * 2
+        cache = PhantomFrameCache(self.phantom, max_bytes=10 * frame_bytes, n_noise=2)
+        for z in range(0, 200, 4):
+            cache.get_frame(dict(self.position, z_pos=z), '488 nm', (256, 256), PIXEL_UM)
+        self.assertLessEqual(cache.nbytes, 10 * frame_bytes)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,35 @@
+# To run the test:
+# python -m test.test_processor_chain
+import unittest
+from pathlib import Path
+import numpy as np
+from mesoSPIM.src.plugins.manager import _import_path
+from mesoSPIM.src.mesoSPIM_ProcessorChain import ProcessorChain
+
+class TestProcessorChain(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        processors = Path(__file__).parents[1] / 'src/plugins/ImageProcessors'
+        for name in ('IdentityProcessor', 'BinningProcessor'):
+            _import_path(processors / f'{name}.py') # registers the plugin
+
+    def setUp(self) -> None:
+        self.chain = ProcessorChain()
+
+    def test_output_spec_inplace(self):
+        self.assertTrue(self.chain.add_processor('Identity'))
+        self.assertEqual(self.chain.output_spec((64, 48), 'uint16'), ((64, 48), np.dtype('uint16')))
+        image = np.arange(64 * 48, dtype='uint16').reshape(64, 48)
+        expected = image.copy()
+        self.chain.process_inplace(image)
+        self.assertTrue(np.array_equal(image, expected))
+
+    def test_output_spec_binning(self):
+        self.assertTrue(self.chain.add_processor('Binning'))
+        self.assertEqual(self.chain.output_spec((64, 48), 'uint16'), ((32, 24), np.dtype('uint16')),
+                         "Binning changes the frame shape, the frames cannot be processed in place")
+        self.chain.disable_processor(0)
+        self.assertEqual(self.chain.output_spec((64, 48), 'uint16')[0], (64, 48))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# To run the test:
+# python -m test.test_pyramid_builder
+import os
+import tempfile
+import unittest
+import concurrent.futures
+import numpy as np
+import zarr
+from src.plugins.support_files.ImageWriters.OmeZarrWriterMP.omezarr_writer import (
+    PyramidBuilder, FlushPad, ceil_div, ds2_mean_uint16, dsZ2_mean_uint16)
+from src.plugins.support_files.ImageWriters.OmeZarrWriter import omezarr_writer as single_process
+from test.benchmark_pyramid import ReferencePyramid, reference_ds2, reference_dsZ2
+
+LEVELS = 5
+
+
+class TestPyramidBuilder(unittest.TestCase):
+    def setUp(self) -> None:
+        self.rng = np.random.default_rng(0)
+
+    def run_pyramid(self, pyramid_class, planes, xy_levels, **kwargs):
+        y, x = planes.shape[1:]
+        shapes = [(ceil_div(y, 2 ** l), ceil_div(x, 2 ** l)) for l in range(LEVELS)]
+        levels = [[] for _ in range(LEVELS)]
+        sink = lambda level, stack: levels[level].extend(plane.copy() for plane in stack)
+        if pyramid_class is ReferencePyramid:
+            pyramid = ReferencePyramid(LEVELS, xy_levels, sink)
+        else:
+            pyramid = PyramidBuilder(shapes, xy_levels, sink, **kwargs)
+        for plane in planes:
+            pyramid.push(plane)
+        pyramid.finish()
+        return levels
+
+    def test_mean_functions(self):
+        a, b = self.rng.integers(0, 2**16, (2, 3, 51, 34), dtype=np.uint16)
+        np.testing.assert_array_equal(ds2_mean_uint16(a[0]), reference_ds2(a[0]))
+        np.testing.assert_array_equal(ds2_mean_uint16(a), np.stack([reference_ds2(plane) for plane in a]))
+        np.testing.assert_array_equal(dsZ2_mean_uint16(a, b), reference_dsZ2(a, b))
+
+    def test_same_as_per_plane_pyramid(self):
+        pool = concurrent.futures.ThreadPoolExecutor(3)
+        for shape, xy_levels, n_planes, batch, bands in [((96, 128), 0, 33, 4, 1), ((101, 67), 1, 17, 3, 1),
+                                                         ((301, 203), 2, 8, 2, 3), ((64, 64), 0, 1, 8, 1)]:
+            planes = self.rng.integers(0, 2**16, (n_planes,) + shape, dtype=np.uint16)
+            expected = self.run_pyramid(ReferencePyramid, planes, xy_levels)
+            levels = self.run_pyramid(PyramidBuilder, planes, xy_levels, batch=batch,
+                                      pool=pool if bands > 1 else None, bands=bands)
+            for level in range(1, LEVELS):
+                self.assertEqual(len(levels[level]), len(expected[level]), (shape, level))
+                for plane, expected_plane in zip(levels[level], expected[level]):
+                    np.testing.assert_array_equal(plane, expected_plane)
+        pool.shutdown()
+
+    def test_flush_pad(self):
+        planes = self.rng.integers(0, 2**16, (5, 64, 64), dtype=np.uint16)
+        dropped = self.run_pyramid(PyramidBuilder, planes, 0, flush_pad=FlushPad.DROP)
+        self.assertEqual([len(level) for level in dropped], [0, 2, 1, 0, 0])
+        zeros = self.run_pyramid(PyramidBuilder, planes, 0, flush_pad=FlushPad.ZEROS)
+        self.assertEqual([len(level) for level in zeros], [0, 3, 2, 1, 1])
+        np.testing.assert_array_equal(zeros[1][2], reference_dsZ2(reference_ds2(planes[4]), np.zeros((32, 32), np.uint16)))
+
+    def test_single_process_writer(self):
+        planes = self.rng.integers(0, 2**16, (21, 96, 80), dtype=np.uint16)
+        expected = self.run_pyramid(ReferencePyramid, planes, 0)
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'tile.ome.zarr')
+            writer = single_process.Live3DPyramidWriter(
+                single_process.PyramidSpec(len(planes), 96, 80, 3), path=path, async_close=False,
+                chunk_scheme=single_process.ChunkScheme(base=(8, 32, 32), target=(8, 32, 32)))
+            for plane in planes:
+                writer.push_slice(plane)
+            writer.close()
+            root = zarr.open_group(path, mode='r')
+            np.testing.assert_array_equal(root['0'][:], planes)
+            for level in (1, 2):
+                np.testing.assert_array_equal(root[str(level)][:], np.stack(expected[level]))
+
+
+if __name__ == '__main__':
+    unittest.main()
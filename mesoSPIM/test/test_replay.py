@@ -0,0 +1,106 @@
+# To run the test:
+# python -m test.test_replay
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import tifffile
+import h5py
+import zarr
+from src.utils.replay import ReplayStream, open_dataset
+from src.plugins.support_files.ImageWriters.OmeZarrWriterMP.omezarr_writer import Live3DPyramidWriter, PyramidSpec, ChunkScheme
+from src.plugins.ImageWriterApi import MESOSPIM_ORIENTATION
+
+N_FRAMES = 12
+RAW_SHAPE = (96, 128) # camera frame (y, x)
+
+
+class TestReplay(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.raw_frames = rng.integers(0, 4000, (N_FRAMES,) + RAW_SHAPE, dtype=np.uint16)
+        self.saved = np.stack([MESOSPIM_ORIENTATION.apply(frame) for frame in self.raw_frames]) # as written by the image writers
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def write_raw(self):
+        path = os.path.join(self.folder, 'stack.raw')
+        self.saved.tofile(path)
+        with open(path + '_meta.txt', 'w') as file:
+            file.write(f'[z_planes] {N_FRAMES}\n[x_pixels] {RAW_SHAPE[1]}\n[y_pixels] {RAW_SHAPE[0]}\n')
+        return path
+
+    def write_omezarr_tile(self, path, saved):
+        writer = Live3DPyramidWriter(PyramidSpec(N_FRAMES, *saved.shape[1:], 2), path=path, async_close=False,
+                                     chunk_scheme=ChunkScheme(base=(4, 64, 64), target=(4, 64, 64)))
+        for plane in saved:
+            writer.push_slice(plane)
+        writer.close()
+
+    def replay_all(self, path, **kwargs):
+        stream = ReplayStream(path, read_ahead=4, loop=False, **kwargs)
+        self.assertEqual(stream.frame_shape, RAW_SHAPE)
+        stream.start()
+        frames = []
+        while (frame := stream.next_frame()) is not None:
+            frames.append(frame)
+        stream.close()
+        return np.stack(frames)
+
+    def test_datasets_restore_camera_frames(self):
+        tiff_path = os.path.join(self.folder, 'stack.tif')
+        tifffile.imwrite(tiff_path, self.saved)
+        compressed_path = os.path.join(self.folder, 'compressed.tif')
+        tifffile.imwrite(compressed_path, self.saved, compression='zlib')
+        for path in (tiff_path, compressed_path, self.write_raw()):
+            np.testing.assert_array_equal(self.replay_all(path), self.raw_frames, err_msg=path)
+
+    def test_omezarr(self):
+        single_path = os.path.join(self.folder, 'stack.ome.zarr')
+        self.write_omezarr_tile(single_path, self.saved)
+        np.testing.assert_array_equal(self.replay_all(single_path), self.raw_frames)
+        # mesoSPIM container, as written by the OME-Zarr writers: one OME-Zarr group per tile
+        container = os.path.join(self.folder, 'container.ome.zarr')
+        tiles = ['Mag1x_Tile0_Ch488_FltEmpty_Sh0_Rot0.ome.zarr', 'Mag1x_Tile1_Ch488_FltEmpty_Sh0_Rot0.ome.zarr']
+        zarr.open_group(container, mode='a')
+        self.write_omezarr_tile(os.path.join(container, tiles[0]), self.saved)
+        np.testing.assert_array_equal(self.replay_all(container), self.raw_frames) # the only tile
+        self.write_omezarr_tile(os.path.join(container, tiles[1]), self.saved[::-1])
+        with self.assertRaises(ValueError) as context:
+            ReplayStream(container)
+        self.assertIn(tiles[1], str(context.exception))
+        with self.assertRaises(ValueError):
+            ReplayStream(container, tile='Mag1x_Tile2_Ch488_FltEmpty_Sh0_Rot0.ome.zarr')
+        np.testing.assert_array_equal(self.replay_all(container, tile=tiles[1]), self.raw_frames[::-1])
+
+    def test_bdv_h5(self):
+        path = os.path.join(self.folder, 'stack.h5')
+        with h5py.File(path, 'w') as file:
+            file['t00000/s00/0/cells'] = np.zeros_like(self.saved)
+            file['t00000/s01/0/cells'] = self.saved
+        np.testing.assert_array_equal(self.replay_all(path, setup=1), self.raw_frames)
+
+    def test_frame_rate_and_loop(self):
+        frame_rate = 100
+        stream = ReplayStream(self.write_raw(), frame_rate=frame_rate, jitter_ms=1.0, read_ahead=4, seed=0)
+        stream.start()
+        t_start = time.perf_counter()
+        for i in range(2 * N_FRAMES):
+            frame = stream.next_frame()
+        elapsed = time.perf_counter() - t_start
+        stream.close()
+        np.testing.assert_array_equal(frame, self.raw_frames[-1])
+        self.assertAlmostEqual(elapsed, (2 * N_FRAMES - 1) / frame_rate, delta=0.05)
+        self.assertEqual(stream.stats['frames'], 2 * N_FRAMES)
+
+    def test_unsupported_dataset(self):
+        with self.assertRaises(ValueError):
+            open_dataset(os.path.join(self.folder, 'stack.png'))
+
+
+if __name__ == '__main__':
+    unittest.main()
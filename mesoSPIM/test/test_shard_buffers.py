@@ -0,0 +1,73 @@
+# To run the test:
+# python -m test.test_shard_buffers
+import os
+import shutil
+import tempfile
+import unittest
+import collections
+import numpy as np
+import zarr
+from zarr.storage import LocalStore
+from src.plugins.support_files.ImageWriters.OmeZarrWriterMP.omezarr_writer import plan_shard_buffers
+from src.plugins.support_files.ImageWriters.OmeZarrWriterMP import omezarr_writer as multi_process
+from src.plugins.support_files.ImageWriters.OmeZarrWriter import omezarr_writer as single_process
+
+N_PLANES = 75
+FRAME_SHAPE = (300, 200)
+
+
+class TestShardBuffers(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        self.planes = np.random.default_rng(0).integers(0, 2**16, (N_PLANES,) + FRAME_SHAPE, dtype=np.uint16)
+        self.writes = collections.Counter()
+        self.store_set = LocalStore.set
+        writes, store_set = self.writes, self.store_set
+        async def counting_set(store, key, value, *args, **kwargs):
+            writes[key] += 1
+            return await store_set(store, key, value, *args, **kwargs)
+        LocalStore.set = counting_set
+
+    def tearDown(self) -> None:
+        LocalStore.set = self.store_set
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def write(self, shard_buffer_gb, module=multi_process):
+        path = os.path.join(self.folder, f'{module.__name__}_{shard_buffer_gb}.ome.zarr')
+        writer = module.Live3DPyramidWriter(module.PyramidSpec(N_PLANES, *FRAME_SHAPE, 2), path=path, async_close=False,
+                                            chunk_scheme=module.ChunkScheme(base=(8, 64, 64), target=(8, 64, 64)),
+                                            shard_shape=(32, 6000, 6000), shard_buffer_gb=shard_buffer_gb)
+        for plane in self.planes:
+            writer.push_slice(plane)
+        writer.close()
+        return path, writer
+
+    def test_plan_shard_buffers(self):
+        shapes = [(100, 2048, 2048), (50, 1024, 1024)]
+        chunks = [(16, 256, 256), (16, 256, 256)]
+        shards = [(64, 2048, 2048), (48, 1024, 1024)]
+        self.assertEqual(plan_shard_buffers(shapes, chunks, shards), shards)
+        # 2 x 32 x 8 MB for level 0 and 2 x 48 x 2 MB for level 1 fit in 0.7 GB
+        self.assertEqual(plan_shard_buffers(shapes, chunks, shards, int(0.7 * 2**30)), [(32, 2048, 2048), (48, 1024, 1024)])
+        # shards are not made shallower than a chunk
+        self.assertEqual(plan_shard_buffers(shapes, chunks, shards, 0), [(16, 2048, 2048), (16, 1024, 1024)])
+        self.assertEqual(plan_shard_buffers(shapes, chunks, [None, None], 0), [None, None])
+
+    def test_shards_written_once(self, module=multi_process):
+        shards_written = []
+        for shard_buffer_gb, depth in ((None, 32), (0, 8)):
+            self.writes.clear()
+            path, writer = self.write(shard_buffer_gb, module)
+            self.assertEqual(writer.buf_depth, [depth, depth])
+            shard_writes = [count for key, count in self.writes.items() if '/c/' in key]
+            self.assertEqual(max(shard_writes), 1)
+            shards_written.append(len(shard_writes))
+            np.testing.assert_array_equal(zarr.open_group(path, mode='r')['0'][:], self.planes)
+        self.assertLess(shards_written[0], shards_written[1]) # deeper shards, fewer of them
+
+    def test_single_process_shards_written_once(self):
+        self.test_shards_written_once(single_process)
+
+
+if __name__ == '__main__':
+    unittest.main()
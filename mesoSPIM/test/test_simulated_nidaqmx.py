@@ -0,0 +1,169 @@
+# To run the test:
+# python -m test.test_simulated_nidaqmx
+import os
+import time
+import unittest
+import importlib.util
+import numpy as np
+from PyQt5 import QtCore
+from src.mesoSPIM_State import mesoSPIM_StateSingleton
+from src.mesoSPIM_WaveFormGenerator import mesoSPIM_SimulatedWaveFormGenerator
+from src.devices.daq import simulated_nidaqmx as nidaqmx
+from src.devices.daq.simulated_nidaqmx.constants import LineGrouping, TaskMode
+
+PACKAGE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SWEEPTIME = 0.1
+
+
+def load_demo_config():
+    spec = importlib.util.spec_from_file_location('demo_config', os.path.join(PACKAGE_DIRECTORY, 'config', 'demo_config.py'))
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    config.waveformgeneration = 'Simulated'
+    return config
+
+
+class CoreStub(QtCore.QObject):
+    """The attributes of mesoSPIM_Core used by the waveform generator"""
+    sig_save_etl_config = QtCore.pyqtSignal()
+
+    def __init__(self, cfg):
+        super().__init__()
+        self.cfg = cfg
+        self.package_directory = PACKAGE_DIRECTORY
+        self.state = mesoSPIM_StateSingleton()
+        self.state.set_parameters(cfg.startup)
+        self.state['sweeptime'] = SWEEPTIME
+
+    def read_config_parameter(self, key, dictionary):
+        return dictionary[key]
+
+
+class TestSimulatedNIDAQmx(unittest.TestCase):
+    def setUp(self) -> None:
+        self.cfg = load_demo_config()
+        self.waveformer = mesoSPIM_SimulatedWaveFormGenerator(CoreStub(self.cfg))
+        self.waveformer.create_waveforms()
+
+    def tearDown(self) -> None:
+        self.waveformer.close_tasks()
+
+    def test_triggered_sweep(self):
+        self.waveformer.create_tasks()
+        self.waveformer.write_waveforms_to_tasks()
+        self.waveformer.start_tasks()
+        self.assertEqual(self.waveformer.ao_cards, 2)
+        self.assertFalse(self.waveformer.galvo_etl_task.is_task_done(), "Started tasks wait for the master trigger")
+        t_start = time.perf_counter()
+        self.waveformer.run_tasks()
+        self.assertGreaterEqual(time.perf_counter() - t_start, SWEEPTIME)
+        for task, buffer in ((self.waveformer.galvo_etl_task, 'galvo_etl'), (self.waveformer.laser_task, 'laser')):
+            self.assertEqual(task.out_stream.total_samp_per_chan_generated, self.waveformer.samples)
+            np.testing.assert_array_equal(task.generated[-1][1], self.waveformer.ao_buffers[buffer])
+        self.assertEqual(self.waveformer.camera_trigger_task.n_plays, 1)
+        self.assertEqual(len(nidaqmx.system.trigger_times), 1)
+        self.waveformer.stop_tasks()
+
+    def test_single_ao_card(self):
+        self.cfg.acquisition_hardware = dict(self.cfg.acquisition_hardware, laser_task_line='PXI6259/ao4:7')
+        waveformer = mesoSPIM_SimulatedWaveFormGenerator(CoreStub(self.cfg))
+        waveformer.create_waveforms()
+        waveformer.create_tasks()
+        waveformer.write_waveforms_to_tasks()
+        waveformer.start_tasks()
+        waveformer.run_tasks()
+        self.assertIsNone(waveformer.galvo_etl_task)
+        np.testing.assert_array_equal(waveformer.galvo_etl_laser_task.generated[-1][1], waveformer.ao_buffers['galvo_etl_laser'])
+        waveformer.stop_tasks()
+        waveformer.close_tasks()
+
+    def test_live_tasks(self):
+        self.assertTrue(self.waveformer.start_live_tasks())
+        for sweep in range(3):
+            self.waveformer.run_live_tasks()
+        self.assertEqual(self.waveformer.galvo_etl_task.out_stream.total_samp_per_chan_generated, 3 * self.waveformer.samples)
+        self.assertEqual(self.waveformer.camera_trigger_task.n_plays, 3)
+        self.assertLessEqual(len(self.waveformer.galvo_etl_task.plays), 1, "Finished generations are only counted")
+        self.assertEqual(self.waveformer.task_stats['tasks_created'], 1)
+        self.assertEqual(self.waveformer.task_stats['buffer_writes'], 1)
+        with self.assertRaises(nidaqmx.errors.DaqError):
+            self.waveformer.galvo_etl_task.wait_until_done(timeout=0.05) # retriggerable tasks are never done
+        self.waveformer.stop_live_tasks()
+        self.assertEqual(nidaqmx.system.tasks, [])
+
+    def test_live_tasks_fallback(self):
+        nidaqmx.system.retriggerable_ao = False
+        self.assertFalse(self.waveformer.start_live_tasks())
+        self.assertFalse(self.waveformer.live_tasks_running)
+        self.assertEqual(nidaqmx.system.tasks, [], "The partially started live tasks are closed")
+        # per-frame tasks still work
+        self.waveformer.create_tasks()
+        self.waveformer.write_waveforms_to_tasks()
+        self.waveformer.start_tasks()
+        self.waveformer.run_tasks()
+        self.assertEqual(self.waveformer.galvo_etl_task.n_plays, 1)
+        self.waveformer.stop_tasks()
+
+    def test_trigger_during_generation_is_ignored(self):
+        self.waveformer.create_tasks(retriggerable=True)
+        self.waveformer.write_waveforms_to_tasks()
+        self.waveformer.start_tasks()
+        self.waveformer.master_trigger_task.write([False, True, True, True, True, True, False], auto_start=True)
+        self.waveformer.master_trigger_task.write([False, True, True, True, True, True, False], auto_start=True)
+        self.assertEqual(self.waveformer.galvo_etl_task.n_plays, 1)
+        self.waveformer.stop_tasks()
+
+    def test_stack_progress(self):
+        n_sweeps = 5
+        self.waveformer.create_tasks(n_sweeps=n_sweeps)
+        self.waveformer.write_waveforms_to_tasks()
+        self.waveformer.start_stack_tasks()
+        time.sleep(2.5 * SWEEPTIME)
+        self.assertEqual(self.waveformer.get_completed_sweeps(), 2)
+        self.waveformer.stop_tasks()
+        self.assertLess(self.waveformer.galvo_etl_task.out_stream.total_samp_per_chan_generated,
+                        3 * self.waveformer.samples, "Stopped tasks do not generate")
+
+    def test_driver_latencies(self):
+        nidaqmx.system.set_latencies(create_task=0.02)
+        t_start = time.perf_counter()
+        self.waveformer.create_tasks()
+        self.assertGreaterEqual(time.perf_counter() - t_start, 4 * 0.02)
+        self.assertEqual(nidaqmx.system.stats['create_task'], 4)
+        with self.assertRaises(ValueError):
+            nidaqmx.system.set_latencies(unknown=1)
+
+    def test_errors(self):
+        self.waveformer.create_tasks()
+        ao = self.waveformer.galvo_etl_task
+        waveforms = self.waveformer.ao_buffers['galvo_etl']
+        with self.assertRaises(nidaqmx.errors.DaqError) as context:
+            ao.write(waveforms * 10)
+        self.assertEqual(context.exception.error_code, -200561)
+        with self.assertRaises(nidaqmx.errors.DaqError):
+            ao.write(waveforms[:3])
+        with self.assertRaises(nidaqmx.errors.DaqError) as context:
+            ao.start()
+        self.assertEqual(context.exception.error_code, -200462)
+        ao.write(waveforms)
+        ao.start()
+        second = nidaqmx.Task()
+        self.addCleanup(second.close)
+        second.ao_channels.add_ao_voltage_chan('PXI6259/ao3')
+        with self.assertRaises(nidaqmx.errors.DaqError) as context:
+            second.control(TaskMode.TASK_RESERVE)
+        self.assertEqual(context.exception.error_code, -50103)
+
+    def test_laser_enable_lines_are_static(self):
+        task = nidaqmx.Task()
+        self.addCleanup(task.close)
+        task.do_channels.add_do_chan('PXI6733/port0/line2,PXI6733/port0/line3,', line_grouping=LineGrouping.CHAN_PER_LINE)
+        task.start()
+        task.write([False, True])
+        task.write([True, False])
+        self.assertEqual(nidaqmx.system.trigger_times, [])
+        np.testing.assert_array_equal(task.generated[-1][1], [[True], [False]])
+
+
+if __name__ == '__main__':
+    unittest.main()
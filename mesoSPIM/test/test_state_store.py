@@ -0,0 +1,50 @@
+# To run the test:
+# python -m test.test_state_store
+import threading
+import unittest
+from src.mesoSPIM_State import mesoSPIM_StateSingleton
+
+
+class TestStateStore(unittest.TestCase):
+    def setUp(self) -> None:
+        self.state = mesoSPIM_StateSingleton()
+
+    def test_snapshot_is_immutable_and_versioned(self):
+        version = self.state.version
+        snapshot = self.state.snapshot()
+        self.state.set_parameters({'laser': '561 nm', 'intensity': 50})
+        self.assertEqual(self.state.version, version + 1, "A batched update must publish one version")
+        self.assertEqual(snapshot['laser'], '488 nm', "Old snapshots must not change")
+        self.assertEqual(self.state.get_parameter_list(['laser', 'intensity']), ['561 nm', 50])
+        with self.assertRaises(TypeError):
+            snapshot['laser'] = '405 nm'
+
+    def test_subscribe(self):
+        changes = []
+        self.state.subscribe(['zoom'], lambda change, version: changes.append((change, version)))
+        self.state['laser'] = '561 nm'
+        self.state.set_parameters({'zoom': '1x', 'intensity': 20})
+        self.assertEqual(changes, [({'zoom': '1x'}, self.state.version)])
+
+    def test_concurrent_access(self):
+        """Readers see complete positions while a writer replaces them (throughput: benchmark_pipeline --components)"""
+        n_writes = 2000
+        torn = []
+        def read():
+            for i in range(5 * n_writes):
+                position = self.state['position']
+                if position['y_pos'] != -position['x_pos']:
+                    torn.append(position)
+        def write():
+            for i in range(n_writes):
+                self.state['position'] = {'x_pos': i, 'y_pos': -i, 'z_pos': 0, 'f_pos': 0, 'theta_pos': 0}
+        threads = [threading.Thread(target=read) for i in range(4)] + [threading.Thread(target=write)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(torn, [])
+        self.assertEqual(self.state['position']['x_pos'], n_writes - 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+# To run the test:
+# python -m test.test_waveform_cache
+import unittest
+import numpy as np
+from src.utils.waveform_cache import WaveformCache
+
+class TestWaveformCache(unittest.TestCase):
+    def setUp(self) -> None:
+        self.buffer_bytes = 8 * 4 * 1000 # 4 AO channels x 1000 samples, float64
+        self.cache = WaveformCache(max_bytes=3 * self.buffer_bytes)
+
+    def buffers(self, value):
+        return {'galvo_etl': np.full((4, 1000), value, dtype=np.float64)}
+
+    def test_hit_and_miss(self):
+        self.assertIsNone(self.cache.get(('488 nm', 'Left')))
+        buffers = self.cache.put(('488 nm', 'Left'), self.buffers(1.0))
+        self.assertIs(self.cache.get(('488 nm', 'Left')), buffers)
+        self.assertFalse(buffers['galvo_etl'].flags.writeable, "Cached buffers must be read-only")
+        self.assertEqual((self.cache.stats['hits'], self.cache.stats['misses']), (1, 1))
+
+    def test_lru_eviction_under_memory_cap(self):
+        for value in range(3):
+            self.cache.put(value, self.buffers(value))
+        self.cache.get(0) # 1 becomes the least recently used entry
+        self.cache.put(3, self.buffers(3))
+        self.assertNotIn(1, self.cache)
+        self.assertIn(0, self.cache)
+        self.assertLessEqual(self.cache.nbytes, self.cache.max_bytes)
+        self.assertEqual(self.cache.stats['evictions'], 1)
+
+    def test_disabled(self):
+        cache = WaveformCache(max_bytes=0)
+        cache.put(0, self.buffers(0))
+        self.assertEqual(len(cache), 0)
+        self.assertIsNone(cache.get(0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+# To run the test:
+# python -m test.test_write_context_speed
+import unittest
+import numpy as np
+from src.utils.acquisitions import Acquisition, AcquisitionList
+from src.plugins.ImageWriterApi import WriteContext
+
+def make_acq_list(n_tiles):
+    return AcquisitionList([Acquisition(x_pos=100 * i, laser=('488 nm', '561 nm')[i % 2]) for i in range(n_tiles)])
+
+def lookup_indices(acq, acq_list):
+    """Per-frame lookups done before the WriteContext"""
+    return (acq_list.get_tile_index(acq), acq_list.find_value_index(acq['laser'], 'laser'),
+            acq_list.find_value_index(acq['shutterconfig'], 'shutterconfig'), acq_list.find_value_index(acq['rot'], 'rot'))
+
+class TestWriteContextSpeed(unittest.TestCase):
+    """The per-frame WriteImage is built from indices resolved once per acquisition, the same indices
+    as the per-frame lookups in the AcquisitionList it replaces (timings: benchmark_pipeline --components)."""
+    def setUp(self) -> None:
+        self.raw_image = np.zeros((64, 32), dtype='uint16')
+
+    def test_indices_resolved_once(self):
+        for n_tiles in (10, 5000):
+            acq_list = make_acq_list(n_tiles)
+            acq = acq_list[-1]
+            context = WriteContext.from_acquisition(acq, acq_list, pixelsize_um=1.0)
+            image = context.write_image(self.raw_image, 3)
+            self.assertEqual((image.tile_number, image.laser, image.shutter, image.rot), lookup_indices(acq, acq_list))
+            self.assertEqual((image.tile_number, image.laser), (n_tiles - 1, 1))
+            self.assertEqual(image.current_image_counter, 3)
+            self.assertIs(image.raw_image, self.raw_image)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+# To run the test:
+# python -m test.test_writer_pool
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import zarr
+from src.plugins.support_files.ImageWriters.OmeZarrWriterMP.omezarr_writer import PyramidSpec, ChunkScheme
+from src.plugins.support_files.ImageWriters.OmeZarrWriterMP.writer_pool import WriterProcessPool
+
+N_PLANES = 8
+FRAME_SHAPE = (64, 64)
+RING_SIZE = 2 * N_PLANES
+NO_ORIENTATION = (False, ())
+
+
+class TestWriterProcessPool(unittest.TestCase):
+    def setUp(self) -> None:
+        self.folder = tempfile.mkdtemp()
+        self.statuses = []
+
+    def tearDown(self) -> None:
+        self.pool.shutdown(timeout=30)
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def start_pool(self, n_workers, **supervision):
+        self.pool = WriterProcessPool(n_workers, RING_SIZE, FRAME_SHAPE, **supervision)
+
+    def open_tile(self, name):
+        writer_kwargs = dict(spec=PyramidSpec(N_PLANES, *FRAME_SHAPE, 2), path=os.path.join(self.folder, name),
+                             async_close=False, chunk_scheme=ChunkScheme(base=(8, 64, 64), target=(8, 64, 64)))
+        return self.pool.open_tile(name, writer_kwargs, None, NO_ORIENTATION, on_status=self.statuses.append)
+
+    def submit_frames(self, tile_id, value):
+        for z in range(N_PLANES):
+            slot = self.pool.free_q.get(timeout=30)
+            self.pool.ring[slot] = value + z
+            self.pool.submit_frame(tile_id, slot)
+
+    def write_tile(self, name, value):
+        '''Opens, fills and closes a tile, like the writer plugin: the next tile is opened once this one is closed'''
+        tile_id = self.open_tile(name)
+        self.submit_frames(tile_id, value)
+        self.pool.close_tile(tile_id)
+        return tile_id
+
+    def assert_tile_written(self, name, value):
+        expected = value + np.arange(N_PLANES, dtype=np.uint16)[:, None, None] * np.ones(FRAME_SHAPE, np.uint16)
+        np.testing.assert_array_equal(zarr.open_group(os.path.join(self.folder, name), mode='r')['0'][:], expected)
+
+    def assert_slots_freed(self):
+        self.assertEqual(self.pool.free_q.qsize(), RING_SIZE)
+        self.assertEqual(self.pool.owner, [0] * RING_SIZE)
+
+    def test_scheduling(self):
+        self.start_pool(2)
+        first = self.open_tile('first.ome.zarr')
+        second = self.open_tile('second.ome.zarr') # the first worker is busy with the first tile
+        self.assertEqual((self.pool.tiles[first]['worker'], self.pool.tiles[second]['worker']), (0, 1))
+        self.submit_frames(first, 0)
+        self.pool.close_tile(first)
+        self.assertTrue(self.pool.wait([first], timeout=60))
+        third = self.open_tile('third.ome.zarr') # the second worker still has the unfinished second tile
+        self.assertEqual(self.pool.tiles[third]['worker'], 0)
+        for tile_id in (second, third):
+            self.submit_frames(tile_id, 100 * tile_id)
+            self.pool.close_tile(tile_id)
+        self.assertTrue(self.pool.wait(timeout=60))
+        self.assertEqual([status['status'] for status in self.statuses], ['done'] * 3)
+        for tile_id, name in ((first, 'first.ome.zarr'), (second, 'second.ome.zarr'), (third, 'third.ome.zarr')):
+            self.assert_tile_written(name, 100 * tile_id)
+
+    def test_slot_freeing(self):
+        self.start_pool(2)
+        tiles = [self.write_tile(f'{i}.ome.zarr', 100 * i) for i in range(4)] # the ring holds the frames of 2 tiles
+        self.assertTrue(self.pool.wait(timeout=60))
+        self.assert_slots_freed()
+        self.assertEqual([status['frames'] for status in self.statuses], [N_PLANES] * 4)
+        for tile_id in tiles:
+            self.assert_tile_written(f'{tile_id}.ome.zarr', 100 * tile_id)
+
+    def test_latency_metrics(self):
+        self.start_pool(2)
+        tiles = [self.write_tile(f'{i}.ome.zarr', 0) for i in range(3)]
+        self.assertTrue(self.pool.wait(timeout=60))
+        for stage in ('tile_admission', 'tile_open', 'tile_init', 'tile_close'):
+            self.assertEqual(self.pool.latency.count(stage), 3, stage)
+        for tile_id in tiles:
+            tile = self.pool.tiles[tile_id]
+            self.assertLessEqual(tile['submitted'], tile['opened'])
+            self.assertLessEqual(tile['close_requested'], tile['closed'])
+        # the open latency includes starting the worker process and waiting behind its other tile
+        open_ms = self.pool.latency.values('tile_open') * 1000
+        init_ms = self.pool.latency.values('tile_init') * 1000
+        self.assertTrue(np.all(open_ms >= init_ms))
+        stats = self.pool.stats()
+        self.assertEqual((stats['tiles'], stats['done'], stats['failed'], stats['restarts']), (3, 3, 0, 0))
+        self.assertEqual(stats['latency']['tile_open']['count'], 3)
+
+    def test_crashed_worker(self):
+        self.start_pool(1, max_finishing_tiles=2) # the queued tile is admitted while the crashed one is closing
+        crashed = self.open_tile('crashed.ome.zarr')
+        self.submit_frames(crashed, 0)
+        with self.pool._cond:
+            self.assertTrue(self.pool._cond.wait_for(lambda: self.pool.tiles[crashed]['opened'] is not None, 60))
+            # killed while writing a tile, the next tile is queued before the supervisor notices the crash
+            process = self.pool.workers[0].process
+            process.kill()
+            process.join(10)
+            self.pool.close_tile(crashed)
+            queued = self.open_tile('queued.ome.zarr')
+            self.submit_frames(queued, 100)
+            self.pool.close_tile(queued)
+        self.assertTrue(self.pool.wait(timeout=60))
+        statuses = {status['name']: status for status in self.statuses}
+        self.assertEqual(statuses['crashed.ome.zarr']['status'], 'failed')
+        self.assertEqual(statuses['queued.ome.zarr']['status'], 'done')
+        self.assertEqual((statuses['queued.ome.zarr']['frames'], statuses['queued.ome.zarr']['retries']), (N_PLANES, 1))
+        self.assertEqual(self.pool.restarts, 1)
+        self.assert_tile_written('queued.ome.zarr', 100)
+        self.assert_slots_freed()
+
+
+if __name__ == '__main__':
+    unittest.main()